@@ -28,6 +28,7 @@
 
 #include <chrono>
 #include <cxxopts.hpp>
+#include <fstream>
 #include <iostream>
 #include <nlohmann/json.hpp>
 #include <string>
@@ -433,12 +434,62 @@ private:
 namespace
 {
 
+// The binary workload format of benchmarks/cpp/workload.py
+std::string const kWorkloadMagic{"TLLMWKLD"};
+
+std::pair<std::vector<std::vector<int32_t>>, std::vector<int32_t>> parseBinaryDataset(
+    std::filesystem::path const& datasetPath)
+{
+    std::ifstream stream(datasetPath, std::ios::binary);
+    std::string magic(kWorkloadMagic.size(), '\0');
+    uint32_t version{0};
+    uint32_t flags{0};
+    uint64_t numRequests{0};
+    uint64_t numTokens{0};
+    stream.read(magic.data(), magic.size());
+    stream.read(reinterpret_cast<char*>(&version), sizeof(version));
+    stream.read(reinterpret_cast<char*>(&flags), sizeof(flags));
+    stream.read(reinterpret_cast<char*>(&numRequests), sizeof(numRequests));
+    stream.read(reinterpret_cast<char*>(&numTokens), sizeof(numTokens));
+    TLLM_CHECK_WITH_INFO(version == 1, "Unsupported workload version %u: %s", version, datasetPath.string().c_str());
+
+    std::vector<int64_t> offsets(numRequests + 1);
+    stream.read(reinterpret_cast<char*>(offsets.data()), offsets.size() * sizeof(int64_t));
+    if (flags & 1)
+    {
+        // The arrival times are not used
+        stream.seekg(numRequests * sizeof(double), std::ios::cur);
+    }
+    std::vector<int32_t> outputIds(numRequests);
+    stream.read(reinterpret_cast<char*>(outputIds.data()), outputIds.size() * sizeof(int32_t));
+    std::vector<int32_t> tokens(numTokens);
+    stream.read(reinterpret_cast<char*>(tokens.data()), tokens.size() * sizeof(int32_t));
+    TLLM_CHECK_WITH_INFO(stream.good(), "Truncated workload: %s", datasetPath.string().c_str());
+
+    std::vector<std::vector<int32_t>> inputIds;
+    inputIds.reserve(numRequests);
+    for (uint64_t i = 0; i < numRequests; ++i)
+    {
+        inputIds.emplace_back(tokens.begin() + offsets[i], tokens.begin() + offsets[i + 1]);
+    }
+    return std::make_pair(std::move(inputIds), std::move(outputIds));
+}
+
 std::pair<std::vector<std::vector<int32_t>>, std::vector<int32_t>> parseDataset(
     std::filesystem::path const& datasetPath)
 {
     auto constexpr allowExceptions = true;
     auto constexpr ingoreComments = true;
     TLLM_CHECK_WITH_INFO(std::filesystem::exists(datasetPath), "File does not exist: %s", datasetPath.string().c_str());
+    {
+        std::ifstream magicStream(datasetPath, std::ios::binary);
+        std::string magic(kWorkloadMagic.size(), '\0');
+        magicStream.read(magic.data(), magic.size());
+        if (magicStream && magic == kWorkloadMagic)
+        {
+            return parseBinaryDataset(datasetPath);
+        }
+    }
     std::ifstream jsonStream(datasetPath);
     auto json = nlohmann::json::parse(jsonStream, nullptr, allowExceptions, ingoreComments);
 
@@ -563,7 +614,9 @@ int main(int argc, char* argv[])
     options.add_options()("engine_dir", "Directory that store the engines.", cxxopts::value<std::string>());
     options.add_options()(
         "type", "Batching type: IFB or V1(non-IFB) batching.", cxxopts::value<std::string>()->default_value("IFB"));
-    options.add_options()("dataset", "Dataset that is used for benchmarking BatchManager.",
+    options.add_options()("dataset",
+        "Dataset that is used for benchmarking BatchManager, the JSON or the binary workload format of "
+        "prepare_dataset.py.",
         cxxopts::value<std::string>()->default_value(""));
     options.add_options()(
         "beam_width", "Specify beam width you want to benchmark.", cxxopts::value<int>()->default_value("1"));
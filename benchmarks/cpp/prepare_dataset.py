@@ -2,8 +2,41 @@
 
 import argparse
 import json
+import os
+from multiprocessing import Pool
 
 from transformers import AutoTokenizer, LlamaTokenizer, T5Tokenizer
+from workload import Workload, save
+
+_tokenizer = None
+
+
+def load_tokenizer(tokenizer_dir, tokenizer_type):
+    global _tokenizer
+    if tokenizer_type == 't5':
+        _tokenizer = T5Tokenizer(vocab_file=tokenizer_dir, padding_side='left')
+    elif tokenizer_type == 'auto':
+        _tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir,
+                                                   padding_side='left')
+    elif tokenizer_type == 'llama':
+        _tokenizer = LlamaTokenizer.from_pretrained(tokenizer_dir,
+                                                    legacy=False,
+                                                    padding_side='left')
+    else:
+        raise AttributeError(f'Unexpected tokenizer type: {tokenizer_type}')
+    _tokenizer.pad_token = _tokenizer.eos_token
+
+
+def tokenize(batch):
+    """
+    Returns the input ids of the prompts and the number of tokens of the
+    outputs of a batch of (prompt, output) pairs.
+    """
+    prompts, outputs = zip(*batch)
+    input_ids = _tokenizer(list(prompts)).input_ids
+    output_ids = _tokenizer(list(outputs), add_special_tokens=False).input_ids
+    return [(ids, len(output)) for ids, output in zip(input_ids, output_ids)]
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -25,39 +58,47 @@ if __name__ == '__main__':
                         required=False,
                         choices=['auto', 't5', 'llama'],
                         help='Specify tokenizer type')
-    parser.add_argument('--output',
-                        type=str,
-                        default='preprocessed_dataset.json',
-                        help='Preprocessed dataset path.')
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='preprocessed_dataset.json',
+        help='Preprocessed dataset path, in the JSON format if it ends with '
+        '.json, the binary format of workload.py otherwise.')
+    parser.add_argument('--num_workers',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='The processes tokenizing the dataset.')
+    parser.add_argument('--batch_size',
+                        type=int,
+                        default=256,
+                        help='The prompts tokenized at once by a worker.')
     FLAGS = parser.parse_args()
 
-    if FLAGS.tokenizer_type == 't5':
-        tokenizer = T5Tokenizer(vocab_file=FLAGS.tokenizer_dir,
-                                padding_side='left')
-    elif FLAGS.tokenizer_type == 'auto':
-        tokenizer = AutoTokenizer.from_pretrained(FLAGS.tokenizer_dir,
-                                                  padding_side='left')
-    elif FLAGS.tokenizer_type == 'llama':
-        tokenizer = LlamaTokenizer.from_pretrained(FLAGS.tokenizer_dir,
-                                                   legacy=False,
-                                                   padding_side='left')
-    else:
-        raise AttributeError(
-            f'Unexpected tokenizer type: {FLAGS.tokenizer_type}')
-    tokenizer.pad_token = tokenizer.eos_token
-
-    results = []
     with open(FLAGS.dataset, 'r') as f:
         data_dict = json.load(f)
-        for req in data_dict:
-            prompt = req['input'] + ' ' + req['instruction']
-            output = req['output']
-            line = tokenizer.encode(prompt)
+    pairs = [(req['input'] + ' ' + req['instruction'], req['output'])
+             for req in data_dict]
+    batches = [
+        pairs[i:i + FLAGS.batch_size]
+        for i in range(0, len(pairs), FLAGS.batch_size)
+    ]
+
+    initargs = (FLAGS.tokenizer_dir, FLAGS.tokenizer_type)
+    if FLAGS.num_workers > 1:
+        # The workers tokenize their batches on a single thread each
+        os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+        with Pool(FLAGS.num_workers, load_tokenizer, initargs) as pool:
+            tokenized = pool.map(tokenize, batches)
+    else:
+        load_tokenizer(*initargs)
+        tokenized = [tokenize(batch) for batch in batches]
+
+    input_ids, output_lens = [], []
+    for batch in tokenized:
+        for line, output_len in batch:
             if len(line) > FLAGS.max_input_len:
                 continue
-            # 1.3 is a magic number that converts number of words to number of tokens
-            output_len = int(len(output.split(' ')) * 1.3)
-            results.append({'input_ids': line, 'output_len': output_len})
+            input_ids.append(line)
+            output_lens.append(output_len)
 
-    with open(FLAGS.output, 'w') as f:
-        json.dump(results, f)
+    save(FLAGS.output, Workload.from_lists(input_ids, output_lens))
@@ -0,0 +1,287 @@
+#!/usr/bin/python
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The binary workload format of the benchmarks, and a generator of synthetic
+workloads.
+
+A workload file is a 32-byte header followed by flat little-endian arrays:
+
+    magic           8 bytes, b'TLLMWKLD'
+    version         uint32
+    flags           uint32, bit 0 set when the arrival times are stored
+    num_requests    uint64
+    num_tokens      uint64
+    offsets         int64[num_requests + 1], the input ids of request i are
+                    tokens[offsets[i]:offsets[i + 1]]
+    arrival_times   float64[num_requests], in seconds, with the flag only
+    output_lens     int32[num_requests]
+    tokens          int32[num_tokens]
+
+The arrays are aligned to their item size, so that load_workload maps the file
+and views them without parsing or copying.
+"""
+import argparse
+import json
+import mmap
+import struct
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+MAGIC = b'TLLMWKLD'
+VERSION = 1
+HAS_ARRIVAL_TIMES = 1
+_HEADER = struct.Struct('<8sIIQQ')
+
+
+class Workload(object):
+    """
+    The requests of a workload, numpy arrays viewing a mapped file or built in
+    memory.
+    """
+
+    def __init__(self,
+                 offsets: np.ndarray,
+                 tokens: np.ndarray,
+                 output_lens: np.ndarray,
+                 arrival_times: Optional[np.ndarray] = None):
+        self.offsets = offsets
+        self.tokens = tokens
+        self.output_lens = output_lens
+        self.arrival_times = arrival_times
+
+    @classmethod
+    def from_lists(cls,
+                   input_ids: Sequence[Sequence[int]],
+                   output_lens: Sequence[int],
+                   arrival_times: Optional[Sequence[float]] = None):
+        input_lens = np.fromiter((len(ids) for ids in input_ids),
+                                 dtype=np.int64,
+                                 count=len(input_ids))
+        offsets = np.zeros(len(input_ids) + 1, dtype=np.int64)
+        np.cumsum(input_lens, out=offsets[1:])
+        tokens = np.fromiter((t for ids in input_ids for t in ids),
+                             dtype=np.int32,
+                             count=int(offsets[-1]))
+        return cls(
+            offsets, tokens, np.asarray(output_lens, dtype=np.int32),
+            None if arrival_times is None else np.asarray(arrival_times,
+                                                          dtype=np.float64))
+
+    def __len__(self):
+        return len(self.output_lens)
+
+    @property
+    def input_lens(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def input_ids(self, i: int) -> np.ndarray:
+        return self.tokens[self.offsets[i]:self.offsets[i + 1]]
+
+    def to_json(self) -> List[dict]:
+        """
+        Returns the records of the JSON format of prepare_dataset.py.
+        """
+        return [{
+            'input_ids': self.input_ids(i).tolist(),
+            'output_len': int(self.output_lens[i])
+        } for i in range(len(self))]
+
+
+def write_workload(path: str, workload: Workload):
+    num_requests, num_tokens = len(workload), len(workload.tokens)
+    flags = HAS_ARRIVAL_TIMES if workload.arrival_times is not None else 0
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, flags, num_requests, num_tokens))
+        f.write(np.ascontiguousarray(workload.offsets, dtype='<i8').data)
+        if flags & HAS_ARRIVAL_TIMES:
+            f.write(
+                np.ascontiguousarray(workload.arrival_times, dtype='<f8').data)
+        f.write(np.ascontiguousarray(workload.output_lens, dtype='<i4').data)
+        f.write(np.ascontiguousarray(workload.tokens, dtype='<i4').data)
+
+
+def load_workload(path: str) -> Workload:
+    """
+    Maps a workload file, the arrays are read-only views of the mapping.
+    """
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, flags, num_requests, num_tokens = _HEADER.unpack_from(
+        buffer)
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a workload file')
+    if version != VERSION:
+        raise ValueError(f'Unsupported workload version {version} of {path}')
+
+    offset = _HEADER.size
+
+    def view(dtype, count):
+        nonlocal offset
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+        offset += array.nbytes
+        return array
+
+    offsets = view('<i8', num_requests + 1)
+    arrival_times = view('<f8', num_requests) if flags & HAS_ARRIVAL_TIMES \
+        else None
+    output_lens = view('<i4', num_requests)
+    tokens = view('<i4', num_tokens)
+    return Workload(offsets, tokens, output_lens, arrival_times)
+
+
+def lognormal_lengths(rng: np.random.Generator, num: int, mean: float,
+                      sigma: float, min_len: int, max_len: int) -> np.ndarray:
+    """
+    Samples lengths of a lognormal distribution of the given mean, sigma
+    being the standard deviation of the log of the lengths.
+    """
+    mu = np.log(mean) - sigma**2 / 2
+    lengths = np.rint(rng.lognormal(mu, sigma, num))
+    return np.clip(lengths, min_len, max_len).astype(np.int64)
+
+
+def arrival_times(rng: np.random.Generator, num: int, request_rate: float,
+                  burstiness: float) -> np.ndarray:
+    """
+    Samples the arrival times of requests at request_rate per second. The
+    inter-arrival times follow a gamma distribution of coefficient of variation
+    burstiness, 1 is a Poisson process and larger values give bursts.
+    """
+    shape = 1.0 / burstiness**2
+    gaps = rng.gamma(shape, 1.0 / (shape * request_rate), num)
+    gaps[0] = 0.0
+    return np.cumsum(gaps)
+
+
+def synthetic_workload(num_requests: int,
+                       input_mean: float,
+                       output_mean: float,
+                       input_sigma: float = 0.5,
+                       output_sigma: float = 0.5,
+                       max_input_len: int = 2048,
+                       max_output_len: int = 2048,
+                       vocab_size: int = 32000,
+                       request_rate: Optional[float] = None,
+                       burstiness: float = 1.0,
+                       shared_prefix_ratio: float = 0.0,
+                       prefix_len: int = 0,
+                       num_prefixes: int = 1,
+                       seed: int = 0) -> Workload:
+    """
+    Generates random requests of lognormal input and output lengths. A
+    shared_prefix_ratio fraction of the requests starts with one of
+    num_prefixes common prefixes of prefix_len tokens. The arrival times are
+    only generated with a request_rate.
+    """
+    rng = np.random.default_rng(seed)
+    input_lens = lognormal_lengths(rng, num_requests, input_mean, input_sigma,
+                                   1, max_input_len)
+    output_lens = lognormal_lengths(rng, num_requests, output_mean,
+                                    output_sigma, 1, max_output_len)
+    offsets = np.zeros(num_requests + 1, dtype=np.int64)
+    np.cumsum(input_lens, out=offsets[1:])
+    tokens = rng.integers(0, vocab_size, int(offsets[-1]), dtype=np.int32)
+
+    if shared_prefix_ratio > 0 and prefix_len > 0:
+        prefixes = rng.integers(0,
+                                vocab_size, (num_prefixes, prefix_len),
+                                dtype=np.int32)
+        shared = np.flatnonzero(rng.random(num_requests) < shared_prefix_ratio)
+        prefix_ids = rng.integers(0, num_prefixes, len(shared))
+        # The first tokens of the shared requests, up to their length
+        counts = np.minimum(input_lens[shared], prefix_len)
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        positions = np.arange(int(counts.sum())) - starts
+        tokens[np.repeat(offsets[shared], counts) + positions] = \
+            prefixes[np.repeat(prefix_ids, counts), positions]
+
+    times = None
+    if request_rate is not None:
+        times = arrival_times(rng, num_requests, request_rate, burstiness)
+    return Workload(offsets, tokens, output_lens.astype(np.int32), times)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Generate a synthetic workload for the benchmarks.')
+    parser.add_argument('--num_requests', type=int, default=1000)
+    parser.add_argument('--input_mean', type=float, default=128)
+    parser.add_argument('--input_sigma',
+                        type=float,
+                        default=0.5,
+                        help='The standard deviation of the log of the '
+                        'input lengths, 0 for a fixed length.')
+    parser.add_argument('--output_mean', type=float, default=128)
+    parser.add_argument('--output_sigma', type=float, default=0.5)
+    parser.add_argument('--max_input_len', type=int, default=2048)
+    parser.add_argument('--max_output_len', type=int, default=2048)
+    parser.add_argument('--vocab_size', type=int, default=32000)
+    parser.add_argument(
+        '--request_rate',
+        type=float,
+        default=None,
+        help='The requests per second of the arrival times, none by default.')
+    parser.add_argument(
+        '--burstiness',
+        type=float,
+        default=1.0,
+        help='The coefficient of variation of the inter-arrival times, 1 for '
+        'Poisson arrivals, larger for bursts.')
+    parser.add_argument('--shared_prefix_ratio',
+                        type=float,
+                        default=0.0,
+                        help='The fraction of requests with a shared prefix.')
+    parser.add_argument('--prefix_len', type=int, default=0)
+    parser.add_argument('--num_prefixes', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='synthetic_workload.bin',
+        help='The workload path, in the JSON format of prepare_dataset.py if '
+        'it ends with .json, the binary format otherwise.')
+    return parser.parse_args()
+
+
+def save(path: str, workload: Workload):
+    if path.endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump(workload.to_json(), f)
+    else:
+        write_workload(path, workload)
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    workload = synthetic_workload(args.num_requests,
+                                  args.input_mean,
+                                  args.output_mean,
+                                  input_sigma=args.input_sigma,
+                                  output_sigma=args.output_sigma,
+                                  max_input_len=args.max_input_len,
+                                  max_output_len=args.max_output_len,
+                                  vocab_size=args.vocab_size,
+                                  request_rate=args.request_rate,
+                                  burstiness=args.burstiness,
+                                  shared_prefix_ratio=args.shared_prefix_ratio,
+                                  prefix_len=args.prefix_len,
+                                  num_prefixes=args.num_prefixes,
+                                  seed=args.seed)
+    save(args.output, workload)
+    print(f'{len(workload)} requests, {len(workload.tokens)} input tokens, '
+          f'{int(workload.output_lens.sum())} output tokens written to '
+          f'{args.output}')
@@ -14,6 +14,7 @@
 # limitations under the License.
 import argparse
 import multiprocessing as mp
+import os
 from time import time
 
 import torch
@@ -237,6 +238,20 @@ def parse_arguments():
         help=
         "The number of gpus to be used for inference, only used when --build_only and --serial_build is specified"
     )
+    parser.add_argument(
+        '--memory_timeline',
+        type=str,
+        default=None,
+        help=
+        ('If this option is specified, a Chrome trace of the host and device '
+         'memory during the build and the benchmark is written to this path, '
+         'with the profiler spans and the benchmark events. '
+         'The ranks of a multi-GPU run write a file each.'))
+    parser.add_argument(
+        '--memory_query_interval',
+        type=float,
+        default=0.1,
+        help='The interval in seconds between two samples of the memory.')
 
     return parser.parse_args()
 
@@ -254,6 +269,7 @@ def main(args):
     from mem_monitor import MemoryMonitor
 
     import tensorrt_llm
+    from tensorrt_llm import profiler
     from tensorrt_llm.logger import logger
 
     logger.set_level(args.log_level)
@@ -281,92 +297,126 @@ def main(args):
         rank = tensorrt_llm.mpi_rank()
         world_size = tensorrt_llm.mpi_world_size()
 
-    benchmark_profiler = None
-    if args.model in get_allowed_models(benchmark_type="gpt"):
-        benchmark_profiler = BenchmarkProfiler()
-        benchmarker = GPTBenchmark(args, batch_size_options, in_out_len_options,
-                                   rank, world_size)
-    elif args.model in get_allowed_models(benchmark_type="bert"):
-        benchmarker = BERTBenchmark(args, batch_size_options, input_len_options,
-                                    rank, world_size)
-    elif args.model in get_allowed_models(benchmark_type="enc_dec"):
-        benchmarker = EncDecBenchmark(args, batch_size_options,
-                                      in_out_len_options, rank, world_size)
-    else:
-        raise Exception(f'Unexpected model: {args.model}')
+    # Samples the memory over the whole run, the build included
+    timeline_monitor = None
+    timeline_events = []
+    if args.memory_timeline is not None:
+        profiler.record_spans()
+        timeline_monitor = MemoryMonitor(args.memory_query_interval)
+        timeline_monitor.start()
+
+    def export_memory_timeline():
+        if timeline_monitor is None:
+            return
+        timeline_monitor.stop()
+        path = args.memory_timeline
+        if world_size > 1:
+            root, ext = os.path.splitext(path)
+            path = f'{root}.rank{rank}{ext}'
+        timeline_monitor.export_chrome_trace(path, profiler.spans(),
+                                             timeline_events)
+
+    try:
+        profiler.start('setup')
+        benchmark_profiler = None
+        if args.model in get_allowed_models(benchmark_type="gpt"):
+            benchmark_profiler = BenchmarkProfiler()
+            benchmarker = GPTBenchmark(args, batch_size_options,
+                                       in_out_len_options, rank, world_size)
+        elif args.model in get_allowed_models(benchmark_type="bert"):
+            benchmarker = BERTBenchmark(args, batch_size_options,
+                                        input_len_options, rank, world_size)
+        elif args.model in get_allowed_models(benchmark_type="enc_dec"):
+            benchmarker = EncDecBenchmark(args, batch_size_options,
+                                          in_out_len_options, rank, world_size)
+        else:
+            raise Exception(f'Unexpected model: {args.model}')
+        profiler.stop('setup')
+
+        if args.build_only:
+            export_memory_timeline()
+            return
 
-    if args.build_only:
-        return
+        start = torch.cuda.Event(enable_timing=True)
+        end = torch.cuda.Event(enable_timing=True)
+        benchmarker.print_report_header(args.csv,
+                                        benchmark_profiler=benchmark_profiler)
+        for config in benchmarker.get_config():
+            try:
+                inputs = benchmarker.prepare_inputs(config)
+            except torch.cuda.OutOfMemoryError as e:
+                logger.error(
+                    f'Exception {e} caught while allocating memory; skipping {config}'
+                )
+                continue
 
-    start = torch.cuda.Event(enable_timing=True)
-    end = torch.cuda.Event(enable_timing=True)
-    benchmarker.print_report_header(args.csv,
+            torch.cuda.empty_cache()
+            latencies = []
+
+            memory_monitor = MemoryMonitor(args.memory_query_interval)
+            memory_monitor.start()
+
+            iter_idx = 0
+            try:
+                # Warm up
+                profiler.start(f'warm up {config}')
+                for _ in range(args.warm_up):
+                    benchmarker.run(inputs, config)
+                profiler.stop(f'warm up {config}')
+                logger.info('Warm up done. Start benchmarking.')
+                if benchmark_profiler is not None:
+                    benchmark_profiler.clean()
+                    benchmark_profiler.start()
+                cur_duration = 0
+                profiler.start(f'benchmark {config}')
+                start_time = time()
+                while iter_idx < args.num_runs or cur_duration < args.duration:
+                    start.record()
+                    benchmarker.run(inputs,
+                                    config,
                                     benchmark_profiler=benchmark_profiler)
-    for config in benchmarker.get_config():
-        try:
-            inputs = benchmarker.prepare_inputs(config)
-        except torch.cuda.OutOfMemoryError as e:
-            logger.error(
-                f'Exception {e} caught while allocating memory; skipping {config}'
-            )
-            continue
-
-        torch.cuda.empty_cache()
-        latencies = []
-
-        memory_monitor = MemoryMonitor()
-        memory_monitor.start()
-
-        iter_idx = 0
-        try:
-            # Warm up
-            for _ in range(args.warm_up):
-                benchmarker.run(inputs, config)
-            logger.info('Warm up done. Start benchmarking.')
+                    end.record()
+
+                    torch.cuda.synchronize()
+                    latencies.append(start.elapsed_time(end))
+
+                    iter_idx += 1
+                    cur_duration = round(time() - start_time, 3)
+                profiler.stop(f'benchmark {config}')
+                logger.info(
+                    f'Benchmarking done. Iteration: {iter_idx}, duration: {cur_duration} sec.'
+                )
+
+            except Exception as e:
+                print("Found exception during benchmarking", e.with_traceback())
+                memory_monitor.kill()
+                raise e
+
+            memory_monitor.stop()
+            _, peak_gpu_used = memory_monitor.get_peak_memory_usage("GiB")
+            peak_gpu_used = round(peak_gpu_used, 3)
             if benchmark_profiler is not None:
-                benchmark_profiler.clean()
-                benchmark_profiler.start()
-            cur_duration = 0
-            start_time = time()
-            while iter_idx < args.num_runs or cur_duration < args.duration:
-                start.record()
-                benchmarker.run(inputs,
-                                config,
-                                benchmark_profiler=benchmark_profiler)
-                end.record()
-
-                torch.cuda.synchronize()
-                latencies.append(start.elapsed_time(end))
-
-                iter_idx += 1
-                cur_duration = round(time() - start_time, 3)
-            logger.info(
-                f'Benchmarking done. Iteration: {iter_idx}, duration: {cur_duration} sec.'
-            )
-
-        except Exception as e:
-            print("Found exception during benchmarking", e.with_traceback())
-            memory_monitor.kill()
-            raise e
-
-        memory_monitor.stop()
-        _, peak_gpu_used = memory_monitor.get_peak_memory_usage("GiB")
-        peak_gpu_used = round(peak_gpu_used, 3)
-        if benchmark_profiler is not None:
-            benchmark_profiler.add_aux_info('iter_count', iter_idx)
-            benchmark_profiler.stop()
-
-        latency = round(sum(latencies) / iter_idx, 3)
-        latencies.sort()
-        percentile95 = round(latencies[int(iter_idx * 0.95)], 3)
-        percentile99 = round(latencies[int(iter_idx * 0.99)], 3)
-        benchmarker.report(config,
-                           latency,
-                           percentile95,
-                           percentile99,
-                           peak_gpu_used,
-                           csv=args.csv,
-                           benchmark_profiler=benchmark_profiler)
+                benchmark_profiler.add_aux_info('iter_count', iter_idx)
+                benchmark_profiler.stop()
+                timeline_events.extend(benchmark_profiler.event_times)
+
+            latency = round(sum(latencies) / iter_idx, 3)
+            latencies.sort()
+            percentile95 = round(latencies[int(iter_idx * 0.95)], 3)
+            percentile99 = round(latencies[int(iter_idx * 0.99)], 3)
+            benchmarker.report(config,
+                               latency,
+                               percentile95,
+                               percentile99,
+                               peak_gpu_used,
+                               csv=args.csv,
+                               benchmark_profiler=benchmark_profiler)
+
+        export_memory_timeline()
+    finally:
+        # Stopped by export_memory_timeline unless an exception was raised
+        if timeline_monitor is not None:
+            timeline_monitor.kill()
 
 
 if __name__ == '__main__':
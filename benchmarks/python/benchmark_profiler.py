@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
+
 import torch
 
 
@@ -20,18 +22,22 @@ class BenchmarkProfiler(object):
     cuda_event_dict: dict
     timer_dict: dict
     aux_info: dict
+    # The (name, host time) of the recorded events, for the memory timeline
+    event_times: list
     started: bool
 
     def __init__(self):
         self.cuda_event_dict = {}
         self.timer_dict = {}
         self.aux_info = {}
+        self.event_times = []
         self.started = False
 
     def clean(self):
         self.cuda_event_dict = {}
         self.timer_dict = {}
         self.aux_info = {}
+        self.event_times = []
 
     def start(self):
         self.started = True
@@ -50,6 +56,7 @@ class BenchmarkProfiler(object):
             return
         event = self.get_cuda_event(name)
         event.record()
+        self.event_times.append((name, time.time()))
 
     def get_timer_value(self, timer_name: str):
         # timer is in milliseconds
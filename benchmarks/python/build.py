@@ -26,13 +26,14 @@ from base_benchmark import get_engine_name, serialize_engine
 
 import tensorrt_llm
 from tensorrt_llm._utils import str_dtype_to_trt
-from tensorrt_llm.builder import Builder
+from tensorrt_llm.builder import BuildConfig, Builder
 from tensorrt_llm.layers import MoeConfig, PositionEmbeddingType
 from tensorrt_llm.logger import logger
 from tensorrt_llm.models import PretrainedConfig, quantize_model
 from tensorrt_llm.network import net_guard
 from tensorrt_llm.plugin.plugin import ContextFMHAType
 from tensorrt_llm.quantization import QuantMode
+from tensorrt_llm.runtime.memory_planner import plan_memory
 
 
 def parse_arguments():
@@ -664,6 +665,44 @@ def build_gpt(args):
     assert engine is not None, f'Failed to build engine for rank {runtime_rank}'
     build_time = round(time.time() - start, 2)
 
+    # The KV cache left on the device by the weights and the activations
+    model_config = PretrainedConfig(
+        architecture=args.model,
+        dtype=args.dtype,
+        logits_dtype='float32',
+        vocab_size=build_config['vocab_size'],
+        max_position_embeddings=build_config['n_positions'],
+        hidden_size=build_config['hidden_size'],
+        num_hidden_layers=build_config['num_layers'],
+        num_attention_heads=build_config['num_heads'],
+        num_key_value_heads=num_kv_heads,
+        hidden_act=build_config['hidden_act'],
+        intermediate_size=build_config['inter_size'],
+        norm_epsilon=1e-5,
+        position_embedding_type='learned_absolute',
+        world_size=world_size,
+        tp_size=world_size,
+        pp_size=1,
+        quant_mode=quant_mode,
+        quant_kwargs={},
+        use_prompt_tuning=False)
+    model_config.set_rank(runtime_rank)
+    memory_plan = plan_memory(model_config,
+                              BuildConfig(max_input_len=max_input_len,
+                                          max_output_len=max_output_len,
+                                          max_batch_size=max_batch_size,
+                                          max_beam_width=max_beam_width,
+                                          plugin_config=network.plugin_config),
+                              torch.cuda.get_device_properties(
+                                  torch.cuda.current_device()).total_memory,
+                              weights=engine.nbytes)
+    logger.info(f'Memory plan of rank {runtime_rank}:\n{memory_plan}')
+    if memory_plan.max_num_sequences() < max_batch_size:
+        logger.warning(
+            f'The KV cache only fits {memory_plan.max_num_sequences()} '
+            f'sequences of {memory_plan.max_attention_window_size} tokens, '
+            f'less than max_batch_size {max_batch_size}.')
+
     if args.output_dir is not None:
         os.makedirs(args.output_dir, exist_ok=True)
         serialize_path = os.path.join(args.output_dir, engine_name)
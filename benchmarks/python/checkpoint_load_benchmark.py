@@ -0,0 +1,143 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Peak host memory of loading a TensorRT-LLM checkpoint shard.
+
+Writes a synthetic rank0.safetensors of the requested size, then loads it in a
+fresh process with
+  * safe_open: every tensor read into a dict of torch tensors, then converted
+    with torch_to_numpy, as PretrainedModel.from_checkpoint used to do;
+  * mmap: SafetensorsMmap, as PretrainedModel.from_checkpoint does now.
+Every weight is then copied once into a scratch buffer, like TensorRT reads
+the weights when the engine is built.
+"""
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import SUPPRESS, ArgumentParser
+
+import numpy as np
+
+
+def write_checkpoint(path, size_gb, hidden_size):
+    # fp16 [hidden_size, 4 * hidden_size] weights
+    tensor_bytes = hidden_size * 4 * hidden_size * 2
+    num_tensors = max(1, int(size_gb * (1 << 30)) // tensor_bytes)
+    header = {}
+    for i in range(num_tensors):
+        header[f'transformer.layers.{i}.mlp.fc.weight'] = {
+            'dtype': 'F16',
+            'shape': [4 * hidden_size, hidden_size],
+            'data_offsets': [i * tensor_bytes, (i + 1) * tensor_bytes]
+        }
+    header = json.dumps(header).encode()
+    header += b' ' * (-len(header) % 8)
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for i in range(num_tensors):
+            f.write(
+                np.full((4 * hidden_size, hidden_size), i,
+                        dtype=np.float16).tobytes())
+
+
+def memory_status():
+    status = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, value = line.split(':', 1)
+            if key in ('VmHWM', 'RssAnon', 'RssFile'):
+                status[key] = int(value.split()[0]) / (1 << 20)
+    return status
+
+
+def load(path, mode):
+    from tensorrt_llm._safetensors import SafetensorsMmap
+    from tensorrt_llm._utils import torch_to_numpy
+
+    start = time.time()
+    if mode == 'safe_open':
+        import safetensors
+        weights = {}
+        with safetensors.safe_open(path, framework='pt', device='cpu') as f:
+            for key in f.keys():
+                weights[key] = f.get_tensor(key)
+        weights = {k: torch_to_numpy(v) for k, v in weights.items()}
+    else:
+        weights = SafetensorsMmap(path)
+    load_time = time.time() - start
+
+    peak_anon = memory_status()['RssAnon']
+    scratch = None
+    for name in weights.keys():
+        value = weights[name]
+        if scratch is None or scratch.shape != value.shape:
+            scratch = np.empty_like(value)
+        np.copyto(scratch, value)
+        peak_anon = max(peak_anon, memory_status()['RssAnon'])
+    total_time = time.time() - start
+
+    status = memory_status()
+    print(
+        json.dumps(
+            dict(load_time=load_time,
+                 total_time=total_time,
+                 peak_rss=status['VmHWM'],
+                 peak_anon=peak_anon)))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--size_gb', type=float, default=4)
+    parser.add_argument('--hidden_size', type=int, default=8192)
+    parser.add_argument('--ckpt_dir',
+                        type=str,
+                        default=None,
+                        help='Directory for the synthetic checkpoint')
+    parser.add_argument('--mode',
+                        choices=['safe_open', 'mmap'],
+                        default=None,
+                        help=SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        load(os.path.join(args.ckpt_dir, 'rank0.safetensors'), args.mode)
+        return
+
+    with tempfile.TemporaryDirectory(dir=args.ckpt_dir) as ckpt_dir:
+        path = os.path.join(ckpt_dir, 'rank0.safetensors')
+        write_checkpoint(path, args.size_gb, args.hidden_size)
+        size_gb = os.path.getsize(path) / (1 << 30)
+        print(f'[BENCHMARK] checkpoint size(GB) {size_gb:.2f}')
+        for mode in ['safe_open', 'mmap']:
+            output = subprocess.run([
+                sys.executable, __file__, '--mode', mode, '--ckpt_dir', ckpt_dir
+            ],
+                                    check=True,
+                                    capture_output=True,
+                                    text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f'{mode:>9}: load_time(s) {result["load_time"]:.2f} '
+                  f'total_time(s) {result["total_time"]:.2f} '
+                  f'peak_rss(GB) {result["peak_rss"]:.2f} '
+                  f'peak_anon_rss(GB) {result["peak_anon"]:.2f}')
+
+
+if __name__ == '__main__':
+    main()
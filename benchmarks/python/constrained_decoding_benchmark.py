@@ -0,0 +1,206 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Per-step cost of constraining the generation to a JSON schema.
+
+Compares a logits processor that walks every token of the vocabulary through
+the automaton of each row at every step with the ConstrainedLogitsProcessor,
+which looks the allowed tokens up in the precomputed TokenIndex and masks the
+whole batch with one gather. The vocabulary is synthetic unless
+--tokenizer_dir is given.
+"""
+import random
+import string
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import torch
+
+from tensorrt_llm.runtime.constrained_decoding import (
+    ConstrainedLogitsProcessor, TokenIndex, vocab_strings)
+from tensorrt_llm.runtime.regex_fsm import RegexFSM, json_schema_to_regex
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {
+            "type": "string",
+            "maxLength": 32
+        },
+        "age": {
+            "type": "integer"
+        },
+        "email": {
+            "type": "string"
+        },
+        "tags": {
+            "type": "array",
+            "items": {
+                "enum": ["admin", "user", "guest"]
+            }
+        },
+        "active": {
+            "type": "boolean"
+        },
+    },
+    "required": ["name", "age", "active"]
+}
+
+
+def synthetic_vocab(vocab_size):
+    random.seed(0)
+    chars = string.ascii_letters + string.digits + string.punctuation + ' '
+    vocab = [None] + list(chars)
+    seen = set(vocab)
+    while len(vocab) < vocab_size:
+        token = ''.join(random.choices(chars, k=random.randint(2, 8)))
+        if random.random() < 0.5:
+            token = ' ' + token.strip()
+        if token not in seen:
+            seen.add(token)
+            vocab.append(token)
+    return vocab
+
+
+class VocabScanProcessor(object):
+    """
+    Per-step Python constraint without an index: every token of the
+    vocabulary is walked through the automaton from the state of each row.
+    """
+
+    def __init__(self, fsm, vocab, eos_token_id, input_lengths):
+        self.fsm = fsm
+        self.vocab = vocab
+        self.eos_token_id = eos_token_id
+        self.input_lengths = input_lengths
+        self.states = None
+
+    def __call__(self, step, input_ids, scores):
+        if step == 0:
+            self.states = [self.fsm.initial] * len(self.input_lengths)
+        else:
+            for row, length in enumerate(self.input_lengths):
+                token = self.vocab[input_ids[row, length + step - 1]]
+                if self.states[row] is not None and token is not None:
+                    self.states[row] = self.fsm.walk(token, self.states[row])
+        mask = torch.ones_like(scores, dtype=torch.bool)
+        for row, state in enumerate(self.states):
+            if state is None:
+                continue
+            allowed = [
+                token_id for token_id, token in enumerate(self.vocab)
+                if token and self.fsm.walk(token, state) is not None
+            ]
+            if state in self.fsm.finals:
+                allowed.append(self.eos_token_id)
+            mask[row, allowed] = False
+        return scores.masked_fill(mask, float('-inf'))
+
+
+def run_steps(processor, batch_size, vocab_size, num_steps, device):
+    """ Returns the mean time of the processor per step. """
+    generator = torch.Generator(device=device).manual_seed(0)
+    input_lengths = torch.full((batch_size, ), 8, device=device)
+    input_ids = torch.zeros(batch_size,
+                            8 + num_steps,
+                            dtype=torch.int32,
+                            device=device)
+    rows = torch.arange(batch_size, device=device)
+    elapsed = 0.0
+    for step in range(num_steps):
+        scores = torch.randn(batch_size,
+                             vocab_size,
+                             generator=generator,
+                             device=device)
+        if device == 'cuda':
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        scores = processor(step, input_ids, scores)
+        if device == 'cuda':
+            torch.cuda.synchronize()
+        elapsed += time.perf_counter() - start
+        input_ids[rows, input_lengths + step] = scores.argmax(-1).int()
+    return elapsed / num_steps
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--batch_size', type=int, default=64)
+    parser.add_argument('--vocab_size', type=int, default=128000)
+    parser.add_argument('--num_steps', type=int, default=64)
+    parser.add_argument('--scan_rows',
+                        type=int,
+                        default=1,
+                        help='Rows run through the vocabulary scan, '
+                        'its batch cost is extrapolated from them')
+    parser.add_argument('--tokenizer_dir',
+                        type=str,
+                        default=None,
+                        help='HF tokenizer, a synthetic vocabulary by default')
+    parser.add_argument('--device',
+                        type=str,
+                        default='cuda' if torch.cuda.is_available() else 'cpu')
+    args = parser.parse_args()
+
+    if args.tokenizer_dir is not None:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer_dir)
+        vocab = vocab_strings(tokenizer)
+        eos_token_id = tokenizer.eos_token_id
+    else:
+        vocab = synthetic_vocab(args.vocab_size)
+        eos_token_id = 0
+    pattern = json_schema_to_regex(SCHEMA)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        index = TokenIndex.from_regex(pattern,
+                                      vocab=vocab,
+                                      eos_token_ids=[eos_token_id],
+                                      cache_dir=cache_dir)
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        index = TokenIndex.from_regex(pattern,
+                                      vocab=vocab,
+                                      eos_token_ids=[eos_token_id],
+                                      cache_dir=cache_dir)
+        load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    masks, _ = index.device_masks(len(vocab), args.device)
+    masks_time = time.perf_counter() - start
+
+    processor = ConstrainedLogitsProcessor(index, [8] * args.batch_size)
+    indexed_time = run_steps(processor, args.batch_size, len(vocab),
+                             args.num_steps, args.device)
+    scan = VocabScanProcessor(RegexFSM(pattern), vocab, eos_token_id,
+                              [8] * args.scan_rows)
+    scan_time = run_steps(scan, args.scan_rows, len(vocab), 4,
+                          args.device) * args.batch_size / args.scan_rows
+
+    print(f'[BENCHMARK] batch_size {args.batch_size} vocab_size {len(vocab)} '
+          f'states {index.num_states} distinct_masks {len(masks)} '
+          f'device {args.device}')
+    print(f'index: build(s) {build_time:.2f} cached_load(s) {load_time:.3f} '
+          f'device_masks(s) {masks_time:.3f}')
+    print(f'vocab scan: per_step(ms) {scan_time * 1e3:.1f} '
+          f'(extrapolated from {args.scan_rows} rows)')
+    print(f'indexed:    per_step(ms) {indexed_time * 1e3:.3f} '
+          f'speedup {scan_time / indexed_time:.0f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Host cost of detokenizing streamed completions.
+
+Streams --output_len tokens for --num_requests concurrent requests, one token
+per request and step as the inflight batcher does. Compares the previous
+AsyncLLMEngine.generate, which decoded the prompt and all the generated tokens
+on every step, with the IncrementalDetokenizer.
+"""
+import random
+import time
+from argparse import ArgumentParser
+
+from tensorrt_llm.hlapi.detokenizer import IncrementalDetokenizer
+
+
+class ByteTokenizer(object):
+    """
+    Stand-in tokenizer when no --tokenizer_dir is given, one id per byte.
+    """
+
+    def encode(self, text):
+        return list(text.encode())
+
+    def decode(self, token_ids):
+        return bytes(token_ids).decode(errors='replace')
+
+
+class PreviousDetokenizer(object):
+
+    def __init__(self, tokenizer, prompt_token_ids):
+        self.tokenizer = tokenizer
+        self.current_tokens = list(prompt_token_ids)
+        self.current_str = tokenizer.decode(self.current_tokens)
+
+    def decode(self, new_token_ids):
+        self.current_tokens += new_token_ids
+        new_str = self.tokenizer.decode(self.current_tokens)
+        diff_str = new_str[len(self.current_str):]
+        self.current_str = new_str
+        return diff_str
+
+    def flush(self):
+        return ''
+
+
+def stream(detokenizers, outputs):
+    texts = [[] for _ in detokenizers]
+    start = time.perf_counter()
+    for step in range(max(len(output) for output in outputs)):
+        for text, detokenizer, output in zip(texts, detokenizers, outputs):
+            if step < len(output):
+                text.append(detokenizer.decode(output[step:step + 1]))
+    for text, detokenizer in zip(texts, detokenizers):
+        text.append(detokenizer.flush())
+    return time.perf_counter() - start, [''.join(text) for text in texts]
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--num_requests', type=int, default=100)
+    parser.add_argument('--input_len', type=int, default=128)
+    parser.add_argument('--output_len', type=int, default=4096)
+    parser.add_argument('--tokenizer_dir',
+                        type=str,
+                        default=None,
+                        help='HF tokenizer, a byte tokenizer by default')
+    args = parser.parse_args()
+
+    if args.tokenizer_dir is not None:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer_dir)
+    else:
+        tokenizer = ByteTokenizer()
+
+    random.seed(0)
+    words = ['the', 'stream', 'of', 'tokens', 'naïve', '日本語', '🙂', '42']
+
+    def sample_tokens(length):
+        # Whole words only, so that a prompt does not end in the middle of a
+        # character
+        token_ids = []
+        while len(token_ids) < length:
+            token_ids += tokenizer.encode(' ' + random.choice(words))
+        return token_ids
+
+    prompts = [sample_tokens(args.input_len) for _ in range(args.num_requests)]
+    outputs = [sample_tokens(args.output_len) for _ in range(args.num_requests)]
+    references = [
+        tokenizer.decode(prompt + output)[len(tokenizer.decode(prompt)):]
+        for prompt, output in zip(prompts, outputs)
+    ]
+
+    previous_time, previous = stream(
+        [PreviousDetokenizer(tokenizer, prompt) for prompt in prompts], outputs)
+    incremental_time, incremental = stream(
+        [IncrementalDetokenizer(tokenizer, prompt) for prompt in prompts],
+        outputs)
+    assert incremental == references
+    # Diffing the strings emits the replacement characters of the
+    # incomplete multi-byte characters
+    num_corrupted = sum(text != reference
+                        for text, reference in zip(previous, references))
+
+    num_tokens = args.num_requests * args.output_len
+    print(f'[BENCHMARK] num_requests {args.num_requests} '
+          f'input_len {args.input_len} output_len {args.output_len}')
+    print(f'previous:    total(s) {previous_time:.3f} '
+          f'per_token(us) {previous_time / num_tokens * 1e6:.2f} '
+          f'corrupted_streams {num_corrupted}')
+    print(f'incremental: total(s) {incremental_time:.3f} '
+          f'per_token(us) {incremental_time / num_tokens * 1e6:.2f} '
+          f'speedup {previous_time / incremental_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Micro-benchmark of the host-side bookkeeping of the Python paged KV cache.
+
+Measures the per-step cost of KVCacheManager.step + get_pointer_arrays, as
+called by GenerationSession for every generated token, and compares it with
+the previous list based BlocksManager. The memory pools live on the host,
+since only their addresses are used.
+"""
+import time
+from argparse import ArgumentParser
+from collections import defaultdict
+
+import torch
+
+from tensorrt_llm.runtime.kv_cache_manager import (Block, GenerationSequence,
+                                                   KVCacheManager)
+
+
+class ListBlocksManager(object):
+    """
+    The previous BlocksManager: one Block object per block, a Python list of
+    free blocks and a nested list pointer array rebuilt on every call.
+    """
+    _sizeof = {
+        torch.float32: 4,
+        torch.float16: 2,
+        torch.bfloat16: 2,
+        torch.int8: 1
+    }
+
+    def __init__(self, memory_pools, blocks, max_blocks_per_seq, beam_width):
+        self.max_blocks_per_seq = max_blocks_per_seq
+        self.blocks = blocks
+        self.beam_width = beam_width
+
+        self.free_blocks = []
+        for bi in range(blocks):
+            k_ptrs = []
+            v_ptrs = []
+            for pool in memory_pools:
+                elts_per_block = pool.nelement() // (2 * blocks)
+                block_bytes = elts_per_block * self._sizeof[pool.dtype]
+                k_ptrs.append(pool.data_ptr() + bi * block_bytes)
+                v_ptrs.append(k_ptrs[-1] + blocks * block_bytes)
+            self.free_blocks.append(Block(bi, k_ptrs, v_ptrs))
+
+        self.allocated_blocks = defaultdict(
+            lambda: [[] for _ in range(self.beam_width)])
+
+    def allocate(self, owner, share_across_beam=False):
+        block = None
+        for bi in range(self.beam_width):
+            if not self.free_blocks:
+                raise RuntimeError("Can't allocate new block for KV cache")
+            if block is None or not share_across_beam:
+                block = self.free_blocks.pop(0)
+            block.add_link()
+            self.allocated_blocks[owner][bi].append(block)
+
+    def replace_shared_block(self, owner, block_idx):
+        if not self.allocated_blocks[owner][0][block_idx].is_shared():
+            return
+        for bi in range(self.beam_width):
+            block = self.allocated_blocks[owner][bi][block_idx]
+            block.remove_link()
+            if not block.has_link():
+                self.free_blocks.append(block)
+        for bi in range(self.beam_width):
+            block = self.free_blocks.pop(0)
+            block.add_link()
+            self.allocated_blocks[owner][bi][block_idx] = block
+
+    def free(self, owner):
+        for bi in range(self.beam_width):
+            for block in self.allocated_blocks[owner][bi]:
+                block.remove_link()
+                if not block.has_link():
+                    self.free_blocks.append(block)
+        self.allocated_blocks.pop(owner)
+
+    def get_pointer_array(self, pool_idx, beam_width):
+        pointer_array = [[[[0] * self.max_blocks_per_seq for _ in range(2)]
+                          for _ in range(beam_width)]
+                         for _ in range(len(self.allocated_blocks))]
+        for owner, beams_blocks in self.allocated_blocks.items():
+            for bi in range(beam_width):
+                for block_linear_idx, block in enumerate(beams_blocks[bi]):
+                    pointer_array[owner.get_batch_idx(
+                    )][bi][0][block_linear_idx] = block.get_k_ptr(pool_idx)
+                    pointer_array[owner.get_batch_idx(
+                    )][bi][1][block_linear_idx] = block.get_v_ptr(pool_idx)
+        return torch.tensor(pointer_array, dtype=torch.int64)
+
+
+class ListKVCacheManager(KVCacheManager):
+    """
+    KVCacheManager driving ListBlocksManager with the previous per-sequence
+    step loop.
+    """
+
+    def __init__(self, memory_pools, blocks, tokens_per_block,
+                 max_blocks_per_seq, max_attention_window_size, sink_token_len,
+                 beam_width):
+        super().__init__(memory_pools, blocks, tokens_per_block,
+                         max_blocks_per_seq, max_attention_window_size,
+                         sink_token_len, beam_width)
+        self.blocks_manager = ListBlocksManager(memory_pools, blocks,
+                                                max_blocks_per_seq, beam_width)
+        self.lens = []
+
+    def step(self, finished):
+        cyclic_token_num = self.max_token_num - self.sink_block_token_num
+        for seq in self.sequences:
+            batch_idx = seq.get_batch_idx()
+            next_token_idx_in_cache = self.sink_block_token_num + \
+                (self.lens[batch_idx] - self.sink_block_token_num) % cyclic_token_num
+            if not finished[batch_idx] and (
+                    next_token_idx_in_cache % self.tokens_per_block == 0 or
+                (next_token_idx_in_cache - self.sink_block_token_num) %
+                    cyclic_token_num == 0):
+                if self.lens[batch_idx] < self.max_token_num:
+                    self.blocks_manager.allocate(seq)
+                elif self.beam_width > 1:
+                    self.blocks_manager.replace_shared_block(
+                        seq, next_token_idx_in_cache // self.tokens_per_block)
+            self.lens[batch_idx] += 1
+
+        for fi in range(len(finished)):
+            if finished[fi]:
+                self.blocks_manager.free(self.sequences[fi])
+        self.lens = [l for l, f in zip(self.lens, finished) if not f]
+        new_sequences = []
+        for seq, finish in zip(self.sequences, finished):
+            if not finish:
+                seq.batch_idx = len(new_sequences)
+                new_sequences.append(seq)
+        self.sequences = new_sequences
+
+    def add_sequence(self, sequence, context_len):
+        super().add_sequence(sequence, context_len)
+        self.lens = [int(l) for l in self.lens]
+
+    def get_pointer_arrays(self, beam_width):
+        return [
+            self.blocks_manager.get_pointer_array(pool, beam_width)
+            for pool in range(self.num_pools)
+        ]
+
+
+def run(manager_cls, memory_pools, blocks, max_blocks_per_seq, args):
+    start = time.perf_counter()
+    manager = manager_cls(memory_pools, blocks, args.tokens_per_block,
+                          max_blocks_per_seq,
+                          max_blocks_per_seq * args.tokens_per_block, 0,
+                          args.beam_width)
+    for bi in range(args.batch_size):
+        manager.add_sequence(GenerationSequence(seq_idx=bi, batch_idx=bi),
+                             args.input_len)
+    pointers = manager.get_pointer_arrays(1)
+    setup_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(args.output_len - 1):
+        manager.step([False] * args.batch_size)
+        pointers = manager.get_pointer_arrays(args.beam_width)
+    step_time = (time.perf_counter() - start) / (args.output_len - 1)
+    manager.step([True] * args.batch_size)
+    return setup_time, step_time, pointers
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--batch_size', type=int, default=256)
+    parser.add_argument('--beam_width', type=int, default=1)
+    parser.add_argument('--input_len', type=int, default=1024)
+    parser.add_argument('--output_len', type=int, default=256)
+    parser.add_argument('--tokens_per_block', type=int, default=64)
+    parser.add_argument('--num_layers',
+                        type=int,
+                        default=32,
+                        help='Number of memory pools')
+    args = parser.parse_args()
+
+    max_blocks_per_seq = -(-(args.input_len + args.output_len) //
+                           args.tokens_per_block)
+    blocks = args.batch_size * args.beam_width * max_blocks_per_seq
+    # Only the addresses of the pools are used, one element per block is enough
+    memory_pools = [
+        torch.zeros(2, blocks, dtype=torch.float16)
+        for _ in range(args.num_layers)
+    ]
+
+    list_setup, list_step, list_pointers = run(ListKVCacheManager, memory_pools,
+                                               blocks, max_blocks_per_seq, args)
+    setup, step, pointers = run(KVCacheManager, memory_pools, blocks,
+                                max_blocks_per_seq, args)
+
+    # Both allocators hand out blocks in the same order
+    for list_arr, arr in zip(list_pointers, pointers):
+        assert torch.equal(list_arr, arr)
+
+    print(f'[BENCHMARK] batch_size {args.batch_size} '
+          f'beam_width {args.beam_width} input_len {args.input_len} '
+          f'output_len {args.output_len} '
+          f'tokens_per_block {args.tokens_per_block} '
+          f'num_layers {args.num_layers}')
+    print(f'list allocator:  setup(ms) {list_setup * 1e3:.3f} '
+          f'per_step(ms) {list_step * 1e3:.3f}')
+    print(f'array allocator: setup(ms) {setup * 1e3:.3f} '
+          f'per_step(ms) {step * 1e3:.3f}')
+    print(f'per-step speedup {list_step / step:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -12,14 +12,72 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import json
+import os
+import time
 from multiprocessing import Event, Process, Queue
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import torch
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
 from tensorrt_llm.logger import logger
-from tensorrt_llm.profiler import (MemUnitType, bytes_to_target_unit,
-                                   device_memory_info)
+from tensorrt_llm.profiler import (MemUnitType, PyNVMLContext,
+                                   bytes_to_target_unit, device_memory_info)
+
+
+class MemorySample(NamedTuple):
+    time: float
+    # The RSS of the benchmark process and of its children, by pid
+    host: Dict[int, int]
+    device: int
+
+
+def _host_memory(pid: int, monitor_pid: int) -> Dict[int, int]:
+    if psutil is None:
+        return {}
+    try:
+        process = psutil.Process(pid)
+        processes = [process] + process.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return {}
+    rss = {}
+    for p in processes:
+        if p.pid == monitor_pid:
+            continue
+        try:
+            rss[p.pid] = p.memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            # Exited since listed
+            continue
+    return rss
+
+
+def _sample_memory_usage(pid, device, query_interval, signal_event,
+                         timeline_queue):
+    monitor_pid = os.getpid()
+    timeline = []
+    with PyNVMLContext():
+        while True:
+            used = device_memory_info(device)[0] if device is not None else 0
+            timeline.append((time.time(), _host_memory(pid, monitor_pid), used))
+            # Sleeps for the interval, woken up by stop()
+            if signal_event.wait(query_interval):
+                break
+    timeline_queue.put(timeline)
 
 
 class MemoryMonitor:
+    '''
+    Samples the host RSS of the benchmark process and its workers, and the
+    used memory of the device, every query_interval seconds in a subprocess.
+    The timeline gives the peaks, and is exported as a Chrome trace along the
+    profiler.Timer spans and the BenchmarkProfiler events.
+    '''
 
     def __init__(self, query_interval=0.1):
         self.query_interval = query_interval  # second(s)
@@ -27,42 +85,116 @@ class MemoryMonitor:
         # bytes
         self._peak_host_memory = 0
         self._peak_device_memory = 0
+        self._timeline = []
+        self._start_time = None
 
-        self.device_handles = {}
+        # Resolved here, the monitor subprocess does not create a CUDA context
+        self.device = torch.cuda.current_device() if torch.cuda.is_available(
+        ) else None
 
         self.signal_event = Event()  # Sending signal to subprocess
-        self.peak_mem_queue = Queue()  # Receiving results from subprocess
+        self.timeline_queue = Queue()  # Receiving results from subprocess
 
     def start(self):
-        self.mem_monitor_process = Process(target=self._upd_peak_memory_usage,
-                                           args=(self.signal_event,
-                                                 self.peak_mem_queue))
+        self.signal_event.clear()
+        if self._start_time is None:
+            # The origin of the timeline
+            self._start_time = time.time()
+        # A daemon, an exception of the benchmark must not leave it waiting
+        # for the event at exit
+        self.mem_monitor_process = Process(
+            target=_sample_memory_usage,
+            args=(os.getpid(), self.device, self.query_interval,
+                  self.signal_event, self.timeline_queue),
+            daemon=True)
         self.mem_monitor_process.start()
         logger.debug("Launched memory monitor subprocess.")
 
     def kill(self):
         if self.mem_monitor_process is not None:
             self.mem_monitor_process.kill()
+            self.mem_monitor_process = None
             logger.debug("Memory monitor subprocess is killed.")
 
     def stop(self):
         self.signal_event.set()
         logger.debug("Sent signal to stop memory monitor subprocess.")
 
-        self._peak_device_memory = max(self._peak_device_memory,
-                                       self.peak_mem_queue.get())
+        timeline = [MemorySample(*s) for s in self.timeline_queue.get()]
+        self._timeline.extend(timeline)
+        for sample in timeline:
+            self._peak_host_memory = max(self._peak_host_memory,
+                                         sum(sample.host.values()))
+            self._peak_device_memory = max(self._peak_device_memory,
+                                           sample.device)
 
         self.mem_monitor_process.join()
         self.mem_monitor_process = None
         logger.debug("Memory monitor subprocess joined.")
 
-    def _upd_peak_memory_usage(self, signal_event, peak_mem_queue):
-        peak_used, _, _ = device_memory_info()
-        while not signal_event.is_set():
-            used, _, _ = device_memory_info()
-            peak_used = max(used, peak_used)
-        peak_mem_queue.put(peak_used)
-
     def get_peak_memory_usage(self, unit: MemUnitType = 'GiB'):
         return bytes_to_target_unit(self._peak_host_memory, unit), \
             bytes_to_target_unit(self._peak_device_memory, unit)
+
+    def timeline(self) -> List[MemorySample]:
+        return list(self._timeline)
+
+    def export_chrome_trace(self,
+                            path: str,
+                            spans: Optional[List[Tuple[str, float,
+                                                       float]]] = None,
+                            events: Optional[List[Tuple[str, float]]] = None,
+                            unit: MemUnitType = 'MiB'):
+        '''
+        Writes the timeline as a Chrome trace, for chrome://tracing or
+        Perfetto: the memory counters, the (tag, start, stop) spans of
+        profiler.spans() and the (name, time) events of
+        BenchmarkProfiler.event_times, the times being time.time() values.
+        '''
+        start_time = self._start_time or 0.0
+
+        def ts(t):
+            return round((t - start_time) * 1e6, 1)
+
+        trace = []
+        for sample in self._timeline:
+            trace.append({
+                'name': f'host RSS ({unit})',
+                'ph': 'C',
+                'ts': ts(sample.time),
+                'pid': 0,
+                'args': {
+                    f'pid {pid}': round(bytes_to_target_unit(rss, unit), 3)
+                    for pid, rss in sample.host.items()
+                },
+            })
+            trace.append({
+                'name': f'device memory ({unit})',
+                'ph': 'C',
+                'ts': ts(sample.time),
+                'pid': 0,
+                'args': {
+                    'used': round(bytes_to_target_unit(sample.device, unit), 3)
+                },
+            })
+        for tag, start, stop in spans or []:
+            trace.append({
+                'name': tag,
+                'ph': 'X',
+                'ts': ts(start),
+                'dur': round((stop - start) * 1e6, 1),
+                'pid': 0,
+                'tid': 'profiler',
+            })
+        for name, t in events or []:
+            trace.append({
+                'name': name,
+                'ph': 'i',
+                'ts': ts(t),
+                'pid': 0,
+                'tid': 'benchmark',
+                's': 't',
+            })
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+        logger.info(f'Memory timeline written to {path}')
@@ -0,0 +1,135 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Host throughput of the weight quantization of the checkpoint converters, in GB/s
+of the fp16 weights.
+
+Compares the previous groupwise quantization of the AWQ converters, which
+expanded the scales to the shape of the weights, and the previous unpacking of
+the GPTQ weights, to tensorrt_llm.quantization.weight_quant, layer by layer
+then over a thread pool. The interleaving of the plugin library, common to
+both, is not measured.
+"""
+import time
+from argparse import ArgumentParser
+
+import torch
+
+from tensorrt_llm.quantization.weight_quant import (groupwise_scales, pack_int4,
+                                                    parallel_map,
+                                                    per_channel_scales,
+                                                    quantize, unpack_int4)
+
+
+def previous_awq_scale(weight, group_size):
+    [k, n] = weight.shape
+    weight_t = weight.T.contiguous()
+    weight_t = weight_t.reshape(n, k // group_size, group_size)
+    weight_t = torch.abs(weight_t.reshape(-1, group_size))
+    amax, idx = weight_t.max(1)
+    amax = amax.reshape(n, k // group_size).T.contiguous()
+    return amax / 8
+
+
+def previous_awq_quantize(weight, scale, group_size):
+    weight = weight / scale.repeat_interleave(group_size, dim=0)
+    qweight_int8 = torch.clamp(torch.round(weight).char(), -8, 7)
+    # pack_int8_tensor_to_packed_int4
+    return (qweight_int8[:, 1::2] << 4) | (qweight_int8[:, ::2] & 0x0F)
+
+
+def previous_unpack_int32_into_int8(w_packed):
+    w_packed_int4x2 = w_packed.contiguous().view(torch.uint8)
+    w_unpacked = torch.zeros(w_packed_int4x2.shape[0],
+                             w_packed_int4x2.shape[1] * 2,
+                             dtype=torch.int8)
+    w_unpacked[:, ::2] = w_packed_int4x2 % 16
+    w_unpacked[:, 1::2] = w_packed_int4x2 // 16
+    return w_unpacked.contiguous()
+
+
+def timeit(fn, iters):
+    fn()
+    start = time.perf_counter()
+    for _ in range(iters):
+        fn()
+    return (time.perf_counter() - start) / iters
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--hidden_size', type=int, default=4096)
+    parser.add_argument('--intermediate_size', type=int, default=11008)
+    parser.add_argument('--num_layers', type=int, default=4)
+    parser.add_argument('--group_size', type=int, default=128)
+    parser.add_argument('--workers',
+                        type=int,
+                        default=None,
+                        help='Threads of the pool, the number of CPUs by '
+                        'default')
+    parser.add_argument('--iters', type=int, default=3)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    shapes = [(args.hidden_size, 3 * args.hidden_size),
+              (args.hidden_size, args.hidden_size),
+              (args.hidden_size, args.intermediate_size),
+              (args.intermediate_size, args.hidden_size)]
+    weights = [
+        torch.randn(shape, dtype=torch.float16) for _ in range(args.num_layers)
+        for shape in shapes
+    ]
+    nbytes = sum(weight.nbytes for weight in weights)
+    group_size = args.group_size
+
+    def awq(weight):
+        scale, _ = groupwise_scales(weight, group_size)
+        return pack_int4(quantize(weight, scale, 4, group_size=group_size))
+
+    def previous_awq(weight):
+        scale = previous_awq_scale(weight, group_size)
+        return previous_awq_quantize(weight, scale, group_size)
+
+    def int8(weight):
+        return quantize(weight, per_channel_scales(weight))
+
+    packed = [awq(weight).view(torch.int32) for weight in weights]
+
+    cases = [
+        ('int8 per channel', lambda: [int8(w) for w in weights],
+         lambda: parallel_map(int8, weights, args.workers)),
+        ('int4 groupwise', lambda: [previous_awq(w) for w in weights],
+         lambda: [awq(w) for w in weights],
+         lambda: parallel_map(awq, weights, args.workers)),
+        ('int4 unpack',
+         lambda: [previous_unpack_int32_into_int8(p)
+                  for p in packed], lambda: [unpack_int4(p) for p in packed],
+         lambda: parallel_map(unpack_int4, packed, args.workers)),
+    ]
+    print(f'[BENCHMARK] num_layers {args.num_layers} hidden_size '
+          f'{args.hidden_size} intermediate_size {args.intermediate_size} '
+          f'weights(GB) {nbytes / 1e9:.2f}')
+    for name, *fns in cases:
+        labels = ['serial', 'threaded'] if len(fns) == 2 else \
+            ['previous', 'serial', 'threaded']
+        results = []
+        for label, fn in zip(labels, fns):
+            throughput = nbytes / timeit(fn, args.iters) / 1e9
+            results.append(f'{label}(GB/s) {throughput:.2f}')
+        print(f'{name:<18} ' + ' '.join(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Host cost of preparing the inputs of the context and generation steps.
+
+Compares the previous GenerationSession preparation, one arange per sequence
+for the packed positions, a loop over the batch for ChatGLM and a concatenated
+attention mask every step without the GPT attention plugin, with the
+StepInputBuilder. Runs on the CPU by default.
+"""
+import time
+from argparse import ArgumentParser
+
+import torch
+
+from tensorrt_llm.runtime.step_inputs import StepInputBuilder
+
+
+def previous_packed_position_ids(host_context_lengths, device):
+    return torch.concat([
+        torch.arange(0,
+                     host_context_lengths[i],
+                     dtype=torch.int32,
+                     device=device) for i in range(len(host_context_lengths))
+    ])
+
+
+def previous_glm_position_ids(context_lengths, device):
+    batch_size = len(context_lengths)
+    input_lengths_acc = torch.cumsum(torch.cat(
+        [torch.IntTensor([0]).to(device), context_lengths], dim=0),
+                                     dim=0)
+    position_ids = torch.zeros([1, 2, input_lengths_acc[-1]], dtype=torch.int32)
+    for i in range(batch_size):
+        position_ids[
+            0, 0, input_lengths_acc[i]:input_lengths_acc[i + 1]] = torch.arange(
+                0, context_lengths[i], dtype=torch.int32)
+        position_ids[0, 0,
+                     input_lengths_acc[i + 1] - 1] = context_lengths[i] - 2
+        position_ids[0, 1, input_lengths_acc[i + 1] - 1] = 1
+    return position_ids.int().to(device)
+
+
+def previous_generation(attention_mask, num_steps):
+    rows = attention_mask.shape[0]
+    for _ in range(num_steps):
+        attention_mask = torch.cat(
+            (attention_mask, attention_mask.new_ones(
+                (rows, 1))), dim=-1).contiguous()
+        position_ids = attention_mask.long().cumsum(-1) - 1
+        position_ids.masked_fill_(attention_mask == 0, 1)
+        position_ids = position_ids[:, -1].unsqueeze(-1).int()
+    return attention_mask, position_ids
+
+
+def builder_generation(builder, attention_mask, context_lengths, num_steps):
+    for step in range(num_steps):
+        inputs = builder.generation_inputs(len(context_lengths),
+                                           context_lengths,
+                                           use_gpt_attention_plugin=False,
+                                           remove_input_padding=False,
+                                           step=step,
+                                           attention_mask=attention_mask,
+                                           max_new_tokens=num_steps)
+        attention_mask = inputs['attention_mask']
+    return attention_mask, inputs['position_ids']
+
+
+def timeit(fn, iters, device):
+    fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(iters):
+        result = fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / iters, result
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--batch_size', type=int, default=64)
+    parser.add_argument('--input_len', type=int, default=512)
+    parser.add_argument('--output_len', type=int, default=128)
+    parser.add_argument('--device', type=str, default='cpu')
+    parser.add_argument('--iters', type=int, default=20)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    torch.manual_seed(0)
+    host_context_lengths = torch.randint(args.input_len // 2,
+                                         args.input_len + 1,
+                                         (args.batch_size, ),
+                                         dtype=torch.int32)
+    context_lengths = host_context_lengths.to(device)
+    builder = StepInputBuilder(device)
+
+    previous_time, previous = timeit(
+        lambda: previous_packed_position_ids(host_context_lengths, device),
+        args.iters, device)
+    builder_time, current = timeit(
+        lambda: builder.context_inputs(args.batch_size,
+                                       context_lengths,
+                                       host_context_lengths,
+                                       use_gpt_attention_plugin=True,
+                                       remove_input_padding=True)[
+                                           'position_ids'], args.iters, device)
+    assert torch.equal(previous, current)
+    print(f'[BENCHMARK] batch_size {args.batch_size} '
+          f'input_len {args.input_len} output_len {args.output_len} '
+          f'device {device}')
+    print(f'packed positions: previous(ms) {previous_time * 1e3:.3f} '
+          f'builder(ms) {builder_time * 1e3:.3f} '
+          f'speedup {previous_time / builder_time:.1f}x')
+
+    previous_time, previous = timeit(
+        lambda: previous_glm_position_ids(context_lengths, device), args.iters,
+        device)
+    builder_time, current = timeit(
+        lambda: builder.glm_context_position_ids(args.batch_size,
+                                                 context_lengths,
+                                                 host_context_lengths,
+                                                 args.input_len,
+                                                 remove_input_padding=True),
+        args.iters, device)
+    assert torch.equal(previous, current)
+    print(f'ChatGLM positions: previous(ms) {previous_time * 1e3:.3f} '
+          f'builder(ms) {builder_time * 1e3:.3f} '
+          f'speedup {previous_time / builder_time:.1f}x')
+
+    # Left padded, without the GPT attention plugin
+    columns = torch.arange(args.input_len, device=device)
+    attention_mask = (columns >=
+                      args.input_len - context_lengths.unsqueeze(-1)).int()
+    previous_time, previous = timeit(
+        lambda: previous_generation(attention_mask, args.output_len),
+        args.iters, device)
+    builder_time, current = timeit(
+        lambda: builder_generation(builder, attention_mask, context_lengths,
+                                   args.output_len), args.iters, device)
+    assert all(torch.equal(p, c) for p, c in zip(previous, current))
+    print(f'attention mask: previous per_step(ms) '
+          f'{previous_time / args.output_len * 1e3:.3f} '
+          f'builder per_step(ms) {builder_time / args.output_len * 1e3:.3f} '
+          f'speedup {previous_time / builder_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Per-batch cost of encoding the stop words lists of a batch.
+
+Compares the previous to_word_list_format, which tokenized every word of every
+batch item on every call, with the memoizing WordListEncoder. The requests
+pick their stop words among a few phrases, as in a deployment.
+"""
+import csv
+import random
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from tensorrt_llm.runtime.word_list import WordListEncoder, to_word_list_format
+
+
+def previous_to_word_list_format(word_dict,
+                                 tokenizer,
+                                 add_special_tokens=False):
+    flat_ids = []
+    offsets = []
+    for word_dict_item in word_dict:
+        item_flat_ids = []
+        item_offsets = []
+
+        if isinstance(word_dict_item[0], bytes):
+            word_dict_item = [word_dict_item[0].decode()]
+
+        words = list(csv.reader(word_dict_item))[0]
+        for word in words:
+            ids = tokenizer.encode(word, add_special_tokens=add_special_tokens)
+
+            if len(ids) == 0:
+                continue
+
+            item_flat_ids += ids
+            item_offsets.append(len(ids))
+
+        flat_ids.append(np.array(item_flat_ids))
+        offsets.append(np.cumsum(np.array(item_offsets)))
+
+    pad_to = max(1, max(len(ids) for ids in flat_ids))
+
+    for i, (ids, offs) in enumerate(zip(flat_ids, offsets)):
+        flat_ids[i] = np.pad(ids, (0, pad_to - len(ids)), constant_values=0)
+        offsets[i] = np.pad(offs, (0, pad_to - len(offs)), constant_values=-1)
+
+    return np.array([flat_ids, offsets], dtype="int32").transpose((1, 0, 2))
+
+
+class ByteTokenizer(object):
+    """
+    Stand-in tokenizer when no --tokenizer_dir is given, one id per byte.
+    """
+
+    def encode(self, text, add_special_tokens=False):
+        return list(text.encode())
+
+
+def timeit(fn, iters):
+    fn()
+    start = time.perf_counter()
+    for _ in range(iters):
+        result = fn()
+    return (time.perf_counter() - start) / iters, result
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--batch_size', type=int, default=256)
+    parser.add_argument('--num_phrases',
+                        type=int,
+                        default=8,
+                        help='Number of distinct stop words lists')
+    parser.add_argument('--iters', type=int, default=50)
+    parser.add_argument('--tokenizer_dir',
+                        type=str,
+                        default=None,
+                        help='HF tokenizer, a byte tokenizer by default')
+    args = parser.parse_args()
+
+    if args.tokenizer_dir is not None:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer_dir)
+    else:
+        tokenizer = ByteTokenizer()
+
+    random.seed(0)
+    phrases = [
+        ','.join(f' Stop sequence {i} {j}' for j in range(random.randint(1, 4)))
+        for i in range(args.num_phrases)
+    ]
+    word_dict = [[random.choice(phrases)] for _ in range(args.batch_size)]
+    pretokenized = [[
+        tokenizer.encode(word) for word in list(csv.reader(item))[0]
+    ] for item in word_dict]
+
+    previous_time, previous = timeit(
+        lambda: previous_to_word_list_format(word_dict, tokenizer), args.iters)
+    cached_time, cached = timeit(
+        lambda: to_word_list_format(word_dict, tokenizer), args.iters)
+    encoder = WordListEncoder()
+    ids_time, from_ids = timeit(lambda: encoder.encode(pretokenized),
+                                args.iters)
+    assert np.array_equal(previous, cached)
+    assert np.array_equal(previous, from_ids)
+
+    print(f'[BENCHMARK] batch_size {args.batch_size} '
+          f'num_phrases {args.num_phrases} shape {list(cached.shape)}')
+    print(f'previous:     per_batch(ms) {previous_time * 1e3:.3f}')
+    print(f'cached:       per_batch(ms) {cached_time * 1e3:.3f} '
+          f'speedup {previous_time / cached_time:.1f}x')
+    print(f'pre-tokenized: per_batch(ms) {ids_time * 1e3:.3f} '
+          f'speedup {previous_time / ids_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
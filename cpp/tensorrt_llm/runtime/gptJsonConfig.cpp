@@ -19,9 +19,11 @@
 #include "tensorrt_llm/common/assert.h"
 #include "tensorrt_llm/common/stringUtils.h"
 
+#include <algorithm>
 #include <fstream>
 #include <nlohmann/json.hpp>
 #include <string_view>
+#include <vector>
 
 using namespace tensorrt_llm::runtime;
 namespace tc = tensorrt_llm::common;
@@ -171,6 +173,21 @@ GptJsonConfig parseJson(InputType&& i)
         auto const vocabSize = pretrainedConfig.at("vocab_size").template get<SizeType>();
         auto const numHiddenLayers = pretrainedConfig.at("num_hidden_layers").template get<SizeType>();
 
+        // The runtime gives every pipeline stage numHiddenLayers / ppSize layers
+        TLLM_CHECK_WITH_INFO(numHiddenLayers % ppSize == 0,
+            tc::fmtstr("The %d layers are not split evenly between the %d pipeline stages, which is not supported "
+                       "by the C++ runtime, use the Python session",
+                numHiddenLayers, ppSize));
+        if (mapping.contains("pp_partition") && !mapping.at("pp_partition").is_null())
+        {
+            auto const ppPartition = mapping.at("pp_partition").template get<std::vector<SizeType>>();
+            auto const evenPartition = std::all_of(ppPartition.begin(), ppPartition.end(),
+                [numHiddenLayers, ppSize](SizeType numLayers) { return numLayers == numHiddenLayers / ppSize; });
+            TLLM_CHECK_WITH_INFO(evenPartition,
+                "The engine has an uneven pp_partition, which is not supported by the C++ runtime, use the Python "
+                "session");
+        }
+
         auto dataType = nvinfer1::DataType::kFLOAT;
         if (!dtype.compare("float32"))
             dataType = nvinfer1::DataType::kFLOAT;
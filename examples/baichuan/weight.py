@@ -23,12 +23,16 @@ from safetensors import safe_open
 
 import tensorrt_llm
 import tensorrt_llm.logger as logger
-from tensorrt_llm._utils import (str_dtype_to_np, str_dtype_to_torch,
+from tensorrt_llm._utils import (numpy_to_dtype, str_dtype_to_torch,
                                  torch_to_numpy)
 from tensorrt_llm.mapping import Mapping
 from tensorrt_llm.models import BaichuanForCausalLM
 from tensorrt_llm.models.quantized.quant import get_dummy_quant_scales
 from tensorrt_llm.quantization import QuantMode
+from tensorrt_llm.quantization.weight_quant import (gptq_weights,
+                                                    preprocess_weights,
+                                                    quantize,
+                                                    symmetric_quantize)
 
 
 def get_scaling_factors(
@@ -196,11 +200,10 @@ def load_from_hf_baichuan(tensorrt_llm_baichuan,
                                           model_emb)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
                         torch.tensor(v), plugin_weight_only_quant_type)
                     if not use_gemm_woq_plugin:
-                        dst.value = torch.tensor(v).numpy().astype(
-                            str_dtype_to_np(dtype))
+                        dst.value = numpy_to_dtype(v, dtype)
                     else:
                         dst.value = processed_torch_weights.numpy()
                     scales = tensorrt_llm_baichuan.layers[
@@ -213,11 +216,10 @@ def load_from_hf_baichuan(tensorrt_llm_baichuan,
                 split_v = split(v, tensor_parallel, rank, dim=1)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
                         torch.tensor(v), plugin_weight_only_quant_type)
                     if not use_gemm_woq_plugin:
-                        dst.value = torch.tensor(v).numpy().astype(
-                            str_dtype_to_np(dtype))
+                        dst.value = numpy_to_dtype(v, dtype)
                     else:
                         dst.value = processed_torch_weights.numpy()
                     scales = tensorrt_llm_baichuan.layers[
@@ -230,11 +232,10 @@ def load_from_hf_baichuan(tensorrt_llm_baichuan,
                 split_v = split(v, tensor_parallel, rank, dim=0)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
                         torch.tensor(v), plugin_weight_only_quant_type)
                     if not use_gemm_woq_plugin:
-                        dst.value = torch.tensor(v).numpy().astype(
-                            str_dtype_to_np(dtype))
+                        dst.value = numpy_to_dtype(v, dtype)
                     else:
                         dst.value = processed_torch_weights.numpy()
                     scales = tensorrt_llm_baichuan.layers[
@@ -247,11 +248,10 @@ def load_from_hf_baichuan(tensorrt_llm_baichuan,
                 split_v = split(v, tensor_parallel, rank, dim=1)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
                         torch.tensor(v), plugin_weight_only_quant_type)
                     if not use_gemm_woq_plugin:
-                        dst.value = torch.tensor(v).numpy().astype(
-                            str_dtype_to_np(dtype))
+                        dst.value = numpy_to_dtype(v, dtype)
                     else:
                         dst.value = processed_torch_weights.numpy()
                     scales = tensorrt_llm_baichuan.layers[
@@ -264,11 +264,10 @@ def load_from_hf_baichuan(tensorrt_llm_baichuan,
                 split_v = split(v, tensor_parallel, rank, dim=0)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
                         torch.tensor(v), plugin_weight_only_quant_type)
                     if not use_gemm_woq_plugin:
-                        dst.value = torch.tensor(v).numpy().astype(
-                            str_dtype_to_np(dtype))
+                        dst.value = numpy_to_dtype(v, dtype)
                     else:
                         dst.value = processed_torch_weights.numpy()
                     scales = tensorrt_llm_baichuan.layers[
@@ -481,11 +480,10 @@ def load_from_binary(tensorrt_llm_baichuan: BaichuanForCausalLM,
                     rank=mapping.tp_rank,
                     is_qkv=True)
             elif use_weight_only:
-                processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                processed_torch_weights, torch_weight_scales = symmetric_quantize(
                     torch.tensor(t), plugin_weight_only_quant_type)
                 if not use_gemm_woq_plugin:
-                    dst.value = torch.tensor(t).numpy().astype(
-                        str_dtype_to_np(dtype))
+                    dst.value = numpy_to_dtype(t, dtype)
                 else:
                     dst.value = processed_torch_weights.numpy()
                 scales = tensorrt_llm_baichuan.layers[
@@ -512,11 +510,10 @@ def load_from_binary(tensorrt_llm_baichuan: BaichuanForCausalLM,
                          'model.layers.' + str(i) + '.attention.dense',
                          [1, n_embd // mapping.tp_size], mapping.tp_rank)
         elif use_weight_only:
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             if not use_gemm_woq_plugin:
-                dst.value = torch.tensor(t).numpy().astype(
-                    str_dtype_to_np(dtype))
+                dst.value = numpy_to_dtype(t, dtype)
             else:
                 dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_baichuan.layers[
@@ -548,11 +545,10 @@ def load_from_binary(tensorrt_llm_baichuan: BaichuanForCausalLM,
                 rank=mapping.tp_rank)
         elif use_weight_only:
             dst = tensorrt_llm_baichuan.layers[i].mlp.fc.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             if not use_gemm_woq_plugin:
-                dst.value = torch.tensor(t).numpy().astype(
-                    str_dtype_to_np(dtype))
+                dst.value = numpy_to_dtype(t, dtype)
             else:
                 dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_baichuan.layers[i].mlp.fc.per_channel_scale
@@ -580,11 +576,10 @@ def load_from_binary(tensorrt_llm_baichuan: BaichuanForCausalLM,
                 rank=mapping.tp_rank)
         elif use_weight_only:
             dst = tensorrt_llm_baichuan.layers[i].mlp.gate.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             if not use_gemm_woq_plugin:
-                dst.value = torch.tensor(t).numpy().astype(
-                    str_dtype_to_np(dtype))
+                dst.value = numpy_to_dtype(t, dtype)
             else:
                 dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_baichuan.layers[i].mlp.gate.per_channel_scale
@@ -612,11 +607,10 @@ def load_from_binary(tensorrt_llm_baichuan: BaichuanForCausalLM,
                          [1, inter_size // mapping.tp_size], mapping.tp_rank)
         elif use_weight_only:
             dst = tensorrt_llm_baichuan.layers[i].mlp.proj.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             if not use_gemm_woq_plugin:
-                dst.value = torch.tensor(t).numpy().astype(
-                    str_dtype_to_np(dtype))
+                dst.value = numpy_to_dtype(t, dtype)
             else:
                 dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_baichuan.layers[i].mlp.proj.per_channel_scale
@@ -689,8 +683,6 @@ def load_from_awq_baichuan(tensorrt_llm_baichuan: BaichuanForCausalLM,
     # Int8 KV cache
     use_int8_kv_cache = quant_mode.has_int8_kv_cache()
 
-    packer = torch.ops.fastertransformer.pack_int8_tensor_to_packed_int4
-    preprocessor = torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm
     torch_dtype = str_dtype_to_torch(dtype)
 
     def fromfile(dir_path, name, shape=None, dtype=None):
@@ -712,9 +704,8 @@ def load_from_awq_baichuan(tensorrt_llm_baichuan: BaichuanForCausalLM,
                        dim=dim)[mapping.tp_rank]
 
     def AWQ_quantize_pack_preprocess(weight, scale):
-        weight /= scale.repeat_interleave(group_size, dim=0)
-        qweight_int8 = torch.clamp(torch.round(weight.cuda()).char(), -8, 7)
-        int4_weight = preprocessor(packer(qweight_int8.cpu()), torch.quint4x2)
+        qweight_int8 = quantize(weight, scale, bits=4, group_size=group_size)
+        int4_weight = preprocess_weights(qweight_int8, torch.quint4x2)
         return int4_weight.view(torch.float16).cpu().numpy()
 
     def process_and_assign_weight(mOp, v, tp_dim=0):
@@ -916,8 +907,6 @@ def load_from_gptq_baichuan(tensorrt_llm_baichuan,
     ]
     split_sym = "."
 
-    packer = torch.ops.fastertransformer.pack_int8_tensor_to_packed_int4
-    preprocessor = torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm
     torch_dtype = str_dtype_to_torch(dtype)
 
     def load(key, no_prefix=0):
@@ -935,16 +924,6 @@ def load_from_gptq_baichuan(tensorrt_llm_baichuan,
         return v.split(v.shape[dim] // mapping.tp_size,
                        dim=dim)[mapping.tp_rank]
 
-    def unpack_int32_into_int8(w_packed):
-        # Unpack inputs packed in int32/float32 into uint4 and store them in int8 format
-        w_packed_int4x2 = w_packed.contiguous().view(torch.uint8)
-        w_unpacked = torch.zeros(w_packed_int4x2.shape[0],
-                                 w_packed_int4x2.shape[1] * 2,
-                                 dtype=torch.int8)
-        w_unpacked[:, ::2] = w_packed_int4x2 % 16
-        w_unpacked[:, 1::2] = w_packed_int4x2 // 16
-        return w_unpacked.contiguous()
-
     def process_and_assign_weight(mOp, v, tp_dim=-1):
         if tp_dim == -1:
             qweight_int32, qzeros_int32, scales_fp16 = [
@@ -955,28 +934,12 @@ def load_from_gptq_baichuan(tensorrt_llm_baichuan,
                 torch_split(item, tp_dim).cpu() for item in v
             ]
 
-        USE_UINT4_INPUT = 1  # Set to true if checkpoint store UINT4 weights
-        USE_GPTQ_FOR_LLAMA = 1  # GPTQ-for-LLaMA added 1 to zeros
-
-        qweight_unpacked_int8 = unpack_int32_into_int8(
-            qweight_int32.T).T.contiguous() - 8
-        qweight_interleaved = preprocessor(packer(qweight_unpacked_int8),
-                                           torch.quint4x2).view(torch.float16)
-        # zeros = zeros * scales
-        qzeros_unpacked_int32 = unpack_int32_into_int8(qzeros_int32)
-        if not USE_UINT4_INPUT:
-            # Correcting UINT4 values back to INT4 order
-            mask_negative = qzeros_unpacked_int32[qzeros_unpacked_int32 < 0]
-            mask_positive = qzeros_unpacked_int32[qzeros_unpacked_int32 >= 0]
-            qzeros_unpacked_int32 = qzeros_unpacked_int32 + 16 * mask_negative - 16 * mask_positive
-        zeros_x_scales_fp16 = (-qzeros_unpacked_int32 + 8 * USE_UINT4_INPUT -
-                               USE_GPTQ_FOR_LLAMA) * scales_fp16
-        zeros_x_scales_fp16 = zeros_x_scales_fp16.half()
-
         # return processed interleaved weight, original scales and zeros * scales
-        mOp.weight.value = qweight_interleaved.cpu().numpy()
-        mOp.weights_scaling_factor.value = scales_fp16.cpu().numpy()
-        mOp.zero.value = zeros_x_scales_fp16.cpu().numpy()
+        qweight_interleaved, scales_fp16, zeros_x_scales_fp16 = gptq_weights(
+            qweight_int32, qzeros_int32, scales_fp16)
+        mOp.weight.value = qweight_interleaved.view(torch.float16).numpy()
+        mOp.weights_scaling_factor.value = scales_fp16.numpy()
+        mOp.zero.value = zeros_x_scales_fp16.half().numpy()
 
     # Load weights from GPTQ checkpoint into TRT-LLM module
     # 1. vocab_embedding
@@ -1,26 +1,25 @@
 import argparse
-import functools
 import json
 import os
 import time
-from collections import defaultdict
 from pathlib import Path
-from typing import Any, Dict, Iterable, Optional, Union
+from typing import Any, Dict, Optional, Union
 
 import numpy as np
 import safetensors
 import torch
-import torch.nn as nn
-from tqdm import tqdm
 from transformers import BloomConfig, BloomForCausalLM, BloomTokenizerFast
 from transformers.models.bloom.modeling_bloom import BloomBlock
-from transformers.pytorch_utils import Conv1D
 
 # isort: off
 import tensorrt_llm
 from tensorrt_llm import logger
 from tensorrt_llm.quantization import QuantMode
-from tensorrt_llm.models.llama.utils import iterate_shard_files, load_state_dict  #TODO: move the utils to common dir shared by models
+from tensorrt_llm.models.bloom.convert import (bloom_weight_rules,
+                                               reorder_qkv_weight_or_bias)
+from tensorrt_llm.models.convert_utils import CheckpointConverter
+from tensorrt_llm.quantization.weight_quant import symmetric_quantize
+from tensorrt_llm.quantization.calibration import calibrate_activation_range
 # isort: on
 
 
@@ -83,49 +82,10 @@ def capture_activation_range(model,
                              dataset,
                              num_samples=512,
                              seq_len=512):
-    model.eval()
-    device = next(model.parameters()).device
-    act_scales = defaultdict(lambda: {"x": None, "y": None, "w": None})
-
-    def stat_tensor(name, tensor, act_scales, key):
-        hidden_dim = tensor.shape[-1]
-        tensor = tensor.view(-1, hidden_dim).abs().detach()
-        comming_max = torch.max(tensor, dim=0)[0].float()
-
-        if act_scales[name][key] is None:
-            act_scales[name][key] = comming_max
-        else:
-            act_scales[name][key] = torch.max(act_scales[name][key],
-                                              comming_max)
-
-    def stat_input_hook(m, x, y, name):
-        if isinstance(x, tuple):
-            x = x[0]
-        stat_tensor(name, x, act_scales, "x")
-        stat_tensor(name, y, act_scales, "y")
-
-        if act_scales[name]["w"] is None:
-            act_scales[name]["w"] = m.weight.abs().clip(1e-8,
-                                                        None).max(dim=1)[0]
-
-    hooks = []
-    for name, m in model.named_modules():
-        if isinstance(m, nn.Linear) or isinstance(m, Conv1D):
-            hooks.append(
-                m.register_forward_hook(
-                    functools.partial(stat_input_hook, name=name)))
-
-    for i in tqdm(range(num_samples), desc="calibrating model"):
-        input_ids = tokenizer(dataset[i]["text"],
-                              return_tensors="pt",
-                              max_length=seq_len,
-                              truncation=True).input_ids.to(device)
-        model(input_ids)
-
-    for h in hooks:
-        h.remove()
-
-    return act_scales
+    samples = (tokenizer(dataset[i]["text"],
+                         max_length=seq_len,
+                         truncation=True).input_ids for i in range(num_samples))
+    return calibrate_activation_range(model, samples)
 
 
 def reorder_torch_qkv_weight_or_bias(v, model, is_bias=False):
@@ -377,32 +337,6 @@ def split(v, tp_size, idx, dim=0):
         return torch.chunk(v, tp_size, dim=dim)[idx].clone()
 
 
-def reorder_qkv_weight_or_bias(v, n_head, n_hidden, is_bias=False):
-    """ Reorder the qkv weight.
-
-    Note that the shape of the fused QKV weights in HF is different from the
-    shape that TRT-LLM requires.
-       HF: (num_heads x 3 x head_dim, hidden_size)
-       TRT-LLM: (3 x num_heads x head_dim, hidden_size)
-    This is unlike to the other models in HF e.g. GPT where they have the
-    same shape with TRT-LLM, i.e., (3 x num_heads x head_dim, hidden_size). Also,
-    to split across attention heads in tensor parallel, we reshape the qkv
-        weight: (3, num_heads x head_dim, hidden).
-        bias  : (3, num_heads x head_dim).
-    """
-
-    head_dim = n_hidden // n_head
-
-    # (3 x hidden, ...) view as (num_heads, 3, head_dim, ...)
-    v = v.reshape(n_head, 3, head_dim, -1)
-    # permute to (3, num_heads, head_dim, ...)
-    v = v.transpose(0, 1)
-    # final shape: weight=(3, hidden, hidden) or bias=(3, hidden)
-    if is_bias:
-        return v.reshape(3, n_hidden)
-    return v.reshape(3, n_hidden, n_hidden)
-
-
 def split_qkv_tp(v, n_head, n_hidden, tensor_parallel, rank):
     """
     Splits the QKV matrix according to tensor parallelism
@@ -447,9 +381,8 @@ def get_tllm_linear_weight(weight,
     results = {}
     if use_weight_only:
         v = weight.cpu().t().contiguous()
-        processed_torch_weights, torch_weight_scales = \
-            torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                v, plugin_weight_only_quant_type)
+        processed_torch_weights, torch_weight_scales = symmetric_quantize(
+            v, plugin_weight_only_quant_type)
         results[prefix + 'weight'] = processed_torch_weights
         results[prefix + 'per_channel_scale'] = torch_weight_scales
     else:
@@ -461,32 +394,6 @@ def get_tllm_linear_weight(weight,
     return results
 
 
-def add_tllm_weight(
-        weights: Dict[str, torch.Tensor],
-        name: str,
-        param: torch.Tensor,
-        quant_mode: QuantMode = QuantMode(0),
-):
-    assert name not in weights, f'{name} is already added.'
-
-    if name.endswith('.weight') and quant_mode.is_weight_only():
-        if quant_mode.is_int8_weight_only():
-            quant_dtype = torch.int8
-        elif quant_mode.is_int4_weight_only():
-            quant_dtype = torch.quint4x2
-        else:
-            raise ValueError(
-                f'Invalid configuration, got quant_mode={quant_mode}')
-        processed_torch_weights, torch_weight_scales = \
-            torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                param.t().contiguous(), quant_dtype)
-        weights[name] = processed_torch_weights
-        scale_name = name.replace('.weight', '.per_channel_scale')
-        weights[scale_name] = torch_weight_scales
-    else:
-        weights[name] = param.contiguous()
-
-
 @torch.no_grad()
 def smooth_bloom_model(model, scales, alpha, bloom_qkv_param, bloom_smoother):
     # Smooth the activation and weights with smoother = $\diag{s}$
@@ -867,170 +774,54 @@ def convert_hf_bloom(hf_bloom,
     return weights
 
 
-def rename_hf_to_tllm(name: str):
-    """ Rename a HF parameter name by the corresponding TRT-LLM style name. """
-    if 'word_embeddings_layernorm.' in name:
-        name = name.replace('word_embeddings_layernorm', 'ln_embed')
-        if not name.startswith('transformer.'):
-            name = f'transformer.{name}'
-    elif 'word_embeddings.' in name:
-        name = name.replace('word_embeddings', 'embedding')
-    if name.startswith(('ln_embed.', 'embedding.', 'ln_f.')):
-        name = f'transformer.{name}'
-
-    # Parameter names in layers
-    if name.startswith(('transformer.h.', 'h.')):
-        import re
-        name = re.sub(r'^(transformer.h.|h.)', 'transformer.layers.', name, 1)
-    if 'post_attention_layernorm' in name:
-        name = name.replace('post_attention_layernorm', 'post_layernorm')
-    elif 'self_attention.query_key_value' in name:
-        name = name.replace('self_attention.query_key_value', 'attention.qkv')
-    elif 'self_attention.dense' in name:
-        name = name.replace('self_attention.dense', 'attention.dense')
-    elif 'mlp.dense_h_to_4h' in name:
-        name = name.replace('mlp.dense_h_to_4h', 'mlp.fc')
-    elif 'mlp.dense_4h_to_h' in name:
-        name = name.replace('mlp.dense_4h_to_h', 'mlp.proj')
-    return name
-
-
-def contain_any(name: str, words: Iterable[str]):
-    for word in words:
-        if word in name:
-            return True
-    return False
-
-
 def convert_from_hf_checkpoint(
     model_dir: Union[str, Path],
-    rank=0,
+    output_dir: Union[str, Path],
     tensor_parallel=1,
     dtype: Union[str, torch.dtype] = torch.float32,
     use_parallel_embedding: bool = False,
     sharding_dim: int = 0,
     share_embedding_table: bool = False,
-    use_weight_only: bool = False,
-    plugin_weight_only_quant_type: torch.dtype = torch.int8,
-    use_smooth_quant: bool = False,
-    bloom_qkv_param: Optional[Dict] = None,
-    act_range: Optional[Any] = None,
-    smoother: Optional[Any] = None,
-    per_channel: bool = False,
-    per_token: bool = False,
-    int8_kv_cache: bool = False,
+    plugin_weight_only_quant_type: Optional[torch.dtype] = None,
+    workers: int = 1,
 ):
+    """ Converts the HF checkpoint of all ranks in one pass over the shards. """
     logger.info('Loading weights from HF BLOOM...')
-    tik = time.time()
 
-    weights = {}
+    # TODO: Support SmmothQuant.
     hf_config = BloomConfig.from_pretrained(model_dir)
-    num_heads = hf_config.n_head
-    hidden_size = hf_config.hidden_size
-    if isinstance(dtype, str):
-        dtype = tensorrt_llm.str_dtype_to_torch(dtype)
-    tp_rank = rank
-    tp_size = tensor_parallel
-
-    if use_smooth_quant:
-        quant_mode = QuantMode.use_smooth_quant(per_token, per_channel)
-    elif use_weight_only:
-        quant_mode = QuantMode.from_description(
-            quantize_weights=True,
-            quantize_activations=False,
-            per_token=False,
-            per_channel=False,
-            use_int8_kv_cache=int8_kv_cache,
-            use_int4_weights=plugin_weight_only_quant_type == torch.quint4x2)
-    else:
-        quant_mode = QuantMode(0)
-
-    def is_bias(_name):
-        return 'bias' in _name
-
-    for model_file in iterate_shard_files(model_dir, tp_rank):
-        logger.debug(f'Loading file {str(model_file)}...')
-        model_params = load_state_dict(model_file, dtype=dtype)
-        for name, param in model_params.items():
-            logger.debug(f'Converting weight {name}...')
-            tllm_name = rename_hf_to_tllm(name)
-            param = param.detach().cpu()
-
-            # TODO: Support SmmothQuant.
-
-            if 'self_attention.query_key_value' in name:
-                if not is_bias(name):
-                    param = split_qkv_tp(param, num_heads, hidden_size, tp_size,
-                                         tp_rank)
-                    # TODO: Add KV scalers when quantizing KV cache.
-                else:
-                    param = split_qkv_bias_tp(param, num_heads, hidden_size,
-                                              tp_size, tp_rank)
-                add_tllm_weight(weights, tllm_name, param, quant_mode)
-            elif 'self_attention.dense' in name:
-                if not is_bias(name):
-                    param = split_matrix_tp(param, tp_size, tp_rank, dim=1)
-                add_tllm_weight(weights, tllm_name, param, quant_mode)
-            elif 'mlp.dense_h_to_4h' in name:
-                if not is_bias(name):
-                    param = split_matrix_tp(param, tp_size, tp_rank, dim=0)
-                else:
-                    param = split_matrix_tp(param, tp_size, tp_rank, dim=0)
-                add_tllm_weight(weights, tllm_name, param, quant_mode)
-            elif 'mlp.dense_4h_to_h' in name:
-                if not is_bias(name):
-                    param = split_matrix_tp(param, tp_size, tp_rank, dim=1)
-                add_tllm_weight(weights, tllm_name, param, quant_mode)
-            elif 'word_embeddings.' in name:
-                if not share_embedding_table:
-                    # TODO: safetensor doesn't allow to save a shared tensor.
-                    # Currently, we clone the weight but to save the disk, it
-                    # would be better to skip saving lm_head weights and
-                    # handle it at the loading phase.
-                    lm_head = split_matrix_tp(param, tp_size, tp_rank, dim=0)
-                    weights['lm_head.weight'] = lm_head.clone()
-                if not use_parallel_embedding:
-                    weights[tllm_name] = param
-                else:
-                    assert hf_config.vocab_size % tp_size == 0
-                    weights[tllm_name] = split_matrix_tp(param,
-                                                         tp_size,
-                                                         tp_rank,
-                                                         dim=sharding_dim)
-            elif contain_any(name,
-                             ('input_layernorm', 'post_attention_layernorm',
-                              'word_embeddings_layernorm.', 'ln_f.')):
-                weights[tllm_name] = param
-        del model_params
-
-    tok = time.time()
-    t = time.strftime('%H:%M:%S', time.gmtime(tok - tik))
-    tensorrt_llm.logger.info(f'Weights loaded. Total time: {t}')
-    return weights
+    rules = bloom_weight_rules(
+        hf_config.n_head,
+        hf_config.hidden_size,
+        use_parallel_embedding=use_parallel_embedding,
+        sharding_dim=sharding_dim,
+        share_embedding_table=share_embedding_table,
+        plugin_weight_only_quant_type=plugin_weight_only_quant_type)
+    converter = CheckpointConverter(rules,
+                                    hf_config.num_hidden_layers,
+                                    dtype,
+                                    tp_size=tensor_parallel,
+                                    workers=workers)
+    converter.convert_to_files(model_dir, output_dir)
 
 
 def do_convert_from_ckpt(args):
     return (args.model_dir.exists() and args.smoothquant is None
-            and not args.use_weight_only and not args.int8_kv_cache)
+            and not args.int8_kv_cache)
 
 
 def convert(worker_rank, args, convert_args):
-    convert_from_ckpt = do_convert_from_ckpt(args)
     for rank in range(worker_rank, args.world_size, args.workers):
-        if convert_from_ckpt:
-            weights = convert_from_hf_checkpoint(rank=rank, **convert_args)
-        else:
-            weights = convert_hf_bloom(rank=rank, **convert_args)
+        weights = convert_hf_bloom(rank=rank, **convert_args)
         safetensors.torch.save_file(weights,
                                     args.output_dir / f'rank{rank}.safetensors')
 
 
 def main():
     # TODO(qijun): Currently, the convert script depends on a torch op:
-    # torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix,
+    # torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm,
     # which is included in tensorrt_llm Python package. Otherwise, the convert
-    # script does not need to import tensorrt_llm. Will remove it after reimplementing
-    # the op with PyTorch.
+    # script does not need to import tensorrt_llm.
     print(tensorrt_llm.__version__)
 
     args = parse_arguments()
@@ -1073,7 +864,7 @@ def main():
         json.dump(config, f, indent=4)
 
     # TODO: convert_from_hf_checkpoint is memory efficient but has not
-    # supported quantization yet. Will enable once implemented.
+    # supported SmoothQuant and INT8 KV cache yet. Will enable once implemented.
     convert_from_ckpt = do_convert_from_ckpt(args)
     if not convert_from_ckpt:
         logger.info(f'Convert by using model')
@@ -1108,7 +899,25 @@ def main():
     else:
         plugin_weight_only_quant_type = None
 
+    if convert_from_ckpt:
+        convert_from_hf_checkpoint(
+            args.model_dir,
+            args.output_dir,
+            tensor_parallel=args.world_size,
+            dtype=args.dtype,
+            use_parallel_embedding=args.use_parallel_embedding,
+            sharding_dim=args.embedding_sharding_dim,
+            share_embedding_table=args.use_embedding_sharing,
+            plugin_weight_only_quant_type=plugin_weight_only_quant_type
+            if args.use_weight_only else None,
+            workers=args.workers)
+        tok = time.time()
+        t = time.strftime('%H:%M:%S', time.gmtime(tok - tik))
+        print(f'Total time of converting checkpoints: {t}')
+        return
+
     convert_args = dict(
+        hf_bloom=hf_bloom,
         tensor_parallel=args.world_size,
         dtype=args.dtype,
         use_weight_only=args.use_weight_only,
@@ -1124,10 +933,6 @@ def main():
         per_token=args.per_token,
         int8_kv_cache=args.int8_kv_cache,
     )
-    if convert_from_ckpt:
-        convert_args['model_dir'] = args.model_dir
-    else:
-        convert_args['hf_bloom'] = hf_bloom
 
     if args.workers == 1:
         convert(0, args, convert_args)
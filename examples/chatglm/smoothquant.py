@@ -16,13 +16,10 @@
 Utilities for SmoothQuant models
 '''
 
-import functools
-from collections import defaultdict
-
 import torch
 import torch.nn as nn
-from tqdm import tqdm
-from transformers.pytorch_utils import Conv1D
+
+from tensorrt_llm.quantization.calibration import calibrate_activation_range
 
 
 @torch.no_grad()
@@ -110,46 +107,8 @@ def capture_activation_range(model,
                              dataset,
                              num_samples=8,
                              seq_len=512):
-    model.eval()
-    device = next(model.parameters()).device
-    act_scales = defaultdict(lambda: {"x": None, "y": None, "w": None})
-
-    def stat_tensor(name, tensor, act_scales, key):
-        hidden_dim = tensor.shape[-1]
-        tensor = tensor.view(-1, hidden_dim).abs().detach()
-        comming_max = torch.max(tensor, dim=0)[0].float()
-
-        if act_scales[name][key] is None:
-            act_scales[name][key] = comming_max
-        else:
-            act_scales[name][key] = torch.max(act_scales[name][key],
-                                              comming_max)
-
-    def stat_input_hook(m, x, y, name):
-        if isinstance(x, tuple):
-            x = x[0]
-        stat_tensor(name, x, act_scales, "x")
-        stat_tensor(name, y, act_scales, "y")
-
-        if act_scales[name]["w"] is None:
-            act_scales[name]["w"] = m.weight.abs().clip(
-                1e-8, None).max(dim=1)[0]  # wili
-
-    hooks = []
-    for name, m in model.named_modules():
-        if isinstance(m, nn.Linear) or isinstance(m, Conv1D):
-            hooks.append(
-                m.register_forward_hook(
-                    functools.partial(stat_input_hook, name=name)))
-
-    for i in tqdm(range(num_samples), desc="calibrating model"):
-        input_ids = tokenizer(dataset[i]["article"],
-                              return_tensors="pt",
-                              max_length=seq_len,
-                              truncation=True).input_ids.to(device)
-        model(input_ids)
-
-    for h in hooks:
-        h.remove()
-
-    return act_scales
+    samples = (tokenizer(dataset[i]["article"],
+                         max_length=seq_len,
+                         truncation=True).input_ids for i in range(num_samples))
+    # The position ids of GLM do not support padded batches
+    return calibrate_activation_range(model, samples, batch_size=1)
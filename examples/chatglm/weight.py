@@ -27,6 +27,9 @@ from tensorrt_llm._utils import (str_dtype_to_np, str_dtype_to_torch,
 from tensorrt_llm.mapping import Mapping
 from tensorrt_llm.models.quantized.quant import get_dummy_quant_scales
 from tensorrt_llm.quantization import QuantMode
+from tensorrt_llm.quantization.weight_quant import (preprocess_weights,
+                                                    quantize,
+                                                    symmetric_quantize)
 
 
 def tile_kv_weight_bias(v, kv_num_head, tp_size):
@@ -68,9 +71,8 @@ def split_qkv(v, tp_size, rank, hidden_size, num_heads, num_kv_heads):
 
 def load_quant_weight(src, value_dst, scale_dst, plugin_weight_only_quant_type):
     v = torch.transpose(src, dim0=0, dim1=1).contiguous()
-    processed_torch_weights, torch_weight_scales = \
-        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-            v, plugin_weight_only_quant_type)
+    processed_torch_weights, torch_weight_scales = symmetric_quantize(
+        v, plugin_weight_only_quant_type)
     value_dst.value = torch_to_numpy(processed_torch_weights)
     scale_dst.value = torch_to_numpy(torch_weight_scales)
 
@@ -526,8 +528,6 @@ def load_from_awq(
         awq_weight[name + ".weight_quantizer._amax"].numel()
 
     torch_dtype = str_dtype_to_torch(dtype)
-    int8_to_int4 = torch.ops.fastertransformer.pack_int8_tensor_to_packed_int4
-    int4_to_int4x2 = torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm
 
     layers_per_pipeline_stage = num_layers // mapping.pp_size
     layers_range = list(
@@ -536,11 +536,9 @@ def load_from_awq(
     feed_weight_count = 0
 
     def AWQ_quantize_pack_preprocess(weight, scale):
-        weight = weight / scale.repeat_interleave(group_size, dim=0)
-        weight = torch.clamp(torch.round(weight.cuda()).char(), -8, 7)
-        weight = int8_to_int4(weight.cpu())
-        weight = int4_to_int4x2(weight, torch.quint4x2)
-        return weight.view(torch.float16)
+        qweight_int8 = quantize(weight, scale, bits=4, group_size=group_size)
+        int4_weight = preprocess_weights(qweight_int8, torch.quint4x2)
+        return int4_weight.view(torch.float16)
 
     def process_and_assign_weight(op, prefix, tp_dim=0):
         name = prefix + ".weight"
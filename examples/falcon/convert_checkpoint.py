@@ -1,6 +1,8 @@
 import argparse
+import copy
 import json
 import os
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Dict, List, Optional, Tuple
@@ -12,8 +14,17 @@ from transformers import AutoModelForCausalLM, FalconConfig, FalconForCausalLM
 
 import tensorrt_llm
 from tensorrt_llm.mapping import Mapping
-from tensorrt_llm.models.llama.utils import (  # TODO: move the utils to common dir shared by models
-    iterate_shard_files, load_state_dict, retrieved_layer_index_from_name)
+from tensorrt_llm.models.convert_utils import CheckpointConverter
+from tensorrt_llm.models.falcon.convert import (falcon_weight_rules,
+                                                reorder_qkv_weight_or_bias)
+from tensorrt_llm.models.modeling_utils import PretrainedConfig
+from tensorrt_llm.models.pipeline_partition import (balanced_pp_partition,
+                                                    pp_partition_report)
+from tensorrt_llm.quantization.weight_quant import (groupwise_scales,
+                                                    parallel_map,
+                                                    preprocess_weights,
+                                                    quantize,
+                                                    symmetric_quantize)
 
 
 def parse_arguments():
@@ -22,6 +33,14 @@ def parse_arguments():
     parser.add_argument('--world_size', type=int, default=1)
     parser.add_argument('--tp_size', type=int, default=1)
     parser.add_argument('--pp_size', type=int, default=1)
+    parser.add_argument(
+        '--pp_partition',
+        type=str,
+        default=None,
+        help=
+        'The number of layers of each pipeline stage, comma separated, or "balanced" '
+        'to give fewer layers to the stages running the embedding and the lm_head. '
+        'The layers are split evenly by default.')
     parser.add_argument('--dtype',
                         type=str,
                         default='float16',
@@ -141,88 +160,6 @@ def split(weight: torch.Tensor,
         return torch.chunk(weight, tp_size, dim=dim)[rank].contiguous()
 
 
-def reorder_qkv_weight_or_bias(weight: torch.Tensor,
-                               head_dim: int,
-                               num_heads: int,
-                               num_kv_heads: Optional[int] = None,
-                               tp_size: int = 1,
-                               is_bias: bool = False) -> torch.Tensor:
-    """ Reorder the qkv weight for TRT-LLM use.
-
-    The shape of the fused QKV weights in HF is different from the shape that
-    TRT-LLM requires. In particular, the weight of HF consists of interleaved
-    q, k, v head weights, while that of TRT-LLM is contiguous.
-        HF     : [q1, k1, v1, ..., qh, kh, vh]
-        TRT-LLM: [q1, ..., qh, k1, ..., kh, v1, vh]
-    where qi, vi, ki are weight vectors corresponding to attention head i.
-    It's similar to multi/grouped query attention cases.
-
-    We reorder and split the weight of an attention layer to fit into TRT-LLM.
-    The reordered weight and bias will be
-        weight: (T, Qh * D + 2 * KVh * D, H)
-        bias  : (T, Qh * D + 2 * KVh * D)
-    where T=tp_size, Qh=local_num_q_heads, KVh=local_num_kv_heads, D=head_dim,
-    H=hidden_dim. In the multi/grouped query attention, the number of K/V
-    attention heads are less than that of Q attention, so that K/V attention
-    heads may be shared across different ranks if necessary.
-
-    For tensor parallelism, we use the first dimension to select the
-    corresponding weights.
-    """
-
-    # Query types and expected kv heads.
-    #  - Conventional MHA: num_heads = num_kv_heads
-    #  - Multi-Query Attention: num_kv_heads = 1
-    #  - Grouped-Query Attention: num_heads % num_kv_heads = 0
-    num_kv_heads = num_kv_heads if num_kv_heads is not None else num_heads
-    assert num_heads % num_kv_heads == 0, \
-        f'num_heads({num_heads}) must be divisible by '\
-        f'num_kv_heads({num_kv_heads})).'
-
-    # The number of attention heads per group: N q head + 1 k head + 1 v head.
-    num_group_heads = num_heads // num_kv_heads + 2
-    assert weight.shape[0] == num_kv_heads * num_group_heads * head_dim, \
-        f'{weight.shape[0]} != {num_kv_heads} * {num_group_heads} * {head_dim}'
-
-    qkv_in = num_heads * head_dim if not is_bias else 1
-
-    # Split Q/K/V weights
-    weight = weight.reshape(num_kv_heads, num_heads // num_kv_heads + 2,
-                            head_dim, qkv_in)
-    q_w = weight[:, :-2, ...]  # (nKV, num_heads // nKV, head_dim, qkv_in)
-    k_w = weight[:, -2:-1, ...]  # (nKV, 1, head_dim, qkv_in)
-    v_w = weight[:, -1:, ...]  # (nKV, 1, head_dim, qkv_in)
-
-    if num_kv_heads < num_heads and num_kv_heads < tp_size:
-        # Duplicate K/V heads to make sure that each rank has at least one
-        # K/V heads. For instance, num_heads=8, num_kv_heads=2, tp_size=4,
-        # we will make the qkv weight as below.
-        #   Orig: [q0 q1 q2 q3 k0 v0 q4 q5 q6 q7 k1 v0 v1]
-        #   >>>>  [[q0 q1 k0 v0], [q2 q3 k0 v0], [q4 q5 k1 v1], [q6 q7 k1 v1]]
-        assert tp_size % num_kv_heads == 0
-        num_dups = tp_size // num_kv_heads
-
-        # k_w and v_w have the same shape.
-        new_shape = (num_kv_heads, num_dups) + k_w.shape[2:]
-        k_w = torch.broadcast_to(k_w, size=new_shape)
-        v_w = torch.broadcast_to(v_w, size=new_shape)
-
-        # Update the number of kv heads.
-        num_kv_heads = tp_size
-
-    reordered = torch.concat(
-        [
-            q_w.reshape(tp_size, num_heads // tp_size, head_dim, qkv_in),
-            k_w.reshape(tp_size, num_kv_heads // tp_size, head_dim, qkv_in),
-            v_w.reshape(tp_size, num_kv_heads // tp_size, head_dim, qkv_in),
-        ],
-        dim=1,
-    )
-
-    qkv_out = (num_heads + 2 * num_kv_heads) // tp_size * head_dim
-    return reordered.reshape((tp_size, qkv_out, -1))
-
-
 def split_qkv_weight(weight: torch.Tensor,
                      hidden_size: int,
                      num_heads: int,
@@ -283,9 +220,8 @@ def get_tllm_linear_weight(
     results = {}
     if use_weight_only:
         v = weight.t().contiguous()
-        processed_torch_weights, torch_weight_scales = \
-            torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                v, plugin_weight_only_quant_type)
+        processed_torch_weights, torch_weight_scales = symmetric_quantize(
+            v, plugin_weight_only_quant_type)
         results[f'{prefix}.weight'] = processed_torch_weights
         results[f'{prefix}.per_channel_scale'] = torch_weight_scales
     else:
@@ -297,27 +233,6 @@ def get_tllm_linear_weight(
     return results
 
 
-def get_tllm_param(
-    param: torch.Tensor,
-    name: str,
-    use_weight_only: bool = False,
-    plugin_weight_only_quant_type: torch.dtype = torch.int8
-) -> Dict[str, torch.Tensor]:
-    results = {}
-    if name.endswith('.weight') and use_weight_only:
-        v = param.t().contiguous()
-        processed_torch_weights, torch_weight_scales = \
-            torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                v, plugin_weight_only_quant_type)
-        results[name] = processed_torch_weights
-        results[name.replace('weight',
-                             'per_channel_scale')] = torch_weight_scales
-    else:
-        results[name] = param
-
-    return results
-
-
 def convert_hf_falcon(hf_model: FalconForCausalLM,
                       hf_config: FalconConfig,
                       mapping: Mapping,
@@ -456,152 +371,29 @@ def convert_hf_falcon(hf_model: FalconForCausalLM,
 def load_from_hf_falcon_checkpoint(
         hf_model_dir: str,
         hf_config: FalconConfig,
-        mapping: Mapping,
+        output_dir: str,
+        tp_size: int = 1,
+        pp_size: int = 1,
         dtype: str = 'float32',
         use_weight_only: bool = False,
-        plugin_weight_only_quant_type: torch.dtype = torch.int8):
-
-    weights = {}
-    tik = time.time()
-
-    dtype = getattr(torch, dtype)
-    num_attention_heads = hf_config.num_attention_heads
-    hidden_size = hf_config.hidden_size
-    num_kv_heads = getattr(hf_config, 'num_kv_heads', num_attention_heads)
-    num_hidden_layers = hf_config.num_hidden_layers
-
-    layers_range = mapping.pp_layers(num_hidden_layers)
-    for model_file in iterate_shard_files(hf_model_dir, mapping.tp_rank):
-        state_dict = load_state_dict(model_file, dtype)
-        for name, param in state_dict.items():
-            param = param.detach().cpu()
-            l = retrieved_layer_index_from_name(name)
-            if l is not None:
-                if l not in layers_range:
-                    continue
-                tllm_prex = f'transformer.layers.{l-layers_range[0]}'
-
-                if 'self_attention.query_key_value' in name:
-                    if name.endswith('weight'):
-                        qkv_w = split_qkv_weight(param,
-                                                 hidden_size,
-                                                 num_attention_heads,
-                                                 mapping.tp_size,
-                                                 mapping.tp_rank,
-                                                 is_bias=False,
-                                                 num_kv_heads=num_kv_heads)
-                        weights.update(
-                            get_tllm_param(qkv_w,
-                                           f'{tllm_prex}.attention.qkv.weight',
-                                           use_weight_only,
-                                           plugin_weight_only_quant_type))
-                    else:
-                        qkv_b = split_qkv_weight(param,
-                                                 hidden_size,
-                                                 num_attention_heads,
-                                                 mapping.tp_size,
-                                                 mapping.tp_rank,
-                                                 is_bias=True,
-                                                 num_kv_heads=num_kv_heads)
-                        weights.update(
-                            get_tllm_param(qkv_b,
-                                           f'{tllm_prex}.attention.qkv.bias',
-                                           use_weight_only,
-                                           plugin_weight_only_quant_type))
-
-                elif 'self_attention.dense' in name:
-                    if name.endswith('weight'):
-                        attn_dense_w = split_matrix(param,
-                                                    mapping.tp_size,
-                                                    mapping.tp_rank,
-                                                    dim=1)
-                        weights.update(
-                            get_tllm_param(
-                                attn_dense_w,
-                                f'{tllm_prex}.attention.dense.weight',
-                                use_weight_only, plugin_weight_only_quant_type))
-                    else:
-                        weights.update(
-                            get_tllm_param(param,
-                                           f'{tllm_prex}.attention.dense.bias',
-                                           use_weight_only,
-                                           plugin_weight_only_quant_type))
-
-                elif 'mlp.dense_h_to_4h' in name:
-                    if name.endswith('weight'):
-                        mlp_fc_w = split_matrix(param,
-                                                mapping.tp_size,
-                                                mapping.tp_rank,
-                                                dim=0)
-                        weights.update(
-                            get_tllm_param(mlp_fc_w,
-                                           f'{tllm_prex}.mlp.fc.weight',
-                                           use_weight_only,
-                                           plugin_weight_only_quant_type))
-                    else:
-                        mlp_fc_b = split_matrix(param,
-                                                mapping.tp_size,
-                                                mapping.tp_rank,
-                                                dim=0)
-                        weights.update(
-                            get_tllm_param(mlp_fc_b, f'{tllm_prex}.mlp.fc.bias',
-                                           use_weight_only,
-                                           plugin_weight_only_quant_type))
-
-                elif 'mlp.dense_4h_to_h' in name:
-                    if name.endswith('weight'):
-                        mlp_proj_w = split_matrix(param,
-                                                  mapping.tp_size,
-                                                  mapping.tp_rank,
-                                                  dim=1)
-                        weights.update(
-                            get_tllm_param(mlp_proj_w,
-                                           f'{tllm_prex}.mlp.proj.weight',
-                                           use_weight_only,
-                                           plugin_weight_only_quant_type))
-                    else:
-                        weights.update(
-                            get_tllm_param(param, f'{tllm_prex}.mlp.proj.bias',
-                                           use_weight_only,
-                                           plugin_weight_only_quant_type))
-
-                elif 'ln_attn' in name or 'input_layernorm' in name:
-                    if name.endswith('weight'):
-                        weights[f'{tllm_prex}.input_layernorm.weight'] = param
-                    else:
-                        weights[f'{tllm_prex}.input_layernorm.bias'] = param
-                elif 'ln_mlp' in name:
-                    if name.endswith('weight'):
-                        weights[f'{tllm_prex}.mlp_layernorm.weight'] = param
-                    else:
-                        weights[f'{tllm_prex}.mlp_layernorm.bias'] = param
-                elif 'post_attention_layernorm' in name:
-                    if name.endswith('weight'):
-                        weights[f'{tllm_prex}.post_layernorm.weight'] = param
-                    else:
-                        weights[f'{tllm_prex}.post_layernorm.bias'] = param
-            else:
-                if 'word_embeddings' in name:
-                    if mapping.is_first_pp_rank():
-                        weights['transformer.embedding.weight'] = param
-                    if mapping.is_last_pp_rank():
-                        weights['lm_head.weight'] = split_matrix(
-                            param.clone(),
-                            mapping.tp_size,
-                            mapping.tp_rank,
-                            dim=0)
-                elif 'ln_f' in name:
-                    if mapping.is_last_pp_rank():
-                        if name.endswith('weight'):
-                            weights['transformer.ln_f.weight'] = param
-                        else:
-                            weights['transformer.ln_f.bias'] = param
-        del state_dict
-
-    tok = time.time()
-    t = time.strftime('%H:%M:%S', time.gmtime(tok - tik))
-    print(f'Weights loaded. Total time: {t}')
-    return weights
+        plugin_weight_only_quant_type: torch.dtype = torch.int8,
+        workers: int = 1,
+        pp_partition: Optional[List[int]] = None):
+    """ Converts the HF checkpoint of all ranks in one pass over the shards. """
+    rules = falcon_weight_rules(
+        hf_config.num_attention_heads,
+        getattr(hf_config, 'num_kv_heads', hf_config.num_attention_heads),
+        hf_config.hidden_size,
+        plugin_weight_only_quant_type=plugin_weight_only_quant_type
+        if use_weight_only else None)
+    converter = CheckpointConverter(rules,
+                                    hf_config.num_hidden_layers,
+                                    dtype,
+                                    tp_size=tp_size,
+                                    pp_size=pp_size,
+                                    workers=workers,
+                                    pp_partition=pp_partition)
+    converter.convert_to_files(hf_model_dir, output_dir)
 
 
 def load_from_awq_falcon(quant_ckpt_path: str,
@@ -614,8 +406,6 @@ def load_from_awq_falcon(quant_ckpt_path: str,
     parallel_attention = hf_config.parallel_attn
     new_decoder_architecture = hf_config.new_decoder_architecture
 
-    packer = torch.ops.fastertransformer.pack_int8_tensor_to_packed_int4
-    preprocessor = torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm
     torch_dtype = tensorrt_llm._utils.str_dtype_to_torch(dtype)
 
     if not quant_ckpt_path.endswith(".npz"):
@@ -642,10 +432,15 @@ def load_from_awq_falcon(quant_ckpt_path: str,
     split_sym = ":"
     AMMO_WEIGHT_SCALING_FACTOR_COEFF = 7
 
+    # The members of a npz file are read from a shared file object
+    load_lock = threading.Lock()
+
     def load(key):
         if awq_prefix + key not in awq_falcon:
             return None
-        v = torch.from_numpy(awq_falcon[awq_prefix + key]).to(torch_dtype)
+        with load_lock:
+            v = awq_falcon[awq_prefix + key]
+        v = torch.from_numpy(v).to(torch_dtype)
         if "weights_scaling_factor" in key:
             v *= AMMO_WEIGHT_SCALING_FACTOR_COEFF  # For AMMO *.npz checkpoints
         return v
@@ -663,10 +458,8 @@ def load_from_awq_falcon(quant_ckpt_path: str,
                        dim=dim)[mapping.tp_rank]
 
     def AWQ_quantize_pack_preprocess(weight, scale):
-        weight /= scale.repeat_interleave(group_size, dim=0)
-        qweight_int8 = torch.clamp(torch.round(weight.cuda()).char(), -8, 7)
-        int4_weight = preprocessor(packer(qweight_int8.cpu()), torch.quint4x2)
-        return int4_weight.view(torch.int8)
+        qweight_int8 = quantize(weight, scale, bits=4, group_size=group_size)
+        return preprocess_weights(qweight_int8, torch.quint4x2)
 
     def get_tllm_weight_from_awq(v: List[torch.Tensor],
                                  tllm_prex: str,
@@ -688,16 +481,6 @@ def load_from_awq_falcon(quant_ckpt_path: str,
         }
         return results
 
-    def get_scale(weight):
-        [k, n] = weight.shape
-        weight_t = weight.T.contiguous()
-        weight_t = weight_t.reshape(n, k // group_size, group_size)
-        weight_t = torch.abs(weight_t.reshape(-1, group_size))
-        amax, idx = weight_t.max(1)
-        amax = amax.reshape(n, k // group_size).T.contiguous()
-        scale = amax / 8
-        return scale
-
     def get_tllm_qkv_weight_from_awq(prefix, tllm_prex: str):
         q_weight = load(prefix + "q" + awq_suffix_list[0]).T.contiguous()
         k_weight = load(prefix + "k" + awq_suffix_list[0]).T.contiguous()
@@ -709,7 +492,7 @@ def load_from_awq_falcon(quant_ckpt_path: str,
         qkv_pre_quant_scale = load(prefix + "q" + awq_suffix_list[2]).reshape(
             (1, dim_k))
         qkv_weights = torch.cat((q_weight, k_weight, v_weight), dim=1)
-        qkv_scale = get_scale(qkv_weights)
+        qkv_scale = groupwise_scales(qkv_weights, group_size)[0].to(torch_dtype)
 
         results = {
             f'{tllm_prex}.prequant_scaling_factor':
@@ -752,7 +535,8 @@ def load_from_awq_falcon(quant_ckpt_path: str,
 
     # 4. Weights inside each layer
     layers_range = mapping.pp_layers(num_hidden_layers)
-    for l in layers_range:
+
+    def load_layer(l):
         # layer_idx = l - mapping.pp_rank * layers_per_pipeline_stage
         # prefix = "layers" + split_sym + str(layer_idx) + split_sym
         # tensorrt_llm.logger.info(f'Process weights in layer: {layer_idx}')
@@ -844,6 +628,9 @@ def load_from_awq_falcon(quant_ckpt_path: str,
                 v = load(prefix + 'post_layernorm' + split_sym + "bias")
                 weights[f'{tllm_prex}.post_layernorm.bias'] = v.to(torch_dtype)
 
+    # The layers are quantized concurrently
+    parallel_map(load_layer, layers_range)
+
     tok = time.time()
     t = time.strftime('%H:%M:%S', time.gmtime(tok - tik))
     tensorrt_llm.logger.info(f'Weights loaded. Elapsed time: {t}')
@@ -940,10 +727,9 @@ def load_from_fp8_falcon(quant_ckpt_path: str, hf_config: FalconConfig,
 
 if __name__ == '__main__':
     # TODO(qijun): Currently, the convert script depends on a torch op:
-    # torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix,
+    # torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm,
     # which is included in tensorrt_llm Python package. Otherwise, the convert
-    # script does not need to import tensorrt_llm. Will remove it after reimplementing
-    # the op with PyTorch.
+    # script does not need to import tensorrt_llm.
     print(tensorrt_llm.__version__)
     args = parse_arguments()
     tik = time.time()
@@ -990,6 +776,19 @@ if __name__ == '__main__':
             'exclude_modules': [],
         })
 
+    pp_partition = None
+    if args.pp_partition == 'balanced':
+        pp_partition = balanced_pp_partition(
+            PretrainedConfig.from_dict(copy.deepcopy(config)))
+    elif args.pp_partition is not None:
+        pp_partition = [int(n) for n in args.pp_partition.split(',')]
+    if pp_partition is not None:
+        config['mapping']['pp_partition'] = pp_partition
+    if args.pp_size > 1:
+        report = pp_partition_report(
+            PretrainedConfig.from_dict(copy.deepcopy(config)))
+        print(f'Predicted pipeline stage times:\n{report}')
+
     with open(os.path.join(args.output_dir, 'config.json'), 'w') as f:
         json.dump(config, f, indent=4)
 
@@ -1002,7 +801,8 @@ if __name__ == '__main__':
         mapping = Mapping(world_size=args.tp_size * args.pp_size,
                           rank=rank,
                           tp_size=args.tp_size,
-                          pp_size=args.pp_size)
+                          pp_size=args.pp_size,
+                          pp_partition=pp_partition)
 
         if args.use_weight_only and args.weight_only_precision == 'int4_awq':
             weights = load_from_awq_falcon(args.ammo_quant_ckpt_path,
@@ -1010,25 +810,16 @@ if __name__ == '__main__':
                                            mapping,
                                            dtype=args.dtype)
         else:
-            if args.load_by_shard:
-                weights = load_from_hf_falcon_checkpoint(
-                    args.model_dir,
-                    hf_config,
-                    mapping,
-                    dtype=args.dtype,
-                    use_weight_only=args.use_weight_only,
-                    plugin_weight_only_quant_type=plugin_weight_only_quant_type)
-            else:
-                hf_model = AutoModelForCausalLM.from_pretrained(
-                    args.model_dir, trust_remote_code=True, torch_dtype="auto")
-                weights = convert_hf_falcon(
-                    hf_model,
-                    hf_config,
-                    mapping,
-                    dtype=args.dtype,
-                    use_weight_only=args.use_weight_only,
-                    plugin_weight_only_quant_type=plugin_weight_only_quant_type)
-                del hf_model
+            hf_model = AutoModelForCausalLM.from_pretrained(
+                args.model_dir, trust_remote_code=True, torch_dtype="auto")
+            weights = convert_hf_falcon(
+                hf_model,
+                hf_config,
+                mapping,
+                dtype=args.dtype,
+                use_weight_only=args.use_weight_only,
+                plugin_weight_only_quant_type=plugin_weight_only_quant_type)
+            del hf_model
 
             if args.enable_fp8 or args.fp8_kv_cache:
                 scales = load_from_fp8_falcon(args.ammo_quant_ckpt_path,
@@ -1039,7 +830,23 @@ if __name__ == '__main__':
         safetensors.torch.save_file(
             weights, os.path.join(args.output_dir, f'rank{rank}.safetensors'))
 
-    if args.workers == 1:
+    load_by_shard = args.load_by_shard and not (
+        args.use_weight_only and args.weight_only_precision == 'int4_awq') \
+        and not (args.enable_fp8 or args.fp8_kv_cache)
+    if load_by_shard:
+        # All the ranks are converted in one pass over the HF shards
+        load_from_hf_falcon_checkpoint(
+            args.model_dir,
+            hf_config,
+            args.output_dir,
+            tp_size=args.tp_size,
+            pp_size=args.pp_size,
+            dtype=args.dtype,
+            use_weight_only=args.use_weight_only,
+            plugin_weight_only_quant_type=plugin_weight_only_quant_type,
+            workers=args.workers,
+            pp_partition=pp_partition)
+    elif args.workers == 1:
         for rank in range(args.world_size):
             covert_and_save(rank)
     else:
@@ -27,6 +27,7 @@ from tensorrt_llm._utils import (numpy_to_torch, pad_vocab_size,
 from tensorrt_llm.functional import is_gated_activation
 from tensorrt_llm.models import GPTLMHeadModel
 from tensorrt_llm.quantization import QuantMode
+from tensorrt_llm.quantization.weight_quant import symmetric_quantize
 
 LOGGER = logging.getLogger(__name__)
 
@@ -312,7 +313,7 @@ def load_from_ft(tensorrt_llm_gpt: GPTLMHeadModel,
                     rank=rank,
                     is_qkv=True)
             elif use_weight_only:
-                processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                processed_torch_weights, torch_weight_scales = symmetric_quantize(
                     numpy_to_torch(t), plugin_weight_only_quant_type)
                 dst.value = torch_to_numpy(processed_torch_weights)
                 scales = tensorrt_llm_gpt.layers[
@@ -358,7 +359,7 @@ def load_from_ft(tensorrt_llm_gpt: GPTLMHeadModel,
             gpt_layer.attention.dense.smoother.value = np.ones(
                 [1, n_embd // tensor_parallel], dtype=np.float32)
         elif use_weight_only:
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 numpy_to_torch(t), plugin_weight_only_quant_type)
             dst.value = torch_to_numpy(processed_torch_weights)
             scales = tensorrt_llm_gpt.layers[
@@ -408,7 +409,7 @@ def load_from_ft(tensorrt_llm_gpt: GPTLMHeadModel,
                                           rank=rank)
         elif use_weight_only:
             dst = gpt_layer.mlp.fc.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 numpy_to_torch(t), plugin_weight_only_quant_type)
             dst.value = torch_to_numpy(processed_torch_weights)
             scales = gpt_layer.mlp.fc.per_channel_scale
@@ -456,7 +457,7 @@ def load_from_ft(tensorrt_llm_gpt: GPTLMHeadModel,
                 [1, inter_size // tensor_parallel], dtype=np.float32)
         elif use_weight_only:
             dst = gpt_layer.mlp.proj.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 numpy_to_torch(t), plugin_weight_only_quant_type)
             dst.value = torch_to_numpy(processed_torch_weights)
             scales = gpt_layer.mlp.proj.per_channel_scale
@@ -18,22 +18,19 @@ Convert huggingface GPT-J model. Use https://huggingface.co/EleutherAI/gpt-j-6b
 import argparse
 import configparser
 import dataclasses
-import functools
 import os
 import platform
-from collections import defaultdict
 from pathlib import Path
 
 import torch
 import torch.multiprocessing as multiprocessing
-import torch.nn as nn
 from tqdm import tqdm
 from transformers import AutoModelForCausalLM  # transformers-4.10.0-py3
 from transformers import AutoTokenizer
-from transformers.pytorch_utils import Conv1D
 from utils.convert import split_and_save_weight
 
 from tensorrt_llm._utils import str_dtype_to_torch, torch_to_numpy
+from tensorrt_llm.quantization.calibration import calibrate_activation_range
 
 
 @torch.no_grad()
@@ -42,49 +39,10 @@ def capture_activation_range(model,
                              dataset,
                              num_samples=512,
                              seq_len=512):
-    model.eval()
-    device = next(model.parameters()).device
-    act_scales = defaultdict(lambda: {"x": None, "y": None, "w": None})
-
-    def stat_tensor(name, tensor, act_scales, key):
-        hidden_dim = tensor.shape[-1]
-        tensor = tensor.view(-1, hidden_dim).abs().detach()
-        comming_max = torch.max(tensor, dim=0)[0].float()
-
-        if act_scales[name][key] is None:
-            act_scales[name][key] = comming_max
-        else:
-            act_scales[name][key] = torch.max(act_scales[name][key],
-                                              comming_max)
-
-    def stat_input_hook(m, x, y, name):
-        if isinstance(x, tuple):
-            x = x[0]
-        stat_tensor(name, x, act_scales, "x")
-        stat_tensor(name, y, act_scales, "y")
-
-        if act_scales[name]["w"] is None:
-            act_scales[name]["w"] = m.weight.abs().clip(1e-8,
-                                                        None).max(dim=0)[0]
-
-    hooks = []
-    for name, m in model.named_modules():
-        if isinstance(m, nn.Linear) or isinstance(m, Conv1D):
-            hooks.append(
-                m.register_forward_hook(
-                    functools.partial(stat_input_hook, name=name)))
-
-    for i in tqdm(range(num_samples), desc="calibrating model"):
-        input_ids = tokenizer(dataset[i]["text"],
-                              return_tensors="pt",
-                              max_length=seq_len,
-                              truncation=True).input_ids.to(device)
-        model(input_ids)
-
-    for h in hooks:
-        h.remove()
-
-    return act_scales
+    samples = (tokenizer(dataset[i]["text"],
+                         max_length=seq_len,
+                         truncation=True).input_ids for i in range(num_samples))
+    return calibrate_activation_range(model, samples)
 
 
 @dataclasses.dataclass(frozen=True)
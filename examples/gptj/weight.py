@@ -28,6 +28,9 @@ from tensorrt_llm.mapping import Mapping
 from tensorrt_llm.models import GPTJForCausalLM
 from tensorrt_llm.models.quantized.quant import get_dummy_quant_scales
 from tensorrt_llm.quantization import QuantMode
+from tensorrt_llm.quantization.weight_quant import (preprocess_weights,
+                                                    quantize,
+                                                    symmetric_quantize)
 
 
 def get_scaling_factors(
@@ -340,7 +343,7 @@ def load_from_bin_gpt_j(tensorrt_llm_gpt_j: GPTJForCausalLM,
                     rank=rank,
                     is_qkv=True)
             elif use_weight_only:
-                processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                processed_torch_weights, torch_weight_scales = symmetric_quantize(
                     torch.tensor(t), plugin_weight_only_quant_type)
                 dst.value = processed_torch_weights.numpy()
                 scales = tensorrt_llm_gpt_j.layers[
@@ -381,7 +384,7 @@ def load_from_bin_gpt_j(tensorrt_llm_gpt_j: GPTJForCausalLM,
                 i].attention.dense.smoother.value = np.ones(
                     [1, n_embd // tensor_parallel], dtype=np.float32)
         elif use_weight_only:
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_gpt_j.layers[
@@ -416,7 +419,7 @@ def load_from_bin_gpt_j(tensorrt_llm_gpt_j: GPTJForCausalLM,
                 rank=rank)
         elif use_weight_only:
             dst = tensorrt_llm_gpt_j.layers[i].mlp.fc.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_gpt_j.layers[i].mlp.fc.per_channel_scale
@@ -455,7 +458,7 @@ def load_from_bin_gpt_j(tensorrt_llm_gpt_j: GPTJForCausalLM,
                 [1, inter_size // tensor_parallel], dtype=np.float32)
         elif use_weight_only:
             dst = tensorrt_llm_gpt_j.layers[i].mlp.proj.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_gpt_j.layers[i].mlp.proj.per_channel_scale
@@ -561,10 +564,9 @@ def load_from_hf_gpt_j(tensorrt_llm_gpt_j: GPTJForCausalLM,
                         [scaling_factors['proj_weights'][layer_idx]],
                         dtype=np.float32)
             if use_weight_only and (idx == 2 or idx == 4):
-                processed_torch_weights, torch_weight_scales = \
-                    torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                        v.transpose(0, 1).contiguous(), plugin_weight_only_quant_type
-                    )
+                processed_torch_weights, torch_weight_scales = symmetric_quantize(
+                    v.transpose(0, 1).contiguous(),
+                    plugin_weight_only_quant_type)
                 layer.value = processed_torch_weights.numpy()
                 if idx == 2:
                     scales = tensorrt_llm_gpt_j.layers[
@@ -585,9 +587,9 @@ def load_from_hf_gpt_j(tensorrt_llm_gpt_j: GPTJForCausalLM,
         layer = attrgetter("attention.qkv.weight")(
             tensorrt_llm_gpt_j.layers[layer_idx])
         if use_weight_only:
-            processed_torch_weights, torch_weight_scales = \
-                torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                qkv_weights.transpose(0, 1).contiguous(), plugin_weight_only_quant_type)
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
+                qkv_weights.transpose(0, 1).contiguous(),
+                plugin_weight_only_quant_type)
             layer.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_gpt_j.layers[
                 layer_idx].attention.qkv.per_channel_scale
@@ -619,8 +621,7 @@ def load_from_hf_gpt_j(tensorrt_llm_gpt_j: GPTJForCausalLM,
         layer = attrgetter("attention.dense.weight")(
             tensorrt_llm_gpt_j.layers[layer_idx])
         if use_weight_only:
-            processed_torch_weights, torch_weight_scales = \
-                torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 v.transpose(0, 1).contiguous(), plugin_weight_only_quant_type)
             layer.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_gpt_j.layers[
@@ -689,20 +690,14 @@ def load_from_awq_gpt_j(tensorrt_llm_gpt_j: GPTJForCausalLM,
     # Int8 KV cache
     use_int8_kv_cache = quant_mode.has_int8_kv_cache()
 
-    packer = torch.ops.fastertransformer.pack_int8_tensor_to_packed_int4
-    preprocessor = torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm
-
     tensorrt_llm.logger.info('Loading weights from AWQ GPT-J...')
     tik = time.time()
 
     torch_dtype = torch.float16 if fp16 else torch.float32
 
     def AWQ_quantize_pack_preprocess(weight, scale):
-        scale = scale.repeat_interleave(group_size, dim=0)
-        weight = weight / scale
-        qweight_int8 = torch.clamp(torch.round(weight.cuda()).char(), -8, 7)
-        int4_weight = packer(qweight_int8.cpu())
-        int4_weight = preprocessor(int4_weight, torch.quint4x2)
+        qweight_int8 = quantize(weight, scale, bits=4, group_size=group_size)
+        int4_weight = preprocess_weights(qweight_int8, torch.quint4x2)
         return int4_weight.view(torch.float16).cpu().numpy()
 
     def process_and_assign_weight(awq_gpt_j, mPrefix, mOp, tp_dim=0):
@@ -21,6 +21,8 @@ import torch
 import tensorrt_llm
 from tensorrt_llm._utils import pad_vocab_size
 from tensorrt_llm.models import GPTNeoXForCausalLM
+from tensorrt_llm.quantization.weight_quant import (preprocess_weights,
+                                                    unpack_int4)
 
 UINT4_TO_INT4_FLAG = 1
 GPTQ_FLAG = 1
@@ -42,24 +44,10 @@ def torch_split(v, tp_size, idx, dim=0):
                             dim=dim)[idx]).contiguous()
 
 
-def unpack_int32_into_int8(w_packed):
-    # Unpack inputs packed in int32/float32 into uint4 and store them in int8 format
-    w_packed_int4x2 = w_packed.contiguous().view(torch.uint8)
-    w_unpacked = torch.zeros(w_packed_int4x2.shape[0],
-                             w_packed_int4x2.shape[1] * 2,
-                             dtype=torch.int8)
-    w_unpacked[:, ::2] = w_packed_int4x2 % 16
-    w_unpacked[:, 1::2] = w_packed_int4x2 // 16
-    return w_unpacked.contiguous()
-
-
 def preprocess_groupwise_weight_params(qweight_unpacked_int8, scales_fp16,
                                        qzeros_unpacked_int8):
-    packer = torch.ops.fastertransformer.pack_int8_tensor_to_packed_int4
-    preprocessor = torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm
-
-    qweight_interleaved = preprocessor(packer(qweight_unpacked_int8),
-                                       torch.quint4x2).view(torch.float16)
+    qweight_interleaved = preprocess_weights(qweight_unpacked_int8,
+                                             torch.quint4x2).view(torch.float16)
 
     # zeros = zeros * scales
     zeros_x_scales_fp16 = (-qzeros_unpacked_int8 + 8 * UINT4_TO_INT4_FLAG -
@@ -218,11 +206,11 @@ def load_from_hf_gpt_neox(tensorrt_llm_gpt_neox: GPTNeoXForCausalLM,
                 prefix + "attention.query_key_value.bias")
 
             # [hidden_size // 8, hidden_size * 3] -> [hidden_size * 3, hidden_size]
-            qweight_unpacked_int8 = unpack_int32_into_int8(
-                qweight_int32.T).contiguous() - 8
+            qweight_unpacked_int8 = unpack_int4(qweight_int32.T,
+                                                signed=False).contiguous() - 8
             # [hidden_size // GROUP_SIZE, hidden_size * 3 // 8] ->
             # [hidden_size // GROUP_SIZE, hidden_size * 3]
-            qzeros_unpacked_int8 = unpack_int32_into_int8(qzeros_int32)
+            qzeros_unpacked_int8 = unpack_int4(qzeros_int32, signed=False)
 
             # qkv_weights [num_heads x (q|k|v), hidden_size] ->
             # [(num_heads x q)|(num_heads x k)|(num_heads x v), hidden_size]
@@ -303,13 +291,13 @@ def load_from_hf_gpt_neox(tensorrt_llm_gpt_neox: GPTNeoXForCausalLM,
                 prefix + "attention.dense.bias").numpy()
 
             # [k=hidden_size // 8, n=hidden_size] -> [n=hidden_size, k=hidden_size]
-            qweight_unpacked_int8 = unpack_int32_into_int8(
-                qweight_int32.T).contiguous() - 8
+            qweight_unpacked_int8 = unpack_int4(qweight_int32.T,
+                                                signed=False).contiguous() - 8
             # [n=hidden_size, k=hidden_size] -> [k=hidden_size, n=hidden_size]
             qweight_unpacked_int8 = qweight_unpacked_int8.T.contiguous()
             # [k=hidden_size // GROUP_SIZE, n=hidden_size // 8] ->
             # [k=hidden_size // GROUP_SIZE, n=hidden_size]
-            qzeros_unpacked_int8 = unpack_int32_into_int8(qzeros_int32)
+            qzeros_unpacked_int8 = unpack_int4(qzeros_int32, signed=False)
 
             if tp_size > 1:
                 qweight_unpacked_int8 = torch_split(qweight_unpacked_int8,
@@ -346,13 +334,13 @@ def load_from_hf_gpt_neox(tensorrt_llm_gpt_neox: GPTNeoXForCausalLM,
                 prefix + "mlp.dense_h_to_4h.bias").numpy()
 
             # [hidden_size // 8, hidden_size * 4] -> [hidden_size, hidden_size * 4]
-            qweight_unpacked_int8 = unpack_int32_into_int8(
-                qweight_int32.T).contiguous() - 8
+            qweight_unpacked_int8 = unpack_int4(qweight_int32.T,
+                                                signed=False).contiguous() - 8
             qweight_unpacked_int8 = qweight_unpacked_int8.T.contiguous()
 
             # [hidden_size // GROUP_SIZE, hidden_size * 4 // 8] ->
             # [hidden_size // GROUP_SIZE, hidden_size * 4]
-            qzeros_unpacked_int8 = unpack_int32_into_int8(qzeros_int32)
+            qzeros_unpacked_int8 = unpack_int4(qzeros_int32, signed=False)
 
             if tp_size > 1:
                 # [hidden_size, hidden_size * 4] ->
@@ -395,13 +383,13 @@ def load_from_hf_gpt_neox(tensorrt_llm_gpt_neox: GPTNeoXForCausalLM,
                 prefix + "mlp.dense_4h_to_h.bias").numpy()
 
             # [hidden_size * 4 // 8, hidden_size] -> [hidden_size * 4, hidden_size]
-            qweight_unpacked_int8 = unpack_int32_into_int8(
-                qweight_int32.T).contiguous() - 8
+            qweight_unpacked_int8 = unpack_int4(qweight_int32.T,
+                                                signed=False).contiguous() - 8
             qweight_unpacked_int8 = qweight_unpacked_int8.T.contiguous()
 
             # [hidden_size * 4 // GROUP_SIZE, hidden_size // 8] ->
             # [hidden_size * 4 // GROUP_SIZE, hidden_size]
-            qzeros_unpacked_int8 = unpack_int32_into_int8(qzeros_int32)
+            qzeros_unpacked_int8 = unpack_int4(qzeros_int32, signed=False)
 
             if tp_size > 1:
                 # [hidden_size * 4, hidden_size] ->
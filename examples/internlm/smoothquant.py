@@ -16,14 +16,10 @@
 Utilities for SmoothQuant models
 '''
 
-import copy
-import functools
-from collections import defaultdict
-
 import torch
 import torch.nn as nn
-from tqdm import tqdm
-from transformers.pytorch_utils import Conv1D
+
+from tensorrt_llm.quantization.calibration import calibrate_activation_range
 
 
 @torch.no_grad()
@@ -146,59 +142,14 @@ def smooth_ln_fcs(ln, fcs, act_scales, alpha=0.5):
 
 @torch.no_grad()
 def capture_activation_range(model, tokenizer, num_samples=512, seq_len=512):
-    model.eval()
-    next(model.parameters()).device
-    act_scales = defaultdict(lambda: {"x": None, "y": None, "w": None})
-
     test_token_num = 923
-    tokenizer.pad_token = tokenizer.eos_token
-
-    def stat_tensor(name, tensor, act_scales, key):
-        hidden_dim = tensor.shape[-1]
-        tensor = tensor.view(-1, hidden_dim).abs().detach()
-        comming_max = torch.max(tensor, dim=0)[0].float()
-
-        if act_scales[name][key] is None:
-            act_scales[name][key] = comming_max
-        else:
-            act_scales[name][key] = torch.max(act_scales[name][key],
-                                              comming_max)
-
-    def stat_input_hook(m, x, y, name):
-        if isinstance(x, tuple):
-            x = x[0]
-        stat_tensor(name, x, act_scales, "x")
-        stat_tensor(name, y, act_scales, "y")
-
-        if act_scales[name]["w"] is None:
-            act_scales[name]["w"] = m.weight.abs().clip(1e-8,
-                                                        None).max(dim=1)[0]
-
-    hooks = []
-    for name, m in model.named_modules():
-        if isinstance(m, nn.Linear) or isinstance(m, Conv1D):
-            hooks.append(
-                m.register_forward_hook(
-                    functools.partial(stat_input_hook, name=name)))
-
     from datasets import load_dataset
     dataset_cnn = load_dataset("ccdv/cnn_dailymail", '3.0.0')
 
-    for i in tqdm(range(num_samples), desc="calibrating model"):
-        datapoint = dataset_cnn['train'][i:i + 1]
-        line = copy.copy(datapoint['article'])
-        line[0] = line[0] + ' TL;DR: '
-        line[0] = line[0].strip()
-        line[0] = line[0].replace(" n't", "n't")
-        line_encoded = tokenizer(line,
-                                 return_tensors="pt",
-                                 padding=True,
-                                 truncation=True)["input_ids"].type(torch.int64)
-        line_encoded = line_encoded[:, -test_token_num:]
-        line_encoded = line_encoded.cuda()
-        model(line_encoded)
-
-    for h in hooks:
-        h.remove()
-
-    return act_scales
+    samples = []
+    for i in range(num_samples):
+        line = dataset_cnn['train'][i]['article'] + ' TL;DR: '
+        line = line.strip().replace(" n't", "n't")
+        input_ids = tokenizer(line, truncation=True).input_ids
+        samples.append(input_ids[-test_token_num:])
+    return calibrate_activation_range(model, samples)
@@ -25,12 +25,16 @@ from safetensors import safe_open
 
 import tensorrt_llm
 import tensorrt_llm.logger as logger
-from tensorrt_llm._utils import (str_dtype_to_np, str_dtype_to_torch,
+from tensorrt_llm._utils import (numpy_to_dtype, str_dtype_to_torch,
                                  torch_to_numpy)
 from tensorrt_llm.mapping import Mapping
 from tensorrt_llm.models import LLaMAForCausalLM
 from tensorrt_llm.models.quantized.quant import get_dummy_quant_scales
 from tensorrt_llm.quantization import QuantMode
+from tensorrt_llm.quantization.weight_quant import (gptq_weights,
+                                                    preprocess_weights,
+                                                    quantize,
+                                                    symmetric_quantize)
 
 
 def get_scaling_factors(
@@ -285,12 +289,10 @@ def load_from_hf_internlm(
                                               model_emb)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
                         torch.tensor(v), plugin_weight_only_quant_type)
                     if not use_gemm_woq_plugin:
-                        dst.value = torch.tensor(v).numpy().astype(
-                            str_dtype_to_np(dtype))
+                        dst.value = numpy_to_dtype(v, dtype)
                     else:
                         dst.value = processed_torch_weights.numpy()
                     scales = tensorrt_llm_internlm.layers[
@@ -317,12 +319,10 @@ def load_from_hf_internlm(
                 split_v = split(v, mapping.tp_size, mapping.tp_rank, dim=1)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
                         torch.tensor(v), plugin_weight_only_quant_type)
                     if not use_gemm_woq_plugin:
-                        dst.value = torch.tensor(v).numpy().astype(
-                            str_dtype_to_np(dtype))
+                        dst.value = numpy_to_dtype(v, dtype)
                     else:
                         dst.value = processed_torch_weights.numpy()
                     scales = tensorrt_llm_internlm.layers[
@@ -339,12 +339,10 @@ def load_from_hf_internlm(
                 split_v = split(v, mapping.tp_size, mapping.tp_rank, dim=0)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
                         torch.tensor(v), plugin_weight_only_quant_type)
                     if not use_gemm_woq_plugin:
-                        dst.value = torch.tensor(v).numpy().astype(
-                            str_dtype_to_np(dtype))
+                        dst.value = numpy_to_dtype(v, dtype)
                     else:
                         dst.value = processed_torch_weights.numpy()
                     scales = tensorrt_llm_internlm.layers[
@@ -357,12 +355,10 @@ def load_from_hf_internlm(
                 split_v = split(v, mapping.tp_size, mapping.tp_rank, dim=1)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
                         torch.tensor(v), plugin_weight_only_quant_type)
                     if not use_gemm_woq_plugin:
-                        dst.value = torch.tensor(v).numpy().astype(
-                            str_dtype_to_np(dtype))
+                        dst.value = numpy_to_dtype(v, dtype)
                     else:
                         dst.value = processed_torch_weights.numpy()
                     scales = tensorrt_llm_internlm.layers[
@@ -375,12 +371,10 @@ def load_from_hf_internlm(
                 split_v = split(v, mapping.tp_size, mapping.tp_rank, dim=0)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
                         torch.tensor(v), plugin_weight_only_quant_type)
                     if not use_gemm_woq_plugin:
-                        dst.value = torch.tensor(v).numpy().astype(
-                            str_dtype_to_np(dtype))
+                        dst.value = numpy_to_dtype(v, dtype)
                     else:
                         dst.value = processed_torch_weights.numpy()
                     scales = tensorrt_llm_internlm.layers[
@@ -746,11 +740,10 @@ def load_from_binary(tensorrt_llm_internlm: LLaMAForCausalLM,
                     rank=mapping.tp_rank,
                     is_qkv=True)
             elif use_weight_only:
-                processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                processed_torch_weights, torch_weight_scales = symmetric_quantize(
                     torch.tensor(t), plugin_weight_only_quant_type)
                 if not use_gemm_woq_plugin:
-                    dst.value = torch.tensor(t).numpy().astype(
-                        str_dtype_to_np(dtype))
+                    dst.value = numpy_to_dtype(t, dtype)
                 else:
                     dst.value = processed_torch_weights.numpy()
                 scales = tensorrt_llm_internlm.layers[
@@ -777,11 +770,10 @@ def load_from_binary(tensorrt_llm_internlm: LLaMAForCausalLM,
                          'model.layers.' + str(i) + '.attention.dense',
                          [1, n_embd // mapping.tp_size], mapping.tp_rank)
         elif use_weight_only:
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             if not use_gemm_woq_plugin:
-                dst.value = torch.tensor(t).numpy().astype(
-                    str_dtype_to_np(dtype))
+                dst.value = numpy_to_dtype(t, dtype)
             else:
                 dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_internlm.layers[
@@ -824,11 +816,10 @@ def load_from_binary(tensorrt_llm_internlm: LLaMAForCausalLM,
                 rank=mapping.tp_rank)
         elif use_weight_only:
             dst = tensorrt_llm_internlm.layers[i].mlp.fc.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             if not use_gemm_woq_plugin:
-                dst.value = torch.tensor(t).numpy().astype(
-                    str_dtype_to_np(dtype))
+                dst.value = numpy_to_dtype(t, dtype)
             else:
                 dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_internlm.layers[i].mlp.fc.per_channel_scale
@@ -855,11 +846,10 @@ def load_from_binary(tensorrt_llm_internlm: LLaMAForCausalLM,
                 rank=mapping.tp_rank)
         elif use_weight_only:
             dst = tensorrt_llm_internlm.layers[i].mlp.gate.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             if not use_gemm_woq_plugin:
-                dst.value = torch.tensor(t).numpy().astype(
-                    str_dtype_to_np(dtype))
+                dst.value = numpy_to_dtype(t, dtype)
             else:
                 dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_internlm.layers[i].mlp.gate.per_channel_scale
@@ -886,11 +876,10 @@ def load_from_binary(tensorrt_llm_internlm: LLaMAForCausalLM,
                          [1, inter_size // mapping.tp_size], mapping.tp_rank)
         elif use_weight_only:
             dst = tensorrt_llm_internlm.layers[i].mlp.proj.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             if not use_gemm_woq_plugin:
-                dst.value = torch.tensor(t).numpy().astype(
-                    str_dtype_to_np(dtype))
+                dst.value = numpy_to_dtype(t, dtype)
             else:
                 dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_internlm.layers[i].mlp.proj.per_channel_scale
@@ -936,16 +925,6 @@ def load_from_gptq_internlm(tensorrt_llm_internlm,
     else:
         assert False, "Quantized checkpoint format not supported!"
 
-    def unpack_int32_into_int8(w_packed):
-        # Unpack inputs packed in int32/float32 into uint4 and store them in int8 format
-        w_packed_int4x2 = w_packed.contiguous().view(torch.uint8)
-        w_unpacked = torch.zeros(w_packed_int4x2.shape[0],
-                                 w_packed_int4x2.shape[1] * 2,
-                                 dtype=torch.int8)
-        w_unpacked[:, ::2] = w_packed_int4x2 % 16
-        w_unpacked[:, 1::2] = w_packed_int4x2 // 16
-        return w_unpacked.contiguous()
-
     def preprocess_groupwise_weight_params(weight_name,
                                            qweight_int32=None,
                                            qzeros_int32=None,
@@ -955,19 +934,9 @@ def load_from_gptq_internlm(tensorrt_llm_internlm,
             qzeros_int32 = model_params[weight_name[:-7] + 'qzeros'].cpu()
             scales_fp16 = model_params[weight_name[:-7] + 'scales'].cpu()
 
-        UINT4_TO_INT4_FLAG = 1
-        GPTQ_FLAG = 1
-        packer = torch.ops.fastertransformer.pack_int8_tensor_to_packed_int4
-        preprocessor = torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm
-
-        qweight_unpacked_int8 = unpack_int32_into_int8(
-            qweight_int32.T).T.contiguous() - 8
-        qweight_interleaved = preprocessor(packer(qweight_unpacked_int8),
-                                           torch.quint4x2).view(torch.float16)
-        # zeros = zeros * scales
-        qzeros_unpacked_int32 = unpack_int32_into_int8(qzeros_int32)
-        zeros_x_scales_fp16 = (-qzeros_unpacked_int32 + 8 * UINT4_TO_INT4_FLAG -
-                               GPTQ_FLAG) * scales_fp16
+        qweight_interleaved, scales_fp16, zeros_x_scales_fp16 = gptq_weights(
+            qweight_int32, qzeros_int32, scales_fp16)
+        qweight_interleaved = qweight_interleaved.view(torch.float16)
         zeros_x_scales_fp16 = zeros_x_scales_fp16.half()
 
         # return processed interleaved weight, original scales and zeros * scales
@@ -1161,16 +1130,11 @@ def load_from_awq_internlm(tensorrt_llm_internlm: LLaMAForCausalLM,
 
     getattr(tensorrt_llm_internlm, 'quant_mode', QuantMode(0))
 
-    packer = torch.ops.fastertransformer.pack_int8_tensor_to_packed_int4
-    preprocessor = torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm
     torch_dtype = str_dtype_to_torch(dtype)
 
     def AWQ_quantize_pack_preprocess(weight, scale):
-        scale = scale.repeat_interleave(group_size, dim=0)
-        weight = weight / scale
-        qweight_int8 = torch.clamp(torch.round(weight.cuda()).char(), -8, 7)
-        int4_weight = packer(qweight_int8.cpu())
-        int4_weight = preprocessor(int4_weight, torch.quint4x2)
+        qweight_int8 = quantize(weight, scale, bits=4, group_size=group_size)
+        int4_weight = preprocess_weights(qweight_int8, torch.quint4x2)
         return int4_weight.view(torch.float16).cpu().numpy()
 
     def process_and_assign_weight(awq_internlm, mPrefix, mOp, tp_dim=0):
@@ -16,14 +16,10 @@
 Utilities for SmoothQuant models
 '''
 
-import copy
-import functools
-from collections import defaultdict
-
 import torch
 import torch.nn as nn
-from tqdm import tqdm
-from transformers.pytorch_utils import Conv1D
+
+from tensorrt_llm.quantization.calibration import calibrate_activation_range
 
 
 @torch.no_grad()
@@ -150,54 +146,10 @@ def capture_activation_range(model,
                              dataset,
                              num_samples=512,
                              seq_len=512):
-    model.eval()
-    device = next(model.parameters()).device
-    act_scales = defaultdict(lambda: {"x": None, "y": None, "w": None})
-
-    tokenizer.pad_token = tokenizer.eos_token
-
-    def stat_tensor(name, tensor, act_scales, key):
-        hidden_dim = tensor.shape[-1]
-        tensor = tensor.view(-1, hidden_dim).abs().detach()
-        comming_max = torch.max(tensor, dim=0)[0].float()
-
-        if act_scales[name][key] is None:
-            act_scales[name][key] = comming_max
-        else:
-            act_scales[name][key] = torch.max(act_scales[name][key],
-                                              comming_max)
-
-    def stat_input_hook(m, x, y, name):
-        if isinstance(x, tuple):
-            x = x[0]
-        stat_tensor(name, x, act_scales, "x")
-        stat_tensor(name, y, act_scales, "y")
-
-        if act_scales[name]["w"] is None:
-            act_scales[name]["w"] = m.weight.abs().clip(1e-8,
-                                                        None).max(dim=1)[0]
-
-    hooks = []
-    for name, m in model.named_modules():
-        if isinstance(m, nn.Linear) or isinstance(m, Conv1D):
-            hooks.append(
-                m.register_forward_hook(
-                    functools.partial(stat_input_hook, name=name)))
-
-    for i in tqdm(range(num_samples), desc="calibrating model"):
-        datapoint = dataset['train'][i:i + 1]
-        line = copy.copy(datapoint['article'])
-        line[0] = line[0] + ' TL;DR: '
-        line[0] = line[0].strip()
-        line[0] = line[0].replace(" n't", "n't")
-        input_ids = tokenizer(line,
-                              return_tensors="pt",
-                              max_length=seq_len,
-                              padding=True,
-                              truncation=True).input_ids.to(device)
-        model(input_ids)
-
-    for h in hooks:
-        h.remove()
-
-    return act_scales
+    samples = []
+    for i in range(num_samples):
+        line = dataset['train'][i]['article'] + ' TL;DR: '
+        line = line.strip().replace(" n't", "n't")
+        samples.append(
+            tokenizer(line, max_length=seq_len, truncation=True).input_ids)
+    return calibrate_activation_range(model, samples)
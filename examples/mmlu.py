@@ -41,6 +41,10 @@ Example usage:
 
     python mmlu.py --hf_model_dir <HF model path> --engine_dir <TRTLLM engine path> --test_trt_llm
     python mmlu.py --hf_model_dir <HF model path> --engine_dir <TRTLLM engine path> --test_hf
+
+With --scoring loglikelihood, the questions are batched and answered by the
+most likely choice letter after their prompt, read from the logits of the
+context step, without generation.
 """
 
 import argparse
@@ -60,7 +64,7 @@ from transformers import (AutoModel, AutoModelForCausalLM,
 from utils import load_tokenizer
 
 import tensorrt_llm
-from tensorrt_llm.runtime import ModelRunner
+from tensorrt_llm.runtime import LogitsCapture, ModelRunner
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
@@ -198,33 +202,67 @@ def gen_prompt(train_df, subject, k=-1):
     return prompt
 
 
-def evaluate(args, subject, pipeline, dev_df, test_df):
-    cors = []
-    all_probs = []
-    for i in range(test_df.shape[0]):
-        # get prompt and make sure it fits
-        k = args.ntrain
-        prompt_end = format_example(test_df, i, include_answer=False)
-        train_prompt = gen_prompt(dev_df, subject, k)
-        prompt = train_prompt + prompt_end
-
-        while not pipeline.check_valid_length(prompt) and k > 0:
+class FewShotPrompts:
+    """
+    The k-shot prefixes of a subject, for k up to ntrain, and their token
+    counts. The prompt of a question takes the most shots that fit
+    max_input_len. The counts give the number of shots, instead of tokenizing
+    the prompt again for each k, and the chosen prompt is tokenized as a whole:
+    the tokens of the prefix and of the question tokenized apart differ, e.g.
+    SentencePiece prepends a space to the question.
+    """
+
+    def __init__(self, tokenizer, dev_df, subject, ntrain):
+        self.tokenizer = tokenizer
+        self.prefixes = [
+            gen_prompt(dev_df, subject, k) for k in range(ntrain + 1)
+        ]
+        self.prefix_lengths = [
+            len(tokenizer.encode(prefix)) for prefix in self.prefixes
+        ]
+
+    def input_ids(self, prompt_end, max_input_len):
+        question_length = len(
+            self.tokenizer.encode(prompt_end, add_special_tokens=False))
+        fits = [
+            k for k, length in enumerate(self.prefix_lengths)
+            if length + question_length <= max_input_len
+        ]
+        # The counts can be a token off, one more shot is tried first
+        k = min(max(fits, default=0) + 1, len(self.prefixes) - 1)
+        while True:
+            input_ids = self.tokenizer.encode(self.prefixes[k] + prompt_end)
+            if len(input_ids) <= max_input_len or k == 0:
+                return input_ids
             k -= 1
-            train_prompt = gen_prompt(dev_df, subject, k)
-            prompt = train_prompt + prompt_end
 
-        label = test_df.iloc[i, test_df.shape[1] - 1]
-        pred = pipeline(prompt)
 
-        probs = [0 for _ in get_choices()]
-        cor = pred.strip().startswith(label)
-        cors.append(cor)
-        all_probs.append(probs)
+def evaluate(args, subject, pipeline, dev_df, test_df):
+    prompts = FewShotPrompts(pipeline.tokenizer, dev_df, subject, args.ntrain)
+    batch_input_ids = [
+        prompts.input_ids(format_example(test_df, i, include_answer=False),
+                          pipeline.max_input_len)
+        for i in range(test_df.shape[0])
+    ]
+    labels = test_df.iloc[:, test_df.shape[1] - 1].tolist()
+
+    if args.scoring == "loglikelihood":
+        all_probs = np.concatenate([
+            pipeline.score(batch_input_ids[start:start + pipeline.batch_size])
+            for start in range(0, len(batch_input_ids), pipeline.batch_size)
+        ])
+        preds = [get_choices()[i] for i in all_probs.argmax(axis=-1)]
+        cors = [pred == label for pred, label in zip(preds, labels)]
+    else:
+        cors = []
+        for input_ids, label in zip(batch_input_ids, labels):
+            pred = pipeline(input_ids)
+            cors.append(pred.strip().startswith(label))
+        all_probs = np.zeros((len(cors), len(get_choices())))
 
     acc = np.mean(cors)
     cors = np.array(cors)
 
-    all_probs = np.array(all_probs)
     print("Average accuracy {:.3f} - {}".format(acc, subject))
 
     return cors, acc, all_probs
@@ -250,16 +288,31 @@ class Pipeline:
                  model,
                  pad_id,
                  end_id,
-                 max_attention_window_size=2048):
+                 max_attention_window_size=None,
+                 max_input_len=2048,
+                 batch_size=1):
         self.tokenizer = tokenizer
         self.model = model
         self.pad_id = pad_id
         self.end_id = end_id
         self.max_attention_window_size = max_attention_window_size
-
-    def __call__(self, prompt):
+        self.max_input_len = max_input_len
+        self.batch_size = batch_size
+        if isinstance(self.model, ModelRunner):
+            self.max_input_len = min(max_input_len, self.model.max_input_len)
+            self.batch_size = min(batch_size, self.model.max_batch_size)
+        # The token of each choice letter after "Answer:", as in the examples
+        self.choice_ids = [
+            tokenizer.encode(f"Answer: {choice}", add_special_tokens=False)[-1]
+            for choice in get_choices()
+        ]
+        self.logits_capture = LogitsCapture(output_token_logprobs=False,
+                                            output_nll=False,
+                                            candidate_ids=self.choice_ids)
+
+    def __call__(self, input_ids):
         # Run the model in batch size 1 and beam size 1
-        inputs = self.tokenizer.encode(prompt, return_tensors="pt").squeeze(0)
+        inputs = torch.tensor(input_ids)
         batch_input_ids = [inputs]
 
         # For multi-choice tasks like MMLU, we don't need to adjust following parameters
@@ -305,8 +358,46 @@ class Pipeline:
 
         return self.tokenizer.decode(output_ids, skip_special_tokens=True)
 
-    def check_valid_length(self, prompt):
-        return len(self.tokenizer.encode(prompt)) <= self.model.max_input_len
+    def score(self, batch_input_ids):
+        """
+        Returns the [batch, choices] probabilities of the choice letters as
+        the next token of the prompts, from a single context step.
+        """
+        batch_input_ids = [
+            torch.tensor(x, dtype=torch.int32) for x in batch_input_ids
+        ]
+        with torch.no_grad():
+            if isinstance(self.model, nn.Module):
+                # Right padding, the padding is after the last tokens
+                input_lengths = torch.tensor(
+                    [x.size(0) for x in batch_input_ids])
+                input_ids = nn.utils.rnn.pad_sequence(
+                    batch_input_ids,
+                    batch_first=True,
+                    padding_value=self.pad_id).long().cuda()
+                attention_mask = (torch.arange(input_ids.size(1)) <
+                                  input_lengths.unsqueeze(1)).long().cuda()
+                logits = self.model(input_ids,
+                                    attention_mask=attention_mask).logits
+                last_logits = logits[torch.arange(len(input_lengths)),
+                                     input_lengths.cuda() - 1]
+                choice_logits = last_logits[:, self.choice_ids].float()
+
+            elif isinstance(self.model, ModelRunner):
+                # The logits of the first step are the ones of the last
+                # token of the context
+                self.model.generate(
+                    batch_input_ids,
+                    max_new_tokens=1,
+                    max_attention_window_size=self.max_attention_window_size,
+                    end_id=self.end_id,
+                    pad_id=self.pad_id,
+                    top_k=1,
+                    logits_capture=self.logits_capture)
+                choice_logits = self.logits_capture.outputs(
+                )['candidate_logprobs'][:, 0, 0]
+
+        return choice_logits.softmax(dim=-1).cpu().numpy()
 
 
 def parse_args():
@@ -348,6 +439,19 @@ def parse_args():
         'The attention window size that controls the sliding window attention / cyclic kv cache behaviour'
     )
 
+    parser.add_argument(
+        "--scoring",
+        type=str,
+        choices=["generate", "loglikelihood"],
+        default="generate",
+        help=("How the questions are answered: 'generate' generates the "
+              "answer of each question, 'loglikelihood' picks the most likely "
+              "choice letter of batches of questions, without generation."),
+    )
+    parser.add_argument("--batch_size",
+                        type=int,
+                        default=8,
+                        help="The batch size of --scoring loglikelihood")
     parser.add_argument("--test_trt_llm", action="store_true")
     parser.add_argument("--test_hf", action="store_true")
 
@@ -407,7 +511,14 @@ def main():
             model.generation_config = GenerationConfig.from_pretrained(
                 args.hf_model_dir, trust_remote_code=True)
 
-    pipeline = Pipeline(tokenizer, model, pad_id, end_id)
+    pipeline = Pipeline(
+        tokenizer,
+        model,
+        pad_id,
+        end_id,
+        max_attention_window_size=args.max_attention_window_size,
+        max_input_len=args.max_input_length,
+        batch_size=args.batch_size)
 
     for subject in tqdm(subjects):
         dev_df = pd.read_csv(os.path.join(args.data_dir, "dev",
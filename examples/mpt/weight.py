@@ -14,6 +14,9 @@ from tensorrt_llm.mapping import Mapping
 from tensorrt_llm.models import GPTLMHeadModel
 from tensorrt_llm.models.quantized.quant import get_dummy_quant_scales
 from tensorrt_llm.quantization import QuantMode
+from tensorrt_llm.quantization.weight_quant import (preprocess_weights,
+                                                    quantize,
+                                                    symmetric_quantize)
 
 
 def get_scaling_factors(
@@ -355,7 +358,7 @@ def load_from_ft(tensorrt_llm_gpt: GPTLMHeadModel,
                     rank=rank,
                     is_qkv=True)
             elif use_weight_only:
-                processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                processed_torch_weights, torch_weight_scales = symmetric_quantize(
                     torch.tensor(t), plugin_weight_only_quant_type)
                 dst.value = processed_torch_weights.numpy()
                 scales = tensorrt_llm_gpt.layers[
@@ -391,7 +394,7 @@ def load_from_ft(tensorrt_llm_gpt: GPTLMHeadModel,
                          'model.layers.' + str(i) + '.attention.dense',
                          [1, n_embd // tensor_parallel], rank)
         elif use_weight_only:
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_gpt.layers[
@@ -434,7 +437,7 @@ def load_from_ft(tensorrt_llm_gpt: GPTLMHeadModel,
                 rank=rank)
         elif use_weight_only:
             dst = tensorrt_llm_gpt.layers[i].mlp.fc.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_gpt.layers[i].mlp.fc.per_channel_scale
@@ -478,7 +481,7 @@ def load_from_ft(tensorrt_llm_gpt: GPTLMHeadModel,
                          [1, inter_size // tensor_parallel], rank)
         elif use_weight_only:
             dst = tensorrt_llm_gpt.layers[i].mlp.proj.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_gpt.layers[i].mlp.proj.per_channel_scale
@@ -547,8 +550,6 @@ def load_from_awq_mpt(tensorrt_llm_mpt: GPTLMHeadModel,
     # Int8 KV cache
     use_int8_kv_cache = quant_mode.has_int8_kv_cache()
 
-    packer = torch.ops.fastertransformer.pack_int8_tensor_to_packed_int4
-    preprocessor = torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm
     torch_dtype = str_dtype_to_torch(dtype)
 
     def fromfile(dir_path, name, shape=None, dtype=None):
@@ -570,9 +571,8 @@ def load_from_awq_mpt(tensorrt_llm_mpt: GPTLMHeadModel,
                        dim=dim)[mapping.tp_rank]
 
     def AWQ_quantize_pack_preprocess(weight, scale):
-        weight /= scale.repeat_interleave(group_size, dim=0)
-        qweight_int8 = torch.clamp(torch.round(weight.cuda()).char(), -8, 7)
-        int4_weight = preprocessor(packer(qweight_int8.cpu()), torch.quint4x2)
+        qweight_int8 = quantize(weight, scale, bits=4, group_size=group_size)
+        int4_weight = preprocess_weights(qweight_int8, torch.quint4x2)
         return int4_weight.view(torch.float16).cpu().numpy()
 
     def process_and_assign_weight(mOp, v, tp_dim=0):
@@ -9,6 +9,7 @@ import torch
 from transformers import AutoModelForCausalLM
 
 import tensorrt_llm
+from tensorrt_llm.quantization.weight_quant import symmetric_quantize
 
 
 def parse_arguments():
@@ -133,9 +134,8 @@ def get_tllm_linear_weight(weight,
     results = {}
     if use_weight_only:
         v = weight.t().contiguous()
-        processed_torch_weights, torch_weight_scales = \
-            torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                v, plugin_weight_only_quant_type)
+        processed_torch_weights, torch_weight_scales = symmetric_quantize(
+            v, plugin_weight_only_quant_type)
         results[prefix + 'weight'] = processed_torch_weights
         results[prefix + 'per_channel_scale'] = torch_weight_scales
     else:
@@ -272,10 +272,9 @@ def convert_hf_opt(hf_model,
 
 if __name__ == '__main__':
     # TODO(qijun): Currently, the convert script depends on a torch op:
-    # torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix,
+    # torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm,
     # which is included in tensorrt_llm Python package. Otherwise, the convert
-    # script does not need to import tensorrt_llm. Will remove it after reimplementing
-    # the op with PyTorch.
+    # script does not need to import tensorrt_llm.
     print(tensorrt_llm.__version__)
     args = parse_arguments()
     tik = time.time()
@@ -16,22 +16,19 @@
 Utilities for SmoothQuant models
 '''
 
-import functools
 import os
 import sys
-from collections import defaultdict
 
-import numpy as np
 import torch
 import torch.nn as nn
-from tqdm import tqdm
-from transformers.pytorch_utils import Conv1D
 
 project_dir = os.path.dirname(
     os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(project_dir)
 from utils.utils import make_context
 
+from tensorrt_llm.quantization.calibration import calibrate_activation_range
+
 
 @torch.no_grad()
 def apply_smoothing(scales,
@@ -154,39 +151,9 @@ def capture_activation_range(
     max_input_len,
     num_samples=512,
 ):
-    model.eval()
-    device = next(model.parameters()).device
-    act_scales = defaultdict(lambda: {"x": None, "y": None, "w": None})
-
-    def stat_tensor(name, tensor, act_scales, key):
-        hidden_dim = tensor.shape[-1]
-        tensor = tensor.view(-1, hidden_dim).abs().detach()
-        comming_max = torch.max(tensor, dim=0)[0].float()
-
-        if act_scales[name][key] is None:
-            act_scales[name][key] = comming_max
-        else:
-            act_scales[name][key] = torch.max(act_scales[name][key],
-                                              comming_max)
-
-    def stat_input_hook(m, x, y, name):
-        if isinstance(x, tuple):
-            x = x[0]
-        stat_tensor(name, x, act_scales, "x")
-        stat_tensor(name, y, act_scales, "y")
-
-        if act_scales[name]["w"] is None:
-            act_scales[name]["w"] = m.weight.abs().clip(1e-8,
-                                                        None).max(dim=1)[0]
-
-    hooks = []
-    for name, m in model.named_modules():
-        if isinstance(m, nn.Linear) or isinstance(m, Conv1D):
-            hooks.append(
-                m.register_forward_hook(
-                    functools.partial(stat_input_hook, name=name)))
     num_samples = min(num_samples, len(dataset))
-    for i in tqdm(range(num_samples), desc="calibrating model"):
+    samples = []
+    for i in range(num_samples):
         line = dataset[i]["article"]
         line = line + ' TL;DR: '
         line = line.strip()
@@ -198,12 +165,5 @@ def capture_activation_range(
                                         system=system_prompt,
                                         chat_format=chat_format,
                                         max_input_length=max_input_len)
-        line_encoded = torch.from_numpy(np.array(
-            input_id_list, dtype=np.int32)).type(torch.int32).unsqueeze(0)
-        line_encoded = line_encoded.to(device)
-        model(line_encoded)
-
-    for h in hooks:
-        h.remove()
-
-    return act_scales
+        samples.append(input_id_list)
+    return calibrate_activation_range(model, samples)
@@ -28,6 +28,10 @@ from tensorrt_llm._utils import (str_dtype_to_np, str_dtype_to_torch,
 from tensorrt_llm.mapping import Mapping
 from tensorrt_llm.models import QWenForCausalLM
 from tensorrt_llm.quantization import QuantMode
+from tensorrt_llm.quantization.weight_quant import (gptq_weights,
+                                                    preprocess_weights,
+                                                    quantize,
+                                                    symmetric_quantize)
 
 
 def gen_suffix(rank, use_smooth_quant, quant_per_channel):
@@ -235,7 +239,7 @@ def load_from_ft(tensorrt_llm_qwen: QWenForCausalLM,
                     rank=mapping.tp_rank,
                     is_qkv=True)
             elif use_weight_only:
-                processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                processed_torch_weights, torch_weight_scales = symmetric_quantize(
                     torch.tensor(t), plugin_weight_only_quant_type)
                 dst.value = processed_torch_weights.numpy()
                 scales = tensorrt_llm_qwen.layers[
@@ -273,7 +277,7 @@ def load_from_ft(tensorrt_llm_qwen: QWenForCausalLM,
                          [1, hidden_size // mapping.tp_size], mapping.tp_rank)
 
         elif use_weight_only:
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_qwen.layers[
@@ -300,7 +304,7 @@ def load_from_ft(tensorrt_llm_qwen: QWenForCausalLM,
                 rank=mapping.tp_rank)
         elif use_weight_only:
             dst = tensorrt_llm_qwen.layers[i].mlp.gate.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_qwen.layers[i].mlp.gate.per_channel_scale
@@ -328,7 +332,7 @@ def load_from_ft(tensorrt_llm_qwen: QWenForCausalLM,
                 rank=mapping.tp_rank)
         elif use_weight_only:
             dst = tensorrt_llm_qwen.layers[i].mlp.fc.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_qwen.layers[i].mlp.fc.per_channel_scale
@@ -357,7 +361,7 @@ def load_from_ft(tensorrt_llm_qwen: QWenForCausalLM,
                          mapping.tp_rank)
         elif use_weight_only:
             dst = tensorrt_llm_qwen.layers[i].mlp.proj.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_qwen.layers[i].mlp.proj.per_channel_scale
@@ -443,7 +447,7 @@ def load_from_hf_qwen(tensorrt_llm_qwen: tensorrt_llm.models.QWenForCausalLM,
                                               model_emb)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
                         torch.tensor(v), plugin_weight_only_quant_type)
                     dst.value = processed_torch_weights.numpy()
                     scales = tensorrt_llm_qwen.layers[
@@ -470,7 +474,7 @@ def load_from_hf_qwen(tensorrt_llm_qwen: tensorrt_llm.models.QWenForCausalLM,
                 split_v = split(v, mapping.tp_size, mapping.tp_rank, dim=1)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
                         torch.tensor(v), plugin_weight_only_quant_type)
                     dst.value = processed_torch_weights.numpy()
                     scales = tensorrt_llm_qwen.layers[
@@ -483,7 +487,7 @@ def load_from_hf_qwen(tensorrt_llm_qwen: tensorrt_llm.models.QWenForCausalLM,
                 split_v = split(v, mapping.tp_size, mapping.tp_rank, dim=0)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
                         torch.tensor(v), plugin_weight_only_quant_type)
                     dst.value = processed_torch_weights.numpy()
                     scales = tensorrt_llm_qwen.layers[
@@ -496,7 +500,7 @@ def load_from_hf_qwen(tensorrt_llm_qwen: tensorrt_llm.models.QWenForCausalLM,
                 split_v = split(v, mapping.tp_size, mapping.tp_rank, dim=0)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
                         torch.tensor(v), plugin_weight_only_quant_type)
                     dst.value = processed_torch_weights.numpy()
                     scales = tensorrt_llm_qwen.layers[
@@ -509,7 +513,7 @@ def load_from_hf_qwen(tensorrt_llm_qwen: tensorrt_llm.models.QWenForCausalLM,
                 split_v = split(v, mapping.tp_size, mapping.tp_rank, dim=1)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
                         torch.tensor(v), plugin_weight_only_quant_type)
                     dst.value = processed_torch_weights.numpy()
                     scales = tensorrt_llm_qwen.layers[
@@ -550,16 +554,6 @@ def load_from_gptq_qwen(
     else:
         raise ValueError("quantized checkpoint format not supported!")
 
-    def unpack_int32_into_int8(w_packed):
-        # unpack inputs packed in int32/float32 into uint4 and store them in int8 format
-        w_packed_int4x2 = w_packed.contiguous().view(torch.uint8)
-        w_unpacked = torch.zeros(w_packed_int4x2.shape[0],
-                                 w_packed_int4x2.shape[1] * 2,
-                                 dtype=torch.int8)
-        w_unpacked[:, ::2] = w_packed_int4x2 % 16
-        w_unpacked[:, 1::2] = w_packed_int4x2 // 16
-        return w_unpacked.contiguous()
-
     def preprocess_groupwise_weight_params(
         weight_name,
         qweight_int32=None,
@@ -571,20 +565,9 @@ def load_from_gptq_qwen(
             qzeros_int32 = model_params[weight_name[:-7] + "qzeros"].cpu()
             scales_fp16 = model_params[weight_name[:-7] + "scales"].cpu()
 
-        UINT4_TO_INT4_FLAG = 1
-        GPTQ_FLAG = 1
-        packer = torch.ops.fastertransformer.pack_int8_tensor_to_packed_int4
-        preprocessor = torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm
-
-        qweight_unpacked_int8 = (
-            unpack_int32_into_int8(qweight_int32.T).T.contiguous() - 8)
-        qweight_interleaved = preprocessor(packer(qweight_unpacked_int8),
-                                           torch.quint4x2).view(torch.float16)
-        # zeros = zeros * scales
-        qzeros_unpacked_int32 = unpack_int32_into_int8(qzeros_int32)
-
-        zeros_x_scales_fp16 = (-qzeros_unpacked_int32 + 8 * UINT4_TO_INT4_FLAG -
-                               GPTQ_FLAG) * scales_fp16
+        qweight_interleaved, scales_fp16, zeros_x_scales_fp16 = gptq_weights(
+            qweight_int32, qzeros_int32, scales_fp16)
+        qweight_interleaved = qweight_interleaved.view(torch.float16)
         zeros_x_scales_fp16 = zeros_x_scales_fp16.half()
 
         # return processed interleaved weight, original scales and zeros * scales
@@ -801,17 +784,11 @@ def load_from_awq_qwen(tensorrt_llm_qwen: QWenForCausalLM,
 
     getattr(tensorrt_llm_qwen, 'quant_mode', QuantMode(0))
 
-    packer = torch.ops.fastertransformer.pack_int8_tensor_to_packed_int4
-    preprocessor = torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm
     torch_dtype = str_dtype_to_torch(dtype)
 
     def AWQ_quantize_pack_preprocess(weight, scale):
-        scale = scale.repeat_interleave(group_size, dim=0)
-        weight = weight / scale  # fp16 -> int8
-        qweight_int8 = torch.clamp(torch.round(weight.cuda()).char(), -8, 7)
-        int4_weight = packer(qweight_int8.cpu())
-        int4_weight = preprocessor(int4_weight,
-                                   torch.quint4x2)  # int8 save as uint4
+        qweight_int8 = quantize(weight, scale, bits=4, group_size=group_size)
+        int4_weight = preprocess_weights(qweight_int8, torch.quint4x2)
         return int4_weight.view(torch.float16).cpu().numpy()
 
     def process_and_assign_weight(model_params, mPrefix, mOp, tp_dim=0):
@@ -0,0 +1,84 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The ROUGE of summarize.py. The module only imports rouge_score, it is the
+main module of the metric workers, which then do not import the dependencies
+of the script.
+"""
+import sys
+from multiprocessing import get_context
+
+import numpy as np
+from rouge_score import rouge_scorer, scoring
+
+# The scores of the rouge metric of evaluate
+ROUGE_TYPES = ['rouge1', 'rouge2', 'rougeL', 'rougeLsum']
+
+
+def _rouge_scores(predictions, references):
+    scorer = rouge_scorer.RougeScorer(rouge_types=ROUGE_TYPES)
+    return [
+        scorer.score(reference, prediction)
+        for prediction, reference in zip(predictions, references)
+    ]
+
+
+def create_pool(processes):
+    """
+    Returns a pool of processes scoring the ROUGE. They are spawned, as the
+    script runs CUDA and MPI, with this module as their main module instead of
+    the script.
+    """
+    main = sys.modules['__main__']
+    # The spawned processes import the main module of the parent when they
+    # start, the pool starts them all at once
+    sys.modules['__main__'] = sys.modules[__name__]
+    try:
+        return get_context('spawn').Pool(processes)
+    finally:
+        sys.modules['__main__'] = main
+
+
+class RougeMetric:
+    """
+    The ROUGE of evaluate.load("rouge"), whose samples are scored by a process
+    pool while the next batches generate. compute() aggregates the scores in
+    the order of the batches, with the bootstrap of evaluate, so the results
+    are the same.
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool
+        self.scores = []
+
+    def add_batch(self, predictions, references):
+        if self.pool is None:
+            self.scores.append(_rouge_scores(predictions, references))
+        else:
+            self.scores.append(
+                self.pool.apply_async(_rouge_scores,
+                                      (list(predictions), list(references))))
+
+    def compute(self):
+        # evaluate seeds the bootstrap sampling of every compute
+        np.random.seed(0)
+        aggregator = scoring.BootstrapAggregator()
+        for scores in self.scores:
+            if self.pool is not None:
+                scores = scores.get()
+            for score in scores:
+                aggregator.add_scores(score)
+        result = aggregator.aggregate()
+        return {key: value.mid.fmeasure for key, value in result.items()}
@@ -118,6 +118,12 @@ def parse_arguments(args=None):
                         type=int,
                         help="How often to return tokens when streaming.",
                         default=5)
+    parser.add_argument(
+        '--streaming_deltas',
+        default=False,
+        action='store_true',
+        help="When streaming, receive the new tokens of the steps only "
+        "instead of the whole output ids. Not supported with beam search.")
     parser.add_argument(
         '--prompt_table_path',
         type=str,
@@ -386,11 +392,22 @@ def main(args):
             prompt_table_path=args.prompt_table_path,
             prompt_tasks=args.prompt_tasks,
             streaming=args.streaming,
+            stream_deltas=args.streaming_deltas,
             output_sequence_lengths=True,
             return_dict=True)
         torch.cuda.synchronize()
 
-    if args.streaming:
+    if args.streaming and args.streaming_deltas:
+        output_token_ids = [[] for _ in batch_input_ids]
+        for delta in throttle_generator(outputs, args.streaming_interval):
+            for batch_idx, beams in enumerate(delta.token_lists()):
+                output_token_ids[batch_idx].extend(beams[0])
+            if runtime_rank == 0:
+                for batch_idx, token_ids in enumerate(output_token_ids):
+                    output_text = tokenizer.decode(token_ids)
+                    print(
+                        f'Output [Text {batch_idx} Beam 0]: \"{output_text}\"')
+    elif args.streaming:
         for curr_outputs in throttle_generator(outputs,
                                                args.streaming_interval):
             if runtime_rank == 0:
@@ -8,9 +8,12 @@ from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse, Response, StreamingResponse
 
 from tensorrt_llm.engine import AsyncLLMEngine
+from tensorrt_llm.hlapi.admission_queue import (QueueOverloadError,
+                                                QueueTimeoutError)
 
 TIMEOUT_KEEP_ALIVE = 5  # seconds.
 TIMEOUT_TO_PREVENT_DEADLOCK = 1  # seconds.
+RETRY_AFTER = 1  # seconds.
 app = FastAPI()
 async_engine: AsyncLLMEngine = None
 
@@ -22,6 +25,8 @@ async def stats() -> Response:
         result = {}
     else:
         result = json.loads(await async_engine.stats.async_q.get())
+    # The depth, admissions and wait times (in seconds) of the admission queue
+    result["admission_queue"] = async_engine.requests.stats()
 
     return JSONResponse(result)
 
@@ -39,31 +44,52 @@ async def generate(request: Request) -> Response:
     The request should be a JSON object with the following fields:
     - prompt: the prompt to use for the generation.
     - stream: whether to stream the results or not.
+    - priority: the requests of higher priorities are admitted first, 0 by default.
+    - queue_timeout: the seconds the request can wait for admission.
     - other fields: the sampling parameters (See `SamplingParams` for details).
+
+    The server replies 503 when the admission queue is full or when the
+    request is not admitted before its queue_timeout.
     """
     request_dict = await request.json()
 
     streaming = request_dict.pop("streaming", False)
-    generator = async_engine.generate(request_dict.pop("prompt"),
-                                      request_dict.pop("max_num_tokens", 8),
-                                      streaming)
+    try:
+        generator = async_engine.generate(
+            request_dict.pop("prompt"),
+            request_dict.pop("max_num_tokens", 8),
+            streaming,
+            priority=request_dict.pop("priority", 0),
+            queue_timeout=request_dict.pop("queue_timeout", None))
+    except QueueOverloadError as e:
+        return JSONResponse({"error": str(e)},
+                            status_code=503,
+                            headers={"Retry-After": str(RETRY_AFTER)})
 
     async def stream_results() -> AsyncGenerator[bytes, None]:
-        async for output in generator:
-            yield (json.dumps(output) + "\0").encode("utf-8")
+        try:
+            async for output in generator:
+                yield (json.dumps(output) + "\0").encode("utf-8")
+        finally:
+            # Cancels the request if the client went away
+            await generator.aclose()
 
     if streaming:
         return StreamingResponse(stream_results())
 
     # Non-streaming case
-    return JSONResponse({"text": await anext(generator)})
+    try:
+        return JSONResponse({"text": await anext(generator)})
+    except QueueTimeoutError as e:
+        return JSONResponse({"error": str(e)}, status_code=503)
 
 
 async def main(args):
     global async_engine
 
     async_engine = AsyncLLMEngine(args.model_dir, args.tokenizer_type,
-                                  args.max_beam_width, args.max_num_sequences)
+                                  args.max_beam_width, args.max_num_sequences,
+                                  args.max_queue_size)
     config = uvicorn.Config(app,
                             host=args.host,
                             port=args.port,
@@ -80,6 +106,11 @@ if __name__ == "__main__":
     parser.add_argument("--port", type=int, default=8000)
     parser.add_argument("--max_beam_width", type=int, default=1)
     parser.add_argument("--max_num_sequences", type=int, default=10)
+    parser.add_argument(
+        "--max_queue_size",
+        type=int,
+        default=None,
+        help="Requests beyond this many queued ones are rejected with 503")
     args = parser.parse_args()
 
     asyncio.run(main(args))
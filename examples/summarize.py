@@ -14,13 +14,16 @@
 # limitations under the License.
 
 import argparse
+import hashlib
+import json
+import os
 from pathlib import Path
 
-import evaluate
 import numpy as np
 import torch
 from datasets import load_dataset
 from qwen.utils.utils import make_context
+from rouge_metric import RougeMetric, create_pool
 from transformers import (AutoModel, AutoModelForCausalLM,
                           AutoModelForSeq2SeqLM, GenerationConfig)
 from utils import DEFAULT_HF_MODEL_DIRS, load_tokenizer, read_model_name
@@ -35,6 +38,76 @@ from tensorrt_llm.tools.ppl import ppl
 if PYTHON_BINDINGS:
     from tensorrt_llm.runtime import ModelRunnerCpp
 
+# The files of a model or tokenizer directory hashed by content, the larger
+# ones by size and modification time
+_FINGERPRINT_MAX_HASHED_SIZE = 64 << 20
+
+
+def _fingerprint(path):
+    path = Path(path)
+    if not path.exists():
+        return str(path)
+    files = sorted(path.iterdir()) if path.is_dir() else [path]
+    fingerprint = {}
+    for file in files:
+        if not file.is_file():
+            continue
+        stat = file.stat()
+        if stat.st_size <= _FINGERPRINT_MAX_HASHED_SIZE:
+            fingerprint[file.name] = hashlib.sha256(
+                file.read_bytes()).hexdigest()
+        else:
+            fingerprint[file.name] = [stat.st_size, stat.st_mtime_ns]
+    return fingerprint
+
+
+class ReferenceCache:
+    """
+    The outputs and perplexities of the HF model per batch, cached in a JSON
+    file named by the hash of key, everything they depend on. The regression
+    runs that only change the TensorRT-LLM engine then skip the HF model.
+    """
+
+    def __init__(self, cache_dir, key):
+        # The key as read back from the JSON file
+        self.key = json.loads(json.dumps(key, sort_keys=True))
+        digest = hashlib.sha256(json.dumps(
+            self.key, sort_keys=True).encode()).hexdigest()[:32]
+        self.path = Path(cache_dir) / f'hf_outputs_{digest}.json'
+        self.batches = {}
+        self.modified = False
+        if self.path.exists():
+            with self.path.open() as f:
+                cached = json.load(f)
+            if cached['key'] == self.key:
+                self.batches = cached['batches']
+
+    def contains(self, batch_starts):
+        return all(str(start) in self.batches for start in batch_starts)
+
+    def get(self, batch_start):
+        entry = self.batches.get(str(batch_start))
+        if entry is None:
+            return None
+        return entry['outputs'], entry['ppls']
+
+    def put(self, batch_start, outputs, ppls):
+        self.batches[str(batch_start)] = {
+            'outputs': outputs,
+            'ppls': [[float(p) for p in beam_ppls] for beam_ppls in ppls]
+        }
+        self.modified = True
+
+    def save(self):
+        if not self.modified:
+            return
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        tmp_path = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        with tmp_path.open('w') as f:
+            json.dump({'key': self.key, 'batches': self.batches}, f)
+        os.replace(tmp_path, self.path)
+        self.modified = False
+
 
 def main(args):
     runtime_rank = tensorrt_llm.mpi_rank()
@@ -83,6 +156,7 @@ def main(args):
                            split=dataset_split)
 
     max_batch_size = args.batch_size
+    batch_starts = list(range(0, len(dataset), max_batch_size))[:args.max_ite]
 
     # runtime parameters
     top_k = args.top_k
@@ -100,6 +174,46 @@ def main(args):
     presence_penalty = args.presence_penalty
     frequency_penalty = args.frequency_penalty
 
+    hf_cache = None
+    if test_hf and args.reference_cache_dir is not None:
+        hf_cache = ReferenceCache(
+            args.reference_cache_dir, {
+                'model': [args.hf_model_dir,
+                          _fingerprint(args.hf_model_dir)],
+                'model_name':
+                model_name,
+                'data_type':
+                args.data_type,
+                'dataset':
+                [dataset_name, dataset_revision, dataset_split,
+                 len(dataset)],
+                'eval_task':
+                args.eval_task,
+                'eval_ppl':
+                args.eval_ppl,
+                'batch_size':
+                max_batch_size,
+                'max_input_length':
+                test_token_num,
+                'add_special_tokens':
+                args.add_special_tokens,
+                'sampling': [
+                    output_len, top_k, top_p, temperature, num_beams,
+                    length_penalty, repetition_penalty, presence_penalty,
+                    frequency_penalty
+                ],
+                'tokenizer': [
+                    type(tokenizer).__name__,
+                    _fingerprint(args.tokenizer_dir),
+                    _fingerprint(args.vocab_file) if args.vocab_file else None
+                ],
+            })
+    # The HF model is not loaded when all its outputs are cached
+    run_hf = test_hf and (hf_cache is None
+                          or not hf_cache.contains(batch_starts))
+    if test_hf and not run_hf:
+        logger.info(f'HF outputs are read from {hf_cache.path}')
+
     if test_trt_llm:
         if not PYTHON_BINDINGS and not args.use_py_session:
             logger.warning(
@@ -122,7 +236,7 @@ def main(args):
         assert not (args.eval_ppl and not runner.gather_all_token_logits), \
             "PPL evaluation requires engine built with gather_all_token_logits enabled"
 
-    if test_hf:
+    if run_hf:
         profiler.start('load HF model')
         dtype_alias_mapping = {
             'fp32': 'float32',
@@ -379,7 +493,7 @@ def main(args):
             logger.info(
                 "---------------------------------------------------------")
 
-    if test_hf:
+    if run_hf:
         datapoint = dataset[0:1]
         output, *_ = eval_hf(datapoint,
                              eval_task=args.eval_task,
@@ -392,18 +506,17 @@ def main(args):
         logger.info(f"\n Output : {output}")
         logger.info("---------------------------------------------------------")
 
-    # TODO: Add random_seed flag in gptj
-    metric_tensorrt_llm = [evaluate.load("rouge") for _ in range(num_beams)]
-    metric_hf = [evaluate.load("rouge") for _ in range(num_beams)]
-    for i in range(num_beams):
-        metric_tensorrt_llm[i].seed = 0
-        metric_hf[i].seed = 0
+    # The ROUGE of the batches is computed by the metric workers, while the
+    # next batches generate
+    metric_pool = None
+    if runtime_rank == 0 and args.metric_workers > 0:
+        metric_pool = create_pool(args.metric_workers)
+    metric_tensorrt_llm = [RougeMetric(metric_pool) for _ in range(num_beams)]
+    metric_hf = [RougeMetric(metric_pool) for _ in range(num_beams)]
     ppls_trt_llm = [[] for _ in range(num_beams)]
     ppls_hf = [[] for _ in range(num_beams)]
 
-    ite_count = 0
-    data_point_idx = 0
-    while (data_point_idx < len(dataset)) and (ite_count < args.max_ite):
+    for data_point_idx in batch_starts:
         if runtime_rank == 0:
             logger.debug(
                 f"run data_point {data_point_idx} ~ {data_point_idx + max_batch_size}"
@@ -421,25 +534,32 @@ def main(args):
 
         if test_hf:
             profiler.start('hf')
-            output_hf, _, curr_ppls_hf = eval_hf(
-                datapoint,
-                eval_task=args.eval_task,
-                eval_ppl=args.eval_ppl,
-                add_special_tokens=args.add_special_tokens)
+            cached = hf_cache.get(
+                data_point_idx) if hf_cache is not None else None
+            if cached is not None:
+                output_hf, curr_ppls_hf = cached
+            else:
+                output_hf, _, curr_ppls_hf = eval_hf(
+                    datapoint,
+                    eval_task=args.eval_task,
+                    eval_ppl=args.eval_ppl,
+                    add_special_tokens=args.add_special_tokens)
+                if hf_cache is not None:
+                    hf_cache.put(data_point_idx, output_hf, curr_ppls_hf)
             profiler.stop('hf')
 
         if runtime_rank == 0:
             if test_trt_llm:
-                for batch_idx in range(len(output_tensorrt_llm)):
-                    for beam_idx in range(num_beams):
-                        metric_tensorrt_llm[beam_idx].add_batch(
-                            predictions=[
-                                output_tensorrt_llm[batch_idx][beam_idx]
-                            ],
-                            references=[
-                                datapoint[dataset_output_key][batch_idx]
-                            ])
-                        if args.eval_ppl:
+                batch_size = len(output_tensorrt_llm)
+                for beam_idx in range(num_beams):
+                    metric_tensorrt_llm[beam_idx].add_batch(
+                        predictions=[
+                            output_tensorrt_llm[batch_idx][beam_idx]
+                            for batch_idx in range(batch_size)
+                        ],
+                        references=datapoint[dataset_output_key][:batch_size])
+                    if args.eval_ppl:
+                        for batch_idx in range(batch_size):
                             ppls_trt_llm[beam_idx].append(
                                 curr_ppls_trt_llm[batch_idx][beam_idx])
                 if output_dir is not None:
@@ -451,13 +571,12 @@ def main(args):
                     # yapf: enable
             if test_hf:
                 for beam_idx in range(num_beams):
-                    for batch_idx in range(len(output_hf[beam_idx])):
-                        metric_hf[beam_idx].add_batch(
-                            predictions=[output_hf[beam_idx][batch_idx]],
-                            references=[
-                                datapoint[dataset_output_key][batch_idx]
-                            ])
-                        if args.eval_ppl and args.batch_size == 1:
+                    batch_size = len(output_hf[beam_idx])
+                    metric_hf[beam_idx].add_batch(
+                        predictions=output_hf[beam_idx],
+                        references=datapoint[dataset_output_key][:batch_size])
+                    if args.eval_ppl and args.batch_size == 1:
+                        for batch_idx in range(batch_size):
                             ppls_hf[beam_idx].append(
                                 curr_ppls_hf[batch_idx][beam_idx])
                 if output_dir is not None:
@@ -476,12 +595,11 @@ def main(args):
                 logger.debug(f'HF Output: {output_hf}')
             logger.debug(f"Reference : {datapoint[dataset_output_key]}")
 
-        data_point_idx += max_batch_size
-        ite_count += 1
+    if hf_cache is not None and runtime_rank == 0:
+        hf_cache.save()
 
     if runtime_rank == 0:
         if test_trt_llm:
-            np.random.seed(0)  # rouge score use sampling to compute the score
             logger.info(
                 f'TensorRT-LLM (total latency: {profiler.elapsed_time_in_sec("tensorrt_llm")} sec)'
             )
@@ -501,7 +619,6 @@ def main(args):
                         f"  Per-token perplexity: {np.mean(ppls_trt_llm[beam_idx])}"
                     )
         if test_hf:
-            np.random.seed(0)  # rouge score use sampling to compute the score
             logger.info(
                 f'Hugging Face (total latency: {profiler.elapsed_time_in_sec("hf")} sec)'
             )
@@ -513,6 +630,9 @@ def main(args):
                 if args.eval_ppl and args.batch_size == 1:
                     logger.info(
                         f"  Per-token perplexity: {np.mean(ppls_hf[beam_idx])}")
+    if metric_pool is not None:
+        metric_pool.close()
+        metric_pool.join()
 
 
 if __name__ == '__main__':
@@ -549,6 +669,20 @@ if __name__ == '__main__':
     parser.add_argument('--log_level', type=str, default='info')
     parser.add_argument('--batch_size', type=int, default=1)
     parser.add_argument('--max_ite', type=int, default=20)
+    parser.add_argument(
+        '--reference_cache_dir',
+        type=str,
+        default=None,
+        help="Directory where to cache the HF outputs and perplexities, "
+        "keyed by the model, the dataset slice, the sampling parameters and "
+        "the tokenizer. The reruns with a different TensorRT-LLM engine "
+        "then skip the HF model. If None, the HF outputs are not cached.")
+    parser.add_argument(
+        '--metric_workers',
+        type=int,
+        default=2,
+        help="The processes computing the ROUGE scores while the next batches "
+        "generate, 0 to compute them in the main process.")
     parser.add_argument('--output_len', type=int, default=100)
     parser.add_argument('--max_input_length', type=int, default=923)
     parser.add_argument(
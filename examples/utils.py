@@ -20,6 +20,7 @@ from typing import Optional
 from transformers import AutoTokenizer, T5Tokenizer
 
 import tensorrt_llm
+from tensorrt_llm.runtime import StreamDelta
 
 DEFAULT_HF_MODEL_DIRS = {
     'baichuan': 'baichuan-inc/Baichuan-13B-Chat',
@@ -64,9 +65,19 @@ def read_model_name(engine_dir: str):
 
 
 def throttle_generator(generator, stream_interval):
+    # The StreamDelta of the skipped steps are coalesced into the next yielded
+    # one instead of being dropped, as they are the only copy of their tokens.
+    # They are concatenated as they come, the slots of their tensors are
+    # reused by the later steps.
+    delta = None
     for i, out in enumerate(generator):
+        if isinstance(out, StreamDelta):
+            if delta is not None:
+                out = StreamDelta.concat([delta, out])
+            delta = out
         if not i % stream_interval:
             yield out
+            delta = None
 
     if i % stream_interval:
         yield out
@@ -0,0 +1,116 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Cost of the log-Mel features of a batch of recordings, without the engines.
+
+Compares the previous features, one log_mel_spectrogram per recording with the
+Hann window rebuilt every call, with LogMelSpectrogram over the windows of the
+whole batch. The recordings are random noise, those longer than 30 s are split
+into overlapping windows, which the previous features trimmed. Runs on the CPU
+by default.
+"""
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import torch
+from features import DEFAULT_OVERLAP, LogMelSpectrogram, split_batch
+from whisper_utils import (HOP_LENGTH, N_FFT, N_SAMPLES, SAMPLE_RATE,
+                           mel_filters, pad_or_trim)
+
+
+def previous_log_mel_spectrogram(audio, n_mels, device, mel_filters_dir):
+    audio = torch.from_numpy(pad_or_trim(audio, N_SAMPLES).astype(np.float32))
+    audio = audio.to(device)
+    window = torch.hann_window(N_FFT).to(audio.device)
+    stft = torch.stft(audio,
+                      N_FFT,
+                      HOP_LENGTH,
+                      window=window,
+                      return_complex=True)
+    magnitudes = stft[..., :-1].abs()**2
+    mel_spec = mel_filters(audio.device, n_mels, mel_filters_dir) @ magnitudes
+    log_spec = torch.clamp(mel_spec, min=1e-10).log10()
+    log_spec = torch.maximum(log_spec, log_spec.max() - 8.0)
+    return (log_spec + 4.0) / 4.0
+
+
+def previous_features(audios, n_mels, device, mel_filters_dir):
+    return torch.stack([
+        previous_log_mel_spectrogram(audio, n_mels, device, mel_filters_dir)
+        for audio in audios
+    ])
+
+
+def timeit(fn, iters, device):
+    fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(iters):
+        result = fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / iters, result
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--batch_size', type=int, default=16)
+    parser.add_argument('--min_duration', type=float, default=5.0)
+    parser.add_argument('--max_duration', type=float, default=30.0)
+    parser.add_argument('--overlap', type=float, default=DEFAULT_OVERLAP)
+    parser.add_argument('--n_mels', type=int, default=80)
+    parser.add_argument('--mel_filters_dir', type=str, default=None)
+    parser.add_argument('--device', type=str, default='cpu')
+    parser.add_argument('--iters', type=int, default=5)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    rng = np.random.default_rng(0)
+    durations = rng.uniform(args.min_duration, args.max_duration,
+                            args.batch_size)
+    audios = [
+        0.1 * rng.standard_normal(int(d * SAMPLE_RATE), dtype=np.float32)
+        for d in durations
+    ]
+    extractor = LogMelSpectrogram(args.n_mels, device, args.mel_filters_dir)
+
+    def batched_features():
+        windows, _ = split_batch(audios, args.overlap)
+        return extractor(windows)
+
+    previous_time, previous = timeit(
+        lambda: previous_features(audios, args.n_mels, device, args.
+                                  mel_filters_dir), args.iters, device)
+    batched_time, current = timeit(batched_features, args.iters, device)
+    print(f'[BENCHMARK] batch_size {args.batch_size} '
+          f'duration {args.min_duration}-{args.max_duration}s '
+          f'audio {durations.sum():.1f}s device {device}')
+    print(f'features: previous(ms) {previous_time * 1e3:.3f} '
+          f'({len(previous)} windows) '
+          f'batched(ms) {batched_time * 1e3:.3f} ({len(current)} windows) '
+          f'speedup {previous_time / batched_time:.1f}x')
+    previous_time /= len(previous)
+    batched_time /= len(current)
+    print(f'per window: previous(ms) {previous_time * 1e3:.3f} '
+          f'batched(ms) {batched_time * 1e3:.3f} '
+          f'speedup {previous_time / batched_time:.1f}x')
+    if args.max_duration <= N_SAMPLES / SAMPLE_RATE:
+        torch.testing.assert_close(previous, current)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The batched feature pipeline of the Whisper example.
+
+The audio is decoded and split into 30 s windows in the worker processes of a
+DataLoader, ahead of the encoder. The recordings longer than 30 s are split
+into overlapping windows, transcribed as a batch, and the transcripts of their
+windows are stitched back. LogMelSpectrogram computes the features of all the
+windows of a batch with a single STFT and a single matmul, with the Hann window
+and the mel filter bank cached on its device. It runs on the CPU as well, by
+chunks of a few windows.
+"""
+import re
+from difflib import SequenceMatcher
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import Dataset
+from whisper_utils import (CHUNK_LENGTH, HOP_LENGTH, N_FFT, N_SAMPLES,
+                           SAMPLE_RATE, hann_window, load_audio,
+                           load_audio_wav_format, mel_filters)
+
+# The seconds shared by two consecutive windows of a long recording
+DEFAULT_OVERLAP = 5.0
+# The windows of a chunk of LogMelSpectrogram on the CPU
+CPU_CHUNK_SIZE = 4
+
+
+class LogMelSpectrogram(object):
+    """
+    Computes the log-Mel spectrograms of batches of 16 kHz waveforms.
+
+    A GPU computes a whole batch at once. The CPU is bound by the memory
+    bandwidth on the STFT of a large batch, it computes the batch by chunks of
+    chunk_size windows whose spectrograms fit its caches.
+    """
+
+    def __init__(self,
+                 n_mels: int,
+                 device: Union[str, torch.device] = 'cpu',
+                 mel_filters_dir: Optional[str] = None,
+                 chunk_size: Optional[int] = None):
+        self.device = torch.device(device)
+        self.window = hann_window(self.device)
+        self.filters = mel_filters(self.device, n_mels, mel_filters_dir)
+        if chunk_size is None and self.device.type == 'cpu':
+            chunk_size = CPU_CHUNK_SIZE
+        self.chunk_size = chunk_size
+
+    def __call__(self, audio: torch.Tensor, padding: int = 0) -> torch.Tensor:
+        """
+        Returns the [batch, n_mels, n_frames] log-Mel spectrograms of the
+        [batch, n_samples] audio, a single [n_mels, n_frames] spectrogram for a
+        1D audio as log_mel_spectrogram. Each spectrogram is clamped to 8 below
+        its own maximum.
+        """
+        audio = audio.to(self.device, torch.float32, non_blocking=True)
+        if padding > 0:
+            audio = F.pad(audio, (0, padding))
+        if audio.dim() == 1 or self.chunk_size is None or \
+                len(audio) <= self.chunk_size:
+            return self._log_mel(audio)
+        chunks = audio.split(self.chunk_size)
+        first = self._log_mel(chunks[0])
+        log_spec = first.new_empty((len(audio), ) + first.shape[1:])
+        log_spec[:len(first)] = first
+        start = len(first)
+        for chunk in chunks[1:]:
+            log_spec[start:start + len(chunk)] = self._log_mel(chunk)
+            start += len(chunk)
+        return log_spec
+
+    def _log_mel(self, audio: torch.Tensor) -> torch.Tensor:
+        stft = torch.stft(audio,
+                          N_FFT,
+                          HOP_LENGTH,
+                          window=self.window,
+                          return_complex=True)
+        # The squared magnitudes, without the square root of abs()
+        magnitudes = stft.real.square() + stft.imag.square()
+        mel_spec = self.filters @ magnitudes[..., :-1]
+
+        log_spec = mel_spec.clamp_(min=1e-10).log10_()
+        max_spec = log_spec.amax(dim=(-2, -1), keepdim=True)
+        log_spec = torch.maximum(log_spec, max_spec - 8.0)
+        return log_spec.add_(4.0).div_(4.0)
+
+
+def split_audio(audio: np.ndarray,
+                overlap: float = DEFAULT_OVERLAP) -> np.ndarray:
+    """
+    Returns the [num_windows, N_SAMPLES] float32 windows of 30 s of the audio,
+    consecutive windows sharing overlap seconds, the last one zero padded. An
+    audio of at most 30 s is a single window.
+    """
+    assert 0 <= overlap < CHUNK_LENGTH / 2, \
+        f"The overlap must be shorter than {CHUNK_LENGTH / 2} s, got {overlap}"
+    audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+    overlap_samples = int(overlap * SAMPLE_RATE)
+    stride = N_SAMPLES - overlap_samples
+    num_windows = max(-(-(len(audio) - overlap_samples) // stride), 1)
+    padded = np.zeros((num_windows - 1) * stride + N_SAMPLES, dtype=np.float32)
+    padded[:len(audio)] = audio[:len(padded)]
+    windows = np.lib.stride_tricks.sliding_window_view(padded, N_SAMPLES)
+    return windows[::stride]
+
+
+def split_batch(
+        audios: Sequence[np.ndarray],
+        overlap: float = DEFAULT_OVERLAP) -> Tuple[torch.Tensor, List[int]]:
+    """
+    Returns the [total_windows, N_SAMPLES] windows of the audios, in order,
+    and the number of windows of each audio.
+    """
+    windows = [split_audio(audio, overlap) for audio in audios]
+    num_windows = [len(w) for w in windows]
+    return torch.from_numpy(np.concatenate(windows)), num_windows
+
+
+def _normalize_word(word: str) -> str:
+    return re.sub(r'[^\w]', '', word.lower())
+
+
+def stitch_transcripts(texts: Sequence[str], min_match_words: int = 2) -> str:
+    """
+    Returns the transcript of a recording from the transcripts of its
+    overlapping windows, in order.
+
+    The words of the overlap are in the end of a transcript and in the
+    beginning of the next one: two transcripts are joined at the longest
+    common run of words of the end of the first and of the first half of the
+    second, compared without case and punctuation. The transcripts without a
+    common run of min_match_words words are concatenated.
+    """
+    words = []
+    for text in texts:
+        next_words = text.split()
+        if not words or not next_words:
+            words = words or next_words
+            continue
+        tail = max(len(words) - len(next_words), 0)
+        head = max(len(next_words) // 2, 1)
+        matcher = SequenceMatcher(None,
+                                  [_normalize_word(w) for w in words[tail:]],
+                                  [_normalize_word(w) for w in next_words],
+                                  autojunk=False)
+        match = matcher.find_longest_match(0, len(words) - tail, 0, head)
+        if match.size >= min(min_match_words, len(next_words)):
+            words = words[:tail + match.a + match.size]
+            next_words = next_words[match.b + match.size:]
+        words.extend(next_words)
+    return ' '.join(words)
+
+
+class AudioFileDataset(Dataset):
+    """
+    The audio files to transcribe, decoded by __getitem__, thus in the worker
+    processes of a DataLoader. The items are the ones of the HuggingFace
+    speech datasets, without text.
+    """
+
+    def __init__(self, paths: Sequence[str]):
+        self.paths = list(paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        path = self.paths[index]
+        if path.endswith('.wav'):
+            audio, _ = load_audio_wav_format(path)
+        else:
+            audio = load_audio(path)
+        return {
+            "audio": {
+                "array": audio,
+                "sampling_rate": SAMPLE_RATE
+            },
+            "text": "",
+            "id": index,
+        }
@@ -17,15 +17,18 @@ import json
 import re
 import time
 from collections import OrderedDict
+from functools import partial
 from pathlib import Path
 
+import numpy as np
 import torch
 from datasets import load_dataset
+from features import (DEFAULT_OVERLAP, AudioFileDataset, LogMelSpectrogram,
+                      split_batch, stitch_transcripts)
 from tokenizer import get_tokenizer
 from torch.utils.data import DataLoader
 from whisper.normalizers import EnglishTextNormalizer
-from whisper_utils import (log_mel_spectrogram, store_transcripts,
-                           write_error_stats)
+from whisper_utils import SAMPLE_RATE, store_transcripts, write_error_stats
 
 import tensorrt_llm
 import tensorrt_llm.logger as logger
@@ -41,7 +44,12 @@ def parse_arguments():
     parser.add_argument('--engine_dir', type=str, default='whisper_outputs')
     parser.add_argument('--results_dir', type=str, default='tmp')
     parser.add_argument('--assets_dir', type=str, default=None)
-    parser.add_argument('--input_file', type=str, default=None)
+    parser.add_argument('--input_file',
+                        type=str,
+                        nargs='+',
+                        default=None,
+                        help='The audio files to transcribe, instead of '
+                        'the dataset')
     parser.add_argument('--dataset',
                         type=str,
                         default="hf-internal-testing/librispeech_asr_dummy")
@@ -52,6 +60,16 @@ def parse_arguments():
     parser.add_argument('--num_beams', type=int, default=1)
     parser.add_argument('--debug', action='store_true')
     parser.add_argument('--enable_warmup', action='store_true')
+    parser.add_argument('--num_workers',
+                        type=int,
+                        default=4,
+                        help='The processes decoding the audio ahead of the '
+                        'encoder')
+    parser.add_argument('--chunk_overlap',
+                        type=float,
+                        default=DEFAULT_OVERLAP,
+                        help='The seconds shared by the 30 s windows of the '
+                        'audio longer than 30 s')
     parser.add_argument('--dtype',
                         type=str,
                         default='float16',
@@ -249,43 +267,83 @@ class WhisperTRTLLM(object):
         return texts
 
 
-def decode_wav_file(
-        input_file_path,
+def transcribe(
         model,
+        data_loader,
+        extractor,
         text_prefix="<|startoftranscript|><|en|><|transcribe|><|notimestamps|>",
         dtype='float16',
         batch_size=1,
-        num_beams=1,
-        normalizer=None,
-        mel_filters_dir=None):
-    mel, total_duration = log_mel_spectrogram(input_file_path,
-                                              model.n_mels,
-                                              device='cuda',
-                                              return_duration=True,
-                                              mel_filters_dir=mel_filters_dir)
-    mel = mel.type(str_dtype_to_torch(dtype))
-    mel = mel.unsqueeze(0)
-    # repeat the mel spectrogram to match the batch size
-    mel = mel.repeat(batch_size, 1, 1)
-    predictions = model.process_batch(mel, text_prefix, num_beams)
-    prediction = predictions[0]
-
-    # remove all special tokens in the prediction
-    prediction = re.sub(r'<\|.*?\|>', '', prediction)
-    if normalizer:
-        prediction = normalizer(prediction)
-    print(f"prediction: {prediction}")
-    results = [(0, [""], prediction.split())]
-    return results, total_duration
+        num_beams=1):
+    """
+    Yields the ids, labels and transcripts of the batches of data_loader, and
+    the seconds of audio of the batch. The windows of a batch, prefetched by
+    the workers, are featurized at once and run through the engines
+    batch_size at a time.
+    """
+    for windows, num_windows, durations, labels, ids in data_loader:
+        features = extractor(windows).type(str_dtype_to_torch(dtype))
+        predictions = []
+        for start in range(0, len(features), batch_size):
+            predictions.extend(
+                model.process_batch(features[start:start + batch_size],
+                                    text_prefix, num_beams))
+        # remove all special tokens in the predictions
+        predictions = [re.sub(r'<\|.*?\|>', '', p) for p in predictions]
+        ends = np.cumsum(num_windows)
+        texts = [
+            stitch_transcripts(predictions[end - n:end])
+            for n, end in zip(num_windows, ends)
+        ]
+        yield ids, labels, texts, sum(durations)
 
 
-def collate_wrapper(batch):
+def collate_wrapper(batch, overlap=DEFAULT_OVERLAP):
     speeches, labels, ids = [], [], []
     for item in batch:
         speeches.append(item["audio"]["array"])
         labels.append(item["text"])
         ids.append(item["id"])
-    return speeches, labels, ids
+    durations = [len(speech) / SAMPLE_RATE for speech in speeches]
+    windows, num_windows = split_batch(speeches, overlap)
+    return windows, num_windows, durations, labels, ids
+
+
+def make_data_loader(dataset, batch_size, num_workers, overlap):
+    return DataLoader(dataset,
+                      batch_size=batch_size,
+                      num_workers=num_workers,
+                      pin_memory=True,
+                      collate_fn=partial(collate_wrapper, overlap=overlap))
+
+
+def decode_wav_file(
+        input_file_paths,
+        model,
+        text_prefix="<|startoftranscript|><|en|><|transcribe|><|notimestamps|>",
+        dtype='float16',
+        batch_size=1,
+        num_beams=1,
+        normalizer=None,
+        mel_filters_dir=None,
+        num_workers=4,
+        overlap=DEFAULT_OVERLAP):
+    extractor = LogMelSpectrogram(model.n_mels, 'cuda', mel_filters_dir)
+    data_loader = make_data_loader(AudioFileDataset(input_file_paths),
+                                   batch_size, num_workers, overlap)
+    results = []
+    total_duration = 0
+    for ids, _, predictions, duration in transcribe(model, data_loader,
+                                                    extractor, text_prefix,
+                                                    dtype, batch_size,
+                                                    num_beams):
+        total_duration += duration
+        for wav_id, prediction in zip(ids, predictions):
+            if normalizer:
+                prediction = normalizer(prediction)
+            print(f"prediction: {prediction}")
+            results.append((wav_id, [""], prediction.split()))
+    return results, total_duration
 
 
 def decode_dataset(
@@ -296,33 +354,22 @@ def decode_dataset(
         batch_size=1,
         num_beams=1,
         normalizer=None,
-        sample_rate=16000,
-        mel_filters_dir=None):
+        mel_filters_dir=None,
+        num_workers=4,
+        overlap=DEFAULT_OVERLAP):
     librispeech_dummy = load_dataset(dataset, "clean", split="validation")
 
-    data_loader = DataLoader(librispeech_dummy,
-                             batch_size=batch_size,
-                             num_workers=4,
-                             pin_memory=True,
-                             collate_fn=collate_wrapper)
+    extractor = LogMelSpectrogram(model.n_mels, 'cuda', mel_filters_dir)
+    data_loader = make_data_loader(librispeech_dummy, batch_size, num_workers,
+                                   overlap)
     results = []
     total_duration = 0
-    for batch in data_loader:
-        waveforms, texts, ids = batch
-        total_duration += sum([wave.shape[0]
-                               for wave in waveforms]) / sample_rate
-        features = [
-            log_mel_spectrogram(wave,
-                                model.n_mels,
-                                device='cuda',
-                                mel_filters_dir=mel_filters_dir).unsqueeze(0)
-            for wave in waveforms
-        ]
-        features = torch.cat(features, dim=0).type(str_dtype_to_torch(dtype))
-        predictions = model.process_batch(features, text_prefix, num_beams)
+    for ids, texts, predictions, duration in transcribe(model, data_loader,
+                                                        extractor, text_prefix,
+                                                        dtype, batch_size,
+                                                        num_beams):
+        total_duration += duration
         for wav_id, label, prediction in zip(ids, texts, predictions):
-            # remove all special tokens in the prediction
-            prediction = re.sub(r'<\|.*?\|>', '', prediction)
             if normalizer:
                 prediction, label = normalizer(prediction), normalizer(label)
             print(f"wav_id: {wav_id}, label: {label}, prediction: {prediction}")
@@ -342,7 +389,9 @@ if __name__ == '__main__':
             batch_size=args.batch_size,
             num_beams=args.num_beams,
             normalizer=normallizer,
-            mel_filters_dir=args.assets_dir)
+            mel_filters_dir=args.assets_dir,
+            num_workers=args.num_workers,
+            overlap=args.chunk_overlap)
     start_time = time.time()
     if args.input_file:
         results, total_duration = decode_wav_file(
@@ -351,7 +400,9 @@ if __name__ == '__main__':
             dtype=args.dtype,
             batch_size=args.batch_size,
             num_beams=args.num_beams,
-            mel_filters_dir=args.assets_dir)
+            mel_filters_dir=args.assets_dir,
+            num_workers=args.num_workers,
+            overlap=args.chunk_overlap)
     else:
         results, total_duration = decode_dataset(
             model,
@@ -360,7 +411,9 @@ if __name__ == '__main__':
             batch_size=args.batch_size,
             num_beams=args.num_beams,
             normalizer=normallizer,
-            mel_filters_dir=args.assets_dir)
+            mel_filters_dir=args.assets_dir,
+            num_workers=args.num_workers,
+            overlap=args.chunk_overlap)
     elapsed = time.time() - start_time
     results = sorted(results)
 
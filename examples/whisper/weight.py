@@ -19,6 +19,7 @@ import torch
 
 import tensorrt_llm
 from tensorrt_llm.quantization import QuantMode
+from tensorrt_llm.quantization.weight_quant import symmetric_quantize
 
 
 def fromfile(dir_path, name, shape=None, dtype=None):
@@ -89,7 +90,7 @@ def load_encoder_weight(tensorrt_llm_whisper, model_metadata: dict,
         if t is not None:
             dst = tensorrt_llm_whisper.encoder_layers[i].attention.qkv.weight
             if use_weight_only:
-                processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                processed_torch_weights, torch_weight_scales = symmetric_quantize(
                     torch.tensor(np.ascontiguousarray(t.transpose(1, 0))),
                     plugin_weight_only_quant_type)
                 # workaround for trt not supporting int8 inputs in plugins currently
@@ -119,7 +120,7 @@ def load_encoder_weight(tensorrt_llm_whisper, model_metadata: dict,
         if t is not None:
             dst = tensorrt_llm_whisper.encoder_layers[i].attention.dense.weight
             if use_weight_only:
-                processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                processed_torch_weights, torch_weight_scales = symmetric_quantize(
                     torch.tensor(np.ascontiguousarray(t.transpose(1, 0))),
                     plugin_weight_only_quant_type)
                 # workaround for trt not supporting int8 inputs in plugins currently
@@ -148,7 +149,7 @@ def load_encoder_weight(tensorrt_llm_whisper, model_metadata: dict,
         if t is not None:
             dst = tensorrt_llm_whisper.encoder_layers[i].mlp.fc.weight
             if use_weight_only:
-                processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                processed_torch_weights, torch_weight_scales = symmetric_quantize(
                     torch.tensor(np.ascontiguousarray(t.transpose(1, 0))),
                     plugin_weight_only_quant_type)
                 # workaround for trt not supporting int8 inputs in plugins currently
@@ -167,7 +168,7 @@ def load_encoder_weight(tensorrt_llm_whisper, model_metadata: dict,
         if t is not None:
             dst = tensorrt_llm_whisper.encoder_layers[i].mlp.proj.weight
             if use_weight_only:
-                processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                processed_torch_weights, torch_weight_scales = symmetric_quantize(
                     torch.tensor(np.ascontiguousarray(t.transpose(1, 0))),
                     plugin_weight_only_quant_type)
                 # workaround for trt not supporting int8 inputs in plugins currently
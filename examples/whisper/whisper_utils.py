@@ -105,6 +105,14 @@ def pad_or_trim(array, length: int = N_SAMPLES, *, axis: int = -1):
     return array
 
 
+@lru_cache(maxsize=None)
+def hann_window(device) -> torch.Tensor:
+    """
+    The Hann window of the STFT, cached per device.
+    """
+    return torch.hann_window(N_FFT, device=device)
+
+
 @lru_cache(maxsize=None)
 def mel_filters(device,
                 n_mels: int,
@@ -175,7 +183,7 @@ def log_mel_spectrogram(
         audio = audio.to(device)
     if padding > 0:
         audio = F.pad(audio, (0, padding))
-    window = torch.hann_window(N_FFT).to(audio.device)
+    window = hann_window(audio.device)
     stft = torch.stft(audio,
                       N_FFT,
                       HOP_LENGTH,
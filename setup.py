@@ -103,7 +103,10 @@ setup(
         ]) + ['bindings/*.pyi', 'tools/plugin_gen/templates/*'],
     },
     entry_points={
-        'console_scripts': ['trtllm-build=tensorrt_llm.commands.build:main'],
+        'console_scripts': [
+            'trtllm-build=tensorrt_llm.commands.build:main',
+            'trtllm-plan-memory=tensorrt_llm.commands.plan_memory:main'
+        ],
     },
     extras_require={"devel": devel_deps},
     zip_safe=True,
@@ -0,0 +1,222 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+NumPy conversions between float32, float16, bfloat16 and fp8.
+
+NumPy has no bfloat16 nor fp8 types, their arrays use the abstract np_bfloat16
+and np_float8 types whose items are the raw bits. The conversions work on the
+uint32 view of float32 values and round to nearest even, bit-exact with the
+conversions of torch on the CPU, except for the NaN payloads. fp8 is the e4m3
+format of TensorRT, saturated to +-448 as torch does, and np_float8_e5m2 the
+e5m2 format, whose overflows are infinite.
+
+The arrays are converted by chunks of chunk_size items, which bounds the
+temporary memory, and the chunks by num_threads threads, the NumPy ufuncs
+releasing the GIL.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union
+
+import numpy as np
+
+# numpy doesn't know bfloat16, define abstract binary type instead
+np_bfloat16 = np.dtype('V2', metadata={"dtype": "bfloat16"})
+np_float8 = np.dtype('V1', metadata={"dtype": "float8"})
+# The metadata does not take part in the comparisons of the dtypes, e5m2 is a
+# record of one byte so that it does not compare equal to np_float8, and does
+# not find its entries in the dtype dicts
+np_float8_e5m2 = np.dtype([('float8_e5m2', 'V1')],
+                          metadata={"dtype": "float8_e5m2"})
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+_STR_TO_DTYPE = {
+    'bfloat16': np_bfloat16,
+    'fp8': np_float8,
+    'float8': np_float8,
+    'fp8_e5m2': np_float8_e5m2,
+    'float8_e5m2': np_float8_e5m2,
+}
+
+# The storage of the abstract types
+_BITS_DTYPE = {
+    'bfloat16': np.uint16,
+    'float8': np.uint8,
+    'float8_e5m2': np.uint8,
+}
+
+_FLOAT_NAMES = ('float16', 'float32', 'float64', 'bfloat16', 'float8',
+                'float8_e5m2')
+
+# The quiet NaN of the conversions of c10::BFloat16
+_BF16_NAN = 0x7FC0
+_FP8_NAN = 0x7F
+
+
+def to_np_dtype(dtype: Union[str, np.dtype]) -> np.dtype:
+    """
+    Returns the NumPy dtype of a dtype string, np_bfloat16 for 'bfloat16' and
+    np_float8 for 'fp8'.
+    """
+    if isinstance(dtype, str) and dtype in _STR_TO_DTYPE:
+        return _STR_TO_DTYPE[dtype]
+    return np.dtype(dtype)
+
+
+def dtype_name(dtype: Union[str, np.dtype]) -> str:
+    """
+    Returns the name of dtype, 'bfloat16', 'float8' and 'float8_e5m2' for the
+    abstract types.
+    """
+    dtype = to_np_dtype(dtype)
+    if dtype.metadata is not None and 'dtype' in dtype.metadata:
+        return dtype.metadata['dtype']
+    return dtype.name
+
+
+def is_floating(dtype: Union[str, np.dtype]) -> bool:
+    return dtype_name(dtype) in _FLOAT_NAMES
+
+
+def _fp32_to_bf16_bits(x: np.ndarray) -> np.ndarray:
+    u = x.view(np.uint32)
+    # Rounds to nearest even, the overflows become infinite
+    rounded = u + np.uint32(0x7FFF)
+    rounded += (u >> 16) & 1
+    rounded >>= 16
+    bits = rounded.astype(np.uint16)
+    bits[np.isnan(x)] = _BF16_NAN
+    return bits
+
+
+def _fp32_to_fp8_bits(x: np.ndarray, exponent_bits: int,
+                      mantissa_bits: int) -> np.ndarray:
+    bias = (1 << (exponent_bits - 1)) - 1
+    shift = 23 - mantissa_bits
+    if exponent_bits == 4:
+        # e4m3 has no infinity, its largest value 448 is 0x7E
+        max_bits = 0x7E
+    else:
+        max_bits = 0x7C
+    u = x.view(np.uint32)
+    sign = ((u >> 24) & 0x80).astype(np.uint8)
+    a = u & np.uint32(0x7FFFFFFF)
+
+    # The normal values: the exponent is rebiased, and the mantissa rounded
+    # to nearest even
+    bits = a - np.uint32((127 - bias) << 23)
+    bits += np.uint32((1 << (shift - 1)) - 1)
+    bits += (a >> shift) & 1
+    bits >>= shift
+    np.minimum(bits, max_bits, out=bits)
+
+    # The subnormal values: adding 2^k whose ulp is the subnormal step of fp8
+    # rounds the mantissa
+    denormal = np.float32(2.0**(24 - bias - mantissa_bits))
+    with np.errstate(invalid='ignore'):
+        # The signaling NaNs, replaced below
+        subnormal = np.abs(x) + denormal
+    subnormal = subnormal.view(np.uint32) - denormal.view(np.uint32)
+    is_subnormal = a < np.uint32((128 - bias) << 23)
+    bits[is_subnormal] = subnormal[is_subnormal]
+
+    bits[a > np.uint32(0x7F800000)] = _FP8_NAN
+    return bits.astype(np.uint8) | sign
+
+
+def _e4m3_table() -> np.ndarray:
+    bits = np.arange(256, dtype=np.int32)
+    exponent, mantissa = (bits >> 3) & 0xF, bits & 0x7
+    values = np.where(exponent == 0, mantissa / 8.0 * 2.0**-6,
+                      (1 + mantissa / 8.0) * 2.0**(exponent - 7))
+    values = np.where(bits & 0x80, -values, values)
+    values[(bits & 0x7F) == 0x7F] = np.nan
+    return values.astype(np.float32)
+
+
+_E4M3_TO_FP32 = _e4m3_table()
+
+
+def _decode(chunk: np.ndarray, name: str) -> np.ndarray:
+    """
+    Returns the float32 values of the chunk of a name array.
+    """
+    if name == 'bfloat16':
+        return (chunk.view(np.uint16).astype(np.uint32) << 16).view(np.float32)
+    if name == 'float8':
+        return _E4M3_TO_FP32[chunk.view(np.uint8)]
+    if name == 'float8_e5m2':
+        # e5m2 is the high byte of float16
+        return (chunk.view(np.uint8).astype(np.uint16) << 8).view(
+            np.float16).astype(np.float32)
+    return chunk.astype(np.float32, copy=False)
+
+
+def _encode(values: np.ndarray, name: str, dtype: np.dtype) -> np.ndarray:
+    """
+    Returns the float32 values in dtype, the bits for the abstract types.
+    """
+    if name == 'bfloat16':
+        return _fp32_to_bf16_bits(values)
+    if name == 'float8':
+        return _fp32_to_fp8_bits(values, 4, 3)
+    if name == 'float8_e5m2':
+        return _fp32_to_fp8_bits(values, 5, 2)
+    with np.errstate(over='ignore'):
+        # The overflows of float16 become infinite, as in torch
+        return values.astype(dtype)
+
+
+def _map_chunks(fn, size: int, chunk_size: int, num_threads: int):
+    starts = range(0, size, chunk_size)
+    if num_threads <= 1 or len(starts) <= 1:
+        for start in starts:
+            fn(start, min(start + chunk_size, size))
+        return
+    with ThreadPoolExecutor(max_workers=num_threads) as pool:
+        list(
+            pool.map(lambda start: fn(start, min(start + chunk_size, size)),
+                     starts))
+
+
+def convert(x: np.ndarray,
+            dtype: Union[str, np.dtype],
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            num_threads: int = 1) -> np.ndarray:
+    """
+    Returns x converted to dtype, a NumPy dtype, np_bfloat16, np_float8 or
+    np_float8_e5m2, or their names 'bfloat16', 'fp8' and 'fp8_e5m2'. x is
+    returned as is when it has dtype already.
+    """
+    dtype = to_np_dtype(dtype)
+    src_name, dst_name = dtype_name(x.dtype), dtype_name(dtype)
+    if src_name == dst_name:
+        return x
+    if src_name not in _BITS_DTYPE and dst_name not in _BITS_DTYPE:
+        return x.astype(dtype)
+    if not is_floating(src_name) or not is_floating(dst_name):
+        raise TypeError(f'Cannot convert {src_name} to {dst_name}')
+
+    src = np.ascontiguousarray(x).reshape(-1)
+    out = np.empty(src.shape, dtype=_BITS_DTYPE.get(dst_name, dtype))
+
+    def convert_chunk(start, stop):
+        values = _decode(src[start:stop], src_name)
+        out[start:stop] = _encode(values, dst_name, dtype)
+
+    _map_chunks(convert_chunk, src.size, chunk_size, num_threads)
+    if dst_name in _BITS_DTYPE:
+        out = out.view(dtype)
+    return out.reshape(x.shape)
@@ -0,0 +1,95 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import struct
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Iterator, List, Union
+
+import numpy as np
+
+from ._utils import np_bfloat16
+
+_safetensors_to_np_dtype_dict = dict(
+    BOOL=np.bool_,
+    U8=np.uint8,
+    I8=np.int8,
+    I16=np.int16,
+    I32=np.int32,
+    I64=np.int64,
+    F16=np.float16,
+    BF16=np_bfloat16,
+    F32=np.float32,
+    F64=np.float64,
+)
+
+
+class SafetensorsMmap(Mapping):
+    '''
+    Read-only view of a safetensors file.
+
+    The file is memory-mapped and every tensor is returned as a zero-copy numpy
+    array backed by the mapping, bfloat16 tensors use np_bfloat16. Pages are read
+    from disk when the array is accessed and stay reclaimable by the OS, so
+    loading a checkpoint doesn't need host memory for a copy of the weights.
+    The mapping is copy-on-write: writing into an array never modifies the file.
+    '''
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            header_size, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_size))
+        self.metadata = header.pop('__metadata__', None)
+        self._header = header
+        self._data_offset = 8 + header_size
+        self._mmap = np.memmap(self.path, dtype=np.uint8, mode='c')
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        info = self._header[name]
+        dtype = _safetensors_to_np_dtype_dict.get(info['dtype'])
+        assert dtype is not None, f'Unsupported dtype: {info["dtype"]}'
+        begin, end = info['data_offsets']
+        buffer = self._mmap[self._data_offset + begin:self._data_offset + end]
+        return buffer.view(dtype).reshape(info['shape'])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._header)
+
+    def __len__(self) -> int:
+        return len(self._header)
+
+    def get_tensor(self, name: str) -> np.ndarray:
+        return self[name]
+
+    def get_shape(self, name: str) -> List[int]:
+        return list(self._header[name]['shape'])
+
+    def get_nbytes(self, name: str) -> int:
+        begin, end = self._header[name]['data_offsets']
+        return end - begin
+
+    def close(self):
+        '''
+        Drops the reference to the mapping, it is unmapped once the arrays
+        returned by this object are released.
+        '''
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -15,7 +15,6 @@
 import copy
 import json
 import math
-import struct
 import weakref
 from functools import partial
 from pathlib import Path, PosixPath
@@ -28,37 +27,34 @@ import torch
 import tensorrt as trt
 # isort: on
 
-# numpy doesn't know bfloat16, define abstract binary type instead
-np_bfloat16 = np.dtype('V2', metadata={"dtype": "bfloat16"})
+from ._dtype_conversion import convert as _convert_numpy
+from ._dtype_conversion import dtype_name, np_bfloat16, np_float8
 
 
 def torch_to_numpy(x: torch.Tensor):
     assert isinstance(x, torch.Tensor), \
         f'x must be a torch.Tensor object, but got {type(x)}.'
-    if x.dtype != torch.bfloat16:
-        return x.detach().cpu().numpy()
-    return x.view(torch.int16).detach().cpu().numpy().view(np_bfloat16)
+    if x.dtype == torch.bfloat16:
+        return x.view(torch.int16).detach().cpu().numpy().view(np_bfloat16)
+    if x.dtype == getattr(torch, 'float8_e4m3fn', None):
+        return x.view(torch.uint8).detach().cpu().numpy().view(np_float8)
+    return x.detach().cpu().numpy()
 
 
 def numpy_to_torch(x):
-    if x.dtype != np_bfloat16:
-        return torch.tensor(x)
-    return torch.tensor(x.view(np.int16)).view(torch.bfloat16)
+    if x.dtype == np_bfloat16:
+        return torch.tensor(x.view(np.int16)).view(torch.bfloat16)
+    if dtype_name(x.dtype) == 'float8':
+        return torch.tensor(x.view(np.uint8)).view(torch.float8_e4m3fn)
+    return torch.tensor(x)
 
 
-def numpy_to_dtype(x, dtype: str):
-    if x.dtype == np_bfloat16:
-        # BF16 --> non-BF16 or BF16
-        if dtype != 'bfloat16':
-            torch_to_numpy(numpy_to_torch(x).to(str_dtype_to_torch(dtype)))
-        else:
-            return x
-    else:
-        # non-BF16 types --> non-BF16 or BF16
-        if dtype != 'bfloat16':
-            return x.astype(str_dtype_to_np(dtype))
-        else:
-            return torch_to_numpy(torch.from_numpy(x).to(torch.bfloat16))
+def numpy_to_dtype(x, dtype: str, num_threads: int = 1):
+    '''
+    Converts the numpy array x to dtype, 'bfloat16' and 'fp8' included,
+    without a round trip through torch. See _dtype_conversion.
+    '''
+    return _convert_numpy(x, str_dtype_to_np(dtype), num_threads=num_threads)
 
 
 fp32_array = partial(np.array, dtype=np.float32)
@@ -67,9 +63,7 @@ int32_array = partial(np.array, dtype=np.int32)
 
 
 def bf16_array(x):
-    x = torch.tensor(x, dtype=torch.bfloat16)
-    x = torch_to_numpy(x)
-    return x
+    return _convert_numpy(np.array(x, dtype=np.float32), np_bfloat16)
 
 
 def copy_torch_to_numpy(x: torch.Tensor, ndarray: np.array):
@@ -96,6 +90,7 @@ _str_to_np_dict = dict(
     int8=np.int8,
     bool=np.bool_,
     bfloat16=np_bfloat16,
+    fp8=np_float8,
 )
 
 
@@ -162,6 +157,7 @@ _np_to_trt_dtype_dict = {
     np.dtype('float32'): trt.float32,
     np.dtype('bool'): trt.bool,
     np_bfloat16: trt.bfloat16,
+    np_float8: trt.fp8,
 }
 
 
@@ -179,6 +175,7 @@ _trt_to_np_dtype_dict = {
     trt.float32: np.float32,
     trt.bool: np.bool_,
     trt.bfloat16: np_bfloat16,
+    trt.fp8: np_float8,
 }
 
 
@@ -202,6 +199,8 @@ _torch_to_np_dtype_dict = {
     torch.complex64: np.complex64,
     torch.complex128: np.complex128,
 }
+if hasattr(torch, 'float8_e4m3fn'):
+    _torch_to_np_dtype_dict[torch.float8_e4m3fn] = np_float8
 
 
 def torch_dtype_to_np(dtype):
@@ -297,19 +296,11 @@ def to_json_file(obj, json_file_path):
         writer.write(to_json_string(obj))
 
 
-def numpy_fp32_to_bf16(src):
+def numpy_fp32_to_bf16(src, num_threads: int = 1):
     # Numpy doesn't support bfloat16 type
     # Convert float32 to bfloat16 manually and assign with bf16 abstract type
-    original_shape = src.shape
-    src = src.flatten()
-    src = np.ascontiguousarray(src)
-
     assert src.dtype == np.float32
-    dst = np.empty_like(src, dtype=np.uint16)
-    for i in range(len(dst)):
-        bytes = struct.pack('<f', src[i])
-        dst[i] = struct.unpack('<H', struct.pack('BB', bytes[2], bytes[3]))[0]
-    return dst.reshape(original_shape).view(np_bfloat16)
+    return _convert_numpy(src, np_bfloat16, num_threads=num_threads)
 
 
 def fromfile(dir_path, name, shape=None, dtype=None):
@@ -14,12 +14,13 @@
 # limitations under the License.
 import argparse
 import copy
+import json
 import os
 import time
 from concurrent.futures import ProcessPoolExecutor, wait
 from importlib.machinery import SourceFileLoader
 from multiprocessing import get_context
-from typing import Union
+from typing import Optional, Union
 
 import torch
 
@@ -28,7 +29,8 @@ from ..graph_rewriting import optimize
 from ..logger import logger
 from ..models import MODEL_MAP, PretrainedConfig, PretrainedModel
 from ..network import net_guard
-from ..runtime.engine import Engine, EngineConfig
+from ..runtime.engine import Engine, EngineConfig, serialize_engine
+from ..runtime.engine_cache import EngineCache
 from ..version import __version__
 
 
@@ -123,6 +125,23 @@ def parse_arguments():
                         action='store_true',
                         default=False)
     parser.add_argument('--strongly_typed', action='store_true', default=False)
+    parser.add_argument(
+        '--use_engine_cache',
+        action='store_true',
+        default=False,
+        help=
+        'Reuse the engines built before from the same checkpoint and options')
+    parser.add_argument(
+        '--engine_cache_dir',
+        type=str,
+        default=None,
+        help=
+        'The directory of the engine cache, $TLLM_CACHE_DIR/engines by default')
+    parser.add_argument(
+        '--engine_cache_size',
+        type=float,
+        default=None,
+        help='The size of the engine cache in GiB, unbounded by default')
 
     args = parser.parse_args()
 
@@ -223,16 +242,40 @@ def build(build_config: Union[str, BuildConfig],
     return build_shard_model(model, build_config)
 
 
-def build_and_save_shard(rank, gpu_id, ckpt_dir, build_config, output_dir,
-                         log_level, model_config, model_cls):
+def build_and_save_shard(rank,
+                         gpu_id,
+                         ckpt_dir,
+                         build_config,
+                         output_dir,
+                         log_level,
+                         model_config,
+                         model_cls,
+                         engine_cache: Optional[EngineCache] = None,
+                         cache_key: Optional[str] = None) -> bool:
+    ''' Returns whether the engine of rank was found in the engine cache.  '''
     torch.cuda.set_device(gpu_id)
     logger.set_level(log_level)
+    if cache_key is not None:
+        cached = engine_cache.load(cache_key, rank)
+        if cached is not None:
+            engine_buffer, config = cached
+            if rank == 0:
+                with open(os.path.join(output_dir, 'config.json'), 'w') as f:
+                    json.dump(config, f, indent=4)
+            serialize_engine(engine_buffer,
+                             os.path.join(output_dir, f'rank{rank}.engine'))
+            return True
+
     engine = build(build_config,
                    rank,
                    ckpt_dir,
                    model_config,
                    model_cls=model_cls)
     engine.save(output_dir)
+    if cache_key is not None:
+        engine_cache.store(cache_key, engine.engine, engine.config.to_dict(),
+                           rank)
+    return False
 
 
 def build_and_save(ckpt_dir_or_model_config: str,
@@ -240,7 +283,8 @@ def build_and_save(ckpt_dir_or_model_config: str,
                    output_dir: str,
                    workers: int = 1,
                    log_level: str = 'info',
-                   model_cls=None):
+                   model_cls=None,
+                   engine_cache: Optional[EngineCache] = None):
     ckpt_dir = ckpt_dir_or_model_config
     if ckpt_dir_or_model_config.lower().endswith('.json'):
         model_config = PretrainedConfig.from_json_file(ckpt_dir_or_model_config)
@@ -249,20 +293,45 @@ def build_and_save(ckpt_dir_or_model_config: str,
         model_config = PretrainedConfig.from_json_file(
             os.path.join(ckpt_dir_or_model_config, 'config.json'))
 
+    cache_key = None
+    if engine_cache is not None:
+        if isinstance(build_config, str):
+            build_config = BuildConfig.from_json_file(build_config)
+        if ckpt_dir is not None:
+            model_cls_name = None if model_cls is None else \
+                f'{model_cls.__module__}.{model_cls.__qualname__}'
+            cache_key = engine_cache.cache_key(ckpt_dir,
+                                               build_config,
+                                               model_config.mapping,
+                                               model_cls=model_cls_name)
+        else:
+            logger.warning(
+                'The engine cache is only used to build from a checkpoint')
+
     if workers == 1:
-        for rank in range(model_config.mapping.world_size):
+        cache_hits = [
             build_and_save_shard(rank, rank % workers, ckpt_dir, build_config,
-                                 output_dir, log_level, model_config, model_cls)
+                                 output_dir, log_level, model_config, model_cls,
+                                 engine_cache, cache_key)
+            for rank in range(model_config.mapping.world_size)
+        ]
     else:
         with ProcessPoolExecutor(mp_context=get_context('spawn'),
                                  max_workers=workers) as p:
             futures = [
                 p.submit(build_and_save_shard, rank, rank % workers, ckpt_dir,
                          build_config, output_dir, log_level, model_config,
-                         model_cls)
+                         model_cls, engine_cache, cache_key)
                 for rank in range(model_config.mapping.world_size)
             ]
             wait(futures)
+            cache_hits = [future.result() for future in futures]
+
+    if cache_key is not None:
+        # The shards may run in worker processes, with their own EngineCache
+        num_hits = sum(cache_hits)
+        logger.info(f'Engine cache: {num_hits} hits, '
+                    f'{len(cache_hits) - num_hits} misses, key {cache_key}')
 
 
 def main():
@@ -315,9 +384,15 @@ def main():
             }
         })
 
+    engine_cache = None
+    if args.use_engine_cache:
+        engine_cache = EngineCache(
+            args.engine_cache_dir, None if args.engine_cache_size is None else
+            int(args.engine_cache_size * (1 << 30)))
+
     source = args.checkpoint_dir if args.checkpoint_dir is not None else args.model_config
     build_and_save(source, build_config, args.output_dir, workers,
-                   args.log_level, model_cls)
+                   args.log_level, model_cls, engine_cache)
 
     tok = time.time()
     t = time.strftime('%H:%M:%S', time.gmtime(tok - tik))
@@ -0,0 +1,166 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import argparse
+import copy
+import os
+
+import torch
+
+from ..builder import BuildConfig
+from ..models import PretrainedConfig
+from ..runtime.engine import EngineConfig
+from ..runtime.memory_planner import plan_memory
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Plan the device memory of the ranks of a model, '
+        'the engine is not deserialized.')
+    parser.add_argument(
+        '--engine_dir',
+        type=str,
+        default=None,
+        help='Read the model and build configs from the config.json of the '
+        'engines.')
+    parser.add_argument('--checkpoint_dir', type=str, default=None)
+    parser.add_argument('--model_config', type=str, default=None)
+    parser.add_argument('--build_config', type=str, default=None)
+    parser.add_argument('--max_batch_size', type=int, default=1)
+    parser.add_argument('--max_input_len', type=int, default=1024)
+    parser.add_argument('--max_output_len', type=int, default=1024)
+    parser.add_argument('--max_beam_width', type=int, default=1)
+    parser.add_argument('--max_num_tokens', type=int, default=None)
+    parser.add_argument('--max_prompt_embedding_table_size',
+                        type=int,
+                        default=0)
+    parser.add_argument('--use_gpt_attention_plugin',
+                        nargs='?',
+                        const='float16',
+                        type=str,
+                        default=False,
+                        choices=['float16', 'bfloat16', 'float32'])
+    parser.add_argument('--enable_context_fmha',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('--paged_kv_cache', default=False, action='store_true')
+    parser.add_argument('--tokens_per_block', type=int, default=64)
+    parser.add_argument('--gather_all_token_logits',
+                        action='store_true',
+                        default=False)
+
+    parser.add_argument(
+        '--device_memory',
+        type=float,
+        default=None,
+        help='The memory of a device in GiB, the memory of the current GPU '
+        'by default.')
+    parser.add_argument('--free_gpu_memory_fraction',
+                        type=float,
+                        default=0.9,
+                        help='The fraction of the free memory given to the '
+                        'KV cache.')
+    parser.add_argument(
+        '--kv_dtype',
+        type=str,
+        default=None,
+        choices=['float32', 'float16', 'bfloat16', 'int8', 'fp8'])
+    parser.add_argument('--max_attention_window_size', type=int, default=None)
+    parser.add_argument('--sink_token_length', type=int, default=0)
+    parser.add_argument('--lora_rank', type=int, default=0)
+    parser.add_argument('--num_lora_adapters', type=int, default=0)
+    parser.add_argument(
+        '--seq_lens',
+        type=int,
+        nargs='+',
+        default=None,
+        help='A sample of the input + output lengths of the target workload, '
+        'to count the sequences fitting in the KV cache.')
+    return parser.parse_args()
+
+
+def load_configs(args):
+    if args.engine_dir is not None:
+        engine_config = EngineConfig.from_json_file(
+            os.path.join(args.engine_dir, 'config.json'))
+        return engine_config.pretrained_config, engine_config.build_config
+
+    if args.checkpoint_dir is not None:
+        model_config = PretrainedConfig.from_json_file(
+            os.path.join(args.checkpoint_dir, 'config.json'))
+    else:
+        assert args.model_config is not None, \
+            'One of --engine_dir, --checkpoint_dir and --model_config is required'
+        model_config = PretrainedConfig.from_json_file(args.model_config)
+
+    if args.build_config is not None:
+        build_config = BuildConfig.from_json_file(args.build_config)
+    else:
+        build_config = BuildConfig.from_dict({
+            'max_input_len':
+            args.max_input_len,
+            'max_output_len':
+            args.max_output_len,
+            'max_batch_size':
+            args.max_batch_size,
+            'max_beam_width':
+            args.max_beam_width,
+            'max_num_tokens':
+            args.max_num_tokens,
+            'max_prompt_embedding_table_size':
+            args.max_prompt_embedding_table_size,
+            'gather_all_token_logits':
+            args.gather_all_token_logits,
+            'plugin_config': {
+                'gpt_attention_plugin': args.use_gpt_attention_plugin,
+                'enable_context_fmha': args.enable_context_fmha,
+                'paged_kv_cache': args.paged_kv_cache,
+                'tokens_per_block': args.tokens_per_block,
+            }
+        })
+    return model_config, build_config
+
+
+def main():
+    args = parse_arguments()
+    model_config, build_config = load_configs(args)
+    if args.device_memory is not None:
+        device_memory = int(args.device_memory * (1 << 30))
+    else:
+        device_memory = torch.cuda.get_device_properties(
+            torch.cuda.current_device()).total_memory
+
+    for rank in range(model_config.mapping.world_size):
+        rank_config = copy.deepcopy(model_config)
+        rank_config.set_rank(rank)
+        plan = plan_memory(
+            rank_config,
+            build_config,
+            device_memory,
+            kv_dtype=args.kv_dtype,
+            free_gpu_memory_fraction=args.free_gpu_memory_fraction,
+            max_attention_window_size=args.max_attention_window_size,
+            sink_token_len=args.sink_token_length,
+            lora_rank=args.lora_rank,
+            num_lora_adapters=args.num_lora_adapters)
+        print(f'rank {rank}:')
+        print(plan)
+        if args.seq_lens is not None:
+            print(f'{plan.max_num_sequences(args.seq_lens)} concurrent '
+                  f'sequences for the given lengths, max_batch_size '
+                  f'{build_config.max_batch_size}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,18 @@
 import random
+import time
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Any
+from typing import Any, AsyncGenerator, Optional
 
 import torch
 from janus import LifoQueue, Queue
 from transformers import AutoTokenizer
 
 import tensorrt_llm.bindings as tllm
+from tensorrt_llm.hlapi.admission_queue import (AdmissionQueue,
+                                                QueueOverloadError,
+                                                QueueTimeoutError)
+from tensorrt_llm.hlapi.detokenizer import IncrementalDetokenizer
 from tensorrt_llm.hlapi.llm import LLM, ModelConfig
 
 
@@ -18,8 +23,11 @@ class AsyncLLMEngine:
                  engine_dir: Path,
                  tokenizer: str | Path,
                  max_beam_width: int = 1,
-                 max_num_sequences: int = 10) -> None:
-        self.requests: list[tllm.InferenceRequest] = []
+                 max_num_sequences: int = 10,
+                 max_queue_size: Optional[int] = None) -> None:
+        # The requests waiting for the inflight batcher, raises a QueueOverloadError beyond max_queue_size
+        self.requests = AdmissionQueue(max_queue_size,
+                                       on_expire=self.expire_request)
         self.results: dict[int, Queue] = {}
         self.stop_set: set[int] = set()
         self.stats: LifoQueue = LifoQueue()
@@ -87,6 +95,8 @@ class AsyncLLMEngine:
 
     def add_request(self, request_dict: dict[str,
                                              Any]) -> tllm.InferenceRequest:
+        priority = request_dict.pop("priority", 0)
+        queue_timeout = request_dict.pop("queue_timeout", None)
         ids = self.tokenizer(request_dict.pop("prompt"),
                              return_tensors="pt",
                              return_attention_mask=False)
@@ -100,16 +110,43 @@ class AsyncLLMEngine:
         request = AsyncLLMEngine.create_inference_request(
             AsyncLLMEngine.gen_id(), request_dict)
 
+        deadline = time.monotonic(
+        ) + queue_timeout if queue_timeout is not None else None
         self.results[request.request_id] = Queue()
-        self.requests.append(request)
+        try:
+            self.requests.put(request.request_id, request, priority, deadline)
+        except QueueOverloadError:
+            self.results.pop(request.request_id)
+            raise
 
         return request
 
+    def cancel_request(self, request_id: int) -> None:
+        if self.requests.cancel(request_id):
+            self.results.pop(request_id, None)
+        elif request_id in self.results:
+            # Already admitted, the batch manager stops it with get_stop_set
+            self.stop_set.add(request_id)
+
+    def expire_request(self, request: tllm.InferenceRequest) -> None:
+        if request.request_id in self.results:
+            self.results[request.request_id].sync_q.put(
+                QueueTimeoutError(
+                    f"Request {request.request_id} was not admitted before its deadline"
+                ))
+
     async def get_response(self,
                            request_id: int) -> tuple[dict[str, Any], bool]:
         outputs, finished = None, False
         while outputs is None:
-            outputs, finished = await self.results[request_id].async_q.get()
+            response = await self.results[request_id].async_q.get()
+            if isinstance(response, Exception):
+                self.results.pop(request_id)
+                raise response
+            if isinstance(response, str):
+                self.results.pop(request_id)
+                raise RuntimeError(response)
+            outputs, finished = response
 
         last_idx = outputs["sequence_length"][0, 0].item()
         output = outputs["output_ids"][0, 0, :last_idx]
@@ -119,47 +156,66 @@ class AsyncLLMEngine:
 
         return output, finished
 
-    async def generate(self,
-                       prompt: str,
-                       max_new_tokens: int,
-                       streaming: bool = True):
+    def generate(
+            self,
+            prompt: str,
+            max_new_tokens: int,
+            streaming: bool = True,
+            priority: int = 0,
+            queue_timeout: Optional[float] = None) -> AsyncGenerator[str, None]:
+        ''' Queue the request and return the generator of its text.
+        Raises a QueueOverloadError right away if the admission queue is full.
+        Closing the generator early cancels the request.
+        '''
         tllm_request = self.add_request({
             "prompt": prompt,
             "max_new_tokens": [max_new_tokens],
-            "streaming": streaming
+            "streaming": streaming,
+            "priority": priority,
+            "queue_timeout": queue_timeout
         })
+        return self._generate_text(tllm_request)
+
+    async def _generate_text(self, tllm_request: tllm.InferenceRequest):
         request_id = tllm_request.request_id
-        current_tokens = tllm_request.input_ids[0].numpy().tolist()
-        current_str = self.tokenizer.decode(current_tokens)
+        detokenizer = IncrementalDetokenizer(
+            self.tokenizer, tllm_request.input_ids[0].numpy().tolist())
 
         finished = False
-        while not finished:
-            output, finished = await self.get_response(request_id)
+        try:
+            while not finished:
+                output, finished = await self.get_response(request_id)
 
-            current_tokens += output.numpy().tolist()
-            new_str = self.tokenizer.decode(current_tokens)
-            diff_str = new_str[len(current_str):]
-            current_str = new_str
+                diff_str = detokenizer.decode(output.numpy().tolist())
+                if finished:
+                    diff_str += detokenizer.flush()
 
-            yield diff_str
+                yield diff_str
+        finally:
+            if not finished:
+                self.cancel_request(request_id)
 
     # Callbacks for BatchManager
     def fetch_requests(self, max_num_sequences) -> list[tllm.InferenceRequest]:
-        fetched = []
-        for _ in range(max_num_sequences):
-            if len(self.requests) == 0:
-                break
-            fetched.append(self.requests.pop())
-        return fetched
+        return self.requests.get(max_num_sequences)
 
     def handle_response(self, req_id: int, tensors: list[tllm.NamedTensor],
                         is_ok: bool, err_msg: str) -> None:
+        if req_id in self.stop_set:
+            # Cancelled, nobody waits for the response anymore
+            if is_ok or err_msg:
+                self.stop_set.discard(req_id)
+                self.results.pop(req_id, None)
+            return
+        if req_id not in self.results:
+            return
         self.results[req_id].sync_q.put(
             [{t.name: t.tensor
               for t in tensors}, is_ok] if not err_msg else err_msg)
 
     def get_stop_set(self) -> set[int]:
-        return self.stop_set
+        # A copy, the set is updated from the event loop thread
+        return set(self.stop_set)
 
     def handle_stats(self, stats: str):
         while self.stats.sync_q.full():
@@ -30,8 +30,8 @@ from . import graph_rewriting as gw
 from ._common import default_net, default_trtnet, precision
 from ._utils import (bf16_array, dim_resolve_negative, dim_to_trt_axes,
                      fp16_array, fp32_array, int32_array, np_dtype_to_trt,
-                     str_dtype_to_np, str_dtype_to_trt, torch_to_numpy,
-                     trt_dtype_to_np, trt_dtype_to_torch)
+                     numpy_to_dtype, str_dtype_to_np, str_dtype_to_trt,
+                     trt_dtype_to_np, trt_dtype_to_str)
 from .logger import logger
 from .network import PluginInfo, set_np_weight, set_plugin_info
 from .plugin import TRT_LLM_PLUGIN_NAMESPACE
@@ -4042,14 +4042,8 @@ def generate_alibi_slopes(num_heads: int,
     slopes = np.asarray(slopes_ft, dtype=np.float32)
 
     slopes = alibi_scale * slopes
-    # Note that for bfloat16, we cannot case numpy tensor from float32 to bfloat16
-    # because numpy does not support bfloat16. Even if we use custom type to define
-    # the np_bfloat16, the "astype" here would be undefined.
-    # So, we must use torch to cast tensor from float32 to bfloat16, and then use torch_to_numpy
-    # to cast the tensor back.
-    slopes = torch.from_numpy(slopes)
-    slopes = slopes.to(trt_dtype_to_torch(dtype))
-    slopes = torch_to_numpy(slopes)
+    # numpy_to_dtype also converts to bfloat16, which numpy does not support
+    slopes = numpy_to_dtype(slopes, trt_dtype_to_str(dtype))
     slopes = constant(slopes.reshape(1, (end_head_id - start_head_id), 1, 1))
     return slopes
 
@@ -0,0 +1,156 @@
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+
+class QueueOverloadError(RuntimeError):
+    ''' Raised when a request is submitted to a full admission queue.  '''
+
+
+class QueueTimeoutError(TimeoutError):
+    ''' Raised for a request whose deadline passed before it was admitted.  '''
+
+
+@dataclass
+class _QueuedRequest:
+    request_id: int
+    request: Any
+    enqueue_time: float
+    deadline: Optional[float]
+
+
+class AdmissionQueue:
+    ''' The requests waiting to be admitted by the inflight batcher.
+
+    The requests are admitted in FIFO order within a priority class, the classes of higher priorities first.
+    A request can have a deadline (in the time.monotonic() clock), it is dropped if it is not admitted by then.
+    With max_size, submitting to a full queue raises a QueueOverloadError so that the callers can back off.
+
+    The queue is thread safe, the inflight batcher fetches the requests from its own thread.
+    '''
+
+    def __init__(self,
+                 max_size: Optional[int] = None,
+                 on_expire: Optional[Callable[[Any], None]] = None):
+        '''
+        Args:
+            max_size: The maximum number of queued requests, unbounded if not provided.
+            on_expire: Called with each request dropped for its deadline, out of the lock.
+        '''
+        self.max_size = max_size
+        self.on_expire = on_expire
+        # Entries are (-priority, sequence number, request), cancelled ones are left behind and skipped
+        self._heap = []
+        self._queued: Dict[int, _QueuedRequest] = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+        self.num_admitted = 0
+        self.num_rejected = 0
+        self.num_expired = 0
+        self.num_cancelled = 0
+        self.max_depth = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def __len__(self) -> int:
+        return len(self._queued)
+
+    def put(self,
+            request_id: int,
+            request: Any,
+            priority: int = 0,
+            deadline: Optional[float] = None):
+        ''' Queue a request, the larger the priority the sooner it is admitted.  '''
+        expired = []
+        with self._lock:
+            is_full = self.max_size is not None and len(
+                self._queued) >= self.max_size
+            if is_full:
+                expired = self._drop_expired(time.monotonic())
+                is_full = len(self._queued) >= self.max_size
+
+            if is_full:
+                self.num_rejected += 1
+            else:
+                queued = _QueuedRequest(request_id, request, time.monotonic(),
+                                        deadline)
+                heapq.heappush(self._heap,
+                               (-priority, next(self._sequence), queued))
+                self._queued[request_id] = queued
+                self.max_depth = max(self.max_depth, len(self._queued))
+        self._notify_expired(expired)
+        if is_full:
+            raise QueueOverloadError(
+                f"The admission queue is full ({self.max_size} requests)")
+
+    def get(self, max_num: int) -> List[Any]:
+        ''' Pop up to max_num requests to admit.  '''
+        admitted, expired = [], []
+        now = time.monotonic()
+        with self._lock:
+            while self._heap and len(admitted) < max_num:
+                _, _, queued = heapq.heappop(self._heap)
+                if self._queued.get(queued.request_id) is not queued:
+                    # Cancelled
+                    continue
+                del self._queued[queued.request_id]
+                if queued.deadline is not None and now > queued.deadline:
+                    self.num_expired += 1
+                    expired.append(queued.request)
+                    continue
+
+                wait_time = now - queued.enqueue_time
+                self.num_admitted += 1
+                self.total_wait_time += wait_time
+                self.max_wait_time = max(self.max_wait_time, wait_time)
+                admitted.append(queued.request)
+        self._notify_expired(expired)
+        return admitted
+
+    def cancel(self, request_id: int) -> bool:
+        ''' Remove a queued request, returns False if it is not queued, e.g. already admitted.  '''
+        with self._lock:
+            if self._queued.pop(request_id, None) is None:
+                return False
+            self.num_cancelled += 1
+            if len(self._heap) > 2 * len(self._queued) + 16:
+                # Compact the cancelled entries
+                self._heap = [
+                    entry for entry in self._heap
+                    if self._queued.get(entry[2].request_id) is entry[2]
+                ]
+                heapq.heapify(self._heap)
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                depth=len(self._queued),
+                max_depth=self.max_depth,
+                admitted=self.num_admitted,
+                rejected=self.num_rejected,
+                expired=self.num_expired,
+                cancelled=self.num_cancelled,
+                mean_wait_time=self.total_wait_time /
+                self.num_admitted if self.num_admitted else 0.0,
+                max_wait_time=self.max_wait_time,
+            )
+
+    def _drop_expired(self, now: float) -> List[Any]:
+        expired = [
+            queued for queued in self._queued.values()
+            if queued.deadline is not None and now > queued.deadline
+        ]
+        for queued in expired:
+            del self._queued[queued.request_id]
+        self.num_expired += len(expired)
+        return [queued.request for queued in expired]
+
+    def _notify_expired(self, expired: List[Any]):
+        if self.on_expire is not None:
+            for request in expired:
+                self.on_expire(request)
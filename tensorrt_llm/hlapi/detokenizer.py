@@ -0,0 +1,54 @@
+from typing import List, Sequence
+
+
+class IncrementalDetokenizer:
+    ''' Detokenize a stream of generated tokens into text deltas.
+
+    Only a small window of tokens is decoded per step: the tokens already emitted as text but still needed as the
+    context of the next ones (from the prefix offset) and the tokens not emitted yet (from the read offset).
+    The text of a step is held back while it ends with an incomplete UTF-8 sequence, e.g. a multi-byte character
+    split across byte-fallback tokens.
+
+    The window starts with the tail of the prompt, so the first generated tokens are decoded as they follow the
+    prompt (e.g. a sentencepiece word keeps its leading space) while the prompt itself is never emitted.
+    '''
+
+    # The number of prompt tokens decoded as the context of the first generated tokens
+    PROMPT_CONTEXT_SIZE = 5
+
+    def __init__(self,
+                 tokenizer,
+                 prompt_token_ids: Sequence[int] = (),
+                 context_size: int = PROMPT_CONTEXT_SIZE):
+        self.tokenizer = tokenizer
+        self._token_ids: List[int] = list(
+            prompt_token_ids[-context_size:]) if context_size > 0 else []
+        self._prefix_offset = 0
+        self._read_offset = len(self._token_ids)
+
+    def decode(self, new_token_ids: Sequence[int]) -> str:
+        ''' Append the newly generated tokens and return the text they complete.  '''
+        self._token_ids.extend(new_token_ids)
+        prefix_text, text = self._decode_window()
+        if len(text) <= len(prefix_text) or text.endswith('\ufffd'):
+            return ''
+        self._advance()
+        return text[len(prefix_text):]
+
+    def flush(self) -> str:
+        ''' Return the text held back, at the end of the generation.  '''
+        prefix_text, text = self._decode_window()
+        self._advance()
+        return text[len(prefix_text):]
+
+    def _decode_window(self):
+        window = self._token_ids[self._prefix_offset:]
+        prefix_text = self.tokenizer.decode(window[:self._read_offset -
+                                                   self._prefix_offset])
+        return prefix_text, self.tokenizer.decode(window)
+
+    def _advance(self):
+        # Drop the tokens out of the window so that the memory stays bounded
+        del self._token_ids[:self._read_offset]
+        self._prefix_offset = 0
+        self._read_offset = len(self._token_ids)
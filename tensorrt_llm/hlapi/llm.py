@@ -1,21 +1,24 @@
 import json
 import os
 import time
-from concurrent.futures import as_completed
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass, field
 from enum import Enum
+from itertools import chain
 from pathlib import Path
-from typing import Iterable, List, Optional, Union
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
 import torch
 from tqdm import tqdm
 from transformers import AutoTokenizer
 
-from tensorrt_llm import Mapping, Module, logger
+from tensorrt_llm import Mapping, Module, logger, profiler
 from tensorrt_llm.builder import BuildConfig, BuilderConfig
 from tensorrt_llm.runtime import (GenerationSession, ModelRunner,
                                   SamplingConfig, model_runner)
 from tensorrt_llm.runtime.engine import EngineConfig
+from tensorrt_llm.runtime.engine_cache import EngineCache
 
 from .mpi_session import MpiSession, NodeSession, mpi_rank, mpi_size
 
@@ -68,6 +71,9 @@ class ModelConfig:
     # ``parallel_config`` contains the options for distributed inference.
     parallel_config: ParallelConfig = ParallelConfig()
 
+    # ``engine_cache`` reuses the engines built before from the same model and options.
+    engine_cache: Optional[EngineCache] = None
+
     def __post_init__(self):
         assert self.model or self.model_dir, "Either model or model_dir should be provided."
 
@@ -103,6 +109,58 @@ class GenerationPiece:
     logprobs: List[float] = field(default_factory=list)
 
 
+@dataclass
+class BucketingReport:
+    ''' The padding of a length-bucketed generation.
+    The padding tokens are counted on both the inputs and the requested outputs of every batch, it is compared with
+    the batches sliced in the arrival order.
+    '''
+    num_prompts: int = 0
+    num_batches: int = 0
+    padding_tokens: int = 0
+    arrival_order_padding_tokens: int = 0
+
+    @property
+    def saved_padding_tokens(self) -> int:
+        return self.arrival_order_padding_tokens - self.padding_tokens
+
+
+def _count_padding_tokens(batches: List[List[int]], input_lengths: List[int],
+                          output_lengths: List[int]) -> int:
+    ''' Count the tokens padded to the longest input and the longest requested output of each batch.  '''
+    padding = 0
+    for batch in batches:
+        for lengths in (input_lengths, output_lengths):
+            batch_lengths = [lengths[i] for i in batch]
+            padding += max(batch_lengths) * len(batch) - sum(batch_lengths)
+    return padding
+
+
+def _bucket_by_length(input_lengths: List[int], output_lengths: List[int],
+                      max_batch_size: int) -> List[List[int]]:
+    ''' Group the prompt indices into batches of similar requested output length and input length.
+    The sort is stable, the prompts of the same lengths keep their arrival order.
+    '''
+    order = sorted(range(len(input_lengths)),
+                   key=lambda i: (output_lengths[i], input_lengths[i]))
+    return [
+        order[i:i + max_batch_size]
+        for i in range(0, len(order), max_batch_size)
+    ]
+
+
+def _restore_order(
+        outputs: Iterable[GenerationOuptut]) -> Iterable[GenerationOuptut]:
+    ''' Yield the outputs by request_id, the ones completed ahead of their turn are held back.  '''
+    pending: Dict[int, GenerationOuptut] = {}
+    next_id = 0
+    for output in outputs:
+        pending[output.request_id] = output
+        while next_id in pending:
+            yield pending.pop(next_id)
+            next_id += 1
+
+
 class TokenizerBase:
     ''' This is a protocol for the tokenizer. Users can implement their own tokenizer by inheriting this class.  '''
 
@@ -179,7 +237,9 @@ class LLM:
                  enable_tokenizer: bool = True,
                  disable_model_download: bool = False,
                  display_model_processing_summary: bool = False,
-                 dump_model_processing_summary: Optional[str] = None):
+                 dump_model_processing_summary: Optional[str] = None,
+                 pipeline_workers: int = 0,
+                 pipeline_queue_size: int = 4):
         '''
         Args:
             config: The model config for the model.
@@ -188,6 +248,8 @@ class LLM:
             disable_model_download: Disable downloading the HF model from third-party model hub like www.modelscope.cn or huggingface.
             display_model_processing_summary: Display the summary of the model building.
             dump_model_processing_summary: Dump the summary of the model building into a log file.
+            pipeline_workers: The number of threads tokenizing the prompts and detokenizing the outputs while the engine runs, 0 runs them in line with the engine.
+            pipeline_queue_size: The number of batches tokenized ahead of the engine with pipeline_workers.
         '''
 
         self.config = config
@@ -196,6 +258,10 @@ class LLM:
         self.disable_model_download = disable_model_download
         self.display_model_processing_summary = display_model_processing_summary
         self.dump_model_processing_summary = dump_model_processing_summary
+        self.pipeline_workers = pipeline_workers
+        self.pipeline_queue_size = pipeline_queue_size
+        # The report of the last length-bucketed generation on a single GPU
+        self.bucketing_report: Optional[BucketingReport] = None
 
         if self.config.is_multi_gpu:
             import torch
@@ -214,20 +280,29 @@ class LLM:
     def __call__(
         self,
         prompts: List[str] | List[TokenIdsTy],
-        sampling_config: Optional[SamplingConfig] = None
+        sampling_config: Optional[SamplingConfig] = None,
+        max_new_tokens: Optional[List[int]] = None,
+        bucketing: bool = False,
+        keep_order: bool = True,
     ) -> Iterable[GenerationOuptut]:
         ''' Generate the output for the given inputs.
 
         Args:
             prompts: The raw text or token ids to the model.
             sampling_config: The sampling config for the generation, a default one will be used if not provided.
+            max_new_tokens: The number of tokens requested for each prompt, the one of sampling_config is used if not provided.
+            bucketing: Tokenize all the prompts up front and batch the ones of similar input and requested output lengths, for offline jobs.
+            keep_order: With bucketing, yield the outputs in the order of the prompts rather than in the completion order.
         '''
 
         if self.config.is_multi_gpu:
-            return self._generate_sync_multi_gpu(prompts, sampling_config)
+            return self._generate_sync_multi_gpu(prompts, sampling_config,
+                                                 max_new_tokens, bucketing,
+                                                 keep_order)
         else:
             return self._generate_sync(prompts, self.runtime_stuff,
-                                       sampling_config)
+                                       sampling_config, max_new_tokens,
+                                       bucketing, keep_order)
 
     def __getstate__(self):
         # Customize the members to be pickled
@@ -253,8 +328,13 @@ class LLM:
 
         return state
 
-    def _generate_sync(self, prompts, runtime_stuff: "_ModelRuntimeStuff",
-                       sampling_config) -> Iterable[GenerationOuptut]:
+    def _generate_sync(self,
+                       prompts,
+                       runtime_stuff: "_ModelRuntimeStuff",
+                       sampling_config,
+                       max_new_tokens: Optional[List[int]] = None,
+                       bucketing: bool = False,
+                       keep_order: bool = True) -> Iterable[GenerationOuptut]:
         ''' Generate in sync mode on a single GPU.  '''
         sampling_config = sampling_config or self.default_sampling_config
         assert sampling_config is not None, "The sampling_config need to be provided."
@@ -262,16 +342,42 @@ class LLM:
         if not prompts:
             return []
         assert runtime_stuff.runner, "The model runner is not built yet."
+        assert max_new_tokens is None or len(max_new_tokens) == len(prompts), \
+            "max_new_tokens should be provided for each prompt."
 
-        def generate_batch(batch_input_ids: List[torch.Tensor]):
+        tokenizer = runtime_stuff.tokenizer
+        need_tokenize: bool = isinstance(prompts[0], str)
+
+        if need_tokenize:
+            assert tokenizer, "The tokenizer is not built or provided."
+
+        def process_batch(batch):
+            if not need_tokenize:
+                return batch
+            start = time.perf_counter()
+            input_ids = tokenizer.batch_encode_plus(batch)['input_ids']
+            profiler.add_elapsed_time("LLM tokenize",
+                                      time.perf_counter() - start)
+            return input_ids
+
+        def generate_batch(batch_input_ids: List[torch.Tensor],
+                           request_ids: List[int]) -> List[Tuple[int, list]]:
+            start = time.perf_counter()
             batch_input_ids = [
                 torch.tensor(x, dtype=torch.int32) for x in batch_input_ids
             ]  # List[torch.Tensor(seq)]
 
             assert len(batch_input_ids) <= build_config.max_batch_size, \
                 f"Can not run batch size larger than {build_config.max_batch_size}, got {len(batch_input_ids)}"
-            outputs = runtime_stuff.runner.generate(batch_input_ids,
-                                                    sampling_config)
+            if max_new_tokens is None:
+                outputs = runtime_stuff.runner.generate(batch_input_ids,
+                                                        sampling_config)
+            else:
+                # The batch runs up to its longest request, the others are truncated below
+                outputs = runtime_stuff.runner.generate(
+                    batch_input_ids,
+                    sampling_config,
+                    max_new_tokens=max(max_new_tokens[i] for i in request_ids))
 
             output_ids = outputs['output_ids']
             sequence_lengths = outputs['sequence_lengths']
@@ -280,57 +386,130 @@ class LLM:
             input_lengths = [x.size(0) for x in batch_input_ids]
             assert num_beams == 1, "Support beam search later"
 
+            batch_outputs = []
             for batch_idx in range(batch_size):
                 for beam in range(num_beams):
-                    inputs = output_ids[batch_idx][
-                        0][:input_lengths[batch_idx]].tolist()
-
+                    request_id = request_ids[batch_idx]
                     output_begin = input_lengths[batch_idx]
-                    output_end = sequence_lengths[batch_idx][beam]
-                    outputs = output_ids[batch_idx][beam][
-                        output_begin:output_end].tolist()
-
-                    output_text = runtime_stuff.tokenizer.decode(
-                        outputs) if runtime_stuff.tokenizer else None
-
-                    # get a sequence for each prompt directly
-                    piece = GenerationPiece(text=output_text, token_ids=outputs)
-                    yield GenerationOuptut(generate_pieces=[piece])
-
-        tokenizer = runtime_stuff.tokenizer
-
-        def batching_prompts(prompts):
-            need_tokenize: bool = isinstance(prompts[0], str)
-
-            if need_tokenize:
-                assert tokenizer, "The tokenizer is not built or provided."
-
-            def process_batch(batch):
-                return tokenizer.batch_encode_plus(
-                    batch)['input_ids'] if need_tokenize else batch
-
-            batch = []
-            for i, prompt in enumerate(prompts):
-                batch.append(prompt)
-                if len(batch) >= build_config.max_batch_size:
-                    yield process_batch(batch)
-                    batch = []
-            if batch:
-                yield process_batch(batch)
-
-        for batch in batching_prompts(prompts):
-            outs = generate_batch(batch)
-            for o in outs:
-                yield o
+                    output_end = int(sequence_lengths[batch_idx][beam])
+                    if max_new_tokens is not None:
+                        output_end = min(
+                            output_end,
+                            output_begin + max_new_tokens[request_id])
+                    batch_outputs.append(
+                        (request_id, output_ids[batch_idx][beam]
+                         [output_begin:output_end].tolist()))
+            profiler.add_elapsed_time("LLM generate",
+                                      time.perf_counter() - start)
+            return batch_outputs
+
+        def detokenize_batch(
+                batch_outputs: List[Tuple[int,
+                                          list]]) -> List[GenerationOuptut]:
+            start = time.perf_counter()
+            results = []
+            for request_id, outputs in batch_outputs:
+                output_text = tokenizer.decode(outputs) if tokenizer else None
+
+                # get a sequence for each prompt directly
+                piece = GenerationPiece(text=output_text, token_ids=outputs)
+                results.append(
+                    GenerationOuptut(request_id=request_id,
+                                     generate_pieces=[piece]))
+            profiler.add_elapsed_time("LLM detokenize",
+                                      time.perf_counter() - start)
+            return results
+
+        arrival_order_batches = [
+            list(range(i, min(i + build_config.max_batch_size, len(prompts))))
+            for i in range(0, len(prompts), build_config.max_batch_size)
+        ]
+
+        def tokenize_batches(batches, pool):
+            if pool is None:
+                for batch in batches:
+                    yield process_batch([prompts[i] for i in batch])
+                return
+            # Tokenize up to pipeline_queue_size batches ahead of the runner
+            pending = deque()
+            for batch in batches:
+                if len(pending) >= self.pipeline_queue_size:
+                    profiler.record_queue_depth(
+                        "LLM tokenized batches",
+                        sum(future.done() for future in pending))
+                    yield pending.popleft().result()
+                pending.append(
+                    pool.submit(process_batch, [prompts[i] for i in batch]))
+            while pending:
+                yield pending.popleft().result()
+
+        def bucketing_batches(pool):
+            input_ids = list(
+                chain.from_iterable(
+                    tokenize_batches(arrival_order_batches, pool)))
+            input_lengths = [len(x) for x in input_ids]
+            output_lengths = max_new_tokens or [sampling_config.max_new_tokens
+                                                ] * len(prompts)
+
+            batches = _bucket_by_length(input_lengths, output_lengths,
+                                        build_config.max_batch_size)
+            self.bucketing_report = BucketingReport(
+                num_prompts=len(prompts),
+                num_batches=len(batches),
+                padding_tokens=_count_padding_tokens(batches, input_lengths,
+                                                     output_lengths),
+                arrival_order_padding_tokens=_count_padding_tokens(
+                    arrival_order_batches, input_lengths, output_lengths))
+            logger.info(
+                f"Bucketed {len(prompts)} prompts into {len(batches)} batches, "
+                f"saved {self.bucketing_report.saved_padding_tokens} padding tokens"
+            )
+            return batches, ([input_ids[i] for i in batch] for batch in batches)
+
+        def generate(batches, batch_input_ids, pool):
+            pending = deque()
+            for request_ids, input_ids in zip(batches, batch_input_ids):
+                batch_outputs = generate_batch(input_ids, request_ids)
+                if pool is None:
+                    yield from detokenize_batch(batch_outputs)
+                    continue
+                pending.append(pool.submit(detokenize_batch, batch_outputs))
+                while pending and pending[0].done():
+                    yield from pending.popleft().result()
+                profiler.record_queue_depth("LLM detokenizing batches",
+                                            len(pending))
+            while pending:
+                yield from pending.popleft().result()
+
+        pool = ThreadPoolExecutor(
+            self.pipeline_workers) if self.pipeline_workers > 0 else None
+        try:
+            if bucketing:
+                batches, batch_input_ids = bucketing_batches(pool)
+            else:
+                batches = arrival_order_batches
+                batch_input_ids = tokenize_batches(batches, pool)
+            outputs = generate(batches, batch_input_ids, pool)
+            if bucketing and keep_order:
+                outputs = _restore_order(outputs)
+            yield from outputs
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
 
     def _generate_sync_multi_gpu(
-        self, prompts, sampling_config: Optional[SamplingConfig]
-    ) -> Iterable[GenerationOuptut]:
+            self,
+            prompts,
+            sampling_config: Optional[SamplingConfig],
+            max_new_tokens: Optional[List[int]] = None,
+            bucketing: bool = False,
+            keep_order: bool = True) -> Iterable[GenerationOuptut]:
         # TODO[chunweiy]: May merge this with the one gpu version later
         assert self.config.is_multi_gpu, "The model is not distributed."
 
         features = self.mpi_session.submit(self._node_generation_task, prompts,
-                                           sampling_config)
+                                           sampling_config, max_new_tokens,
+                                           bucketing, keep_order)
 
         res = [feature.result() for feature in as_completed(features)]
 
@@ -338,9 +517,12 @@ class LLM:
         return res[0]
 
     def _node_generation_task(
-            self, prompts: List[str] | List[List[int]],
-            sampling_config: Optional[SamplingConfig]
-    ) -> List[GenerationOuptut]:
+            self,
+            prompts: List[str] | List[List[int]],
+            sampling_config: Optional[SamplingConfig],
+            max_new_tokens: Optional[List[int]] = None,
+            bucketing: bool = False,
+            keep_order: bool = True) -> List[GenerationOuptut]:
         assert NodeSession.is_initialized(), "Model is not built yet."
         assert isinstance(NodeSession.state, _ModelRuntimeStuff)
         model: _ModelRuntimeStuff = NodeSession.state
@@ -353,7 +535,9 @@ class LLM:
                 output_sequence_lengths=True,
                 return_dict=True) if model.tokenizer else None
 
-        return list(self._generate_sync(prompts, model, sampling_config))
+        return list(
+            self._generate_sync(prompts, model, sampling_config, max_new_tokens,
+                                bucketing, keep_order))
 
     @property
     def tokenizer(self) -> TokenizerBase:
@@ -500,7 +684,20 @@ class _ModelBuilder:
         self._model_name = self._model_name or self._get_model_kind(
             self._model_dir)
 
-        if self._model_format is ModelFormatKind.HF:
+        self._cache_key = None
+        self._cached_engine = None
+        if self._model_format is ModelFormatKind.HF and self.config.engine_cache is not None:
+            self._cache_key = self.config.engine_cache.cache_key(
+                self._model_dir, self.config.build_config, self.mapping
+                or Mapping())
+            self._cached_engine = self.config.engine_cache.load(
+                self._cache_key, self._rank)
+
+        if self._model_format is ModelFormatKind.HF and self._cached_engine is not None:
+            ''' Engine built before from the same HF model '''
+            self._model_pipeline.append(
+                ("load_cached_engine", self._load_cached_engine))
+        elif self._model_format is ModelFormatKind.HF:
             ''' HF -> TFRT checkpoints -> engine '''
             self._model_pipeline.append(
                 ("hf_to_trtllm", self._build_model_from_hf))
@@ -519,6 +716,10 @@ class _ModelBuilder:
             self._model_pipeline.append(
                 ("init_tokenizer", self._init_default_tokenizer))
 
+    @property
+    def _rank(self) -> int:
+        return self.mapping.rank if self.mapping else 0
+
     def __call__(self) -> _ModelRuntimeStuff:
         if self.config.is_multi_gpu:
             torch.cuda.set_device(self.mapping.rank)
@@ -656,12 +857,19 @@ class _ModelBuilder:
             self._model_structure = self._engine_config['builder_config'][
                 'name']
 
+    def _load_cached_engine(self):
+        ''' Load the engine built before from the engine cache.
+        The model runner will be created.
+        '''
+        self._engine, self._engine_config = self._cached_engine
+        self._cached_engine = None
+        self._model_structure = self._engine_config['builder_config']['name']
+        self._create_model_runner(self._engine_config)
+
     def _build_engine_and_model_runner(self):
         ''' Build TensorRT-LLM engine from a in-memory model.
         The model runner will be created.
         '''
-        from tensorrt_llm.mapping import Mapping
-
         self._engine, self._builder_config = self.model.to_trt(
             self.config.build_config.max_batch_size,
             self.config.build_config.max_input_len,
@@ -674,9 +882,16 @@ class _ModelBuilder:
         # delete the model explicitly to free all the build-time resources
         del self.model
 
+        if self._cache_key is not None:
+            self.config.engine_cache.store(self._cache_key, self._engine,
+                                           self._builder_config.to_dict(),
+                                           self._rank)
+        self._create_model_runner(self._builder_config.to_dict())
+
+    def _create_model_runner(self, config: dict):
         # TODO [chunweiy]: Is this conversion necessary?
         model_config, other_config = model_runner._builder_to_model_config(
-            self._builder_config.to_dict())
+            config)
         max_batch_size = other_config.get('max_batch_size')
         max_input_len = other_config.get('max_input_len')
         max_output_len = other_config.get('max_output_len')
@@ -12,7 +12,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import List
+from typing import List, Optional
 
 
 class Mapping(object):
@@ -30,6 +30,12 @@ class Mapping(object):
     - [1, 5]
     - [2, 6]
     - [3, 7]
+
+    The decoder layers are split into contiguous slices across the pp ranks.
+    pp_partition gives the number of layers of each stage, e.g. lighter
+    slices for the first and last stages that also run the embedding and the
+    lm_head, see tensorrt_llm.models.pipeline_partition. By default the layers
+    are split evenly, the remainder going to the middle stages first.
     '''
 
     def __init__(self,
@@ -37,7 +43,8 @@ class Mapping(object):
                  rank=0,
                  gpus_per_node=8,
                  tp_size=1,
-                 pp_size=1):
+                 pp_size=1,
+                 pp_partition: Optional[List[int]] = None):
         self.tp_size = tp_size
         self.pp_size = pp_size
         self.world_size = world_size
@@ -46,6 +53,13 @@ class Mapping(object):
 
         if pp_size * tp_size != world_size:
             raise ValueError("world_size must equal to pp_size * tp_size")
+        if pp_partition is not None:
+            pp_partition = list(pp_partition)
+            if len(pp_partition) != pp_size or any(n < 0 for n in pp_partition):
+                raise ValueError(
+                    f"pp_partition {pp_partition} must give the number of layers of each of the {pp_size} pp stages"
+                )
+        self.pp_partition = pp_partition
         self.pp_groups = []
         self.tp_groups = []
 
@@ -89,11 +103,26 @@ class Mapping(object):
             p = p - self.world_size
         return p
 
+    def pp_stage_num_layers(self, num_layers: int) -> List[int]:
+        ''' The number of layers of each pp stage.  '''
+        if self.pp_partition is not None:
+            if sum(self.pp_partition) != num_layers:
+                raise ValueError(
+                    f"pp_partition {self.pp_partition} does not add up to {num_layers} layers"
+                )
+            return list(self.pp_partition)
+        stage_num_layers = [num_layers // self.pp_size] * self.pp_size
+        # The first and last stages also run the embedding and the lm_head
+        stages = list(range(1, self.pp_size - 1)) + [0, self.pp_size - 1]
+        for stage in stages[:num_layers % self.pp_size]:
+            stage_num_layers[stage] += 1
+        return stage_num_layers
+
     def pp_layers(self, num_layers: int) -> List[int]:
-        layers_per_pipeline_stage = num_layers // self.pp_size
-        layers_range = range(self.pp_rank * layers_per_pipeline_stage,
-                             (self.pp_rank + 1) * layers_per_pipeline_stage)
-        return list(layers_range)
+        stage_num_layers = self.pp_stage_num_layers(num_layers)
+        first_layer = sum(stage_num_layers[:self.pp_rank])
+        return list(
+            range(first_layer, first_layer + stage_num_layers[self.pp_rank]))
 
     def ep_experts(self, num_experts: int) -> List[int]:
         experts_per_rank = num_experts // self.tp_size
@@ -0,0 +1,123 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import functools
+from typing import List, Optional
+
+import torch
+
+from ..convert_utils import WeightRule, quantize_weight_only
+
+
+def reorder_qkv_weight_or_bias(v, n_head, n_hidden, is_bias=False):
+    """ Reorder the qkv weight.
+
+    Note that the shape of the fused QKV weights in HF is different from the
+    shape that TRT-LLM requires.
+       HF: (num_heads x 3 x head_dim, hidden_size)
+       TRT-LLM: (3 x num_heads x head_dim, hidden_size)
+    This is unlike to the other models in HF e.g. GPT where they have the
+    same shape with TRT-LLM, i.e., (3 x num_heads x head_dim, hidden_size). Also,
+    to split across attention heads in tensor parallel, we reshape the qkv
+        weight: (3, num_heads x head_dim, hidden).
+        bias  : (3, num_heads x head_dim).
+    """
+
+    head_dim = n_hidden // n_head
+
+    # (3 x hidden, ...) view as (num_heads, 3, head_dim, ...)
+    v = v.reshape(n_head, 3, head_dim, -1)
+    # permute to (3, num_heads, head_dim, ...)
+    v = v.transpose(0, 1)
+    # final shape: weight=(3, hidden, hidden) or bias=(3, hidden)
+    if is_bias:
+        return v.reshape(3, n_hidden)
+    return v.reshape(3, n_hidden, n_hidden)
+
+
+def split_qkv(v, tp_size, n_head, n_hidden):
+    """
+    Splits the QKV weight or bias of all tensor parallel ranks
+    """
+    is_bias = v.ndim == 1
+    v = reorder_qkv_weight_or_bias(v, n_head, n_hidden, is_bias=is_bias)
+    return [
+        split_v.reshape(3 * (n_hidden // tp_size), *v.shape[2:])
+        for split_v in torch.chunk(v, tp_size, dim=1)
+    ]
+
+
+def bloom_weight_rules(
+    num_heads: int,
+    hidden_size: int,
+    use_parallel_embedding: bool = False,
+    sharding_dim: int = 0,
+    share_embedding_table: bool = False,
+    plugin_weight_only_quant_type: Optional[torch.dtype] = None
+) -> List[WeightRule]:
+    '''
+    Conversion rules of the HF BLOOM checkpoints, for BloomForCausalLM and
+    BloomModel parameter names.
+    '''
+    layer = r'(?:transformer\.)?h\.(?P<layer>\d+)'
+    target = 'transformer.layers.{layer}'
+    postprocess = None
+    if plugin_weight_only_quant_type is not None:
+        postprocess = functools.partial(
+            quantize_weight_only,
+            plugin_weight_only_quant_type=plugin_weight_only_quant_type)
+
+    rules = [
+        WeightRule(rf'{layer}\.self_attention\.query_key_value\.(?P<p>\w+)',
+                   f'{target}.attention.qkv.{{p}}',
+                   split_fn=functools.partial(split_qkv,
+                                              n_head=num_heads,
+                                              n_hidden=hidden_size),
+                   postprocess=postprocess),
+        WeightRule(rf'{layer}\.self_attention\.dense\.weight',
+                   f'{target}.attention.dense.weight',
+                   split_dim=1,
+                   postprocess=postprocess),
+        WeightRule(rf'{layer}\.self_attention\.dense\.bias',
+                   f'{target}.attention.dense.bias'),
+        WeightRule(rf'{layer}\.mlp\.dense_h_to_4h\.(?P<p>\w+)',
+                   f'{target}.mlp.fc.{{p}}',
+                   split_dim=0,
+                   postprocess=postprocess),
+        WeightRule(rf'{layer}\.mlp\.dense_4h_to_h\.weight',
+                   f'{target}.mlp.proj.weight',
+                   split_dim=1,
+                   postprocess=postprocess),
+        WeightRule(rf'{layer}\.mlp\.dense_4h_to_h\.bias',
+                   f'{target}.mlp.proj.bias'),
+        WeightRule(rf'{layer}\.input_layernorm\.(?P<p>\w+)',
+                   f'{target}.input_layernorm.{{p}}'),
+        WeightRule(rf'{layer}\.post_attention_layernorm\.(?P<p>\w+)',
+                   f'{target}.post_layernorm.{{p}}'),
+        WeightRule(r'(?:transformer\.)?word_embeddings_layernorm\.(?P<p>\w+)',
+                   'transformer.ln_embed.{p}'),
+        WeightRule(r'(?:transformer\.)?word_embeddings\.weight',
+                   'transformer.embedding.weight',
+                   split_dim=sharding_dim if use_parallel_embedding else None),
+        WeightRule(r'(?:transformer\.)?ln_f\.(?P<p>\w+)',
+                   'transformer.ln_f.{p}'),
+    ]
+    if not share_embedding_table:
+        # safetensors doesn't allow to save a shared tensor, lm_head is saved
+        # as a copy of the embedding table.
+        rules.append(
+            WeightRule(r'(?:transformer\.)?word_embeddings\.weight',
+                       'lm_head.weight',
+                       split_dim=0))
+    return rules
@@ -0,0 +1,448 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Streaming conversion of HF checkpoints to TRT-LLM checkpoints.
+
+The HF shards are read tensor by tensor. Every tensor is matched against the
+WeightRule list of the model family, which declares its TRT-LLM name, how it
+is split across tensor parallel ranks and which pipeline stages hold it. A
+source tensor is read once and the shards of all ranks are produced from it
+in a thread pool, so the memory used by the conversion depends on the largest
+tensors and the number of tensors in flight, not on the model size.
+"""
+import json
+import os
+import re
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+from typing import (Callable, Dict, Iterator, List, Optional, Sequence, Tuple,
+                    Union)
+
+import numpy as np
+import torch
+
+from .._safetensors import SafetensorsMmap
+from .._utils import np_bfloat16, str_dtype_to_torch
+from ..logger import logger
+from ..mapping import Mapping
+from ..quantization.weight_quant import symmetric_quantize
+from .llama.utils import iterate_shard_files
+
+
+class WeightRule(object):
+    '''
+    Conversion rule of HF tensors.
+
+    Parameters:
+        pattern : str
+            Regular expression matching the whole HF tensor name. The named
+            group `layer` holds the decoder layer index, such tensors only go
+            to the pipeline stage holding the layer.
+
+        target : str
+            TRT-LLM tensor name, formatted with the named groups of pattern.
+            `{layer}` is the layer index local to the pipeline stage.
+
+        split_dim : int
+            Dimension split across the tensor parallel ranks.
+            None replicates the tensor on every rank.
+
+        split_fn : Callable[[torch.Tensor, int], Sequence[torch.Tensor]]
+            Returns the tensors of all tp_size ranks, for layouts which need
+            more than a chunk along one dimension, e.g. interleaved QKV.
+            Overrides split_dim.
+
+        pp_stage : str
+            'first' or 'last' keeps a tensor without layer index on the first
+            or last pipeline stage only, e.g. embedding or lm_head.
+
+        concat : Tuple[int, int]
+            (index, count), the rank tensors of `count` rules with the same
+            target are concatenated along dim 0 in index order, e.g. separate
+            q, k and v projections fused into one qkv weight.
+
+        postprocess : Callable[[str, torch.Tensor], Dict[str, torch.Tensor]]
+            Applied to the tensor of every rank, returns the tensors to save,
+            e.g. weight-only quantized weights and their scales.
+    '''
+
+    def __init__(self,
+                 pattern: str,
+                 target: str,
+                 split_dim: Optional[int] = None,
+                 split_fn: Optional[Callable[[torch.Tensor, int],
+                                             Sequence[torch.Tensor]]] = None,
+                 pp_stage: Optional[str] = None,
+                 concat: Optional[Tuple[int, int]] = None,
+                 postprocess: Optional[Callable[[str, torch.Tensor],
+                                                Dict[str,
+                                                     torch.Tensor]]] = None):
+        assert pp_stage in (None, 'first', 'last')
+        self.pattern = re.compile(pattern)
+        self.target = target
+        self.split_dim = split_dim
+        self.split_fn = split_fn
+        self.pp_stage = pp_stage
+        self.concat = concat
+        self.postprocess = postprocess
+
+    def match(self, name: str) -> Optional[Dict[str, str]]:
+        match = self.pattern.fullmatch(name)
+        return None if match is None else match.groupdict()
+
+    def split(self, tensor: torch.Tensor,
+              tp_size: int) -> Sequence[torch.Tensor]:
+        if self.split_fn is not None:
+            return self.split_fn(tensor, tp_size)
+        if self.split_dim is None or tp_size == 1:
+            return [tensor] * tp_size
+        assert tensor.shape[self.split_dim] % tp_size == 0, \
+            f'Unable to split: shape={tuple(tensor.shape)} (dim={self.split_dim}) tp_size={tp_size}.'
+        return torch.chunk(tensor, tp_size, dim=self.split_dim)
+
+
+def quantize_weight_only(
+        name: str, weight: torch.Tensor,
+        plugin_weight_only_quant_type: torch.dtype) -> Dict[str, torch.Tensor]:
+    '''
+    Postprocess of the linear weights for the weight-only quantization plugin.
+    '''
+    if not name.endswith('.weight'):
+        return {name: weight}
+    processed_torch_weights, torch_weight_scales = symmetric_quantize(
+        weight.t().contiguous(), plugin_weight_only_quant_type)
+    return {
+        name: processed_torch_weights,
+        name[:-len('weight')] + 'per_channel_scale': torch_weight_scales
+    }
+
+
+def iterate_hf_tensors(
+        model_dir: Union[str, Path]) -> Iterator[Tuple[str, torch.Tensor]]:
+    '''
+    Yields the tensors of a HF checkpoint one by one. Safetensors shards are
+    memory-mapped and .bin shards are memory-mapped when torch supports it,
+    the data is read from disk when the tensor is used.
+    '''
+    for shard_file in iterate_shard_files(model_dir, rank=0,
+                                          progress_bar=False):
+        logger.debug(f'Loading file {str(shard_file)}...')
+        if shard_file.suffix == '.safetensors':
+            shard = SafetensorsMmap(shard_file)
+            for name in shard.keys():
+                value = shard[name]
+                if value.dtype == np_bfloat16:
+                    yield name, torch.from_numpy(value.view(np.int16)).view(
+                        torch.bfloat16)
+                else:
+                    yield name, torch.from_numpy(value)
+        else:
+            try:
+                state_dict = torch.load(shard_file,
+                                        map_location='cpu',
+                                        mmap=True,
+                                        weights_only=True)
+            except (TypeError, RuntimeError):
+                # mmap needs torch>=2.1 and a zipfile checkpoint
+                state_dict = torch.load(shard_file, map_location='cpu')
+            for name in list(state_dict.keys()):
+                yield name, state_dict.pop(name)
+
+
+_torch_to_safetensors_dtype_dict = {
+    torch.bool: 'BOOL',
+    torch.uint8: 'U8',
+    torch.int8: 'I8',
+    torch.int16: 'I16',
+    torch.int32: 'I32',
+    torch.int64: 'I64',
+    torch.float16: 'F16',
+    torch.bfloat16: 'BF16',
+    torch.float32: 'F32',
+    torch.float64: 'F64',
+}
+if hasattr(torch, 'float8_e4m3fn'):
+    _torch_to_safetensors_dtype_dict[torch.float8_e4m3fn] = 'F8_E4M3'
+
+
+class SafetensorsWriter(object):
+    '''
+    Writes a safetensors file tensor by tensor, from any thread.
+
+    The tensor data is appended after a reserved header area. The header is
+    written in place when the file is closed if it fits into the reserved
+    area (padded with spaces, as allowed by the format), otherwise the data is
+    copied after the header in chunks. The file is renamed to its final path
+    once complete.
+
+    As a context manager, the file is closed on exit, or aborted if an
+    exception was raised, so that no partial temporary file is left behind.
+    '''
+
+    def __init__(self, path: Union[str, Path], reserved_header_size=1 << 20):
+        self.path = str(path)
+        self._tmp_path = f'{self.path}.tmp'
+        self._reserved_header_size = reserved_header_size
+        self._header = {}
+        self._offset = 0
+        self._lock = threading.Lock()
+        self._file = open(self._tmp_path, 'wb')
+        self._file.seek(self._reserved_header_size)
+
+    def add(self, name: str, tensor: torch.Tensor):
+        tensor = tensor.detach().cpu().contiguous()
+        data = tensor.reshape(-1).view(torch.uint8).numpy()
+        with self._lock:
+            assert name not in self._header, f'Duplicated tensor {name}'
+            self._header[name] = {
+                'dtype': _torch_to_safetensors_dtype_dict[tensor.dtype],
+                'shape': list(tensor.shape),
+                'data_offsets': [self._offset, self._offset + data.nbytes]
+            }
+            self._file.write(data)
+            self._offset += data.nbytes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def abort(self):
+        '''
+        Closes and removes the temporary file, path is not written.
+        '''
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def close(self):
+        try:
+            self._finalize()
+        except BaseException:
+            self.abort()
+            raise
+
+    def _finalize(self):
+        header = dict(self._header)
+        header['__metadata__'] = {'format': 'pt'}
+        header = json.dumps(header, separators=(',', ':')).encode()
+        if len(header) + 8 <= self._reserved_header_size:
+            header += b' ' * (self._reserved_header_size - 8 - len(header))
+            self._file.seek(0)
+            self._file.write(struct.pack('<Q', len(header)))
+            self._file.write(header)
+            self._file.close()
+            os.replace(self._tmp_path, self.path)
+            return
+
+        self._file.close()
+        header += b' ' * (-len(header) % 8)
+        try:
+            with open(self._tmp_path, 'rb') as src, open(self.path,
+                                                         'wb') as dst:
+                dst.write(struct.pack('<Q', len(header)))
+                dst.write(header)
+                src.seek(self._reserved_header_size)
+                while True:
+                    chunk = src.read(64 << 20)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+        except BaseException:
+            # No truncated file at the final path either
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            raise
+        os.remove(self._tmp_path)
+
+
+class CheckpointConverter(object):
+    '''
+    Converts a HF checkpoint to the TRT-LLM checkpoints of several ranks
+    in one pass over the HF tensors.
+    '''
+
+    def __init__(self,
+                 rules: List[WeightRule],
+                 num_layers: int,
+                 dtype: Union[str, torch.dtype],
+                 tp_size: int = 1,
+                 pp_size: int = 1,
+                 ranks: Optional[Sequence[int]] = None,
+                 workers: int = 1,
+                 max_inflight: Optional[int] = None,
+                 pp_partition: Optional[Sequence[int]] = None):
+        self.rules = rules
+        self.dtype = str_dtype_to_torch(dtype) if isinstance(dtype,
+                                                             str) else dtype
+        self.tp_size = tp_size
+        world_size = tp_size * pp_size
+        if ranks is None:
+            ranks = range(world_size)
+        self.mappings = {
+            rank: Mapping(world_size=world_size,
+                          rank=rank,
+                          tp_size=tp_size,
+                          pp_size=pp_size,
+                          pp_partition=pp_partition)
+            for rank in ranks
+        }
+        self.layers_range = {
+            rank: mapping.pp_layers(num_layers)
+            for rank, mapping in self.mappings.items()
+        }
+        self.workers = workers
+        # Tensors read and not converted yet, bounds the memory in use
+        self.max_inflight = max_inflight or 2 * workers
+        self._concat_parts = {}
+        self._lock = threading.Lock()
+
+    def _target_ranks(self, rule: WeightRule,
+                      layer: Optional[int]) -> List[Tuple[int, int, int]]:
+        targets = []
+        for rank, mapping in self.mappings.items():
+            if layer is not None:
+                layers_range = self.layers_range[rank]
+                if layer not in layers_range:
+                    continue
+                local_layer = layer - layers_range[0]
+            else:
+                if rule.pp_stage == 'first' and not mapping.is_first_pp_rank():
+                    continue
+                if rule.pp_stage == 'last' and not mapping.is_last_pp_rank():
+                    continue
+                local_layer = None
+            targets.append((rank, mapping.tp_rank, local_layer))
+        return targets
+
+    def _convert(self, rule: WeightRule, groups: Dict[str, str],
+                 tensor: torch.Tensor, sink: Callable[[int, str, torch.Tensor],
+                                                      None]):
+        layer = groups.get('layer')
+        targets = self._target_ranks(rule,
+                                     None if layer is None else int(layer))
+        if not targets:
+            return
+
+        tensor = tensor.to(self.dtype)
+        rank_tensors = rule.split(tensor, self.tp_size)
+        for rank, tp_rank, local_layer in targets:
+            name = rule.target.format(**dict(groups, layer=local_layer))
+            rank_tensor = rank_tensors[tp_rank]
+            if rule.concat is not None:
+                index, count = rule.concat
+                with self._lock:
+                    parts = self._concat_parts.setdefault((rank, name), {})
+                    parts[index] = rank_tensor
+                    if len(parts) < count:
+                        continue
+                    del self._concat_parts[(rank, name)]
+                rank_tensor = torch.cat([parts[i] for i in range(count)])
+
+            if rule.postprocess is not None:
+                results = rule.postprocess(name, rank_tensor)
+            else:
+                results = {name: rank_tensor}
+            for result_name, result in results.items():
+                sink(rank, result_name, result)
+
+    def convert(self,
+                model_dir: Union[str, Path],
+                sink: Callable[[int, str, torch.Tensor], None],
+                overrides: Optional[Dict[str, torch.Tensor]] = None):
+        '''
+        Converts the HF checkpoint in model_dir and calls sink(rank, name,
+        tensor) for every TRT-LLM tensor, from the worker threads.
+        The HF tensors found in overrides are replaced, e.g. by LoRA weights.
+        '''
+        overrides = overrides or {}
+        tik = time.time()
+        inflight = threading.BoundedSemaphore(self.max_inflight)
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for name, tensor in iterate_hf_tensors(model_dir):
+                tensor = overrides.get(name, tensor)
+                matched = False
+                for rule in self.rules:
+                    groups = rule.match(name)
+                    if groups is None:
+                        continue
+                    matched = True
+                    inflight.acquire()
+                    future = pool.submit(self._convert, rule, groups, tensor,
+                                         sink)
+                    future.add_done_callback(lambda _: inflight.release())
+                    futures.append(future)
+                if not matched:
+                    logger.debug(f'Skip weight {name}')
+                del tensor
+                # Report errors early and drop the finished futures
+                while futures and futures[0].done():
+                    futures.pop(0).result()
+            for future in futures:
+                future.result()
+        assert not self._concat_parts, \
+            f'Missing parts of tensors {list(self._concat_parts.keys())}'
+
+        t = time.strftime('%H:%M:%S', time.gmtime(time.time() - tik))
+        logger.info(f'Weights converted. Total time: {t}')
+
+    def convert_to_dict(
+        self,
+        model_dir: Union[str, Path],
+        overrides: Optional[Dict[str, torch.Tensor]] = None
+    ) -> Dict[int, Dict[str, torch.Tensor]]:
+        '''
+        Returns the TRT-LLM weights of every rank.
+        '''
+        weights = {rank: {} for rank in self.mappings}
+
+        def sink(rank, name, tensor):
+            # Copy the shards, they must not keep the source tensor alive
+            weights[rank][name] = tensor.clone(
+                memory_format=torch.contiguous_format)
+
+        self.convert(model_dir, sink, overrides)
+        return weights
+
+    def convert_to_files(self,
+                         model_dir: Union[str, Path],
+                         output_dir: Union[str, Path],
+                         overrides: Optional[Dict[str, torch.Tensor]] = None):
+        '''
+        Writes the TRT-LLM weights of every rank to
+        output_dir/rank{N}.safetensors while converting.
+        '''
+        with ExitStack() as stack:
+            # The temporary files are removed if the conversion fails
+            writers = {
+                rank: stack.enter_context(
+                    SafetensorsWriter(
+                        Path(output_dir) / f'rank{rank}.safetensors'))
+                for rank in self.mappings
+            }
+
+            def sink(rank, name, tensor):
+                writers[rank].add(name, tensor)
+
+            self.convert(model_dir, sink, overrides)
@@ -0,0 +1,178 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import functools
+from typing import List, Optional
+
+import torch
+
+from ..convert_utils import WeightRule, quantize_weight_only
+
+
+def reorder_qkv_weight_or_bias(weight: torch.Tensor,
+                               head_dim: int,
+                               num_heads: int,
+                               num_kv_heads: Optional[int] = None,
+                               tp_size: int = 1,
+                               is_bias: bool = False) -> torch.Tensor:
+    """ Reorder the qkv weight for TRT-LLM use.
+
+    The shape of the fused QKV weights in HF is different from the shape that
+    TRT-LLM requires. In particular, the weight of HF consists of interleaved
+    q, k, v head weights, while that of TRT-LLM is contiguous.
+        HF     : [q1, k1, v1, ..., qh, kh, vh]
+        TRT-LLM: [q1, ..., qh, k1, ..., kh, v1, vh]
+    where qi, vi, ki are weight vectors corresponding to attention head i.
+    It's similar to multi/grouped query attention cases.
+
+    We reorder and split the weight of an attention layer to fit into TRT-LLM.
+    The reordered weight and bias will be
+        weight: (T, Qh * D + 2 * KVh * D, H)
+        bias  : (T, Qh * D + 2 * KVh * D)
+    where T=tp_size, Qh=local_num_q_heads, KVh=local_num_kv_heads, D=head_dim,
+    H=hidden_dim. In the multi/grouped query attention, the number of K/V
+    attention heads are less than that of Q attention, so that K/V attention
+    heads may be shared across different ranks if necessary.
+
+    For tensor parallelism, we use the first dimension to select the
+    corresponding weights.
+    """
+
+    # Query types and expected kv heads.
+    #  - Conventional MHA: num_heads = num_kv_heads
+    #  - Multi-Query Attention: num_kv_heads = 1
+    #  - Grouped-Query Attention: num_heads % num_kv_heads = 0
+    num_kv_heads = num_kv_heads if num_kv_heads is not None else num_heads
+    assert num_heads % num_kv_heads == 0, \
+        f'num_heads({num_heads}) must be divisible by '\
+        f'num_kv_heads({num_kv_heads})).'
+
+    # The number of attention heads per group: N q head + 1 k head + 1 v head.
+    num_group_heads = num_heads // num_kv_heads + 2
+    assert weight.shape[0] == num_kv_heads * num_group_heads * head_dim, \
+        f'{weight.shape[0]} != {num_kv_heads} * {num_group_heads} * {head_dim}'
+
+    qkv_in = num_heads * head_dim if not is_bias else 1
+
+    # Split Q/K/V weights
+    weight = weight.reshape(num_kv_heads, num_heads // num_kv_heads + 2,
+                            head_dim, qkv_in)
+    q_w = weight[:, :-2, ...]  # (nKV, num_heads // nKV, head_dim, qkv_in)
+    k_w = weight[:, -2:-1, ...]  # (nKV, 1, head_dim, qkv_in)
+    v_w = weight[:, -1:, ...]  # (nKV, 1, head_dim, qkv_in)
+
+    if num_kv_heads < num_heads and num_kv_heads < tp_size:
+        # Duplicate K/V heads to make sure that each rank has at least one
+        # K/V heads. For instance, num_heads=8, num_kv_heads=2, tp_size=4,
+        # we will make the qkv weight as below.
+        #   Orig: [q0 q1 q2 q3 k0 v0 q4 q5 q6 q7 k1 v0 v1]
+        #   >>>>  [[q0 q1 k0 v0], [q2 q3 k0 v0], [q4 q5 k1 v1], [q6 q7 k1 v1]]
+        assert tp_size % num_kv_heads == 0
+        num_dups = tp_size // num_kv_heads
+
+        # k_w and v_w have the same shape.
+        new_shape = (num_kv_heads, num_dups) + k_w.shape[2:]
+        k_w = torch.broadcast_to(k_w, size=new_shape)
+        v_w = torch.broadcast_to(v_w, size=new_shape)
+
+        # Update the number of kv heads.
+        num_kv_heads = tp_size
+
+    reordered = torch.concat(
+        [
+            q_w.reshape(tp_size, num_heads // tp_size, head_dim, qkv_in),
+            k_w.reshape(tp_size, num_kv_heads // tp_size, head_dim, qkv_in),
+            v_w.reshape(tp_size, num_kv_heads // tp_size, head_dim, qkv_in),
+        ],
+        dim=1,
+    )
+
+    qkv_out = (num_heads + 2 * num_kv_heads) // tp_size * head_dim
+    return reordered.reshape((tp_size, qkv_out, -1))
+
+
+def split_qkv(weight: torch.Tensor, tp_size: int, hidden_size: int,
+              num_heads: int, num_kv_heads: int) -> List[torch.Tensor]:
+    """ Splits the QKV weight or bias of all tensor parallel ranks """
+    is_bias = weight.ndim == 1
+    weight = reorder_qkv_weight_or_bias(weight,
+                                        head_dim=hidden_size // num_heads,
+                                        num_heads=num_heads,
+                                        num_kv_heads=num_kv_heads,
+                                        tp_size=tp_size,
+                                        is_bias=is_bias)
+    if is_bias:
+        weight = weight.reshape(tp_size, -1)
+    return list(weight)
+
+
+def falcon_weight_rules(
+    num_heads: int,
+    num_kv_heads: int,
+    hidden_size: int,
+    plugin_weight_only_quant_type: Optional[torch.dtype] = None
+) -> List[WeightRule]:
+    '''
+    Conversion rules of the HF Falcon checkpoints, for both the
+    FalconForCausalLM and the RefinedWeb parameter names.
+    '''
+    layer = r'transformer\.h\.(?P<layer>\d+)'
+    target = 'transformer.layers.{layer}'
+    postprocess = None
+    if plugin_weight_only_quant_type is not None:
+        postprocess = functools.partial(
+            quantize_weight_only,
+            plugin_weight_only_quant_type=plugin_weight_only_quant_type)
+
+    return [
+        WeightRule(rf'{layer}\.self_attention\.query_key_value\.(?P<p>\w+)',
+                   f'{target}.attention.qkv.{{p}}',
+                   split_fn=functools.partial(split_qkv,
+                                              hidden_size=hidden_size,
+                                              num_heads=num_heads,
+                                              num_kv_heads=num_kv_heads),
+                   postprocess=postprocess),
+        WeightRule(rf'{layer}\.self_attention\.dense\.weight',
+                   f'{target}.attention.dense.weight',
+                   split_dim=1,
+                   postprocess=postprocess),
+        WeightRule(rf'{layer}\.self_attention\.dense\.bias',
+                   f'{target}.attention.dense.bias'),
+        WeightRule(rf'{layer}\.mlp\.dense_h_to_4h\.(?P<p>\w+)',
+                   f'{target}.mlp.fc.{{p}}',
+                   split_dim=0,
+                   postprocess=postprocess),
+        WeightRule(rf'{layer}\.mlp\.dense_4h_to_h\.weight',
+                   f'{target}.mlp.proj.weight',
+                   split_dim=1,
+                   postprocess=postprocess),
+        WeightRule(rf'{layer}\.mlp\.dense_4h_to_h\.bias',
+                   f'{target}.mlp.proj.bias'),
+        WeightRule(rf'{layer}\.(?:ln_attn|input_layernorm)\.(?P<p>\w+)',
+                   f'{target}.input_layernorm.{{p}}'),
+        WeightRule(rf'{layer}\.ln_mlp\.(?P<p>\w+)',
+                   f'{target}.mlp_layernorm.{{p}}'),
+        WeightRule(rf'{layer}\.post_attention_layernorm\.(?P<p>\w+)',
+                   f'{target}.post_layernorm.{{p}}'),
+        WeightRule(r'transformer\.word_embeddings\.weight',
+                   'transformer.embedding.weight',
+                   pp_stage='first'),
+        WeightRule(r'transformer\.word_embeddings\.weight',
+                   'lm_head.weight',
+                   split_dim=0,
+                   pp_stage='last'),
+        WeightRule(r'transformer\.ln_f\.(?P<p>\w+)',
+                   'transformer.ln_f.{p}',
+                   pp_stage='last'),
+    ]
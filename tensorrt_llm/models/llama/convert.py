@@ -0,0 +1,110 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import functools
+from typing import List, Optional
+
+import torch
+
+from ..convert_utils import WeightRule, quantize_weight_only
+
+
+def split_kv(v: torch.Tensor, tp_size: int, num_kv_heads: int):
+    """
+    Splits the K or V weight, the KV heads are duplicated when there are fewer
+    KV heads than tensor parallel ranks.
+    """
+    if num_kv_heads < tp_size:
+        assert tp_size % num_kv_heads == 0
+        reps = tp_size // num_kv_heads
+        v = v.reshape(num_kv_heads, 1, -1,
+                      v.shape[-1]).expand(num_kv_heads, reps, -1, v.shape[-1])
+        return list(v.reshape(tp_size, -1, v.shape[-1]))
+    return torch.chunk(v, tp_size, dim=0)
+
+
+def llama_weight_rules(
+    num_kv_heads: int,
+    use_parallel_embedding: bool = False,
+    sharding_dim: int = 0,
+    tie_word_embeddings: bool = False,
+    plugin_weight_only_quant_type: Optional[torch.dtype] = None
+) -> List[WeightRule]:
+    '''
+    Conversion rules of the HF LLaMA checkpoints. The q, k and v projections
+    are fused into the qkv weight of every rank.
+    '''
+    layer = r'model\.layers\.(?P<layer>\d+)'
+    target = 'layers.{layer}'
+    postprocess = None
+    if plugin_weight_only_quant_type is not None:
+        postprocess = functools.partial(
+            quantize_weight_only,
+            plugin_weight_only_quant_type=plugin_weight_only_quant_type)
+    split_kv_fn = functools.partial(split_kv, num_kv_heads=num_kv_heads)
+
+    rules = [
+        WeightRule(rf'{layer}\.self_attn\.q_proj\.weight',
+                   f'{target}.attention.qkv.weight',
+                   split_dim=0,
+                   concat=(0, 3),
+                   postprocess=postprocess),
+        WeightRule(rf'{layer}\.self_attn\.k_proj\.weight',
+                   f'{target}.attention.qkv.weight',
+                   split_fn=split_kv_fn,
+                   concat=(1, 3),
+                   postprocess=postprocess),
+        WeightRule(rf'{layer}\.self_attn\.v_proj\.weight',
+                   f'{target}.attention.qkv.weight',
+                   split_fn=split_kv_fn,
+                   concat=(2, 3),
+                   postprocess=postprocess),
+        WeightRule(rf'{layer}\.self_attn\.o_proj\.weight',
+                   f'{target}.attention.dense.weight',
+                   split_dim=1,
+                   postprocess=postprocess),
+        WeightRule(rf'{layer}\.mlp\.up_proj\.weight',
+                   f'{target}.mlp.gate.weight',
+                   split_dim=0,
+                   postprocess=postprocess),
+        WeightRule(rf'{layer}\.mlp\.gate_proj\.weight',
+                   f'{target}.mlp.fc.weight',
+                   split_dim=0,
+                   postprocess=postprocess),
+        WeightRule(rf'{layer}\.mlp\.down_proj\.weight',
+                   f'{target}.mlp.proj.weight',
+                   split_dim=1,
+                   postprocess=postprocess),
+        WeightRule(rf'{layer}\.input_layernorm\.weight',
+                   f'{target}.input_layernorm.weight'),
+        WeightRule(rf'{layer}\.post_attention_layernorm\.weight',
+                   f'{target}.post_layernorm.weight'),
+        WeightRule(r'model\.embed_tokens\.weight',
+                   'vocab_embedding.weight',
+                   split_dim=sharding_dim if use_parallel_embedding else None,
+                   pp_stage='first'),
+        WeightRule(r'model\.norm\.weight', 'ln_f.weight', pp_stage='last'),
+        WeightRule(r'lm_head\.weight',
+                   'lm_head.weight',
+                   split_dim=0,
+                   pp_stage='last'),
+    ]
+    if tie_word_embeddings:
+        # lm_head.weight has the same weights as embedding
+        rules.append(
+            WeightRule(r'model\.embed_tokens\.weight',
+                       'lm_head.weight',
+                       split_dim=0,
+                       pp_stage='last'))
+    return rules
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import configparser
+import threading
 import time
 from pathlib import Path
 from typing import Dict, List, Optional, Union
@@ -23,16 +24,24 @@ from safetensors import safe_open
 
 import tensorrt_llm
 import tensorrt_llm.logger as logger
-from tensorrt_llm._utils import (numpy_to_torch, str_dtype_to_np,
+from tensorrt_llm._utils import (numpy_to_dtype, numpy_to_torch,
                                  str_dtype_to_torch, torch_to_numpy)
 from tensorrt_llm.mapping import Mapping
 from tensorrt_llm.models import LLaMAForCausalLM
 from tensorrt_llm.models.quantized.quant import get_dummy_quant_scales
 from tensorrt_llm.quantization import QuantMode
+# yapf: disable
+from tensorrt_llm.quantization.weight_quant import (gptq_weights,
+                                                    groupwise_scales,
+                                                    parallel_map,
+                                                    preprocess_weights,
+                                                    quantize,
+                                                    symmetric_quantize)
+# yapf: enable
 from tensorrt_llm.runtime.lora_manager import LoraConfig
 
-from .utils import (iterate_shard_files, load_state_dict,
-                    retrieved_layer_index_from_name)
+from ..convert_utils import CheckpointConverter
+from .convert import llama_weight_rules
 
 
 def get_scaling_factors(
@@ -260,10 +269,7 @@ def load_from_hf_llama(tensorrt_llm_llama: tensorrt_llm.models.LLaMAForCausalLM,
             f'model.layers.{l}.block_sparse_moe.experts.w2.weight'] = w2
 
     torch_dtype = str_dtype_to_torch(dtype)
-    layers_per_pipeline_stage = hf_llama.config.num_hidden_layers // mapping.pp_size
-    layers_range = list(
-        range(mapping.pp_rank * layers_per_pipeline_stage,
-              (mapping.pp_rank + 1) * layers_per_pipeline_stage, 1))
+    layers_range = mapping.pp_layers(hf_llama.config.num_hidden_layers)
 
     vocab_size = hf_llama.config.vocab_size
     for k, v in model_params.items():
@@ -309,7 +315,7 @@ def load_from_hf_llama(tensorrt_llm_llama: tensorrt_llm.models.LLaMAForCausalLM,
             layer_idx = extract_layer_idx(k)
             if layer_idx is None or int(layer_idx) not in layers_range:
                 continue
-            idx = int(layer_idx) - mapping.pp_rank * layers_per_pipeline_stage
+            idx = int(layer_idx) - layers_range[0]
             if 'input_layernorm.weight' in k:
                 tensorrt_llm_llama.layers[idx].input_layernorm.weight.value = v
             elif 'post_attention_layernorm.weight' in k:
@@ -332,12 +338,10 @@ def load_from_hf_llama(tensorrt_llm_llama: tensorrt_llm.models.LLaMAForCausalLM,
                                               model_emb)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                            numpy_to_torch(v), plugin_weight_only_quant_type)
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
+                        numpy_to_torch(v), plugin_weight_only_quant_type)
                     if not use_gemm_woq_plugin:
-                        dst.value = numpy_to_torch(v).numpy().astype(
-                            str_dtype_to_np(dtype))
+                        dst.value = numpy_to_dtype(v, dtype)
                     else:
                         dst.value = torch_to_numpy(processed_torch_weights)
                     scales = tensorrt_llm_llama.layers[
@@ -350,12 +354,10 @@ def load_from_hf_llama(tensorrt_llm_llama: tensorrt_llm.models.LLaMAForCausalLM,
                 split_v = split(v, mapping.tp_size, mapping.tp_rank, dim=1)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                            numpy_to_torch(v), plugin_weight_only_quant_type)
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
+                        numpy_to_torch(v), plugin_weight_only_quant_type)
                     if not use_gemm_woq_plugin:
-                        dst.value = numpy_to_torch(v).numpy().astype(
-                            str_dtype_to_np(dtype))
+                        dst.value = numpy_to_dtype(v, dtype)
                     else:
                         dst.value = torch_to_numpy(processed_torch_weights)
                     scales = tensorrt_llm_llama.layers[
@@ -368,13 +370,11 @@ def load_from_hf_llama(tensorrt_llm_llama: tensorrt_llm.models.LLaMAForCausalLM,
                 split_v = split(v, mapping.tp_size, mapping.tp_rank, dim=0)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                            numpy_to_torch(v), plugin_weight_only_quant_type)
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
+                        numpy_to_torch(v), plugin_weight_only_quant_type)
 
                     if not use_gemm_woq_plugin:
-                        dst.value = numpy_to_torch(v).numpy().astype(
-                            str_dtype_to_np(dtype))
+                        dst.value = numpy_to_dtype(v, dtype)
                     else:
                         dst.value = torch_to_numpy(processed_torch_weights)
 
@@ -388,12 +388,10 @@ def load_from_hf_llama(tensorrt_llm_llama: tensorrt_llm.models.LLaMAForCausalLM,
                 split_v = split(v, mapping.tp_size, mapping.tp_rank, dim=1)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                            numpy_to_torch(v), plugin_weight_only_quant_type)
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
+                        numpy_to_torch(v), plugin_weight_only_quant_type)
                     if not use_gemm_woq_plugin:
-                        dst.value = numpy_to_torch(v).numpy().astype(
-                            str_dtype_to_np(dtype))
+                        dst.value = numpy_to_dtype(v, dtype)
                     else:
                         dst.value = torch_to_numpy(processed_torch_weights)
                     scales = tensorrt_llm_llama.layers[
@@ -406,13 +404,11 @@ def load_from_hf_llama(tensorrt_llm_llama: tensorrt_llm.models.LLaMAForCausalLM,
                 split_v = split(v, mapping.tp_size, mapping.tp_rank, dim=0)
                 if use_weight_only:
                     v = np.ascontiguousarray(split_v.transpose())
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                            numpy_to_torch(v), plugin_weight_only_quant_type)
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
+                        numpy_to_torch(v), plugin_weight_only_quant_type)
 
                     if not use_gemm_woq_plugin:
-                        dst.value = numpy_to_torch(v).numpy().astype(
-                            str_dtype_to_np(dtype))
+                        dst.value = numpy_to_dtype(v, dtype)
                     else:
                         dst.value = torch_to_numpy(processed_torch_weights)
                     scales = tensorrt_llm_llama.layers[
@@ -427,9 +423,8 @@ def load_from_hf_llama(tensorrt_llm_llama: tensorrt_llm.models.LLaMAForCausalLM,
                 if use_weight_only:
                     v = np.ascontiguousarray(
                         np.transpose(split_v, axes=(0, 2, 1)))
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                            numpy_to_torch(v), plugin_weight_only_quant_type)
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
+                        numpy_to_torch(v), plugin_weight_only_quant_type)
                     dst.value = processed_torch_weights
                     tensorrt_llm_llama.layers[
                         idx].mlp.experts_scale_2.value = torch_weight_scales
@@ -442,9 +437,8 @@ def load_from_hf_llama(tensorrt_llm_llama: tensorrt_llm.models.LLaMAForCausalLM,
                 if use_weight_only:
                     v = np.ascontiguousarray(
                         np.transpose(split_v, axes=(0, 2, 1)))
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                            numpy_to_torch(v), plugin_weight_only_quant_type)
+                    processed_torch_weights, torch_weight_scales = symmetric_quantize(
+                        numpy_to_torch(v), plugin_weight_only_quant_type)
                     dst.value = processed_torch_weights
                     tensorrt_llm_llama.layers[
                         idx].mlp.experts_scale_1.value = torch_weight_scales
@@ -460,77 +454,13 @@ def load_from_hf_llama(tensorrt_llm_llama: tensorrt_llm.models.LLaMAForCausalLM,
     tensorrt_llm.logger.info(f'Weights loaded. Total time: {t}')
 
 
-class QkvWeightHelper:
-    """ A helper utility for loading QKV weights from sharded files. """
-
-    def __init__(self, model: tensorrt_llm.models.LLaMAForCausalLM):
-        self.hidden_size = model.hidden_size
-        self.num_heads = model.num_heads
-        self.num_kv_heads = model.num_kv_heads
-        self.tp_size = model.mapping.tp_size
-        self.tp_rank = model.mapping.tp_rank
-        self.is_mha = self.num_heads == self.num_kv_heads
-        self._qkv_weights = {}
-
-    @staticmethod
-    def is_qkv_weight(name):
-        for k in ['q_proj', 'k_proj', 'v_proj']:
-            if 'self_attn' in name and k in name:
-                return True
-        return False
-
-    def add_weight(self, i: int, name: str, weight: torch.Tensor):
-        if 'q_proj' in name:
-            tag = 'q'
-        elif 'k_proj' in name:
-            tag = 'k'
-        elif 'v_proj' in name:
-            tag = 'v'
-        else:
-            raise ValueError(f'Got an unexpected parameter of name {name}')
-        if i not in self._qkv_weights:
-            self._qkv_weights[i] = {}
-        self._qkv_weights[i][tag] = weight
-
-    def is_qkv_prepared(self, layer_id):
-        if layer_id not in self._qkv_weights:
-            return False
-        weights = self._qkv_weights[layer_id]
-        return 'q' in weights and 'k' in weights and 'v' in weights
-
-    def split_qkv_weights(self, layer_id):
-        if not self.is_qkv_prepared(layer_id):
-            return None
-        weights = self._qkv_weights.pop(layer_id)  # to prevent memory leak.
-        q, k, v = (torch.tensor(weights[t]) for t in ['q', 'k', 'v'])
-
-        if not self.is_mha:
-            head_size = self.hidden_size // self.num_heads
-            if self.num_kv_heads < self.tp_size:
-                # duplicate the KV heads up to tensor_parallel
-                k = dup_kv_weight(k, self.num_kv_heads, self.tp_size)
-                v = dup_kv_weight(v, self.num_kv_heads, self.tp_size)
-            assert k.shape[0] % (self.tp_size * head_size) == 0
-            assert v.shape[0] % (self.tp_size * head_size) == 0
-            wq = split(q, self.tp_size, self.tp_rank)
-            wk = split(k, self.tp_size, self.tp_rank)
-            wv = split(v, self.tp_size, self.tp_rank)
-            fused_qkv = torch.cat((wq, wk, wv), dim=0)
-        else:
-            qkv = torch.cat([q, k, v], dim=0)
-            qkv = qkv.reshape(3, q.shape[0], q.shape[1])
-            fused_qkv = split(qkv, self.tp_size, self.tp_rank, dim=1)
-            fused_qkv = fused_qkv.reshape(3 * (q.shape[0] // self.tp_size),
-                                          q.shape[1])
-        return fused_qkv
-
-
 def load_from_hf_checkpoint(
         tensorrt_llm_llama: tensorrt_llm.models.LLaMAForCausalLM,
         model_dir: Union[str, Path],
         mapping=Mapping(),
         dtype: Union[str, torch.dtype] = torch.float32,
         lora_config=LoraConfig(),
+        workers: int = 1,
 ):
     tensorrt_llm.logger.info('Loading weights from HF LLaMA...')
     tik = time.time()
@@ -546,112 +476,36 @@ def load_from_hf_checkpoint(
     hf_config = AutoConfig.from_pretrained(model_dir)
 
     quant_mode = getattr(tensorrt_llm_llama, 'quant_mode', QuantMode(0))
+    plugin_weight_only_quant_type = None
     if quant_mode.is_int8_weight_only():
         plugin_weight_only_quant_type = torch.int8
     elif quant_mode.is_int4_weight_only():
         plugin_weight_only_quant_type = torch.quint4x2
-    use_weight_only = quant_mode.is_weight_only()
-
-    layers_range = mapping.pp_layers(tensorrt_llm_llama.num_layers)
 
-    qkv_weight_helper = QkvWeightHelper(tensorrt_llm_llama)
-
-    for model_file in iterate_shard_files(model_dir,
-                                          rank=mapping.tp_rank,
-                                          progress_bar=False):
-        logger.debug(f'Loading file {str(model_file)}...')
-        model_params = load_state_dict(model_file, dtype=dtype)
-        for name, param in model_params.items():
-            logger.debug(f'Converting weight {name}...')
-            i = retrieved_layer_index_from_name(name)
-            if i is None:
-                layer = None
-            else:
-                if i not in layers_range:
-                    continue
-                layer = tensorrt_llm_llama.layers[i - layers_range[0]]
-
-            if 'model.embed_tokens.weight' in name:
-                if lora_config.is_valid and lora_config.embedding_weight is not None:
-                    param = lora_config.embedding_weight.to(dtype)
-                if hf_config.tie_word_embeddings:
-                    # lm_head.weight has the same weights as embedding
-                    if mapping.is_last_pp_rank():
-                        tensorrt_llm_llama.lm_head.weight.value = split(
-                            param, mapping.tp_size, mapping.tp_rank)
-                if tensorrt_llm_llama.use_parallel_embedding:
-                    param = split(param, mapping.tp_size, mapping.tp_rank,
-                                  tensorrt_llm_llama.embedding_sharding_dim)
-                if mapping.is_first_pp_rank():
-                    tensorrt_llm_llama.vocab_embedding.weight.value = param
-            elif 'model.norm.weight' in name:
-                if mapping.is_last_pp_rank():
-                    tensorrt_llm_llama.ln_f.weight.value = param
-            elif 'lm_head.weight' in name:
-                if lora_config.is_valid and lora_config.lm_head_weight is not None:
-                    param = lora_config.lm_head_weight.to(dtype)
-                if mapping.is_last_pp_rank():
-                    tensorrt_llm_llama.lm_head.weight.value = split(
-                        param, mapping.tp_size, mapping.tp_rank)
-            elif 'input_layernorm.weight' in name:
-                layer.input_layernorm.weight.value = param
-            elif 'post_attention_layernorm.weight' in name:
-                layer.post_layernorm.weight.value = param
-            elif qkv_weight_helper.is_qkv_weight(name):
-                qkv_weight_helper.add_weight(i, name, param)
-                if not qkv_weight_helper.is_qkv_prepared(i):
-                    continue
-                split_v = qkv_weight_helper.split_qkv_weights(i)
-                if use_weight_only:
-                    param = split_v.transpose()
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                            param, plugin_weight_only_quant_type)
-                    layer.attention.qkv.weight.value = processed_torch_weights
-                    layer.attention.qkv.per_channel_scale.value = torch_weight_scales
-                else:
-                    layer.attention.qkv.weight.value = split_v
-            elif 'self_attn.o_proj.weight' in name:
-                split_v = split(param, mapping.tp_size, mapping.tp_rank, dim=1)
-                if use_weight_only:
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                            split_v.transpose(), plugin_weight_only_quant_type)
-                    layer.attention.dense.weight.value = processed_torch_weights
-                    layer.attention.dense.per_channel_scale.value = torch_weight_scales
-                else:
-                    layer.attention.dense.weight.value = split_v
-            elif 'mlp.up_proj.weight' in name:
-                split_v = split(param, mapping.tp_size, mapping.tp_rank, dim=0)
-                if use_weight_only:
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                            split_v.transpose(), plugin_weight_only_quant_type)
-                    layer.mlp.gate.weight.value = processed_torch_weights
-                    layer.mlp.gate.per_channel_scale.value = torch_weight_scales
-                else:
-                    layer.mlp.gate.weight.value = split_v
-            elif 'mlp.down_proj.weight' in name:
-                split_v = split(param, mapping.tp_size, mapping.tp_rank, dim=1)
-                if use_weight_only:
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                            split_v.transpose(), plugin_weight_only_quant_type)
-                    layer.mlp.proj.weight.value = processed_torch_weights
-                    layer.mlp.proj.per_channel_scale.value = torch_weight_scales
-                else:
-                    layer.mlp.proj.weight.value = split_v
-            elif 'mlp.gate_proj.weight' in name:
-                split_v = split(param, mapping.tp_size, mapping.tp_rank, dim=0)
-                if use_weight_only:
-                    processed_torch_weights, torch_weight_scales = \
-                        torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
-                            split_v.transpose(), plugin_weight_only_quant_type)
-                    layer.mlp.fc.weight.value = processed_torch_weights
-                    layer.mlp.fc.per_channel_scale.value = torch_weight_scales
-                else:
-                    layer.mlp.fc.weight.value = split_v
-        del model_params
+    rules = llama_weight_rules(
+        tensorrt_llm_llama.num_kv_heads,
+        use_parallel_embedding=tensorrt_llm_llama.use_parallel_embedding,
+        sharding_dim=tensorrt_llm_llama.embedding_sharding_dim,
+        tie_word_embeddings=hf_config.tie_word_embeddings,
+        plugin_weight_only_quant_type=plugin_weight_only_quant_type)
+    overrides = {}
+    if lora_config.is_valid and lora_config.embedding_weight is not None:
+        overrides['model.embed_tokens.weight'] = lora_config.embedding_weight
+    if lora_config.is_valid and lora_config.lm_head_weight is not None:
+        overrides['lm_head.weight'] = lora_config.lm_head_weight
+
+    converter = CheckpointConverter(rules,
+                                    tensorrt_llm_llama.num_layers,
+                                    dtype,
+                                    tp_size=mapping.tp_size,
+                                    pp_size=mapping.pp_size,
+                                    ranks=[mapping.rank],
+                                    workers=workers)
+    weights = converter.convert_to_dict(model_dir, overrides)[mapping.rank]
+
+    params = dict(tensorrt_llm_llama.named_parameters())
+    for name, param in weights.items():
+        params[name].value = param
     tok = time.time()
     t = time.strftime('%H:%M:%S', time.gmtime(tok - tik))
     tensorrt_llm.logger.info(f'Weights loaded. Total time: {t}')
@@ -785,10 +639,7 @@ def load_from_meta_llama(
 
     head_size = tensorrt_llm_llama.hidden_size // tensorrt_llm_llama.num_heads
     ckpt = get_current_weights(num_ckpts)
-    layers_per_pipeline_stage = tensorrt_llm_llama.num_layers // mapping.pp_size
-    layers_range = list(
-        range(mapping.pp_rank * layers_per_pipeline_stage,
-              (mapping.pp_rank + 1) * layers_per_pipeline_stage, 1))
+    layers_range = mapping.pp_layers(tensorrt_llm_llama.num_layers)
 
     for l in layers_range:
         prefix = f'layers.{l}.attention.'
@@ -850,7 +701,7 @@ def load_from_meta_llama(
             layer_idx = extract_layer_idx(k)
             if layer_idx is None or int(layer_idx) not in layers_range:
                 continue
-            idx = int(layer_idx) - mapping.pp_rank * layers_per_pipeline_stage
+            idx = int(layer_idx) - layers_range[0]
             if 'attention_norm.weight' in k:
                 tensorrt_llm_llama.layers[idx].input_layernorm.weight.value = v
             elif 'ffn_norm.weight' in k:
@@ -999,10 +850,7 @@ def load_from_binary(tensorrt_llm_llama: LLaMAForCausalLM,
         tensorrt_llm_llama.lm_head.weight.value = np.ascontiguousarray(
             split(lm_head_weight, mapping.tp_size, mapping.tp_rank))
 
-    layers_per_pipeline_stage = tensorrt_llm_llama.num_layers // mapping.pp_size
-    layers_range = list(
-        range(mapping.pp_rank * layers_per_pipeline_stage,
-              (mapping.pp_rank + 1) * layers_per_pipeline_stage, 1))
+    layers_range = mapping.pp_layers(tensorrt_llm_llama.num_layers)
 
     for i in layers_range:
         n_groups = n_head // n_kv_head
@@ -1010,7 +858,7 @@ def load_from_binary(tensorrt_llm_llama: LLaMAForCausalLM,
             3 * n_embd // mapping.tp_size) if not multi_query_mode else (
                 n_embd // mapping.tp_size +
                 (n_embd // n_head * n_groups) // mapping.tp_size * 2)
-        idx = i - mapping.pp_rank * layers_per_pipeline_stage
+        idx = i - layers_range[0]
         tensorrt_llm_llama.layers[idx].input_layernorm.weight.value = (fromfile(
             dir_path, 'model.layers.' + str(i) + '.input_layernorm.weight.bin'))
         t = fromfile(
@@ -1032,7 +880,7 @@ def load_from_binary(tensorrt_llm_llama: LLaMAForCausalLM,
                     rank=mapping.tp_rank,
                     is_qkv=True)
             elif use_weight_only:
-                processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+                processed_torch_weights, torch_weight_scales = symmetric_quantize(
                     torch.tensor(t), plugin_weight_only_quant_type)
                 dst.value = processed_torch_weights.numpy()
                 scales = tensorrt_llm_llama.layers[
@@ -1059,7 +907,7 @@ def load_from_binary(tensorrt_llm_llama: LLaMAForCausalLM,
                          'model.layers.' + str(i) + '.attention.dense',
                          [1, n_embd // mapping.tp_size], mapping.tp_rank)
         elif use_weight_only:
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_llama.layers[
@@ -1091,7 +939,7 @@ def load_from_binary(tensorrt_llm_llama: LLaMAForCausalLM,
                 rank=mapping.tp_rank)
         elif use_weight_only:
             dst = tensorrt_llm_llama.layers[idx].mlp.fc.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
 
             dst.value = processed_torch_weights.numpy()
@@ -1120,7 +968,7 @@ def load_from_binary(tensorrt_llm_llama: LLaMAForCausalLM,
                 rank=mapping.tp_rank)
         elif use_weight_only:
             dst = tensorrt_llm_llama.layers[idx].mlp.gate.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
             dst.value = processed_torch_weights.numpy()
             scales = tensorrt_llm_llama.layers[idx].mlp.gate.per_channel_scale
@@ -1149,7 +997,7 @@ def load_from_binary(tensorrt_llm_llama: LLaMAForCausalLM,
                          [1, inter_size // mapping.tp_size], mapping.tp_rank)
         elif use_weight_only:
             dst = tensorrt_llm_llama.layers[idx].mlp.proj.weight
-            processed_torch_weights, torch_weight_scales = torch.ops.fastertransformer.symmetric_quantize_last_axis_of_batched_matrix(
+            processed_torch_weights, torch_weight_scales = symmetric_quantize(
                 torch.tensor(t), plugin_weight_only_quant_type)
 
             dst.value = processed_torch_weights.numpy()
@@ -1201,8 +1049,6 @@ def load_from_gptq_llama(tensorrt_llm_llama,
     ]
     split_sym = "."
 
-    packer = torch.ops.fastertransformer.pack_int8_tensor_to_packed_int4
-    preprocessor = torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm
     torch_dtype = str_dtype_to_torch(dtype)
 
     def load(key, no_prefix=0):
@@ -1220,16 +1066,6 @@ def load_from_gptq_llama(tensorrt_llm_llama,
         return v.split(v.shape[dim] // mapping.tp_size,
                        dim=dim)[mapping.tp_rank]
 
-    def unpack_int32_into_int8(w_packed):
-        # Unpack inputs packed in int32/float32 into uint4 and store them in int8 format
-        w_packed_int4x2 = w_packed.contiguous().view(torch.uint8)
-        w_unpacked = torch.zeros(w_packed_int4x2.shape[0],
-                                 w_packed_int4x2.shape[1] * 2,
-                                 dtype=torch.int8)
-        w_unpacked[:, ::2] = w_packed_int4x2 % 16
-        w_unpacked[:, 1::2] = w_packed_int4x2 // 16
-        return w_unpacked.contiguous()
-
     def process_and_assign_weight(mOp, v, tp_dim=-1):
         if tp_dim == -1:
             qweight_int32, qzeros_int32, scales_fp16 = [
@@ -1240,28 +1076,12 @@ def load_from_gptq_llama(tensorrt_llm_llama,
                 torch_split(item, tp_dim).cpu() for item in v
             ]
 
-        USE_UINT4_INPUT = 1  # Set to true if checkpoint store UINT4 weights
-        USE_GPTQ_FOR_LLAMA = 1  # GPTQ-for-LLaMA added 1 to zeros
-
-        qweight_unpacked_int8 = unpack_int32_into_int8(
-            qweight_int32.T).T.contiguous() - 8
-        qweight_interleaved = preprocessor(packer(qweight_unpacked_int8),
-                                           torch.quint4x2).view(torch.float16)
-        # zeros = zeros * scales
-        qzeros_unpacked_int32 = unpack_int32_into_int8(qzeros_int32)
-        if not USE_UINT4_INPUT:
-            # Correcting UINT4 values back to INT4 order
-            mask_negative = qzeros_unpacked_int32[qzeros_unpacked_int32 < 0]
-            mask_positive = qzeros_unpacked_int32[qzeros_unpacked_int32 >= 0]
-            qzeros_unpacked_int32 = qzeros_unpacked_int32 + 16 * mask_negative - 16 * mask_positive
-        zeros_x_scales_fp16 = (-qzeros_unpacked_int32 + 8 * USE_UINT4_INPUT -
-                               USE_GPTQ_FOR_LLAMA) * scales_fp16
-        zeros_x_scales_fp16 = zeros_x_scales_fp16.half()
-
         # return processed interleaved weight, original scales and zeros * scales
-        mOp.weight.value = qweight_interleaved.cpu().numpy()
-        mOp.weights_scaling_factor.value = scales_fp16.cpu().numpy()
-        mOp.zero.value = zeros_x_scales_fp16.cpu().numpy()
+        qweight_interleaved, scales_fp16, zeros_x_scales_fp16 = gptq_weights(
+            qweight_int32, qzeros_int32, scales_fp16)
+        mOp.weight.value = qweight_interleaved.view(torch.float16).numpy()
+        mOp.weights_scaling_factor.value = scales_fp16.numpy()
+        mOp.zero.value = zeros_x_scales_fp16.half().numpy()
 
     # Load weights from GPTQ checkpoint into TRT-LLM module
     # 1. vocab_embedding
@@ -1283,13 +1103,10 @@ def load_from_gptq_llama(tensorrt_llm_llama,
 
     # 4. Weights inside each layer
     num_hidden_layers = tensorrt_llm_llama.num_layers
-    layers_per_pipeline_stage = num_hidden_layers // mapping.pp_size
-    layers_range = list(
-        range(mapping.pp_rank * layers_per_pipeline_stage,
-              (mapping.pp_rank + 1) * layers_per_pipeline_stage, 1))
+    layers_range = mapping.pp_layers(num_hidden_layers)
 
-    for l in layers_range:
-        layer_idx = l - mapping.pp_rank * layers_per_pipeline_stage
+    def load_layer(l):
+        layer_idx = l - layers_range[0]
         prefix = "layers" + split_sym + str(layer_idx) + split_sym
         tensorrt_llm.logger.info(f'Process weights in layer: {layer_idx}')
         layer = tensorrt_llm_llama.layers[layer_idx]
@@ -1331,6 +1148,9 @@ def load_from_gptq_llama(tensorrt_llm_llama,
         v = load(prefix + gptq_key_list[10])
         layer.post_layernorm.weight.value = v.to(torch_dtype).cpu().numpy()
 
+    # The layers are quantized concurrently
+    parallel_map(load_layer, layers_range)
+
     tok = time.time()
     t = time.strftime('%H:%M:%S', time.gmtime(tok - tik))
     tensorrt_llm.logger.info(f'Weights loaded. Total time: {t}')
@@ -1401,8 +1221,12 @@ def load_from_awq_llama(tensorrt_llm_llama: LLaMAForCausalLM,
         ]
         split_sym = ":"
 
+        # The members of a npz file are read from a shared file object
+        load_lock = threading.Lock()
+
         def load(key):
-            v = torch.from_numpy(awq_llama[awq_prefix + key])
+            with load_lock:
+                v = torch.from_numpy(awq_llama[awq_prefix + key])
             if "weights_scaling_factor" in key:
                 v *= 7  # For AMMO *.npz checkpoints
             return v
@@ -1418,8 +1242,6 @@ def load_from_awq_llama(tensorrt_llm_llama: LLaMAForCausalLM,
     # FP8 KV cache
     use_fp8_kv_cache = quant_mode.has_fp8_kv_cache()
 
-    packer = torch.ops.fastertransformer.pack_int8_tensor_to_packed_int4
-    preprocessor = torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm
     torch_dtype = str_dtype_to_torch(dtype)
 
     def fromfile(dir_path, name, shape=None, dtype=None):
@@ -1441,9 +1263,8 @@ def load_from_awq_llama(tensorrt_llm_llama: LLaMAForCausalLM,
                        dim=dim)[mapping.tp_rank]
 
     def AWQ_quantize_pack_preprocess(weight, scale):
-        weight /= scale.repeat_interleave(group_size, dim=0)
-        qweight_int8 = torch.clamp(torch.round(weight.cuda()).char(), -8, 7)
-        int4_weight = preprocessor(packer(qweight_int8.cpu()), torch.quint4x2)
+        qweight_int8 = quantize(weight, scale, bits=4, group_size=group_size)
+        int4_weight = preprocess_weights(qweight_int8, torch.quint4x2)
         return int4_weight.view(torch.float16).cpu().numpy()
 
     def process_and_assign_weight(mOp, v, tp_dim=0):
@@ -1472,13 +1293,8 @@ def load_from_awq_llama(tensorrt_llm_llama: LLaMAForCausalLM,
                 (n, 1)).transpose(1, 0).contiguous()
 
         # Get scale
-        weight_t = weight.T.contiguous()
-        weight_t = weight_t.reshape(n, k // group_size, group_size)
-        weight_t = torch.abs(weight_t.reshape(-1, group_size))
-        amax, idx = weight_t.max(1)
-        amax = amax.reshape(n, k // group_size).T.contiguous()
-        scale = amax / 8
-        return weight, scale
+        scale, _ = groupwise_scales(weight, group_size)
+        return weight, scale.to(weight.dtype)
 
     def process_and_assign_qkv_weight(prefix, mOp):
         q_weight = load(prefix + "q" + awq_key_list[4] +
@@ -1542,13 +1358,10 @@ def load_from_awq_llama(tensorrt_llm_llama: LLaMAForCausalLM,
 
     # 4. Weights inside each layer
     num_hidden_layers = tensorrt_llm_llama.num_layers
-    layers_per_pipeline_stage = num_hidden_layers // mapping.pp_size
-    layers_range = list(
-        range(mapping.pp_rank * layers_per_pipeline_stage,
-              (mapping.pp_rank + 1) * layers_per_pipeline_stage, 1))
+    layers_range = mapping.pp_layers(num_hidden_layers)
 
-    for l in layers_range:
-        layer_idx = l - mapping.pp_rank * layers_per_pipeline_stage
+    def load_layer(l):
+        layer_idx = l - layers_range[0]
         prefix = "layers" + split_sym + str(layer_idx) + split_sym
         tensorrt_llm.logger.info(f'Process weights in layer: {layer_idx}')
         layer = tensorrt_llm_llama.layers[layer_idx]
@@ -1598,6 +1411,9 @@ def load_from_awq_llama(tensorrt_llm_llama: LLaMAForCausalLM,
             layer.attention.kv_orig_quant_scale.value = 1.0 / t
             layer.attention.kv_quant_orig_scale.value = t
 
+    # The layers are quantized concurrently
+    parallel_map(load_layer, layers_range)
+
     tok = time.time()
     t = time.strftime('%H:%M:%S', time.gmtime(tok - tik))
     tensorrt_llm.logger.info(f'Weights loaded. Total time: {t}')
@@ -3,9 +3,8 @@ import json
 import os
 from typing import List, Optional
 
-import safetensors
-
 from .._common import default_net
+from .._safetensors import SafetensorsMmap
 from .._utils import str_dtype_to_trt
 from ..functional import PositionEmbeddingType, Tensor, gather_last_token_logits
 from ..layers import AttentionParams, KeyValueCacheParams, LoraParams
@@ -18,14 +17,28 @@ from .generation_mixin import GenerationMixin
 
 class PretrainedConfig:
 
-    def __init__(self, architecture: str, dtype: str, logits_dtype: str,
-                 vocab_size: int, max_position_embeddings: int,
-                 hidden_size: int, num_hidden_layers: int,
-                 num_attention_heads: int, num_key_value_heads: int,
-                 hidden_act: str, intermediate_size: int, norm_epsilon: float,
-                 position_embedding_type: str, world_size: int, tp_size: int,
-                 pp_size: int, quant_mode: QuantMode, quant_kwargs: dict,
-                 use_prompt_tuning: bool, **kwargs):
+    def __init__(self,
+                 architecture: str,
+                 dtype: str,
+                 logits_dtype: str,
+                 vocab_size: int,
+                 max_position_embeddings: int,
+                 hidden_size: int,
+                 num_hidden_layers: int,
+                 num_attention_heads: int,
+                 num_key_value_heads: int,
+                 hidden_act: str,
+                 intermediate_size: int,
+                 norm_epsilon: float,
+                 position_embedding_type: str,
+                 world_size: int,
+                 tp_size: int,
+                 pp_size: int,
+                 quant_mode: QuantMode,
+                 quant_kwargs: dict,
+                 use_prompt_tuning: bool,
+                 pp_partition: Optional[List[int]] = None,
+                 **kwargs):
         self.architecture = architecture
         self.dtype = dtype
         self.logits_dtype = logits_dtype
@@ -44,7 +57,8 @@ class PretrainedConfig:
         self.use_prompt_tuning = use_prompt_tuning
         self.mapping = Mapping(world_size=world_size,
                                tp_size=tp_size,
-                               pp_size=pp_size)
+                               pp_size=pp_size,
+                               pp_partition=pp_partition)
         self.quant_mode = quant_mode
         self.quant_kwargs = quant_kwargs
         self.kv_dtype = self.dtype
@@ -90,6 +104,7 @@ class PretrainedConfig:
         world_size = mapping.get('world_size', 1)
         tp_size = mapping.get('tp_size', 1)
         pp_size = mapping.get('pp_size', 1)
+        pp_partition = mapping.get('pp_partition', None)
 
         quantization = config.pop(
             'quantization', {
@@ -155,7 +170,7 @@ class PretrainedConfig:
                    num_attention_heads, num_key_value_heads, hidden_act,
                    intermediate_size, norm_epsilon, position_embedding_type,
                    world_size, tp_size, pp_size, quant_mode, quant_kwargs,
-                   use_prompt_tuning, **config)
+                   use_prompt_tuning, pp_partition, **config)
 
     @classmethod
     def from_json_file(cls, config_file: str):
@@ -172,6 +187,8 @@ class PretrainedConfig:
             'tp_size': self.mapping.tp_size,
             'pp_size': self.mapping.pp_size,
         }
+        if self.mapping.pp_partition is not None:
+            output['mapping']['pp_partition'] = self.mapping.pp_partition
         output.pop('quant_mode')
         output.pop('quant_kwargs')
         output['quantization'] = {
@@ -209,7 +226,8 @@ class PretrainedConfig:
         self.mapping = Mapping(self.mapping.world_size,
                                rank=rank,
                                tp_size=self.mapping.tp_size,
-                               pp_size=self.mapping.pp_size)
+                               pp_size=self.mapping.pp_size,
+                               pp_partition=self.mapping.pp_partition)
 
 
 class DecoderLayerList(ModuleList):
@@ -308,14 +326,10 @@ class PretrainedModel(Module, GenerationMixin, metaclass=PostInitCaller):
         config.set_rank(rank)
         model = cls.from_config(config)
 
-        weights = {}
-        with safetensors.safe_open(os.path.join(ckpt_dir,
-                                                f'rank{rank}.safetensors'),
-                                   framework='pt',
-                                   device='cpu') as f:
-            for key in f.keys():
-                weights[key] = f.get_tensor(key)
-
+        # The parameters get zero-copy views of the memory-mapped checkpoint,
+        # the weights are read from disk when the engine is built.
+        weights = SafetensorsMmap(
+            os.path.join(ckpt_dir, f'rank{rank}.safetensors'))
         model.load(weights)
 
         return model
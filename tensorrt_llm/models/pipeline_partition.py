@@ -0,0 +1,259 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''
+Cost-balanced partitioning of the decoder layers across the pipeline stages.
+
+The cost of each part of the model is predicted from the PretrainedConfig with
+a roofline model: a part takes max(flops / peak_flops, bytes / bandwidth),
+the bytes being the weights and the KV cache it reads. The first stage also
+runs the embedding and the last stage the lm_head, which for the large
+vocabularies costs as much as a few decoder layers, so these stages get fewer
+layers.
+'''
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+# A100 SXM, dense fp16 tensor cores and HBM2e
+DEFAULT_PEAK_FLOPS = 312e12
+DEFAULT_MEMORY_BANDWIDTH = 2.0e12
+
+GATED_ACTIVATIONS = ('silu', 'swiglu', 'fast-swiglu', 'geglu')
+DTYPE_SIZES = {'float32': 4, 'float16': 2, 'bfloat16': 2, 'int8': 1, 'fp8': 1}
+
+
+@dataclass
+class Cost:
+    flops: float = 0.0
+    bytes: float = 0.0
+
+    def __add__(self, other: 'Cost') -> 'Cost':
+        return Cost(self.flops + other.flops, self.bytes + other.bytes)
+
+    def time(self,
+             peak_flops: float = DEFAULT_PEAK_FLOPS,
+             memory_bandwidth: float = DEFAULT_MEMORY_BANDWIDTH) -> float:
+        return max(self.flops / peak_flops, self.bytes / memory_bandwidth)
+
+
+def weight_element_size(config) -> float:
+    ''' The bytes per element of the quantized decoder weights. '''
+    quant_mode = getattr(config, 'quant_mode', None)
+    if quant_mode is not None:
+        if quant_mode.is_int4_weight_only():
+            return 0.5
+        if quant_mode.is_int8_weight_only(
+        ) or quant_mode.has_act_and_weight_quant() or quant_mode.has_fp8_qdq():
+            return 1
+    return DTYPE_SIZES[config.dtype]
+
+
+def decoder_layer_matrices(config) -> List[Tuple[int, int]]:
+    '''
+    Returns the (in_features, out_features) of the linear layers of a decoder
+    layer before the tp split: qkv, dense, fc, gate for the gated activations
+    and proj.
+    '''
+    hidden_size = config.hidden_size
+    head_size = hidden_size // config.num_attention_heads
+    kv_size = config.num_key_value_heads * head_size
+    intermediate_size = config.intermediate_size or 4 * hidden_size
+    matrices = [(hidden_size, hidden_size + 2 * kv_size),
+                (hidden_size, hidden_size), (hidden_size, intermediate_size)]
+    if config.hidden_act in GATED_ACTIVATIONS:
+        matrices.append((hidden_size, intermediate_size))
+    matrices.append((intermediate_size, hidden_size))
+    return matrices
+
+
+def decoder_costs(config,
+                  batch_size: int = 8,
+                  seq_len: int = 2048,
+                  phase: str = 'generation') -> Tuple[List[Cost], Cost, Cost]:
+    '''
+    Returns the costs of the decoder layers, of the embedding and of the
+    lm_head for one forward pass on one tp rank.
+
+    In the generation phase each of the batch_size sequences runs one token
+    attending to seq_len tokens, in the context phase the whole seq_len
+    tokens of each sequence run.
+    '''
+    assert phase in ('context', 'generation'), f"Unknown phase {phase}"
+    tp_size = config.mapping.tp_size
+    hidden_size = config.hidden_size
+    head_size = hidden_size // config.num_attention_heads
+    kv_size = config.num_key_value_heads * head_size
+    num_tokens = batch_size * (seq_len if phase == 'context' else 1)
+    weight_size = weight_element_size(config)
+    act_size = DTYPE_SIZES[config.dtype]
+    kv_cache_size = DTYPE_SIZES[getattr(config, 'kv_dtype', config.dtype)]
+
+    num_params = sum(
+        in_features * out_features
+        for in_features, out_features in decoder_layer_matrices(config))
+    # QK^T and AV, causal in the context phase
+    attended = seq_len / 2 if phase == 'context' else seq_len
+    flops = 2 * num_params * num_tokens + \
+        4 * num_tokens * attended * hidden_size
+    kv_cache_bytes = 2 * batch_size * seq_len * kv_size * kv_cache_size
+    layer = Cost(flops / tp_size,
+                 (num_params * weight_size + kv_cache_bytes) / tp_size)
+
+    embedding = Cost(0, num_tokens * hidden_size * act_size / tp_size)
+    # The logits are only computed for the last token of each sequence
+    lm_head_params = config.vocab_size * hidden_size
+    lm_head = Cost(2 * lm_head_params * batch_size / tp_size,
+                   lm_head_params * act_size / tp_size)
+    return [layer] * config.num_hidden_layers, embedding, lm_head
+
+
+def partition_layers(layer_times: Sequence[float],
+                     pp_size: int,
+                     first_stage_time: float = 0.0,
+                     last_stage_time: float = 0.0) -> List[int]:
+    '''
+    Splits the layers into pp_size contiguous stages minimizing the time of
+    the slowest stage, the first and last stages having extra fixed times.
+    Among the optimal partitions, the one with the most even stage times is
+    picked. Every stage gets at least one layer if there are enough layers.
+    '''
+    num_layers = len(layer_times)
+    if pp_size == 1:
+        return [num_layers]
+    min_layers = 1 if num_layers >= pp_size else 0
+    prefix = [0.0]
+    for t in layer_times:
+        prefix.append(prefix[-1] + t)
+
+    def stage_time(stage, begin, end):
+        extra = first_stage_time if stage == 0 else 0.0
+        if stage == pp_size - 1:
+            extra += last_stage_time
+        return prefix[end] - prefix[begin] + extra
+
+    # best[stage][end]: (slowest stage time, sum of the squared stage times,
+    # begin of the stage) for the layers [0, end) over stages [0, stage]
+    inf = (float('inf'), float('inf'), 0)
+    best = [[inf] * (num_layers + 1) for _ in range(pp_size)]
+    for end in range(min_layers, num_layers + 1):
+        t = stage_time(0, 0, end)
+        best[0][end] = (t, t * t, 0)
+    for stage in range(1, pp_size):
+        for end in range(num_layers + 1):
+            for begin in range(end - min_layers + 1):
+                previous = best[stage - 1][begin]
+                if previous[0] == float('inf'):
+                    continue
+                t = stage_time(stage, begin, end)
+                candidate = (max(previous[0], t), previous[1] + t * t, begin)
+                if candidate[:2] < best[stage][end][:2]:
+                    best[stage][end] = candidate
+
+    partition, end = [], num_layers
+    for stage in reversed(range(pp_size)):
+        begin = best[stage][end][2]
+        partition.append(end - begin)
+        end = begin
+    return partition[::-1]
+
+
+def balanced_pp_partition(config,
+                          pp_size: Optional[int] = None,
+                          peak_flops: float = DEFAULT_PEAK_FLOPS,
+                          memory_bandwidth: float = DEFAULT_MEMORY_BANDWIDTH,
+                          **workload) -> List[int]:
+    '''
+    Returns the number of layers of each pp stage balancing the predicted
+    stage times, to be given as the pp_partition of the Mapping. workload are
+    the batch_size, seq_len and phase of decoder_costs.
+    '''
+    pp_size = pp_size or config.mapping.pp_size
+    layers, embedding, lm_head = decoder_costs(config, **workload)
+    return partition_layers(
+        [layer.time(peak_flops, memory_bandwidth) for layer in layers], pp_size,
+        embedding.time(peak_flops, memory_bandwidth),
+        lm_head.time(peak_flops, memory_bandwidth))
+
+
+@dataclass
+class StageReport:
+    stage: int
+    first_layer: int
+    num_layers: int
+    cost: Cost
+    time: float
+
+
+@dataclass
+class PipelineReport:
+    stages: List[StageReport]
+
+    @property
+    def imbalance(self) -> float:
+        ''' The time of the slowest stage over the mean stage time, 1.0 when balanced.  '''
+        times = [stage.time for stage in self.stages]
+        mean = sum(times) / len(times)
+        return max(times) / mean if mean > 0 else 1.0
+
+    @property
+    def bottleneck(self) -> StageReport:
+        return max(self.stages, key=lambda stage: stage.time)
+
+    def __str__(self) -> str:
+        lines = [
+            f'{"stage":>5} {"layers":>9} {"GFLOP":>10} {"MB":>10} {"time(us)":>10}'
+        ]
+        for stage in self.stages:
+            layers = f'{stage.first_layer}-{stage.first_layer + stage.num_layers - 1}' \
+                if stage.num_layers > 0 else '-'
+            lines.append(f'{stage.stage:>5} {layers:>9} '
+                         f'{stage.cost.flops / 1e9:>10.2f} '
+                         f'{stage.cost.bytes / 1e6:>10.1f} '
+                         f'{stage.time * 1e6:>10.1f}')
+        lines.append(f'imbalance (slowest / mean stage time): '
+                     f'{self.imbalance:.3f}, bottleneck stage '
+                     f'{self.bottleneck.stage}')
+        return '\n'.join(lines)
+
+
+def pp_partition_report(config,
+                        pp_partition: Optional[Sequence[int]] = None,
+                        peak_flops: float = DEFAULT_PEAK_FLOPS,
+                        memory_bandwidth: float = DEFAULT_MEMORY_BANDWIDTH,
+                        **workload) -> PipelineReport:
+    '''
+    Predicts the time of each pp stage, for pp_partition or else the
+    partition of config.mapping. Computed on the host, no GPU is needed.
+    '''
+    if pp_partition is None:
+        pp_partition = config.mapping.pp_stage_num_layers(
+            config.num_hidden_layers)
+    layers, embedding, lm_head = decoder_costs(config, **workload)
+    assert sum(pp_partition) == len(layers), \
+        f"pp_partition {list(pp_partition)} does not add up to {len(layers)} layers"
+
+    stages, first_layer = [], 0
+    for stage, num_layers in enumerate(pp_partition):
+        cost, time = Cost(), 0.0
+        parts = layers[first_layer:first_layer + num_layers]
+        if stage == 0:
+            parts = [embedding] + parts
+        if stage == len(pp_partition) - 1:
+            parts = parts + [lm_head]
+        for part in parts:
+            cost += part
+            time += part.time(peak_flops, memory_bandwidth)
+        stages.append(StageReport(stage, first_layer, num_layers, cost, time))
+        first_layer += num_layers
+    return PipelineReport(stages)
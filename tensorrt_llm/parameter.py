@@ -23,11 +23,20 @@ import tensorrt as trt
 # isort: on
 
 from ._common import default_net
-from ._utils import (copy_torch_to_numpy, np_dtype_to_trt, str_dtype_to_trt,
-                     torch_to_numpy, trt_dtype_to_np, trt_dtype_to_torch)
+from ._dtype_conversion import convert, is_floating
+from ._utils import (copy_torch_to_numpy, np_bfloat16, np_dtype_to_trt,
+                     np_float8, str_dtype_to_trt, torch_to_numpy,
+                     trt_dtype_to_np, trt_dtype_to_torch)
 from .functional import Tensor, constant
 from .logger import logger
 
+_FLOAT_TRT_TO_NP = {
+    trt.float32: np.float32,
+    trt.float16: np.float16,
+    trt.bfloat16: np_bfloat16,
+    trt.fp8: np_float8,
+}
+
 
 class Parameter:
     _DEFAULT_DTYPE = trt.DataType.FLOAT
@@ -126,9 +135,14 @@ class Parameter:
             return None
 
     def _regularize_value(self, value):
-        if isinstance(value, np.ndarray):
-            return value
-        elif isinstance(value, torch.Tensor):
-            return torch_to_numpy(value)
-        raise TypeError(
-            f'Expected numpy.ndarray or torch.Tensor, got {type(value)}')
+        if isinstance(value, torch.Tensor):
+            value = torch_to_numpy(value)
+        elif not isinstance(value, np.ndarray):
+            raise TypeError(
+                f'Expected numpy.ndarray or torch.Tensor, got {type(value)}')
+        # The floating point values are converted to the floating point dtype
+        # of the parameter, bfloat16 and fp8 included
+        dtype = _FLOAT_TRT_TO_NP.get(self._dtype)
+        if dtype is not None and is_floating(value.dtype):
+            value = convert(value, dtype)
+        return value
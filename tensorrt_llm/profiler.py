@@ -12,9 +12,10 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import threading
 import time
 from functools import partial
-from typing import Literal, Optional, Tuple, Union
+from typing import List, Literal, Optional, Tuple, Union
 
 # isort: off
 import torch
@@ -60,17 +61,46 @@ class Timer:
     def __init__(self):
         self._start_times = {}
         self._total_elapsed_times = {}
+        # The (tag, start time, stop time) of the timed intervals, None when
+        # not recorded
+        self._spans = None
+        self._lock = threading.Lock()
 
     def start(self, tag):
         self._start_times[tag] = time.time()
 
     def stop(self, tag) -> float:
-        elapsed_time = time.time() - self._start_times[tag]
-        if tag not in self._total_elapsed_times:
-            self._total_elapsed_times[tag] = 0
-        self._total_elapsed_times[tag] += elapsed_time
+        start_time = self._start_times[tag]
+        stop_time = time.time()
+        elapsed_time = stop_time - start_time
+        self.add_elapsed_time(tag, elapsed_time)
+        if self._spans is not None:
+            with self._lock:
+                self._spans.append((tag, start_time, stop_time))
         return elapsed_time
 
+    def record_spans(self, enable: bool = True):
+        '''
+        Records the intervals timed from now on, e.g. to place them on a memory
+        timeline. They are kept until reset().
+        '''
+        with self._lock:
+            if not enable:
+                self._spans = None
+            elif self._spans is None:
+                self._spans = []
+
+    def spans(self) -> List[Tuple[str, float, float]]:
+        with self._lock:
+            return list(self._spans or [])
+
+    def add_elapsed_time(self, tag, elapsed_time: float):
+        # Thread safe, for the tags timed by several threads at once
+        with self._lock:
+            if tag not in self._total_elapsed_times:
+                self._total_elapsed_times[tag] = 0
+            self._total_elapsed_times[tag] += elapsed_time
+
     def elapsed_time_in_sec(self, tag) -> float:
         if tag not in self._total_elapsed_times:
             return None
@@ -79,6 +109,8 @@ class Timer:
     def reset(self):
         self._start_times.clear()
         self._total_elapsed_times.clear()
+        if self._spans is not None:
+            self._spans.clear()
 
     def summary(self):
         logger.info('Profile Results')
@@ -86,7 +118,45 @@ class Timer:
             logger.info(f' - {tag.ljust(30, ".")}: {elapsed_time:.6f} (sec)')
 
 
+class QueueDepthMeter:
+    '''
+    Samples the depth of queues, e.g. the batches waiting between the stages
+    of a pipeline.
+    '''
+
+    def __init__(self):
+        # tag -> [num_samples, total_depth, max_depth]
+        self._depths = {}
+        self._lock = threading.Lock()
+
+    def record(self, tag, depth: int):
+        with self._lock:
+            if tag not in self._depths:
+                self._depths[tag] = [0, 0, 0]
+            samples = self._depths[tag]
+            samples[0] += 1
+            samples[1] += depth
+            samples[2] = max(samples[2], depth)
+
+    def depth_stats(self, tag) -> Optional[Tuple[float, int]]:
+        ''' Returns the mean and the max depth.  '''
+        if tag not in self._depths:
+            return None
+        num_samples, total_depth, max_depth = self._depths[tag]
+        return total_depth / num_samples, max_depth
+
+    def reset(self):
+        self._depths.clear()
+
+    def summary(self):
+        for tag in self._depths:
+            mean_depth, max_depth = self.depth_stats(tag)
+            logger.info(f' - {tag.ljust(30, ".")}: mean depth '
+                        f'{mean_depth:.2f}, max depth {max_depth}')
+
+
 _default_timer = Timer()
+_default_queue_depth_meter = QueueDepthMeter()
 
 
 def start(tag):
@@ -97,16 +167,38 @@ def stop(tag):
     return _default_timer.stop(tag)
 
 
+def add_elapsed_time(tag, elapsed_time):
+    _default_timer.add_elapsed_time(tag, elapsed_time)
+
+
 def elapsed_time_in_sec(tag):
     return _default_timer.elapsed_time_in_sec(tag)
 
 
+def record_spans(enable: bool = True):
+    _default_timer.record_spans(enable)
+
+
+def spans():
+    return _default_timer.spans()
+
+
+def record_queue_depth(tag, depth):
+    _default_queue_depth_meter.record(tag, depth)
+
+
+def queue_depth_stats(tag):
+    return _default_queue_depth_meter.depth_stats(tag)
+
+
 def reset():
     _default_timer.reset()
+    _default_queue_depth_meter.reset()
 
 
 def summary():
     _default_timer.summary()
+    _default_queue_depth_meter.summary()
 
 
 MemUnitType = Literal['GiB', 'MiB', 'KiB']
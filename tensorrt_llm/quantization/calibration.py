@@ -0,0 +1,272 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The activation ranges of the SmoothQuant and the INT8 KV cache calibration,
+shared by the checkpoint converters.
+
+The calibration samples, lists of token ids, are run through the HF model in
+right-padded batches, and forward hooks keep the running per-channel maxima of
+the absolute inputs "x" and outputs "y" of the linear layers, the padded
+tokens excluded. The ranges only depend on the weights and the tokens, so they
+are stored in $TLLM_CACHE_DIR/calibration keyed by the digests of both, and a
+conversion of the same model to another TP size or SmoothQuant alpha skips the
+forward passes.
+"""
+import functools
+import hashlib
+import io
+import json
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import torch
+import torch.nn as nn
+from tqdm import tqdm
+
+from ..logger import logger
+from ..runtime.engine_cache import _write_atomic
+
+try:
+    from transformers.pytorch_utils import Conv1D
+except ImportError:
+    Conv1D = None
+
+# Bumped when the statistics change, invalidating the cached ranges
+_CALIBRATION_VERSION = 1
+
+
+def default_cache_dir() -> str:
+    return os.path.join(
+        os.environ.get(
+            'TLLM_CACHE_DIR',
+            os.path.join(os.path.expanduser('~'), '.cache', 'tensorrt_llm')),
+        'calibration')
+
+
+def _is_conv1d(module: nn.Module) -> bool:
+    return Conv1D is not None and isinstance(module, Conv1D)
+
+
+def model_digest(model: nn.Module) -> str:
+    """
+    Returns the sha256 of the names, dtypes, shapes and values of the
+    parameters and buffers of model.
+    """
+    sha = hashlib.sha256(type(model).__name__.encode())
+    for name, tensor in model.state_dict().items():
+        tensor = tensor.detach().cpu().contiguous().reshape(-1)
+        sha.update(f'{name}:{tensor.dtype}:{tuple(tensor.shape)}\n'.encode())
+        sha.update(tensor.view(torch.uint8).numpy().data)
+    return sha.hexdigest()
+
+
+def samples_digest(samples: Sequence[Sequence[int]]) -> str:
+    """
+    Returns the sha256 of the token ids of the calibration samples.
+    """
+    sha = hashlib.sha256()
+    for sample in samples:
+        sha.update(torch.tensor(sample, dtype=torch.int64).numpy().data)
+        # Separates the samples
+        sha.update(b'\n')
+    return sha.hexdigest()
+
+
+def calibration_key(model: nn.Module, samples: Sequence[Sequence[int]],
+                    **extra) -> str:
+    """
+    Returns the key of the activation ranges of model on samples, extra are
+    other options changing the ranges.
+    """
+    key = {
+        'model': model_digest(model),
+        'samples': samples_digest(samples),
+        'version': _CALIBRATION_VERSION,
+        'extra': extra,
+    }
+    return hashlib.sha256(
+        json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+
+def _padding_mask(tensor: torch.Tensor,
+                  mask: Optional[torch.Tensor]) -> Optional[torch.Tensor]:
+    """
+    Returns the mask of the tokens of the batch broadcast to tensor, in the
+    [batch, seq, ...], [seq, batch, ...] or [batch * seq, ...] layouts, None
+    when there is no padding or the layout is unknown.
+    """
+    if mask is None:
+        return None
+    batch_size, seq_len = mask.shape
+    extra_dims = [1] * (tensor.dim() - 2)
+    if tuple(tensor.shape[:2]) == (batch_size, seq_len):
+        return mask.reshape(batch_size, seq_len, *extra_dims)
+    if tuple(tensor.shape[:2]) == (seq_len, batch_size):
+        return mask.t().reshape(seq_len, batch_size, *extra_dims)
+    if tensor.dim() == 2 and tensor.shape[0] == batch_size * seq_len:
+        return mask.reshape(-1, 1)
+    return None
+
+
+class ActivationStats(object):
+    """
+    The forward hooks recording the activation ranges of the nn.Linear and the
+    HF Conv1D modules of a model.
+    """
+
+    def __init__(self, model: nn.Module):
+        self.act_range = defaultdict(lambda: {"x": None, "y": None, "w": None})
+        self.modules = {}
+        # The mask of the tokens of the current batch, None without padding
+        self.mask = None
+        self.hooks = []
+        for name, m in model.named_modules():
+            if isinstance(m, nn.Linear) or _is_conv1d(m):
+                self.modules[name] = m
+                self.hooks.append(
+                    m.register_forward_hook(
+                        functools.partial(self.hook, name=name)))
+
+    def update(self, name: str, key: str, tensor: torch.Tensor):
+        tensor = tensor.detach()
+        mask = _padding_mask(tensor, self.mask)
+        tensor = tensor.abs()
+        if mask is not None:
+            # The absolute values are >= 0, the padded tokens become neutral
+            tensor.masked_fill_(~mask, 0)
+        amax = tensor.reshape(-1, tensor.shape[-1]).amax(dim=0).float()
+        stats = self.act_range[name]
+        if stats[key] is None:
+            stats[key] = amax
+        else:
+            torch.maximum(stats[key], amax, out=stats[key])
+
+    def hook(self, m, x, y, name):
+        if isinstance(x, tuple):
+            x = x[0]
+        self.update(name, "x", x)
+        self.update(name, "y", y)
+
+    def remove(self):
+        for h in self.hooks:
+            h.remove()
+        self.hooks = []
+
+    def finalize(self) -> Dict[str, Dict[str, torch.Tensor]]:
+        """
+        Removes the hooks and adds the per output channel maxima of the
+        weights "w" of the called modules.
+        """
+        self.remove()
+        for name, stats in self.act_range.items():
+            weight = self.modules[name].weight.detach()
+            # The Conv1D weights are [in_features, out_features]
+            dim = 0 if _is_conv1d(self.modules[name]) else 1
+            stats["w"] = weight.abs().clip(1e-8, None).amax(dim=dim)
+        return self.act_range
+
+
+def _batches(samples: List[List[int]], batch_size: int):
+    for i in range(0, len(samples), batch_size):
+        yield samples[i:i + batch_size]
+
+
+@torch.no_grad()
+def run_calibration(model: nn.Module,
+                    samples: List[List[int]],
+                    batch_size: int = 8,
+                    pad_token_id: int = 0,
+                    desc: str = "calibrating model"):
+    """
+    Returns the activation ranges of model on samples, run in right-padded
+    batches of batch_size samples with their attention mask.
+    """
+    # The samples of similar lengths are batched together, the maxima do not
+    # depend on the order
+    samples = sorted(samples, key=len)
+    model.eval()
+    device = next(model.parameters()).device
+    stats = ActivationStats(model)
+    try:
+        batches = list(_batches(samples, batch_size))
+        for batch in tqdm(batches, desc=desc):
+            seq_len = max(len(sample) for sample in batch)
+            input_ids = torch.full((len(batch), seq_len),
+                                   pad_token_id,
+                                   dtype=torch.int64)
+            mask = torch.zeros((len(batch), seq_len), dtype=torch.bool)
+            for i, sample in enumerate(batch):
+                input_ids[i, :len(sample)] = torch.tensor(sample)
+                mask[i, :len(sample)] = True
+            input_ids, mask = input_ids.to(device), mask.to(device)
+            stats.mask = None if bool(mask.all()) else mask
+            model(input_ids, attention_mask=mask.long())
+    finally:
+        stats.remove()
+    return stats.finalize()
+
+
+def _load(path: str, device):
+    act_range = defaultdict(lambda: {"x": None, "y": None, "w": None})
+    act_range.update(torch.load(path, map_location=device))
+    return act_range
+
+
+def _store(path: str, act_range):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    buffer = io.BytesIO()
+    torch.save(
+        {
+            name: {key: value.cpu()
+                   for key, value in stats.items()}
+            for name, stats in act_range.items()
+        }, buffer)
+    _write_atomic(path, buffer.getvalue())
+
+
+def calibrate_activation_range(model: nn.Module,
+                               samples: Iterable[Sequence[int]],
+                               batch_size: int = 8,
+                               pad_token_id: int = 0,
+                               cache_dir: Optional[str] = None,
+                               use_cache: bool = True,
+                               **extra):
+    """
+    Returns the activation ranges of the linear layers of the HF model on the
+    tokenized samples, a defaultdict of {"x": ..., "y": ..., "w": ...} per
+    module name as the smoothing functions of the examples expect.
+
+    The ranges are loaded from cache_dir, default_cache_dir() by default, when
+    the same weights were calibrated on the same tokens, and stored there
+    otherwise. extra are other options changing the ranges, part of the key.
+    The models whose layers do not support padded batches are calibrated with
+    batch_size=1.
+    """
+    samples = [list(sample) for sample in samples]
+    if not use_cache:
+        return run_calibration(model, samples, batch_size, pad_token_id)
+
+    device = next(model.parameters()).device
+    key = calibration_key(model, samples, **extra)
+    path = os.path.join(cache_dir or default_cache_dir(), f'{key}.pt')
+    if os.path.exists(path):
+        logger.info(f'Calibration cache hit: {path}')
+        return _load(path, device)
+
+    act_range = run_calibration(model, samples, batch_size, pad_token_id)
+    _store(path, act_range)
+    logger.info(f'Calibration stored: {path}')
+    return act_range
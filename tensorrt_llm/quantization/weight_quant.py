@@ -0,0 +1,216 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+CPU quantization and packing of the weights of the weight-only plugins, shared
+by the checkpoint converters.
+
+The weights are [in_features, out_features], or batched along the leading
+dimensions, and are quantized per output channel or per group of group_size
+input rows. The int4 values are packed two per byte along the last axis, the
+even index in the low nibble, as in the GPTQ and AWQ checkpoints. The work is
+done by vectorized torch ops, which release the GIL, so that the layers are
+quantized concurrently by parallel_map. Only the interleaving of the mixed GEMM
+kernels, which depends on the GPU architecture, is left to the plugin library.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import torch
+
+_QUANT_BITS = {torch.int8: 8, torch.quint4x2: 4}
+
+
+def quant_bits(quant_type: torch.dtype) -> int:
+    """
+    Returns the bits of the torch.int8 and torch.quint4x2 quantization types.
+    """
+    if quant_type not in _QUANT_BITS:
+        raise ValueError(f'Unsupported quantization type {quant_type}')
+    return _QUANT_BITS[quant_type]
+
+
+def _quant_range(bits: int) -> Tuple[int, int]:
+    return -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+
+
+def per_channel_scales(weight: torch.Tensor, bits: int = 8) -> torch.Tensor:
+    """
+    Returns the float32 symmetric scales of the output channels of weight,
+    amax / 2^(bits-1) as the plugins expect.
+    """
+    amax = weight.abs().amax(dim=-2).float()
+    return amax.clamp_min(torch.finfo(torch.float32).tiny) / (1 << (bits - 1))
+
+
+def groupwise_scales(
+        weight: torch.Tensor,
+        group_size: int,
+        bits: int = 4,
+        zero_point: bool = False
+) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+    """
+    Returns the float32 scales of the groups of group_size input rows of
+    weight, [..., in_features // group_size, out_features], and the zeros with
+    zero_point, None otherwise. With zeros a weight is q * scale + zero, the
+    zero being the value of the smallest quantized value plus 2^(bits-1)
+    steps, as the zeros of the groupwise plugin.
+    """
+    *batch, k, n = weight.shape
+    if k % group_size != 0:
+        raise ValueError(
+            f'in_features {k} is not a multiple of group_size {group_size}')
+    # Reduced in the dtype of weight, exact, before the float32 conversion
+    groups = weight.reshape(*batch, k // group_size, group_size, n)
+    tiny = torch.finfo(torch.float32).tiny
+    if not zero_point:
+        amax = groups.abs().amax(dim=-2).float()
+        return amax.clamp_min(tiny) / (1 << (bits - 1)), None
+    wmin, wmax = torch.aminmax(groups, dim=-2)
+    wmin, wmax = wmin.float(), wmax.float()
+    scales = (wmax - wmin).clamp_min(tiny) / ((1 << bits) - 1)
+    zeros = wmin + (1 << (bits - 1)) * scales
+    return scales, zeros
+
+
+def quantize(weight: torch.Tensor,
+             scales: torch.Tensor,
+             bits: int = 8,
+             group_size: Optional[int] = None,
+             zeros: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """
+    Returns the int8 tensor of the values of weight quantized to bits, per
+    channel if group_size is None, groupwise otherwise. The int4 values are
+    not packed.
+    """
+    qmin, qmax = _quant_range(bits)
+    shape = weight.shape
+    *batch, k, n = shape
+    if group_size is not None:
+        weight = weight.reshape(*batch, k // group_size, group_size, n)
+    # The float32 temporaries are updated in place
+    q = weight.to(torch.float32, copy=True)
+    if zeros is not None:
+        q.sub_(zeros.unsqueeze(-2))
+    q.div_(scales.unsqueeze(-2))
+    # Rounds half away from zero as std::round in the C++ ops, round() rounds
+    # half to even. The fractions q - trunc(q) are exact.
+    rounded = q.trunc()
+    q.sub_(rounded)
+    rounded.add_(q.sign().mul_(q.abs_().ge_(0.5)))
+    rounded.clamp_(qmin, qmax)
+    return rounded.to(torch.int8).reshape(shape)
+
+
+def dequantize(q: torch.Tensor,
+               scales: torch.Tensor,
+               group_size: Optional[int] = None,
+               zeros: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """
+    Returns the float32 weight of the unpacked int8 values q.
+    """
+    shape = q.shape
+    *batch, k, n = shape
+    if group_size is not None:
+        q = q.reshape(*batch, k // group_size, group_size, n)
+    weight = q.float() * scales.unsqueeze(-2)
+    if zeros is not None:
+        weight += zeros.unsqueeze(-2)
+    return weight.reshape(shape)
+
+
+def pack_int4(q: torch.Tensor) -> torch.Tensor:
+    """
+    Packs the int4 values in [-8, 7] of the int8 tensor q two per byte along
+    the last axis, the even index in the low nibble.
+    """
+    if q.shape[-1] % 2 != 0:
+        raise ValueError(f'The last axis of {tuple(q.shape)} is odd')
+    q = q.to(torch.int8)
+    return (q[..., 1::2] << 4) | (q[..., ::2] & 0x0F)
+
+
+def unpack_int4(packed: torch.Tensor, signed: bool = True) -> torch.Tensor:
+    """
+    Unpacks the int4 values packed in the bytes of packed, of any dtype, along
+    the last axis into an int8 tensor, [-8, 7] if signed and [0, 15] otherwise.
+    An int32 [k, n] tensor of a GPTQ checkpoint gives a [k, 8n] tensor.
+    """
+    if signed:
+        # The arithmetic shifts of the int8 bytes extend the sign
+        packed = packed.contiguous().view(torch.int8)
+        unpacked = torch.stack((packed << 4, packed), dim=-1) >> 4
+    else:
+        packed = packed.contiguous().view(torch.uint8)
+        unpacked = torch.stack((packed & 0x0F, packed >> 4), dim=-1)
+    return unpacked.reshape(*packed.shape[:-1], -1).view(torch.int8)
+
+
+def preprocess_weights(q: torch.Tensor,
+                       quant_type: torch.dtype) -> torch.Tensor:
+    """
+    Returns the int8 values q, in [-8, 7] for torch.quint4x2, packed and
+    interleaved on the CPU for the mixed GEMM kernels of the current GPU
+    architecture.
+    """
+    if quant_bits(quant_type) == 4:
+        q = pack_int4(q)
+    return torch.ops.fastertransformer.preprocess_weights_for_mixed_gemm(
+        q.cpu().contiguous(), quant_type)
+
+
+def symmetric_quantize(
+        weight: torch.Tensor,
+        quant_type: torch.dtype) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Quantizes weight per output channel for the weight-only plugin, as
+    symmetric_quantize_last_axis_of_batched_matrix. Returns the preprocessed
+    weight and the scales in the dtype of weight.
+    """
+    bits = quant_bits(quant_type)
+    scales = per_channel_scales(weight, bits)
+    q = quantize(weight, scales, bits)
+    return preprocess_weights(q, quant_type), scales.to(weight.dtype)
+
+
+def gptq_weights(
+        qweight: torch.Tensor, qzeros: torch.Tensor, scales: torch.Tensor
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Converts the int32 qweight [k / 8, n], qzeros [k / group_size, n / 8] and
+    the scales of a GPTQ-for-LLaMA checkpoint, whose uint4 zeros are stored
+    minus one, to the preprocessed weight, the scales and the zeros times the
+    scales of the groupwise plugin.
+    """
+    q = unpack_int4(qweight.T, signed=False).T - 8
+    zeros = unpack_int4(qzeros, signed=False)
+    zeros_x_scales = ((7 - zeros) * scales).to(scales.dtype)
+    return preprocess_weights(q, torch.quint4x2), scales, zeros_x_scales
+
+
+def parallel_map(fn: Callable,
+                 items: Iterable,
+                 workers: Optional[int] = None) -> List:
+    """
+    Returns [fn(item) for item in items], computed in a thread pool of
+    workers threads, the number of CPUs by default.
+    """
+    items = list(items)
+    if workers is None:
+        workers = min(len(items), os.cpu_count() or 1)
+    if workers <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, items))
@@ -12,15 +12,20 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from .constrained_decoding import ConstrainedLogitsProcessor, TokenIndex
 from .generation import SamplingConfig  # autoflake: skip
 from .generation import (ChatGLMGenerationSession, GenerationSession,
                          LogitsProcessor, LogitsProcessorList, ModelConfig,
                          QWenForCausalLMGenerationSession, StoppingCriteria,
                          StoppingCriteriaList, to_word_list_format)
 from .kv_cache_manager import GenerationSequence, KVCacheManager
+from .logits_capture import LogitsCapture
 from .lora_manager import LoraManager  # autoflake: skip
+from .memory_planner import MemoryPlan, plan_memory
 from .model_runner import ModelRunner
 from .session import Session, TensorInfo
+from .stream_deltas import StreamDelta, StreamDeltas
+from .word_list import WordListEncoder
 
 try:
     from .model_runner_cpp import ModelRunnerCpp
@@ -40,8 +45,16 @@ __all__ = [
     'ChatGLMGenerationSession',
     'QWenForCausalLMGenerationSession',
     'to_word_list_format',
+    'WordListEncoder',
     'LogitsProcessorList',
     'LogitsProcessor',
+    'LogitsCapture',
+    'StreamDelta',
+    'StreamDeltas',
+    'ConstrainedLogitsProcessor',
+    'TokenIndex',
+    'MemoryPlan',
+    'plan_memory',
     'StoppingCriteriaList',
     'StoppingCriteria',
     'ModelRunner',
@@ -0,0 +1,385 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+
+from ..logger import logger
+from .generation import LogitsProcessor
+from .regex_fsm import RegexFSM, json_schema_to_regex
+
+
+def default_cache_dir() -> str:
+    return os.path.join(
+        os.environ.get(
+            'TLLM_CACHE_DIR',
+            os.path.join(os.path.expanduser('~'), '.cache', 'tensorrt_llm')),
+        'token_index')
+
+
+def vocab_strings(tokenizer) -> List[Optional[str]]:
+    """
+    Returns the text of each token id of a HuggingFace tokenizer, None for the
+    special tokens and the tokens that are not a whole UTF-8 text, e.g. the
+    byte fallback pieces of a multi-byte character.
+    """
+    special_ids = set(getattr(tokenizer, 'all_special_ids', []))
+    tokens = tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))
+    strings = []
+    for token_id, token in enumerate(tokens):
+        if token is None or token_id in special_ids:
+            strings.append(None)
+            continue
+        string = tokenizer.convert_tokens_to_string([token])
+        # Sentencepiece drops the leading space of the decoded text
+        if (token.startswith('▁')
+                or token == '<0x20>') and not string.startswith(' '):
+            string = ' ' + string
+        strings.append(string if string and '�' not in string else None)
+    return strings
+
+
+class _TokenTrie(object):
+    """
+    The prefix tree of the token strings, in CSR arrays: the children of a
+    node are child_nodes[child_offsets[n]:child_offsets[n + 1]], reached with
+    the codepoints child_chars, the tokens ending at a node are
+    node_tokens[token_offsets[n]:token_offsets[n + 1]].
+    """
+
+    def __init__(self, vocab: Sequence[Optional[str]]):
+        children: List[Dict[str, int]] = [{}]
+        tokens: List[List[int]] = [[]]
+        for token_id, string in enumerate(vocab):
+            if not string:
+                continue
+            node = 0
+            for char in string:
+                child = children[node].get(char)
+                if child is None:
+                    child = len(children)
+                    children[node][char] = child
+                    children.append({})
+                    tokens.append([])
+                node = child
+            tokens[node].append(token_id)
+
+        self.child_offsets = np.zeros(len(children) + 1, dtype=np.int64)
+        self.child_offsets[1:] = np.cumsum([len(c) for c in children])
+        self.child_chars = np.array([ord(char) for c in children for char in c],
+                                    dtype=np.int64)
+        self.child_nodes = np.array([n for c in children for n in c.values()],
+                                    dtype=np.int64)
+        self.token_offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+        self.token_offsets[1:] = np.cumsum([len(t) for t in tokens])
+        self.node_tokens = np.array([t for ts in tokens for t in ts],
+                                    dtype=np.int64)
+
+    def walk(self, class_starts: np.ndarray, table: np.ndarray,
+             states: np.ndarray):
+        """
+        Walks the trie from each of states through the transition table of
+        RegexFSM.transition_table, level by level and vectorized over the
+        (node, state) pairs. Returns the (origin, token id, next state) arrays
+        of the tokens accepted from the states.
+        """
+        child_classes = np.searchsorted(
+            class_starts, self.child_chars, side='right') - 1
+        nodes = np.zeros(len(states), dtype=np.int64)
+        origins = np.arange(len(states), dtype=np.int64)
+        states = np.asarray(states, dtype=np.int64)
+        accepted = []
+        while len(nodes):
+            counts = self.child_offsets[nodes + 1] - self.child_offsets[nodes]
+            pairs = np.repeat(np.arange(len(nodes)), counts)
+            # The index of each child edge, within the children of its parent
+            edges = np.arange(len(pairs)) - np.repeat(
+                np.cumsum(counts) - counts, counts)
+            edges += self.child_offsets[nodes][pairs]
+            next_states = table[states[pairs], child_classes[edges]]
+            kept = next_states >= 0
+            nodes = self.child_nodes[edges[kept]]
+            states = next_states[kept].astype(np.int64)
+            origins = origins[pairs[kept]]
+
+            counts = self.token_offsets[nodes + 1] - self.token_offsets[nodes]
+            ending = np.repeat(np.arange(len(nodes)), counts)
+            tokens = np.arange(len(ending)) - np.repeat(
+                np.cumsum(counts) - counts, counts)
+            tokens = self.node_tokens[self.token_offsets[nodes][ending] +
+                                      tokens]
+            accepted.append((origins[ending], tokens, states[ending]))
+        if not accepted:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        return tuple(np.concatenate(arrays) for arrays in zip(*accepted))
+
+
+class TokenIndex(object):
+    """
+    The tokens allowed in each state of a regex automaton, over a vocabulary.
+
+    The index is stored as a CSR table sorted by (state, token id): the
+    tokens allowed in state s are token_ids[offsets[s]:offsets[s + 1]] and
+    lead to next_states[offsets[s]:offsets[s + 1]]. The end tokens are
+    allowed in the final states and lead to the extra done state, where only
+    the end tokens are allowed. A state from which no token can continue the
+    regex also allows the end tokens, so that a row is never fully masked.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, offsets: np.ndarray, token_ids: np.ndarray,
+                 next_states: np.ndarray, vocab_size: int,
+                 eos_token_ids: Sequence[int]):
+        self.offsets = offsets
+        self.token_ids = token_ids
+        self.next_states = next_states
+        self.vocab_size = vocab_size
+        self.eos_token_ids = list(eos_token_ids)
+        self.initial_state = 0
+        self.done_state = len(offsets) - 2
+        # Sorted as the CSR rows, for the vectorized transitions
+        self._keys = np.repeat(np.arange(len(offsets) - 1, dtype=np.int64),
+                               np.diff(offsets)) * vocab_size + token_ids
+        self._device_masks = {}
+
+    @property
+    def num_states(self) -> int:
+        return len(self.offsets) - 1
+
+    @classmethod
+    def build(cls,
+              fsm: RegexFSM,
+              vocab: Sequence[Optional[str]],
+              eos_token_ids: Sequence[int],
+              states_per_walk: int = 64) -> 'TokenIndex':
+        trie = _TokenTrie(vocab)
+        class_starts, table = fsm.transition_table()
+        done_state = fsm.num_states
+        eos_token_ids = np.array(sorted(set(eos_token_ids)), dtype=np.int64)
+
+        origins, token_ids, next_states = [], [], []
+        # The walks of a few states at a time bound the size of the frontiers
+        for first in range(0, fsm.num_states, states_per_walk):
+            states = np.arange(first,
+                               min(first + states_per_walk, fsm.num_states))
+            origin, tokens, targets = trie.walk(class_starts, table, states)
+            origins.append(origin + first)
+            token_ids.append(tokens)
+            next_states.append(targets)
+
+        num_accepted = np.bincount(np.concatenate(origins),
+                                   minlength=fsm.num_states)
+        eos_states = np.array(sorted(
+            set(fsm.finals) | set(np.flatnonzero(num_accepted == 0).tolist())) +
+                              [done_state],
+                              dtype=np.int64)
+        origins.append(np.repeat(eos_states, len(eos_token_ids)))
+        token_ids.append(np.tile(eos_token_ids, len(eos_states)))
+        next_states.append(
+            np.full(len(eos_states) * len(eos_token_ids), done_state))
+
+        origins = np.concatenate(origins)
+        token_ids = np.concatenate(token_ids)
+        next_states = np.concatenate(next_states)
+        order = np.lexsort((token_ids, origins))
+        offsets = np.zeros(fsm.num_states + 2, dtype=np.int64)
+        offsets[1:] = np.cumsum(
+            np.bincount(origins, minlength=fsm.num_states + 1))
+        return cls(offsets, token_ids[order].astype(np.int32),
+                   next_states[order].astype(np.int32), len(vocab),
+                   eos_token_ids.tolist())
+
+    @classmethod
+    def from_regex(cls,
+                   pattern: str,
+                   tokenizer=None,
+                   vocab: Optional[Sequence[Optional[str]]] = None,
+                   eos_token_ids: Optional[Sequence[int]] = None,
+                   cache_dir: Optional[str] = None,
+                   use_cache: bool = True) -> 'TokenIndex':
+        """
+        Builds the index of a regex over the vocabulary of tokenizer, or of
+        vocab, the text of each token id (None for the tokens never allowed).
+
+        The index of a tokenizer and regex is computed once and cached on disk
+        in cache_dir, by default $TLLM_CACHE_DIR/token_index.
+        """
+        if vocab is None:
+            assert tokenizer is not None, "Either tokenizer or vocab is needed"
+            vocab = vocab_strings(tokenizer)
+        if eos_token_ids is None:
+            assert tokenizer is not None and tokenizer.eos_token_id is not None, \
+                "eos_token_ids is needed"
+            eos_token_ids = [tokenizer.eos_token_id]
+
+        path = None
+        if use_cache:
+            path = os.path.join(
+                cache_dir or default_cache_dir(),
+                cls.cache_key(pattern, vocab, eos_token_ids) + '.npz')
+            if os.path.exists(path):
+                try:
+                    return cls.load(path)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(
+                        f"Rebuilding the unreadable token index {path}: {e}")
+
+        index = cls.build(RegexFSM(pattern), vocab, eos_token_ids)
+        if path is not None:
+            index.save(path)
+        return index
+
+    @classmethod
+    def from_json_schema(cls, schema: Union[str, dict],
+                         **kwargs) -> 'TokenIndex':
+        """ Builds the index of the documents of a JSON schema, see from_regex.  """
+        return cls.from_regex(json_schema_to_regex(schema), **kwargs)
+
+    @classmethod
+    def cache_key(cls, pattern: str, vocab: Sequence[Optional[str]],
+                  eos_token_ids: Sequence[int]) -> str:
+        key = hashlib.sha256()
+        key.update(
+            json.dumps([cls.FORMAT_VERSION, pattern,
+                        sorted(eos_token_ids)]).encode())
+        for string in vocab:
+            # The strings are separated by a byte that UTF-8 text never has
+            key.update(b'\xff' if string is None else string.encode(
+                errors='surrogatepass') + b'\xfe')
+        return key.hexdigest()
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Written then renamed, so that concurrent readers never see a partial file
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f,
+                     format_version=self.FORMAT_VERSION,
+                     offsets=self.offsets,
+                     token_ids=self.token_ids,
+                     next_states=self.next_states,
+                     vocab_size=self.vocab_size,
+                     eos_token_ids=np.array(self.eos_token_ids, dtype=np.int64))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'TokenIndex':
+        with np.load(path) as data:
+            if int(data['format_version']) != cls.FORMAT_VERSION:
+                raise ValueError("Outdated format")
+            return cls(data['offsets'], data['token_ids'], data['next_states'],
+                       int(data['vocab_size']), data['eos_token_ids'].tolist())
+
+    def allowed_token_ids(self, state: int) -> np.ndarray:
+        return self.token_ids[self.offsets[state]:self.offsets[state + 1]]
+
+    def advance(self, states: np.ndarray, token_ids: np.ndarray) -> np.ndarray:
+        """
+        Returns the states after token_ids, vectorized over the rows. A token
+        that is not allowed, e.g. one sampled after the end token, leads to
+        the done state.
+        """
+        token_ids = np.asarray(token_ids, dtype=np.int64)
+        keys = np.asarray(states, dtype=np.int64) * self.vocab_size + token_ids
+        positions = np.minimum(np.searchsorted(self._keys, keys),
+                               len(self._keys) - 1)
+        found = (self._keys[positions]
+                 == keys) & (token_ids >= 0) & (token_ids < self.vocab_size)
+        return np.where(found, self.next_states[positions],
+                        self.done_state).astype(np.int32)
+
+    def device_masks(self, vocab_size_padded: int,
+                     device) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Returns the [num_masks, vocab_size_padded] bool table of the distinct
+        allowed token sets and the [num_states] index of the mask of each
+        state. They are built once per vocabulary size and device.
+        """
+        key = (vocab_size_padded, torch.device(device))
+        if key not in self._device_masks:
+            masks, mask_ids, unique = [], [], {}
+            for state in range(self.num_states):
+                mask = np.zeros(vocab_size_padded, dtype=bool)
+                mask[self.allowed_token_ids(state)] = True
+                # Many states allow the same tokens, e.g. within a string
+                packed = np.packbits(mask).tobytes()
+                if packed not in unique:
+                    unique[packed] = len(masks)
+                    masks.append(mask)
+                mask_ids.append(unique[packed])
+            self._device_masks[key] = (torch.from_numpy(
+                np.stack(masks)).to(device),
+                                       torch.tensor(mask_ids,
+                                                    dtype=torch.int64,
+                                                    device=device))
+        return self._device_masks[key]
+
+
+class ConstrainedLogitsProcessor(LogitsProcessor):
+    """
+    Restricts the generation to the outputs matching a TokenIndex, e.g. a
+    regex or the documents of a JSON schema.
+
+    The automaton state of every row is advanced on the host with the token
+    sampled at the previous step, then the logits of the disallowed tokens are
+    masked with one gather and one masked_fill for the whole batch.
+
+    input_lengths are the prompt lengths of the batch, the generated tokens of
+    a row follow its prompt in the input_ids given to the processor. With beam
+    search, the beams are reordered at every step, so their states are
+    replayed from the generated tokens.
+    """
+
+    def __init__(self,
+                 token_index: TokenIndex,
+                 input_lengths: Union[Sequence[int], torch.Tensor],
+                 num_beams: int = 1):
+        self.token_index = token_index
+        self.num_beams = num_beams
+        input_lengths = torch.as_tensor(input_lengths, dtype=torch.int64)
+        self.input_lengths = input_lengths.repeat_interleave(num_beams)
+        self.states = None
+
+    def __call__(self, step: int, input_ids: torch.Tensor,
+                 scores: torch.Tensor) -> torch.Tensor:
+        index = self.token_index
+        num_rows = input_ids.shape[0]
+        assert num_rows == len(self.input_lengths), \
+            f"Expected {len(self.input_lengths)} rows, got {num_rows}"
+
+        if step == 0 or self.num_beams > 1:
+            self.states = np.full(num_rows, index.initial_state, dtype=np.int32)
+        if step > 0:
+            positions = self.input_lengths.to(input_ids.device).unsqueeze(-1)
+            if self.num_beams == 1:
+                positions = positions + (step - 1)
+            else:
+                positions = positions + torch.arange(step,
+                                                     device=input_ids.device)
+            generated = input_ids.gather(1, positions).cpu().numpy()
+            for t in range(generated.shape[1]):
+                self.states = index.advance(self.states, generated[:, t])
+
+        masks, mask_ids = index.device_masks(scores.shape[-1], scores.device)
+        states = torch.from_numpy(self.states).to(scores.device,
+                                                  non_blocking=True)
+        allowed = masks[mask_ids[states.long()]]
+        return scores.masked_fill(~allowed.view(scores.shape), float('-inf'))
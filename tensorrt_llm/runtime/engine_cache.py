@@ -0,0 +1,250 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+A local cache of the built engines, keyed by the content of the checkpoint,
+the build options, the mapping and the versions of the libraries.
+
+An entry is a directory laid out as an engine directory, a config.json and a
+rank{N}.engine per rank, the ranks being stored by their builders as they
+are done. The files are written then renamed, so that concurrent builders and
+readers never see a partial file, and the least recently used entries are
+evicted beyond max_size bytes.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, Optional
+
+from ..logger import logger
+from ..version import __version__
+
+_CHUNK_SIZE = 16 << 20
+
+
+def default_cache_dir() -> str:
+    return os.path.join(
+        os.environ.get(
+            'TLLM_CACHE_DIR',
+            os.path.join(os.path.expanduser('~'), '.cache', 'tensorrt_llm')),
+        'engines')
+
+
+def engine_platform() -> Dict[str, str]:
+    """
+    The versions and the device the engines are built for, an engine only
+    runs with the TensorRT version and on the GPU architecture it is built
+    for.
+    """
+    import tensorrt as trt
+    import torch
+    platform = {'tensorrt_llm': __version__, 'tensorrt': trt.__version__}
+    if torch.cuda.is_available():
+        platform['sm'] = '{}{}'.format(*torch.cuda.get_device_capability())
+    return platform
+
+
+def _write_atomic(path: str, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class EngineCache(object):
+
+    def __init__(self,
+                 cache_dir: Optional[str] = None,
+                 max_size: Optional[int] = None):
+        """
+        max_size is the size of the cache in bytes, unbounded if None.
+        """
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def file_digest(self, path: str) -> str:
+        """
+        Returns the sha256 of a file. The digests are kept in the cache
+        directory along the size and the modification time of the files, so
+        that the weights are only read again when they change.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        digests_path = os.path.join(self.cache_dir, 'digests.json')
+        try:
+            with open(digests_path) as f:
+                digests = json.load(f)
+        except (OSError, ValueError):
+            digests = {}
+        size, mtime_ns, digest = digests.get(path, (None, None, None))
+        if (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+            return digest
+
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        digests[path] = (stat.st_size, stat.st_mtime_ns, digest)
+        _write_atomic(digests_path, json.dumps(digests).encode())
+        return digest
+
+    def checkpoint_digest(self, checkpoint_dir: str) -> str:
+        """
+        Returns the digest of the files of a checkpoint directory, the
+        config.json and the tensors, of the TensorRT-LLM or the HF format.
+        """
+        sha = hashlib.sha256()
+        for name in sorted(os.listdir(checkpoint_dir)):
+            path = os.path.join(checkpoint_dir, name)
+            if os.path.isfile(path):
+                sha.update(f'{name}:{self.file_digest(path)}\n'.encode())
+        return sha.hexdigest()
+
+    def cache_key(self,
+                  checkpoint_dir: str,
+                  build_config,
+                  mapping,
+                  platform: Optional[Dict[str, str]] = None,
+                  **extra) -> str:
+        """
+        Returns the key of the engines of a checkpoint built with
+        build_config for the ranks of mapping. platform defaults to the
+        engine_platform() of this process, extra are other options of the
+        build, as the model class.
+        """
+        key = {
+            'checkpoint': self.checkpoint_digest(checkpoint_dir),
+            'build_config': build_config.to_dict(),
+            'mapping': {
+                'world_size': mapping.world_size,
+                'tp_size': mapping.tp_size,
+                'pp_size': mapping.pp_size,
+                'pp_partition': mapping.pp_partition,
+            },
+            'platform': platform or engine_platform(),
+            'extra': extra,
+        }
+        return hashlib.sha256(
+            json.dumps(key, sort_keys=True,
+                       default=str).encode()).hexdigest()[:32]
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key: str, rank: int = 0):
+        """
+        Returns the engine buffer of rank and the config of an entry, None on a
+        miss.
+        """
+        entry_dir = self.entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, f'rank{rank}.engine'), 'rb') as f:
+                engine_buffer = f.read()
+            with open(os.path.join(entry_dir, 'config.json')) as f:
+                config = json.load(f)
+            # The modification time of the entry orders the evictions
+            os.utime(entry_dir)
+        except OSError:
+            # Not built yet for rank, or evicted
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.info(f'Engine cache hit: {entry_dir}, rank {rank}')
+        return engine_buffer, config
+
+    def store(self, key: str, engine_buffer, config: dict, rank: int = 0):
+        """
+        Stores the engine of rank and the config.json of an entry, then
+        evicts the least recently used entries beyond max_size.
+        """
+        entry_dir = self.entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        _write_atomic(os.path.join(entry_dir, 'config.json'),
+                      json.dumps(config, indent=4, default=str).encode())
+        _write_atomic(os.path.join(entry_dir, f'rank{rank}.engine'),
+                      bytes(engine_buffer))
+        os.utime(entry_dir)
+        self.stores += 1
+        if self.max_size is not None:
+            self.evict(keep=key)
+
+    def entries(self):
+        """
+        Returns the (last use time, size, key) of the entries, the least
+        recently used first.
+        """
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self.entry_dir(key)
+            if key.startswith('.') or not os.path.isdir(entry_dir):
+                continue
+            try:
+                size = sum(entry.stat().st_size
+                           for entry in os.scandir(entry_dir))
+                entries.append((os.stat(entry_dir).st_mtime, size, key))
+            except OSError:
+                # Evicted by another process
+                continue
+        return sorted(entries)
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep: Optional[str] = None):
+        """
+        Removes the least recently used entries, except keep, until the cache
+        fits max_size.
+        """
+        with open(os.path.join(self.cache_dir, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = self.entries()
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, key in entries:
+                if total_size <= self.max_size:
+                    break
+                if key == keep:
+                    continue
+                # Renamed first so that the readers never see a partial entry
+                evicted_dir = os.path.join(self.cache_dir,
+                                           f'.evicted.{key}.{time.time_ns()}')
+                try:
+                    os.rename(self.entry_dir(key), evicted_dir)
+                except OSError:
+                    continue
+                shutil.rmtree(evicted_dir, ignore_errors=True)
+                total_size -= size
+                self.evictions += 1
+                logger.info(f'Engine cache evicted {key}')
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.evictions,
+        }
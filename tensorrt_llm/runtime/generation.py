@@ -14,8 +14,6 @@
 # limitations under the License.
 
 import copy
-import csv
-import math
 from dataclasses import dataclass, field
 from functools import reduce, wraps
 from pathlib import Path
@@ -35,54 +33,14 @@ from .._utils import (pad_vocab_size, str_dtype_to_torch, torch_to_numpy,
 from ..logger import logger
 from ..mapping import Mapping
 from ..quantization import QuantMode
-from .kv_cache_manager import GenerationSequence, KVCacheManager
+from .kv_cache_manager import (GenerationSequence, KVCacheManager,
+                               blocks_per_sequence)
+from .logits_capture import LogitsCapture
 from .lora_manager import LoraManager
 from .session import _scoped_stream
-
-
-def to_word_list_format(word_dict: List[List[str]],
-                        tokenizer=None,
-                        add_special_tokens=False):
-    '''
-    format of word_dict
-        len(word_dict) should be same to batch_size
-        word_dict[i] means the words for batch i
-        len(word_dict[i]) must be 1, which means it only contains 1 string
-        This string can contains several sentences and split by ",".
-        For example, if word_dict[2] = " I am happy, I am sad", then this function will return
-        the ids for two short sentences " I am happy" and " I am sad".
-    '''
-    assert tokenizer != None, "need to set tokenizer"
-
-    flat_ids = []
-    offsets = []
-    for word_dict_item in word_dict:
-        item_flat_ids = []
-        item_offsets = []
-
-        if isinstance(word_dict_item[0], bytes):
-            word_dict_item = [word_dict_item[0].decode()]
-
-        words = list(csv.reader(word_dict_item))[0]
-        for word in words:
-            ids = tokenizer.encode(word, add_special_tokens=add_special_tokens)
-
-            if len(ids) == 0:
-                continue
-
-            item_flat_ids += ids
-            item_offsets.append(len(ids))
-
-        flat_ids.append(np.array(item_flat_ids))
-        offsets.append(np.cumsum(np.array(item_offsets)))
-
-    pad_to = max(1, max(len(ids) for ids in flat_ids))
-
-    for i, (ids, offs) in enumerate(zip(flat_ids, offsets)):
-        flat_ids[i] = np.pad(ids, (0, pad_to - len(ids)), constant_values=0)
-        offsets[i] = np.pad(offs, (0, pad_to - len(offs)), constant_values=-1)
-
-    return np.array([flat_ids, offsets], dtype="int32").transpose((1, 0, 2))
+from .step_inputs import StepInputBuilder, glm_mask_index
+from .stream_deltas import StreamDeltas
+from .word_list import to_word_list_format  # autoflake: skip
 
 
 def _prepare_input_ids(tensors: Sequence[torch.Tensor]):
@@ -469,6 +427,8 @@ class GenerationSession(object):
         self.device = torch.device(
             f'cuda:{self.runtime.runtime_rank % mapping.gpus_per_node}')
         torch.cuda.set_device(self.device)
+        self.step_input_builder = StepInputBuilder(self.device)
+        self.stream_deltas = StreamDeltas(self.device)
         # dynamic_decoder currently use torch's current stream, so must let TRT enqueue use same stream here
         self.stream = stream
         if self.stream is None:
@@ -640,13 +600,13 @@ class GenerationSession(object):
 
     @property
     def num_layers(self):
-        assert self._model_config.num_layers % self.mapping.pp_size == 0, \
-            f"num_layers {self._model_config.num_layers} must be a multiple of pipeline parallelism size {self.mapping.pp_size}"
-        return self._model_config.num_layers // self.mapping.pp_size
+        return len(self.mapping.pp_layers(self._model_config.num_layers))
 
     @property
     def first_layer(self):
-        return self.num_layers * self.mapping.pp_rank
+        return sum(
+            self.mapping.pp_stage_num_layers(
+                self._model_config.num_layers)[:self.mapping.pp_rank])
 
     @property
     def last_layer(self):
@@ -1087,15 +1047,9 @@ class GenerationSession(object):
                 device=self.device)
 
         if self.paged_kv_cache:
-            bubble_len = 0
-            if self.sink_token_length % self.tokens_per_block > 0:
-                bubble_len += (self.tokens_per_block -
-                               self.sink_token_length % self.tokens_per_block)
-            blocks = batch_size * beam_width * math.ceil(
-                (self.max_attention_window_size + bubble_len) /
-                self.tokens_per_block)
-            if self.use_one_more_block:
-                blocks += batch_size * beam_width
+            blocks = batch_size * beam_width * blocks_per_sequence(
+                self.max_attention_window_size, self.tokens_per_block,
+                self.sink_token_length, self.use_one_more_block)
             cache_shape = (
                 blocks,
                 2,
@@ -1173,6 +1127,7 @@ class GenerationSession(object):
 
         if self.use_lora_plugin and self.lora_manager is not None:
             assert lora_uids is not None
+            self.lora_manager.prepare(lora_uids)
             lora_weights_pointers_list = [
                 torch.zeros(size=(batch_size, 2),
                             dtype=torch.int64).contiguous().cpu()
@@ -1567,76 +1522,33 @@ class GenerationSession(object):
     def _prepare_context_inputs(self, batch_size, context_lengths,
                                 host_context_lengths, use_gpt_attention_plugin,
                                 remove_input_padding, **kwargs):
-
-        last_token_ids = context_lengths.detach().clone()
-        if use_gpt_attention_plugin:
-            max_context_length = kwargs.pop('max_context_length')
-            if remove_input_padding:
-                position_ids = torch.concat([
-                    torch.arange(0,
-                                 host_context_lengths[i],
-                                 dtype=torch.int32,
-                                 device='cuda') for i in range(batch_size)
-                ])
-                last_token_ids = torch.cumsum(last_token_ids, dim=0).int()
-            else:
-                position_ids = torch.tensor(range(max_context_length),
-                                            dtype=torch.int32,
-                                            device='cuda').reshape(
-                                                [1,
-                                                 -1]).expand([batch_size, -1])
-            ret = {'last_token_ids': last_token_ids}
-        else:
-            input_ids = kwargs.pop('input_ids')
-            pad_id = kwargs.pop('pad_id', None)
-            attention_mask = _prepare_attention_mask(input_ids, pad_id)
-            position_ids = attention_mask.long().cumsum(-1) - 1
-            position_ids.masked_fill_(attention_mask == 0, 1)
-            position_ids = position_ids.int()
-
-            ret = {
-                'attention_mask': attention_mask,
-                'last_token_ids': last_token_ids
-            }
-
-        if self.has_position_embedding:
-            ret['position_ids'] = position_ids
-
+        ret = self.step_input_builder.context_inputs(
+            batch_size,
+            context_lengths,
+            host_context_lengths,
+            use_gpt_attention_plugin,
+            remove_input_padding,
+            max_context_length=kwargs.get('max_context_length'),
+            input_ids=kwargs.get('input_ids'),
+            pad_id=kwargs.get('pad_id'))
+        if not self.has_position_embedding:
+            ret.pop('position_ids')
         return ret
 
     def _prepare_generation_inputs(self, batch_size, context_lengths,
                                    use_gpt_attention_plugin,
                                    remove_input_padding, **kwargs):
-        last_token_ids = torch.ones_like(context_lengths)
-        if use_gpt_attention_plugin:
-            step = kwargs.pop('step')
-            position_ids = context_lengths + step
-            if remove_input_padding:
-                last_token_ids = torch.cumsum(last_token_ids, dim=0).int()
-            else:
-                position_ids = torch.unsqueeze(position_ids, 1)
-
-            ret = {'last_token_ids': last_token_ids}
-        else:
-            attention_mask = kwargs.pop('attention_mask')
-            num_beams = kwargs.pop('num_beams')
-            attention_mask = torch.cat((attention_mask,
-                                        attention_mask.new_ones(
-                                            (batch_size * num_beams, 1))),
-                                       dim=-1).contiguous()
-            position_ids = attention_mask.long().cumsum(-1) - 1
-            position_ids.masked_fill_(attention_mask == 0, 1)
-            position_ids = position_ids[:, -1].unsqueeze(-1)
-            position_ids = position_ids.int()
-
-            ret = {
-                'last_token_ids': last_token_ids,
-                'attention_mask': attention_mask,
-            }
-
-        if self.has_position_embedding:
-            ret['position_ids'] = position_ids
-
+        ret = self.step_input_builder.generation_inputs(
+            batch_size,
+            context_lengths,
+            use_gpt_attention_plugin,
+            remove_input_padding,
+            step=kwargs.get('step'),
+            num_beams=kwargs.get('num_beams', 1),
+            attention_mask=kwargs.get('attention_mask'),
+            max_new_tokens=self.max_new_tokens)
+        if not self.has_position_embedding:
+            ret.pop('position_ids')
         return ret
 
     def pp_communicate_new_tokens(self, should_stop, cache_indir,
@@ -2009,6 +1921,19 @@ class GenerationSession(object):
                 t.reshape(-1, t.shape[-1]),  # savetxt accepts 2 dims only
                 fmt=txt_format)
 
+    def _setup_logits_capture(self, logits_capture: Optional[LogitsCapture],
+                              batch_size: int,
+                              beam_width: int) -> Optional[LogitsCapture]:
+        # The logits are only computed on the last pipeline stage
+        if logits_capture is None or not self.mapping.is_last_pp_rank():
+            return None
+        logits_capture.setup(batch_size,
+                             beam_width,
+                             self.max_new_tokens,
+                             vocab_size=self.vocab_size,
+                             device=self.device)
+        return logits_capture
+
     def decode_regular(self,
                        batch_size: int,
                        scfg: SamplingConfig,
@@ -2051,9 +1976,13 @@ class GenerationSession(object):
             if self.gather_all_token_logits:
                 outputs['context_logits'] = context_logits
                 outputs['generation_logits'] = generation_logits
+            if logits_capture is not None:
+                outputs.update(logits_capture.outputs())
             return outputs
 
         benchmark_profiler = kwargs.get('benchmark_profiler', None)
+        logits_capture = self._setup_logits_capture(
+            kwargs.get('logits_capture', None), batch_size, beam_width)
         generation_phase_step_count = 0
 
         def profile_fn(benchmark_profiler_obj, step_count):
@@ -2088,6 +2017,9 @@ class GenerationSession(object):
                     else:
                         l = next_step_tensors['logits'].to_torch()
                         generation_logits.append(l.clone().detach())
+            if logits_capture is not None:
+                logits_capture.capture(step, self.buffer['logits'],
+                                       self.new_tokens, self.finished)
 
             if should_stop is not None and should_stop.item():
                 profile_fn(benchmark_profiler, generation_phase_step_count)
@@ -2166,8 +2098,17 @@ class GenerationSession(object):
                         [batch_size, beam_width])
             if self.gather_all_token_logits:
                 outputs['context_logits'] = context_logits
+            if logits_capture is not None:
+                outputs.update(logits_capture.outputs())
             return outputs
 
+        logits_capture = self._setup_logits_capture(
+            kwargs.get('logits_capture', None), batch_size, beam_width)
+        # Yields the StreamDelta of each step instead of the output ids
+        stream_deltas = kwargs.get('stream_deltas', False)
+        if stream_deltas:
+            self.stream_deltas.setup(batch_size, beam_width,
+                                     host_context_lengths)
         next_step_tensors = None
         for step in range(0, self.max_new_tokens):
             should_stop, next_step_tensors, tasks, context_lengths, host_context_lengths, attention_mask, logits, encoder_input_lengths = self.handle_per_step(
@@ -2182,7 +2123,17 @@ class GenerationSession(object):
                 logits_processor)
             if step == 0:
                 context_logits = logits
-            if should_stop is not None:
+            if logits_capture is not None:
+                logits_capture.capture(step, self.buffer['logits'],
+                                       self.new_tokens, self.finished)
+            if should_stop is not None and stream_deltas:
+                # The new tokens only, without gathering the output ids
+                self.stream_deltas.capture(self.new_tokens, self.finished,
+                                           self.sequence_length_buffer)
+                yield self.stream_deltas.delta()
+                if should_stop.item():
+                    return
+            elif should_stop is not None:
 
                 final_output_ids = self.finalize_decoder(context_lengths,
                                                          batch_size,
@@ -2201,6 +2152,9 @@ class GenerationSession(object):
                 if should_stop.item():
                     return
 
+        if stream_deltas:
+            # The last step was yielded already
+            return
         final_output_ids = self.finalize_decoder(context_lengths, batch_size,
                                                  beam_width, scfg)
         if self.mapping.is_first_pp_rank():
@@ -2261,6 +2215,10 @@ class GenerationSession(object):
         assert self.sink_token_length <= torch.min(context_lengths).item(), \
             "Given sink token length is larger than shortest context length," \
             "rerun the setup function with a smaller sink token length."
+        assert not kwargs.get('stream_deltas', False) or (
+            streaming and beam_width == 1 and not self.mapping.has_pp()), \
+            "Streaming deltas requires streaming, without beam search nor " \
+            "pipeline parallelism."
         ite = 0  # index of local batches, will always be 0 if pp_size = 1
 
         if self.remove_input_padding and input_ids.dim() == 2:
@@ -2311,15 +2269,9 @@ class GenerationSession(object):
 
         # Init KV cache block manager
         if self.paged_kv_cache:
-            bubble_len = 0
-            if self.sink_token_length % self.tokens_per_block > 0:
-                bubble_len += (self.tokens_per_block -
-                               self.sink_token_length % self.tokens_per_block)
-            max_blocks_per_seq = math.ceil(
-                (self.max_attention_window_size + bubble_len) /
-                self.tokens_per_block)
-            if self.use_one_more_block:
-                max_blocks_per_seq += 1
+            max_blocks_per_seq = blocks_per_sequence(
+                self.max_attention_window_size, self.tokens_per_block,
+                self.sink_token_length, self.use_one_more_block)
             blocks = batch_size * beam_width * max_blocks_per_seq
             memory_pools = [
                 self.buffer[f'present_key_value_{i}']
@@ -2386,59 +2338,27 @@ class ChatGLMGenerationSession(GenerationSession):
         self.mask_index_tensor = None
 
     def _prepare_context_inputs(self, batch_size, context_lengths,
-                                use_gpt_attention_plugin, remove_input_padding,
-                                **kwargs):
+                                host_context_lengths, use_gpt_attention_plugin,
+                                remove_input_padding, **kwargs):
 
         max_context_length = kwargs.pop('max_context_length')
+        builder = self.step_input_builder
+        context_lengths = context_lengths.to(builder.device)
         last_token_ids = context_lengths.detach().clone()
 
+        self.mask_index_tensor = None
         if remove_input_padding:
-            input_lengths_acc = torch.cumsum(torch.cat(
-                [torch.IntTensor([0]).cuda(), context_lengths], dim=0),
-                                             dim=0)
-            position_ids = torch.zeros([1, 2, input_lengths_acc[-1]],
-                                       dtype=torch.int32)
-            for i in range(batch_size):
-                position_ids[0, 0, input_lengths_acc[i]:input_lengths_acc[
-                    i + 1]] = torch.arange(0,
-                                           context_lengths[i],
-                                           dtype=torch.int32)
-                position_ids[0, 0, input_lengths_acc[i + 1] -
-                             1] = context_lengths[i] - 2
-                position_ids[0, 1, input_lengths_acc[i + 1] - 1] = 1
-            position_ids = position_ids.int().cuda()
-            last_token_ids = torch.cumsum(last_token_ids, dim=0).int().cuda()
-        else:
-            position_ids = torch.zeros([batch_size, 2, max_context_length],
-                                       dtype=torch.int32)
-            position_ids[:, 0, :] = torch.arange(max_context_length)
-
-            if kwargs["pad_id"] == 50256:  # specialization for GLM-10B
-                self.mask_index_tensor = torch.zeros([batch_size],
-                                                     dtype=torch.int32)
-                for i in range(batch_size):
-                    length = context_lengths[i]
-                    mask_index = torch.where(
-                        kwargs["input_ids"][i] == 50260)[0].int()
-                    gmask_index = torch.where(
-                        kwargs["input_ids"][i] == 50263)[0].int()
-                    smask_index = torch.where(
-                        kwargs["input_ids"][i] == 50264)[0].int()
-                    tail_index = torch.Tensor([max_context_length]).int().cuda()
-                    mask_index = torch.cat([
-                        mask_index.int(), gmask_index, smask_index, tail_index
-                    ],
-                                           dim=0).min()
-                    position_ids[i, 0, length - 1] = int(mask_index)
-                    position_ids[i, 1, length - 1] = 1
-                    self.mask_index_tensor[i] = int(mask_index)
-            else:
-                for i in range(batch_size):
-                    length = context_lengths[i]
-                    position_ids[i, 0, length - 1] = length - 2
-                    position_ids[i, 1, length - 1] = 1
-
-            position_ids = position_ids.cuda()
+            last_token_ids = torch.cumsum(last_token_ids, dim=0).int()
+        elif kwargs["pad_id"] == 50256:  # specialization for GLM-10B
+            self.mask_index_tensor = glm_mask_index(
+                kwargs["input_ids"].to(builder.device), max_context_length)
+        position_ids = builder.glm_context_position_ids(
+            batch_size,
+            context_lengths,
+            host_context_lengths,
+            max_context_length,
+            remove_input_padding,
+            mask_index=self.mask_index_tensor)
 
         inputs = {
             'position_ids': position_ids,
@@ -2455,27 +2375,15 @@ class ChatGLMGenerationSession(GenerationSession):
 
         step = kwargs.pop('step')
         num_beams = kwargs.pop('num_beams')
-        last_token_ids = torch.ones_like(context_lengths)
-
-        if remove_input_padding:
-            position_ids = torch.zeros([1, 2, batch_size], dtype=torch.int32)
-            for i in range(batch_size):
-                position_ids[0, 0, i] = context_lengths[i * num_beams] - 2
-                position_ids[0, 1, i] = step + 2
-            position_ids = torch.tile(position_ids, [1, 1, num_beams])
-            position_ids = position_ids.int().cuda()
-            last_token_ids = torch.cumsum(last_token_ids, dim=0).int().cuda()
-        else:
-            data = []
-            if self.mask_index_tensor is not None:  # specialization for GLM-10B
-                for i in range(batch_size):
-                    data.append([[self.mask_index_tensor[i]], [step + 2]])
-            else:
-                for i in range(batch_size):
-                    data.append([[context_lengths[i * num_beams] - 2],
-                                 [step + 2]])
-            position_ids = torch.tensor(data, dtype=torch.int32, device='cuda')
-            position_ids = _tile_beam_width(position_ids, num_beams)
+        builder = self.step_input_builder
+        last_token_ids = builder.last_token_ids(batch_size * num_beams,
+                                                remove_input_padding)
+        position_ids = builder.glm_generation_position_ids(
+            context_lengths,
+            step,
+            remove_input_padding,
+            num_beams=num_beams,
+            mask_index=self.mask_index_tensor)
 
         inputs = {
             'position_ids': position_ids,
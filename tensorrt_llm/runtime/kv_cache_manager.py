@@ -12,12 +12,40 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from collections import defaultdict
-from typing import List
+import math
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
 
+import numpy as np
 import torch
 
 
+def sink_bubble_len(sink_token_len: int, tokens_per_block: int) -> int:
+    """
+    The sink tokens are not stored into the same block with other tokens,
+    returns the length of the bubble padding the last sink block.
+    """
+    if sink_token_len % tokens_per_block == 0:
+        return 0
+    return tokens_per_block - sink_token_len % tokens_per_block
+
+
+def blocks_per_sequence(max_attention_window_size: int,
+                        tokens_per_block: int,
+                        sink_token_len: int = 0,
+                        use_one_more_block: bool = False) -> int:
+    """
+    Returns the number of blocks of a sequence whose cache holds
+    max_attention_window_size tokens.
+    """
+    num_blocks = math.ceil(
+        (max_attention_window_size +
+         sink_bubble_len(sink_token_len, tokens_per_block)) / tokens_per_block)
+    if use_one_more_block:
+        num_blocks += 1
+    return num_blocks
+
+
 class Block(object):
 
     def __init__(self, block_idx, k_ptrs, v_ptrs):
@@ -71,7 +99,48 @@ class GenerationSequence(object):
         return self.seq_idx
 
 
+class BlockTreeNode(object):
+    """
+    Node of the radix tree of cached blocks.
+    Every node holds the tokens of one full block, the path from the root
+    to the node is the token prefix stored in the block.
+    """
+
+    def __init__(self,
+                 tokens: Tuple[int, ...] = (),
+                 block_idx: int = -1,
+                 parent: Optional['BlockTreeNode'] = None):
+        self.tokens = tokens
+        self.block_idx = block_idx
+        self.parent = parent
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.children = {}
+
+    def detach(self):
+        """
+        Removes the node from the tree. The subtree of the node is dropped
+        with it, since its prefix can't be matched anymore.
+        """
+        if self.parent is not None:
+            self.parent.children.pop(self.tokens, None)
+            self.parent = None
+
+
 class BlocksManager(object):
+    """
+    Paged KV cache block allocator.
+
+    The bookkeeping is kept as struct-of-arrays: the free blocks are a stack of
+    block ids, reference counts and per-sequence block tables are integer
+    arrays, and the pointer arrays of all memory pools are updated in place
+    whenever a block is assigned to a sequence, so that allocation, release
+    and get_pointer_array don't depend on the total number of blocks.
+
+    Full blocks can be registered in a radix tree keyed on their tokens, so
+    that sequences with the same prefix share them. Cached blocks without
+    references are kept until a new block is needed and no free block is
+    left, they are then evicted in LRU order.
+    """
     _sizeof = {
         torch.float32: 4,
         torch.float16: 2,
@@ -96,26 +165,190 @@ class BlocksManager(object):
             # Pool consists of memory for K and V caches
             self.elts_per_blocks.append(pool.nelement() // (2 * blocks))
 
-        self.free_blocks = []
-        for bi in range(blocks):
-            k_ptrs = []
-            v_ptrs = []
-            for pool, elts_per_block in zip(memory_pools, self.elts_per_blocks):
-                k_ptrs.append(self.get_mempool_pointer(bi, pool,
-                                                       elts_per_block))
-                v_ptrs.append(
-                    self.get_mempool_pointer(bi, pool, elts_per_block) +
-                    self.blocks * elts_per_block * self._sizeof[pool.dtype])
-            self.free_blocks.append(Block(bi, k_ptrs, v_ptrs))
-
-        self.allocated_blocks = defaultdict(
-            lambda: [[] for _ in range(self.beam_width)])
+        # [num_pools, blocks] K and V pointers of every block
+        block_ids = np.arange(blocks, dtype=np.int64)
+        self.k_ptrs = np.empty((len(memory_pools), blocks), dtype=np.int64)
+        self.v_ptrs = np.empty((len(memory_pools), blocks), dtype=np.int64)
+        for pi, (pool, elts_per_block) in enumerate(
+                zip(memory_pools, self.elts_per_blocks)):
+            block_bytes = elts_per_block * self._sizeof[pool.dtype]
+            self.k_ptrs[pi] = pool.data_ptr() + block_ids * block_bytes
+            self.v_ptrs[pi] = self.k_ptrs[pi] + self.blocks * block_bytes
+
+        self.ref_counts = np.zeros(blocks, dtype=np.int32)
+
+        # Stack of free block ids, the top is at _num_free - 1.
+        # Block 0 is on the top so blocks are handed out in ascending order.
+        self._free_stack = np.arange(blocks - 1, -1, -1, dtype=np.int32)
+        self._num_free = blocks
+
+        # Every owner gets a slot in the block tables and pointer arrays
+        self._slots = {}
+        self._free_slots = []
+        self._capacity = 0
+        self.block_tables = np.empty(
+            (0, self.beam_width, self.max_blocks_per_seq), dtype=np.int32)
+        self.num_seq_blocks = np.empty(0, dtype=np.int32)
+        # [num_pools, slots, beam_width, 2, max_blocks_per_seq]
+        self.pointers = np.empty(
+            (len(memory_pools), 0, self.beam_width, 2, self.max_blocks_per_seq),
+            dtype=np.int64)
+        self._grow(max(1, blocks // max(1, max_blocks_per_seq)))
+
+        # Radix tree of the cached blocks
+        self.block_tree = BlockTreeNode()
+        self._cached_nodes = {}
+        # Cached blocks with ref_count == 0, the least recently used first
+        self._evictable_blocks = OrderedDict()
+        self.num_evicted_blocks = 0
+
+    @property
+    def free_blocks(self) -> np.ndarray:
+        """
+        Returns ids of the free blocks
+        """
+        return self._free_stack[:self._num_free]
+
+    @property
+    def allocated_blocks(self) -> Dict[GenerationSequence, List[List[Block]]]:
+        """
+        Returns a snapshot of the blocks allocated to every owner, as
+        [beam_width][num_blocks] lists of Block.
+        Used only for debug purposes.
+        """
+        allocated_blocks = {}
+        for owner, slot in self._slots.items():
+            num_blocks = self.num_seq_blocks[slot]
+            allocated_blocks[owner] = [[
+                self._make_block(block_idx)
+                for block_idx in self.block_tables[slot, bi, :num_blocks]
+            ] for bi in range(self.beam_width)]
+        return allocated_blocks
+
+    def _make_block(self, block_idx: int) -> Block:
+        block = Block(int(block_idx), self.k_ptrs[:, block_idx].tolist(),
+                      self.v_ptrs[:, block_idx].tolist())
+        block.ref_count = int(self.ref_counts[block_idx])
+        return block
+
+    def _grow(self, capacity: int):
+        """
+        Grows the number of owner slots to the given capacity
+        """
+        extra = capacity - self._capacity
+        self.block_tables = np.concatenate([
+            self.block_tables,
+            np.full((extra, self.beam_width, self.max_blocks_per_seq),
+                    -1,
+                    dtype=np.int32)
+        ])
+        self.num_seq_blocks = np.concatenate(
+            [self.num_seq_blocks,
+             np.zeros(extra, dtype=np.int32)])
+        self.pointers = np.concatenate([
+            self.pointers,
+            np.zeros((len(self.memory_pools), extra, self.beam_width, 2,
+                      self.max_blocks_per_seq),
+                     dtype=np.int64)
+        ],
+                                       axis=1)
+        self._free_slots.extend(range(capacity - 1, self._capacity - 1, -1))
+        self._capacity = capacity
+
+    def _get_slot(self, owner: GenerationSequence) -> int:
+        slot = self._slots.get(owner)
+        if slot is None:
+            if not self._free_slots:
+                self._grow(2 * self._capacity)
+            slot = self._free_slots.pop()
+            self._slots[owner] = slot
+        return slot
+
+    @property
+    def num_cached_blocks(self) -> int:
+        """
+        Returns number of blocks registered in the block tree
+        """
+        return len(self._cached_nodes)
+
+    def get_num_free_blocks(self) -> int:
+        """
+        Returns number of blocks which can be allocated,
+        including the cached blocks that are not referenced
+        """
+        return self._num_free + len(self._evictable_blocks)
+
+    def _pop_free_block(self) -> int:
+        if self._num_free == 0:
+            return self._evict_block()
+        self._num_free -= 1
+        return int(self._free_stack[self._num_free])
+
+    def _evict_block(self) -> int:
+        """
+        Removes the least recently used unreferenced block from the cache
+        """
+        block_idx, _ = self._evictable_blocks.popitem(last=False)
+        self._uncache(block_idx)
+        self.num_evicted_blocks += 1
+        return block_idx
+
+    def _uncache(self, block_idx: int):
+        """
+        Removes the block and the blocks cached after it from the block tree
+        """
+        node = self._cached_nodes.pop(block_idx)
+        node.detach()
+        subtree = list(node.children.values())
+        while subtree:
+            child = subtree.pop()
+            subtree.extend(child.children.values())
+            del self._cached_nodes[child.block_idx]
+            if child.block_idx in self._evictable_blocks:
+                del self._evictable_blocks[child.block_idx]
+                self._push_free_blocks([child.block_idx])
+
+    def _push_free_blocks(self, block_ids: Sequence[int]):
+        num_blocks = len(block_ids)
+        self._free_stack[self._num_free:self._num_free + num_blocks] = block_ids
+        self._num_free += num_blocks
+
+    def _release(self, block_ids: np.ndarray):
+        """
+        Removes one reference per entry of block_ids (ids may repeat)
+        and moves the blocks which are not referenced anymore to free
+        """
+        np.subtract.at(self.ref_counts, block_ids, 1)
+        released = np.unique(block_ids[self.ref_counts[block_ids] == 0])
+        if not self._cached_nodes:
+            self._push_free_blocks(released)
+            return
+
+        is_cached = np.array([
+            block_idx in self._cached_nodes for block_idx in released.tolist()
+        ],
+                             dtype=bool)
+        self._push_free_blocks(released[~is_cached])
+        # Deeper blocks are evicted first, they are useless without parents
+        cached = sorted(
+            released[is_cached].tolist(),
+            key=lambda block_idx: -self._cached_nodes[block_idx].depth)
+        for block_idx in cached:
+            self._evictable_blocks[block_idx] = None
+
+    def _assign(self, slot: int, beam_idx: int, block_linear_idx: int,
+                block_idx: int):
+        self.block_tables[slot, beam_idx, block_linear_idx] = block_idx
+        self.pointers[:, slot, beam_idx, 0,
+                      block_linear_idx] = self.k_ptrs[:, block_idx]
+        self.pointers[:, slot, beam_idx, 1,
+                      block_linear_idx] = self.v_ptrs[:, block_idx]
 
     def has_free_block(self) -> bool:
         """
         Returns True if we have at least 1 free block
         """
-        return len(self.free_blocks) > 0
+        return self.get_num_free_blocks() > 0
 
     def allocate(self,
                  owner: GenerationSequence,
@@ -123,41 +356,51 @@ class BlocksManager(object):
         """
         Add block to owner and increase ref count
         """
+        # Use the same block for all seqs in beam if share_across_beam
+        required_blocks = 1 if share_across_beam else self.beam_width
+        if self.get_num_free_blocks() < required_blocks:
+            raise RuntimeError("Can't allocate new block for KV cache")
+
+        slot = self._get_slot(owner)
+        block_linear_idx = int(self.num_seq_blocks[slot])
+        if block_linear_idx >= self.max_blocks_per_seq:
+            raise RuntimeError(
+                "Can't allocate more than max_blocks_per_seq blocks per sequence"
+            )
+
         # Add blocks for whole beam width
-        block = None
+        block_idx = None
         for bi in range(self.beam_width):
-            if not self.has_free_block():
-                raise RuntimeError("Can't allocate new block for KV cache")
-
-            # Use the same block for all seqs in beam if share_across_beam
-            if block is None or share_across_beam == False:
-                block = self.free_blocks.pop(0)
+            if block_idx is None or not share_across_beam:
+                block_idx = self._pop_free_block()
             # Add one reference to the block
-            block.add_link()
-            self.allocated_blocks[owner][bi].append(block)
+            self.ref_counts[block_idx] += 1
+            self._assign(slot, bi, block_linear_idx, block_idx)
+        self.num_seq_blocks[slot] += 1
 
     def replace_shared_block(self, owner: GenerationSequence, block_idx: int):
         """
         Replace the shared block.
         Free the shared block, and allocate blocks with share_across_beam=False
         """
-        if not self.allocated_blocks[owner][0][block_idx].is_shared():
+        slot = self._slots[owner]
+        shared_block_idx = int(self.block_tables[slot, 0, block_idx])
+        if self.ref_counts[shared_block_idx] <= 1:
+            # The block is going to be overwritten, don't reuse it anymore
+            if shared_block_idx in self._cached_nodes:
+                self._uncache(shared_block_idx)
             return
 
         # Free shared block
-        for bi in range(self.beam_width):
-            block = self.allocated_blocks[owner][bi][block_idx]
-            block.remove_link()
-            if not block.has_link():
-                self.free_blocks.append(block)
+        self._release(self.block_tables[slot, :, block_idx].copy())
 
         # Allocate new block
         for bi in range(self.beam_width):
             if not self.has_free_block():
                 raise RuntimeError("Can't allocate new block for KV cache")
-            block = self.free_blocks.pop(0)
-            block.add_link()
-            self.allocated_blocks[owner][bi][block_idx] = block
+            new_block_idx = self._pop_free_block()
+            self.ref_counts[new_block_idx] += 1
+            self._assign(slot, bi, block_idx, new_block_idx)
         return
 
     def free(self, owner: GenerationSequence):
@@ -166,22 +409,69 @@ class BlocksManager(object):
         Moves blocks with ref_count == 0 to free.
         Removes owner from allocated blocks.
         """
-        for bi in range(self.beam_width):
-            for block in self.allocated_blocks[owner][bi]:
-                # Move block to free if no one refers to it
-                block.remove_link()
+        slot = self._slots.pop(owner)
+        num_blocks = self.num_seq_blocks[slot]
+        self._release(self.block_tables[slot, :, :num_blocks].ravel())
+
+        # Reset the slot
+        self.block_tables[slot, :, :num_blocks] = -1
+        self.pointers[:, slot, :, :, :num_blocks] = 0
+        self.num_seq_blocks[slot] = 0
+        self._free_slots.append(slot)
+
+    def match_prefix(self, owner: GenerationSequence,
+                     token_blocks: Sequence[Tuple[int, ...]]) -> int:
+        """
+        Attaches the longest chain of cached blocks matching token_blocks
+        to the owner, which mustn't have blocks yet.
+        The matched blocks are shared across beam.
+        Returns number of matched blocks
+        """
+        slot = self._get_slot(owner)
+        assert self.num_seq_blocks[slot] == 0
+
+        node = self.block_tree
+        num_matched = 0
+        for tokens in token_blocks:
+            node = node.children.get(tokens)
+            if node is None:
+                break
+            self._evictable_blocks.pop(node.block_idx, None)
+            self.ref_counts[node.block_idx] += self.beam_width
+            for bi in range(self.beam_width):
+                self._assign(slot, bi, num_matched, node.block_idx)
+            num_matched += 1
+        self.num_seq_blocks[slot] = num_matched
+        return num_matched
 
-                # Move block to free if no one refers to it
-                if not block.has_link():
-                    self.free_blocks.append(block)
-        # Remove owner from allocated blocks
-        self.allocated_blocks.pop(owner)
+    def register_blocks(self, owner: GenerationSequence,
+                        token_blocks: Sequence[Tuple[int, ...]]):
+        """
+        Registers the first blocks of the owner in the block tree,
+        token_blocks are the tokens stored in each of them.
+        Blocks must be full and shared across beam.
+        """
+        slot = self._slots[owner]
+        assert len(token_blocks) <= self.num_seq_blocks[slot]
+
+        node = self.block_tree
+        for block_linear_idx, tokens in enumerate(token_blocks):
+            child = node.children.get(tokens)
+            if child is None:
+                block_idx = int(self.block_tables[slot, 0, block_linear_idx])
+                if block_idx in self._cached_nodes:
+                    # The block is already cached with another prefix
+                    break
+                child = BlockTreeNode(tokens, block_idx, node)
+                node.children[tokens] = child
+                self._cached_nodes[block_idx] = child
+            node = child
 
     def get_number_blocks(self, owner: GenerationSequence) -> int:
         """
         Returns number of blocks allocated to the sequence owner
         """
-        return len(self.allocated_blocks[owner][0])
+        return int(self.num_seq_blocks[self._slots[owner]])
 
     def get_mempool_pointer(self, block_idx: int, pool: torch.Tensor,
                             elts_per_block: int) -> int:
@@ -191,6 +481,15 @@ class BlocksManager(object):
         return pool.data_ptr(
         ) + block_idx * elts_per_block * self._sizeof[pool.dtype]
 
+    def _batch_slots(self) -> np.ndarray:
+        """
+        Returns the slots of the owners ordered by their batch idx
+        """
+        batch_slots = np.empty(len(self._slots), dtype=np.int64)
+        for owner, slot in self._slots.items():
+            batch_slots[owner.get_batch_idx()] = slot
+        return batch_slots
+
     def get_pointer_array(self, pool_idx: int, beam_width: int) -> torch.Tensor:
         """
         Returns array of [batch size, beam_width, 2, max_blocks_per_seq] of poitners
@@ -198,29 +497,21 @@ class BlocksManager(object):
         """
         assert (beam_width <= self.beam_width)
 
-        def create_nested_list(dims):
-            """Recursive function to generate nested list."""
-            if len(dims) == 1:
-                return [0 for _ in range(dims[0])]
-            return [create_nested_list(dims[1:]) for _ in range(dims[0])]
-
-        pointer_array = create_nested_list(
-            (len(self.allocated_blocks), beam_width, 2,
-             self.max_blocks_per_seq))
-
-        for owner, beams_blocks in self.allocated_blocks.items():
-            for bi in range(beam_width):
-                for block_linear_idx, block in enumerate(beams_blocks[bi]):
-                    # K cache pointers
-                    pointer_array[owner.get_batch_idx(
-                    )][bi][0][block_linear_idx] = block.get_k_ptr(pool_idx)
-                    # V cache pointers
-                    pointer_array[owner.get_batch_idx(
-                    )][bi][1][block_linear_idx] = block.get_v_ptr(pool_idx)
-
-        self.pointer_array = torch.tensor(pointer_array, dtype=torch.int64)
+        self.pointer_array = torch.from_numpy(
+            self.pointers[pool_idx, self._batch_slots(), :beam_width])
         return self.pointer_array
 
+    def get_pointer_arrays(self, beam_width: int) -> List[torch.Tensor]:
+        """
+        Returns arrays of [batch size, beam_width, 2, max_blocks_per_seq] of
+        pointers to the allocated blocks for all memory pools
+        """
+        assert (beam_width <= self.beam_width)
+
+        pointer_arrays = torch.from_numpy(
+            self.pointers[:, self._batch_slots(), :beam_width])
+        return list(pointer_arrays.unbind(0))
+
     def get_continous_caches(self, pool_idx: int) -> torch.Tensor:
         """
         Returns countinous KV caches.
@@ -230,30 +521,30 @@ class BlocksManager(object):
 
         elts_per_block = self.elts_per_blocks[pool_idx]
         pool = self.memory_pools[pool_idx].flatten()
-        continous_kv_cache = torch.zeros(len(self.allocated_blocks),
+        continous_kv_cache = torch.zeros(len(self._slots),
                                          2,
                                          self.max_blocks_per_seq *
                                          elts_per_block,
                                          dtype=pool.dtype,
                                          device="cuda")
-        for owner, beam_blocks in self.allocated_blocks.items():
-            for bi in range(self.beam_width):
-                for block_linear_idx, block in enumerate(beam_blocks[bi]):
-                    # The batch index.
-                    batch_idx = owner.get_batch_idx()
-                    # The first index in the sequence.
-                    block_offset = block_linear_idx * elts_per_block
-                    # The first index in the pool for K.
-                    k_start = block.idx * elts_per_block
-                    # The first index in the pool for V.
-                    v_start = k_start + self.blocks * elts_per_block
-
-                    continous_kv_cache[batch_idx][0][
-                        block_offset:block_offset +
-                        elts_per_block] = pool[k_start:k_start + elts_per_block]
-                    continous_kv_cache[batch_idx][1][
-                        block_offset:block_offset +
-                        elts_per_block] = pool[v_start:v_start + elts_per_block]
+        for owner, slot in self._slots.items():
+            # The batch index.
+            batch_idx = owner.get_batch_idx()
+            for block_linear_idx, block_idx in enumerate(
+                    self.block_tables[slot, 0, :self.num_seq_blocks[slot]]):
+                # The first index in the sequence.
+                block_offset = block_linear_idx * elts_per_block
+                # The first index in the pool for K.
+                k_start = int(block_idx) * elts_per_block
+                # The first index in the pool for V.
+                v_start = k_start + self.blocks * elts_per_block
+
+                continous_kv_cache[batch_idx][
+                    0][block_offset:block_offset +
+                       elts_per_block] = pool[k_start:k_start + elts_per_block]
+                continous_kv_cache[batch_idx][
+                    1][block_offset:block_offset +
+                       elts_per_block] = pool[v_start:v_start + elts_per_block]
 
         return continous_kv_cache
 
@@ -268,7 +559,8 @@ class KVCacheManager(object):
                  max_attention_window_size: int,
                  sink_token_len: int,
                  beam_width: int = 1,
-                 use_one_more_block: bool = False):
+                 use_one_more_block: bool = False,
+                 enable_block_reuse: bool = False):
 
         self.blocks_manager = BlocksManager(
             memory_pools=memory_pools,
@@ -280,13 +572,11 @@ class KVCacheManager(object):
         self.max_attention_window_size = max_attention_window_size
         self.sink_token_len = sink_token_len
         self.beam_width = beam_width
+        self.enable_block_reuse = enable_block_reuse
 
         # The sink tokens are not stored into the same block with other tokens.
         # Need to add the bubble after the sink tokens.
-        if sink_token_len % tokens_per_block == 0:
-            self.bubble_len = 0
-        else:
-            self.bubble_len = tokens_per_block - sink_token_len % tokens_per_block
+        self.bubble_len = sink_bubble_len(sink_token_len, tokens_per_block)
 
         # Token num in the sink blocks
         self.sink_block_token_num = self.sink_token_len + self.bubble_len
@@ -296,40 +586,72 @@ class KVCacheManager(object):
         if use_one_more_block:
             self.max_token_num += self.tokens_per_block
 
-        self.lens = []
+        self.lens = np.zeros(0, dtype=np.int64)
         self.sequences = []
 
+        # Full context blocks of the new sequences, they are cached once
+        # the context phase has filled them
+        self.pending_blocks = {}
+        self.num_reused_tokens = 0
+
+    @classmethod
+    def from_memory_plan(cls,
+                         memory_pools: List[torch.Tensor],
+                         plan,
+                         enable_block_reuse: bool = False):
+        """
+        Creates the manager of the KV cache sized by a MemoryPlan, the memory
+        pools having plan.max_num_blocks blocks.
+        """
+        return cls(memory_pools,
+                   blocks=plan.max_num_blocks,
+                   tokens_per_block=plan.tokens_per_block,
+                   max_blocks_per_seq=plan.max_blocks_per_seq,
+                   max_attention_window_size=plan.max_attention_window_size,
+                   sink_token_len=plan.sink_token_len,
+                   beam_width=plan.beam_width,
+                   use_one_more_block=plan.use_one_more_block,
+                   enable_block_reuse=enable_block_reuse)
+
     def step(self, finished: List[bool]):
         """
         Iterate to the next generation step.
         Add new blocks where needed and clear finished sequences.
         """
-        for seq in self.sequences:
-            batch_idx = seq.get_batch_idx()
-            # Enable cyclic kv cache when it exceeds the max_token_num
-            cyclic_token_num = self.max_token_num - self.sink_block_token_num
-            next_token_idx_in_cache = self.sink_block_token_num + \
-                        (self.lens[batch_idx] - self.sink_block_token_num) % cyclic_token_num
-            if not finished[batch_idx] and (
-                    next_token_idx_in_cache % self.tokens_per_block == 0 or
-                (next_token_idx_in_cache - self.sink_block_token_num) %
-                    cyclic_token_num == 0):
-                if self.lens[batch_idx] < self.max_token_num:
-                    self.blocks_manager.allocate(seq)
-                elif self.beam_width > 1:
-                    # Get next block index
-                    next_block_idx = next_token_idx_in_cache // self.tokens_per_block
-                    # Replace the shared block with the unshared ones
-                    self.blocks_manager.replace_shared_block(
-                        seq, next_block_idx)
-
-            self.lens[batch_idx] += 1
+        for seq, token_blocks in self.pending_blocks.items():
+            self.blocks_manager.register_blocks(seq, token_blocks)
+        self.pending_blocks.clear()
+
+        finished = np.asarray(finished, dtype=bool)
+        # Enable cyclic kv cache when it exceeds the max_token_num
+        cyclic_token_num = self.max_token_num - self.sink_block_token_num
+        next_token_idx_in_cache = self.sink_block_token_num + \
+                    (self.lens - self.sink_block_token_num) % cyclic_token_num
+        needs_block = ~finished & (
+            (next_token_idx_in_cache % self.tokens_per_block == 0) |
+            ((next_token_idx_in_cache - self.sink_block_token_num) %
+             cyclic_token_num == 0))
+        # Sequences are kept in batch order, so the batch idx is the position
+        for batch_idx in np.flatnonzero(needs_block):
+            seq = self.sequences[batch_idx]
+            if self.lens[batch_idx] < self.max_token_num:
+                self.blocks_manager.allocate(seq)
+            elif self.beam_width > 1 or self.enable_block_reuse:
+                # Get next block index
+                next_block_idx = int(next_token_idx_in_cache[batch_idx] //
+                                     self.tokens_per_block)
+                # Replace the shared block with the unshared ones
+                self.blocks_manager.replace_shared_block(seq, next_block_idx)
+
+        self.lens += 1
+
+        if not finished.any():
+            return
 
         # Remove finished sequences
-        for fi in range(len(finished)):
-            if finished[fi]:
-                self.blocks_manager.free(self.sequences[fi])
-        self.lens = [l for l, f in zip(self.lens, finished) if not f]
+        for fi in np.flatnonzero(finished):
+            self.blocks_manager.free(self.sequences[fi])
+        self.lens = self.lens[~finished]
 
         # Remap sequence ids
         new_sequences = []
@@ -341,12 +663,18 @@ class KVCacheManager(object):
                 batch_idx += 1
         self.sequences = new_sequences
 
-    def add_sequence(self, sequence: GenerationSequence, context_len: int):
+    def add_sequence(self,
+                     sequence: GenerationSequence,
+                     context_len: int,
+                     input_ids: Optional[Sequence[int]] = None) -> int:
         """
-        Add sequence to the manager and allocate minimum amount of blocks for context
+        Add sequence to the manager and allocate minimum amount of blocks for context.
+        With enable_block_reuse, the cached blocks matching the prefix of input_ids
+        are attached to the sequence.
+        Returns number of context tokens which are already in the KV cache
         """
         seq_len = context_len + self.bubble_len
-        self.lens.append(seq_len)
+        self.lens = np.append(self.lens, seq_len)
         self.sequences.append(sequence)
 
         # Get the final token index in kv cache
@@ -366,18 +694,33 @@ class KVCacheManager(object):
         if seq_len % self.tokens_per_block > 0:
             context_blocks += 1
 
+        # Reuse the cached blocks, the last context token is always computed.
+        # Sink tokens and cyclic kv cache change the block layout, skip them.
+        reused_blocks = 0
+        if self.enable_block_reuse and input_ids is not None and \
+                self.sink_block_token_num == 0 and seq_len == context_len:
+            input_ids = [int(token) for token in input_ids[:context_len]]
+            token_blocks = [
+                tuple(input_ids[i:i + self.tokens_per_block])
+                for i in range(0, context_len - self.tokens_per_block +
+                               1, self.tokens_per_block)
+            ]
+            reused_blocks = self.blocks_manager.match_prefix(
+                sequence,
+                token_blocks[:(context_len - 1) // self.tokens_per_block])
+            self.pending_blocks[sequence] = token_blocks
+
         # Allocate blocks
-        for i in range(context_blocks):
+        for i in range(reused_blocks, context_blocks):
             self.blocks_manager.allocate(
                 sequence, share_across_beam=i != unshared_block_idx)
 
+        reused_tokens = reused_blocks * self.tokens_per_block
+        self.num_reused_tokens += reused_tokens
+        return reused_tokens
+
     def get_pointer_arrays(self, beam_width: int) -> List[torch.Tensor]:
         """
         Returns arrays of pointers for all memory pools
         """
-        pointer_arrays = []
-        for pool in range(self.num_pools):
-            pointer_arrays.append(
-                self.blocks_manager.get_pointer_array(
-                    pool, beam_width).view(dtype=torch.int64))
-        return pointer_arrays
+        return self.blocks_manager.get_pointer_arrays(beam_width)
@@ -0,0 +1,181 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from typing import Dict, Optional, Sequence
+
+import torch
+
+
+def token_logprobs(logits: torch.Tensor,
+                   token_ids: torch.Tensor,
+                   vocab_size: Optional[int] = None) -> torch.Tensor:
+    """
+    Returns the log-probabilities of token_ids, logits are [..., vocab] and
+    token_ids [...]. The softmax is computed in float32, the padded vocabulary
+    entries beyond vocab_size are ignored.
+    """
+    if vocab_size is not None:
+        logits = logits[..., :vocab_size]
+    logprobs = logits.log_softmax(dim=-1, dtype=torch.float32)
+    return logprobs.gather(-1, token_ids.long().unsqueeze(-1)).squeeze(-1)
+
+
+class LogitsCapture(object):
+    """
+    Reduces the logits of every generation step on the fly, instead of
+    keeping a copy of the [batch, beam, vocab] logits per step as
+    gather_all_token_logits does.
+
+    The outputs are written in buffers preallocated for max_new_tokens steps:
+        token_logprobs: [batch, beam, max_new_tokens], the log-probability of
+            the generated tokens.
+        top_k_ids, top_k_logprobs: [batch, beam, max_new_tokens, top_k], the
+            most likely tokens of each step.
+        nll, num_tokens: [batch, beam], the running negative log-likelihood
+            of the generated tokens, until the end token.
+        candidate_logprobs: [batch, beam, max_new_tokens, len(candidate_ids)],
+            the log-probability of the candidate_ids tokens at each step, the
+            answer choices of a multiple-choice question for instance.
+
+    As for the generation logits, a beam keeps the values of the beam that
+    had its index at each step, they are not reordered along the beams
+    selected by the beam search.
+    """
+
+    def __init__(self,
+                 top_k: int = 0,
+                 output_token_logprobs: bool = True,
+                 output_nll: bool = True,
+                 candidate_ids: Optional[Sequence[int]] = None):
+        self.top_k = top_k
+        self.output_token_logprobs = output_token_logprobs
+        self.output_nll = output_nll
+        self.candidate_ids = list(
+            candidate_ids) if candidate_ids is not None else None
+        self.vocab_size = None
+        self.num_steps = 0
+        self.token_logprobs = None
+        self.top_k_ids = None
+        self.top_k_logprobs = None
+        self.nll = None
+        self.num_tokens = None
+        self.candidate_logprobs = None
+        self._candidate_index = None
+        self._finished = None
+        self._buffers_key = None
+
+    def setup(self,
+              batch_size: int,
+              beam_width: int,
+              max_new_tokens: int,
+              vocab_size: Optional[int] = None,
+              device='cuda'):
+        self.vocab_size = vocab_size
+        self.num_steps = 0
+        shape = (batch_size, beam_width, max_new_tokens)
+        if self._buffers_key != (shape, torch.device(device)):
+            # The buffers are reused by the generations of the same shape
+            self._buffers_key = (shape, torch.device(device))
+            self.token_logprobs = torch.zeros(
+                shape, dtype=torch.float32,
+                device=device) if self.output_token_logprobs else None
+            self.top_k_ids = torch.zeros(
+                shape + (self.top_k, ), dtype=torch.int32,
+                device=device) if self.top_k > 0 else None
+            self.top_k_logprobs = torch.zeros(
+                shape + (self.top_k, ), dtype=torch.float32,
+                device=device) if self.top_k > 0 else None
+            self.nll = torch.zeros(shape[:2],
+                                   dtype=torch.float32,
+                                   device=device) if self.output_nll else None
+            self.num_tokens = torch.zeros(
+                shape[:2], dtype=torch.int32,
+                device=device) if self.output_nll else None
+            if self.candidate_ids is not None:
+                self.candidate_logprobs = torch.zeros(
+                    shape + (len(self.candidate_ids), ),
+                    dtype=torch.float32,
+                    device=device)
+                self._candidate_index = torch.tensor(self.candidate_ids,
+                                                     dtype=torch.int64,
+                                                     device=device)
+            self._finished = torch.zeros(shape[:2],
+                                         dtype=torch.bool,
+                                         device=device)
+        else:
+            if self.nll is not None:
+                self.nll.zero_()
+                self.num_tokens.zero_()
+            self._finished.zero_()
+
+    def capture(self, step: int, logits: torch.Tensor, new_tokens: torch.Tensor,
+                finished: torch.Tensor):
+        """
+        Reduces the logits of a step, [batch * beam, vocab], where new_tokens
+        were sampled, finished tells the sequences that are done after it.
+        """
+        batch_size, beam_width = self._finished.shape
+        if self.vocab_size is not None:
+            logits = logits[..., :self.vocab_size]
+        logprobs = logits.reshape(batch_size, beam_width,
+                                  -1).log_softmax(dim=-1, dtype=torch.float32)
+
+        if self.output_token_logprobs or self.output_nll:
+            chosen = logprobs.gather(
+                -1,
+                new_tokens.view(batch_size, beam_width, 1).long()).squeeze(-1)
+            if self.output_token_logprobs:
+                self.token_logprobs[:, :, step] = chosen
+            if self.output_nll:
+                # The step of the end token is the last one counted
+                active = ~self._finished
+                self.nll -= chosen * active
+                self.num_tokens += active
+        if self.top_k > 0:
+            values, indices = logprobs.topk(self.top_k, dim=-1)
+            self.top_k_logprobs[:, :, step] = values
+            self.top_k_ids[:, :, step] = indices
+        if self.candidate_ids is not None:
+            self.candidate_logprobs[:, :, step] = logprobs.index_select(
+                -1, self._candidate_index)
+
+        self._finished.copy_(finished.view(batch_size, beam_width) != 0)
+        self.num_steps = step + 1
+
+    def perplexity(self) -> torch.Tensor:
+        """
+        Returns the [batch, beam] perplexity of the generated tokens.
+        """
+        assert self.output_nll, "output_nll is disabled"
+        return torch.exp(self.nll / self.num_tokens.clamp(min=1))
+
+    def outputs(self) -> Dict[str, torch.Tensor]:
+        """
+        Returns the buffers trimmed to the generated steps.
+        """
+        outputs = {}
+        if self.output_token_logprobs:
+            outputs['token_logprobs'] = self.token_logprobs[:, :, :self.
+                                                            num_steps]
+        if self.top_k > 0:
+            outputs['top_k_ids'] = self.top_k_ids[:, :, :self.num_steps]
+            outputs['top_k_logprobs'] = self.top_k_logprobs[:, :, :self.
+                                                            num_steps]
+        if self.output_nll:
+            outputs['nll'] = self.nll
+            outputs['num_tokens'] = self.num_tokens
+        if self.candidate_ids is not None:
+            outputs['candidate_logprobs'] = self.candidate_logprobs[:, :, :self.
+                                                                    num_steps]
+        return outputs
@@ -1,12 +1,28 @@
 import json
 import os
+import time
+from collections import OrderedDict
 from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import numpy as np
 import torch
 
 from .._utils import (_str_to_np_dict, fromfile, numpy_to_torch,
                       str_dtype_to_torch)
+from ..logger import logger
+
+
+def load_hf_lora_weights(lora_dir) -> Dict[str, torch.Tensor]:
+    '''
+    Loads adapter_model.safetensors, or adapter_model.bin, of a HF LoRA
+    adapter to the host.
+    '''
+    if os.path.exists(f"{lora_dir}/adapter_model.safetensors"):
+        import safetensors.torch
+        return safetensors.torch.load_file(
+            f"{lora_dir}/adapter_model.safetensors")
+    return torch.load(f"{lora_dir}/adapter_model.bin", map_location="cpu")
 
 
 class LoraConfig(object):
@@ -56,8 +72,10 @@ class LoraConfig(object):
 
         lm_head_weight = None
         embedding_weight = None
-        if os.path.exists(f"{hf_lora_dir}/adapter_model.bin"):
-            lora_weight = torch.load(f"{hf_lora_dir}/adapter_model.bin")
+        if os.path.exists(
+                f"{hf_lora_dir}/adapter_model.safetensors") or os.path.exists(
+                    f"{hf_lora_dir}/adapter_model.bin"):
+            lora_weight = load_hf_lora_weights(hf_lora_dir)
 
             if adapter_config["modules_to_save"] is not None:
                 if "lm_head" in adapter_config["modules_to_save"]:
@@ -73,9 +91,48 @@ class LoraConfig(object):
                    embedding_weight, hf_modules_to_trtllm_modules)
 
 
+# TRT-LLM LoRA module: (HF module, weight split across TP ranks, split dim)
+_hf_lora_modules = {
+    "attn_q": ("self_attn.q_proj", "lora_B", 0),
+    "attn_k": ("self_attn.k_proj", "lora_B", 0),
+    "attn_v": ("self_attn.v_proj", "lora_B", 0),
+    "attn_dense": ("self_attn.o_proj", "lora_A", 1),
+    "mlp_h_to_4h": ("mlp.gate_proj", "lora_B", 0),
+    "mlp_gate": ("mlp.up_proj", "lora_B", 0),
+    "mlp_4h_to_h": ("mlp.down_proj", "lora_A", 1),
+}
+
+
+class HostLoraAdapter(object):
+    '''
+    LoRA weights of one adapter, split for the local TP rank and converted to
+    the model dtype, in host memory.
+    '''
+
+    def __init__(self, low_ranks: List[Dict[str, int]],
+                 weights: Dict[Tuple[int, str], Tuple[torch.Tensor,
+                                                      torch.Tensor]]):
+        self.low_ranks = low_ranks
+        self.weights = weights
+        self.nbytes = sum(t_in.nbytes + t_out.nbytes
+                          for t_in, t_out in weights.values())
+
+
 class LoraManager(object):
+    '''
+    Registry of LoRA adapters.
 
-    def __init__(self):
+    HF adapters are registered by uid and loaded on demand: the weights are
+    split for the local TP rank once and kept in a host cache bounded by
+    max_host_cache_size bytes. prepare() makes the adapters of a batch
+    resident on the device, evicting the least recently used adapters beyond
+    max_resident_adapters. None doesn't bound the cache or the residency.
+    '''
+
+    def __init__(self,
+                 max_resident_adapters: Optional[int] = None,
+                 max_host_cache_size: Optional[int] = None,
+                 device: str = 'cuda'):
         self._lora_uid_to_key = {}
         '''
         _lora_uid_to_low_ranks: dict[str -> List[dict[str -> int]]]
@@ -112,6 +169,27 @@ class LoraManager(object):
         self._lora_weights = []
         self._lora_weights_pointers_list = []
 
+        assert max_resident_adapters is None or max_resident_adapters > 0
+        self.max_resident_adapters = max_resident_adapters
+        self.max_host_cache_size = max_host_cache_size
+        self.device = device
+        self._model_config = None
+        self._tp_size = 1
+        self._tp_rank = 0
+        # uid -> HF adapter directory
+        self._adapter_dirs = {}
+        # uid -> HostLoraAdapter, in LRU order
+        self._host_cache = OrderedDict()
+        self._host_cache_size = 0
+        # uid -> device tensors of the resident adapters, in LRU order
+        self._resident = OrderedDict()
+        self.stats = dict(hits=0,
+                          misses=0,
+                          host_hits=0,
+                          host_misses=0,
+                          evictions=0,
+                          load_time=0.0)
+
     def load_from_ckpt(self, model_dir, model_config, runtime_mapping,
                        ckpt_source):
         if ckpt_source == "hf":
@@ -190,6 +268,9 @@ class LoraManager(object):
 
     def load_from_hf(self, model_dir, model_config, runtime_mapping):
         '''
+        Registers the HF adapter in model_dir as uid "0", or every adapter in
+        the subdirectories of model_dir with the subdirectory name as uid.
+
         lora config of https://huggingface.co/hfl/chinese-alpaca-2-lora-7b
         {
             "base_model_name_or_path": "/Llama-2-7b-hf",
@@ -219,7 +300,7 @@ class LoraManager(object):
 
         }
 
-        keys in adapter_model.bin:
+        keys in adapter_model.bin or adapter_model.safetensors:
             base_model.model.model.layers.0.self_attn.q_proj.lora_A.weight torch.Size([64, 4096])
             base_model.model.model.layers.0.self_attn.q_proj.lora_B.weight torch.Size([4096, 64])
             base_model.model.model.layers.0.self_attn.k_proj.lora_A.weight torch.Size([64, 4096])
@@ -237,109 +318,162 @@ class LoraManager(object):
             ...
 
         '''
-        tp_size = runtime_mapping.tp_size
-        tp_rank = runtime_mapping.tp_rank
-        lora_model = torch.load(f"{model_dir}/adapter_model.bin")
-
-        with open(f"{model_dir}/adapter_config.json", 'r') as f:
-            hf_config = json.load(f)
-
-        lora_target_modules = model_config.lora_target_modules
-        dtype = model_config.dtype
-
-        ranks = [0, hf_config["r"]]
-        uids = ["-1", "0"]  # TODO should be lora from some config
-
-        for uid, rank in zip(uids, ranks):
-            self._lora_uid_to_low_ranks[uid] = []
-            for layer_idx in range(model_config.num_layers):
-                self._lora_weights_pointers_list.append({})
-                self._lora_weights_pointers_list[layer_idx].update({uid: {}})
-
-                self._lora_uid_to_low_ranks[uid].append({})
+        self._model_config = model_config
+        self._tp_size = runtime_mapping.tp_size
+        self._tp_rank = runtime_mapping.tp_rank
 
-                prefix = "base_model.model.model.layers"
-                for lora_module in lora_target_modules:
-                    if uid == "-1":
-                        self._lora_uid_to_low_ranks[uid][layer_idx][
-                            lora_module] = 0
-                        continue
-
-                    if lora_module == "attn_q" or lora_module == "attn_k" or lora_module == "attn_v":
-                        name = f"{prefix}.{layer_idx}.{lora_module.replace('attn_', 'self_attn.')}_proj"
-                        # not split
-                        t_in = lora_model[f"{name}.lora_A.weight"]
-                        # split by column
-                        t_out = lora_model[f"{name}.lora_B.weight"]
-                        assert t_out.shape[0] % tp_size == 0
-                        t_out = torch.split(t_out,
-                                            t_out.shape[0] // tp_size,
-                                            dim=0)[tp_rank].contiguous()
-
-                    elif lora_module == "attn_dense":
-                        # split by row
-                        t_in = lora_model[
-                            f"{prefix}.{layer_idx}.self_attn.o_proj.lora_A.weight"]
-                        assert t_in.shape[1] % tp_size == 0
-                        t_in = torch.split(t_in,
-                                           t_in.shape[1] // tp_size,
-                                           dim=1)[tp_rank].contiguous()
-                        # not split
-                        t_out = lora_model[
-                            f"{prefix}.{layer_idx}.self_attn.o_proj.lora_B.weight"]
-
-                    elif lora_module == "mlp_h_to_4h":
-                        # not split
-                        t_in = lora_model[
-                            f"{prefix}.{layer_idx}.mlp.gate_proj.lora_A.weight"]
-                        # split by column
-                        t_out = lora_model[
-                            f"{prefix}.{layer_idx}.mlp.gate_proj.lora_B.weight"]
-                        assert t_out.shape[0] % tp_size == 0
-                        t_out = torch.split(t_out,
-                                            t_out.shape[0] // tp_size,
-                                            dim=0)[tp_rank].contiguous()
-
-                    elif lora_module == "mlp_gate":
-                        # not split
-                        t_in = lora_model[
-                            f"{prefix}.{layer_idx}.mlp.up_proj.lora_A.weight"]
-                        # split by column
-                        t_out = lora_model[
-                            f"{prefix}.{layer_idx}.mlp.up_proj.lora_B.weight"]
-                        assert t_out.shape[0] % tp_size == 0
-                        t_out = torch.split(t_out,
-                                            t_out.shape[0] // tp_size,
-                                            dim=0)[tp_rank].contiguous()
-
-                    elif lora_module == "mlp_4h_to_h":
-                        # split by row
-                        t_in = lora_model[
-                            f"{prefix}.{layer_idx}.mlp.down_proj.lora_A.weight"]
-                        assert t_in.shape[0] % tp_size == 0
-                        t_in = torch.split(t_in,
-                                           t_in.shape[1] // tp_size,
-                                           dim=1)[tp_rank].contiguous()
-                        # not split
-                        t_out = lora_model[
-                            f"{prefix}.{layer_idx}.mlp.down_proj.lora_B.weight"]
-
-                    t_in = t_in.cuda().contiguous()
-                    t_out = t_out.cuda().contiguous()
-                    t_in = t_in.float().to(str_dtype_to_torch(dtype))
-                    t_out = t_out.float().to(str_dtype_to_torch(dtype))
-                    self._lora_weights_pointers_list[layer_idx][uid].update(
-                        {lora_module: [t_in.data_ptr(),
-                                       t_out.data_ptr()]})
+        num_layers = model_config.num_layers
+        while len(self._lora_weights_pointers_list) < num_layers:
+            self._lora_weights_pointers_list.append({})
+        self._lora_uid_to_low_ranks["-1"] = [{
+            lora_module: 0
+            for lora_module in model_config.lora_target_modules
+        } for _ in range(num_layers)]
+        for layer_idx in range(num_layers):
+            self._lora_weights_pointers_list[layer_idx]["-1"] = {}
 
-                    assert t_in.shape[0] == int(hf_config["r"])
-                    self._lora_uid_to_low_ranks[uid][layer_idx][
-                        lora_module] = int(hf_config["r"])
+        model_dir = Path(model_dir)
+        if (model_dir / "adapter_config.json").exists():
+            self.add_hf_adapter("0", model_dir)
+        else:
+            for adapter_dir in sorted(model_dir.iterdir()):
+                if (adapter_dir / "adapter_config.json").exists():
+                    self.add_hf_adapter(adapter_dir.name, adapter_dir)
 
-                    # prevent torch free this buffer
-                    self._lora_weights.append(t_in)
-                    self._lora_weights.append(t_out)
+    def add_hf_adapter(self, uid: str, adapter_dir):
+        '''
+        Registers a HF adapter, it is loaded when a batch first needs it.
+        '''
+        assert isinstance(uid, str) and uid != "-1"
+        assert self._model_config is not None, \
+            "load_from_hf must be called before adding adapters"
+        self.remove_adapter(uid)
+        self._adapter_dirs[uid] = Path(adapter_dir)
+
+    def remove_adapter(self, uid: str):
+        if uid in self._resident:
+            self._evict(uid)
+        host = self._host_cache.pop(uid, None)
+        if host is not None:
+            self._host_cache_size -= host.nbytes
+        self._adapter_dirs.pop(uid, None)
+
+    def prepare(self, uids: Sequence[str]):
+        '''
+        Makes the adapters of a batch resident on the device, so that
+        uid_to_low_ranks and lora_weights_pointers_list hold their entries.
+        '''
+        uids = [
+            uid for uid in dict.fromkeys(uids)
+            if uid is not None and uid != "-1"
+        ]
+        if self.max_resident_adapters is not None and len(
+                uids) > self.max_resident_adapters:
+            raise RuntimeError(
+                f"The batch needs {len(uids)} LoRA adapters but at most "
+                f"{self.max_resident_adapters} can be resident")
+
+        batch_uids = set(uids)
+        for uid in uids:
+            if uid in self._resident:
+                self._resident.move_to_end(uid)
+                self.stats['hits'] += 1
+            elif uid in self._adapter_dirs:
+                self.stats['misses'] += 1
+                self._make_resident(uid, batch_uids)
+            else:
+                # Loaded by load_from_nemo, always resident
+                assert uid in self._lora_uid_to_low_ranks, \
+                    f"Unknown LoRA uid {uid}"
+
+    def _make_resident(self, uid: str, batch_uids):
+        while self.max_resident_adapters is not None and len(
+                self._resident) >= self.max_resident_adapters:
+            victim = next(u for u in self._resident if u not in batch_uids)
+            self._evict(victim)
+
+        host = self._get_host_adapter(uid)
+        tensors = []
+        for layer_idx in range(self._model_config.num_layers):
+            pointers = {}
+            for lora_module in self._model_config.lora_target_modules:
+                weights = host.weights.get((layer_idx, lora_module))
+                if weights is None:
+                    pointers[lora_module] = [0, 0]
+                    continue
+                t_in, t_out = (t.to(self.device, non_blocking=True)
+                               for t in weights)
+                pointers[lora_module] = [t_in.data_ptr(), t_out.data_ptr()]
+                tensors += [t_in, t_out]
+            self._lora_weights_pointers_list[layer_idx][uid] = pointers
+        self._lora_uid_to_low_ranks[uid] = host.low_ranks
+        # prevent torch free these buffers
+        self._resident[uid] = tensors
+        logger.debug(f"LoRA adapter {uid} is resident")
+
+    def _evict(self, uid: str):
+        del self._resident[uid]
+        for pointers in self._lora_weights_pointers_list:
+            pointers.pop(uid, None)
+        self._lora_uid_to_low_ranks.pop(uid, None)
+        self.stats['evictions'] += 1
+
+    def _get_host_adapter(self, uid: str) -> HostLoraAdapter:
+        host = self._host_cache.get(uid)
+        if host is not None:
+            self._host_cache.move_to_end(uid)
+            self.stats['host_hits'] += 1
+            return host
+
+        self.stats['host_misses'] += 1
+        tik = time.time()
+        host = self._load_hf_adapter(self._adapter_dirs[uid])
+        self.stats['load_time'] += time.time() - tik
+
+        if self.max_host_cache_size is None or host.nbytes <= self.max_host_cache_size:
+            self._host_cache[uid] = host
+            self._host_cache_size += host.nbytes
+            while self.max_host_cache_size is not None and self._host_cache_size > self.max_host_cache_size:
+                _, evicted = self._host_cache.popitem(last=False)
+                self._host_cache_size -= evicted.nbytes
+        return host
+
+    def _load_hf_adapter(self, adapter_dir: Path) -> HostLoraAdapter:
+        lora_model = load_hf_lora_weights(adapter_dir)
+        tp_size = self._tp_size
+        tp_rank = self._tp_rank
+        dtype = str_dtype_to_torch(self._model_config.dtype)
+        pin_memory = torch.cuda.is_available()
+
+        prefix = "base_model.model.model.layers"
+        low_ranks = []
+        weights = {}
+        for layer_idx in range(self._model_config.num_layers):
+            low_ranks.append({})
+            for lora_module in self._model_config.lora_target_modules:
+                hf_module, split_name, split_dim = _hf_lora_modules[lora_module]
+                name = f"{prefix}.{layer_idx}.{hf_module}"
+                if f"{name}.lora_A.weight" not in lora_model:
+                    low_ranks[layer_idx][lora_module] = 0
+                    continue
+                # lora_A: [low_rank, in], lora_B: [out, low_rank]
+                split_weights = {}
+                for weight_name in ["lora_A", "lora_B"]:
+                    t = lora_model[f"{name}.{weight_name}.weight"]
+                    if weight_name == split_name:
+                        assert t.shape[split_dim] % tp_size == 0
+                        t = torch.split(t,
+                                        t.shape[split_dim] // tp_size,
+                                        dim=split_dim)[tp_rank]
+                    t = t.to(dtype).contiguous()
+                    split_weights[weight_name] = t.pin_memory(
+                    ) if pin_memory else t
+                t_in = split_weights["lora_A"]
+                t_out = split_weights["lora_B"]
+                weights[(layer_idx, lora_module)] = (t_in, t_out)
+                low_ranks[layer_idx][lora_module] = t_in.shape[0]
         del lora_model
+        return HostLoraAdapter(low_ranks, weights)
 
     def uid_to_key(self, uid: str):
         assert isinstance(uid, str)
@@ -351,7 +485,9 @@ class LoraManager(object):
 
     @property
     def lora_weights(self):
-        return self._lora_weights
+        return self._lora_weights + [
+            t for tensors in self._resident.values() for t in tensors
+        ]
 
     @property
     def lora_weights_pointers_list(self):
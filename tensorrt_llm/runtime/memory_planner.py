@@ -0,0 +1,237 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Sizes the KV cache of a rank from the PretrainedConfig and the BuildConfig,
+without deserializing an engine.
+
+The device memory is split into the weights, the activations of the engine,
+the LoRA weights, the prompt table and the KV cache, which gets a fraction of
+what is left, as the free_gpu_memory_fraction of the C++ runtime. The
+activations are estimated from the widest tensors of a decoder layer, the
+device_memory_size of a built engine can be given instead.
+"""
+import math
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+from ..models.pipeline_partition import (DTYPE_SIZES, decoder_layer_matrices,
+                                         weight_element_size)
+from ..plugin.plugin import ContextFMHAType
+from .kv_cache_manager import blocks_per_sequence
+
+MiB = 1 << 20
+
+
+@dataclass
+class MemoryPlan:
+    """
+    The device memory of one rank in bytes and the geometry of its KV cache.
+    Without paged KV cache, a block holds the whole attention window of a
+    sequence.
+    """
+    device_memory: int
+    weights: int
+    activations: int
+    lora: int
+    prompt_table: int
+    kv_cache: int
+    kv_block_size: int
+    max_num_blocks: int
+    tokens_per_block: int
+    max_attention_window_size: int
+    sink_token_len: int = 0
+    beam_width: int = 1
+    use_one_more_block: bool = False
+
+    @property
+    def free(self) -> int:
+        return self.device_memory - self.weights - self.activations - \
+            self.lora - self.prompt_table - self.kv_cache
+
+    @property
+    def max_blocks_per_seq(self) -> int:
+        return blocks_per_sequence(self.max_attention_window_size,
+                                   self.tokens_per_block, self.sink_token_len,
+                                   self.use_one_more_block)
+
+    def sequence_blocks(self, seq_len: int) -> int:
+        """
+        Returns the number of blocks of the beams of a sequence of seq_len
+        tokens, input and output.
+        """
+        return self.beam_width * blocks_per_sequence(
+            min(seq_len, self.max_attention_window_size), self.tokens_per_block,
+            self.sink_token_len, self.use_one_more_block)
+
+    def max_num_sequences(self,
+                          seq_lens: Optional[Sequence[int]] = None) -> int:
+        """
+        Returns the number of sequences whose KV cache fits at once, seq_lens
+        being a sample of the target length distribution, or the whole
+        attention window for each sequence if None. The max_batch_size of the
+        engine is not taken into account.
+        """
+        if seq_lens is None or len(seq_lens) == 0:
+            seq_lens = [self.max_attention_window_size]
+        mean_blocks = sum(
+            self.sequence_blocks(seq_len)
+            for seq_len in seq_lens) / len(seq_lens)
+        return int(self.max_num_blocks // max(mean_blocks, 1))
+
+    def __str__(self) -> str:
+        lines = [f'{"":<14} {"MiB":>10}']
+        for name in ('weights', 'activations', 'lora', 'prompt_table',
+                     'kv_cache', 'free'):
+            lines.append(f'{name:<14} {getattr(self, name) / MiB:>10.1f}')
+        lines.append(f'{"device_memory":<14} {self.device_memory / MiB:>10.1f}')
+        lines.append(
+            f'KV cache: {self.max_num_blocks} blocks of {self.tokens_per_block} '
+            f'tokens, {self.kv_block_size / MiB:.2f} MiB each, '
+            f'{self.max_blocks_per_seq} blocks per sequence, '
+            f'{self.max_num_sequences()} sequences of '
+            f'{self.max_attention_window_size} tokens')
+        return '\n'.join(lines)
+
+
+def weights_size(config) -> int:
+    """
+    Returns the bytes of the weights of the rank of config.mapping.
+    """
+    mapping = config.mapping
+    num_layers = len(mapping.pp_layers(config.num_hidden_layers))
+    layer_params = sum(
+        in_features * out_features
+        for in_features, out_features in decoder_layer_matrices(config))
+    weights = num_layers * layer_params * weight_element_size(
+        config) / mapping.tp_size
+
+    embedding = config.vocab_size * config.hidden_size * DTYPE_SIZES[
+        config.dtype]
+    if mapping.is_first_pp_rank():
+        weights += embedding / mapping.tp_size if getattr(
+            config, 'use_parallel_embedding', False) else embedding
+    if mapping.is_last_pp_rank():
+        weights += embedding / mapping.tp_size
+    return int(weights)
+
+
+def activations_size(config, build_config) -> int:
+    """
+    Estimates the activation memory of the engine of the rank of
+    config.mapping: the residual, the normalized hidden states and the widest
+    output of a decoder layer for max_num_tokens tokens, the attention scores
+    without the fused context attention and the logits on the last pp rank.
+    """
+    mapping = config.mapping
+    plugin_config = build_config.plugin_config
+    act_size = DTYPE_SIZES[config.dtype]
+    max_num_tokens = build_config.max_num_tokens or \
+        build_config.max_batch_size * build_config.max_input_len
+    num_tokens = max(max_num_tokens,
+                     build_config.max_batch_size * build_config.max_beam_width)
+
+    # qkv, and fc with gate for the gated activations
+    matrices = decoder_layer_matrices(config)
+    widest = max(matrices[0][1],
+                 sum(out_features for _, out_features in matrices[2:-1]))
+    activations = num_tokens * (2 * config.hidden_size +
+                                widest / mapping.tp_size) * act_size
+    if plugin_config.context_fmha_type == ContextFMHAType.disabled:
+        activations += build_config.max_batch_size * \
+            config.num_attention_heads / mapping.tp_size * \
+            build_config.max_input_len ** 2 * act_size
+    if mapping.is_last_pp_rank():
+        num_logits = num_tokens if build_config.gather_all_token_logits else \
+            build_config.max_batch_size * build_config.max_beam_width
+        activations += num_logits * config.vocab_size * DTYPE_SIZES[getattr(
+            config, 'logits_dtype', 'float32')]
+    return int(activations)
+
+
+def plan_memory(config,
+                build_config,
+                device_memory: int,
+                kv_dtype: Optional[str] = None,
+                free_gpu_memory_fraction: float = 0.9,
+                max_attention_window_size: Optional[int] = None,
+                sink_token_len: int = 0,
+                beam_width: Optional[int] = None,
+                lora_rank: int = 0,
+                num_lora_adapters: int = 0,
+                weights: Optional[int] = None,
+                activations: Optional[int] = None) -> MemoryPlan:
+    """
+    Plans the device memory of the rank of config.mapping.
+
+    device_memory is the memory budget of the rank in bytes, kv_dtype defaults
+    to config.kv_dtype and max_attention_window_size to max_input_len +
+    max_output_len. The LoRA weights of num_lora_adapters adapters of rank
+    lora_rank on all the linear layers of the decoder are kept on the device.
+    weights and activations, the sizes of a built engine and of its
+    device_memory_size, replace the estimates when given.
+    """
+    mapping = config.mapping
+    plugin_config = build_config.plugin_config
+    num_layers = len(mapping.pp_layers(config.num_hidden_layers))
+    act_size = DTYPE_SIZES[config.dtype]
+    beam_width = beam_width or build_config.max_beam_width
+    max_seq_length = build_config.max_input_len + build_config.max_output_len
+    max_attention_window_size = max_attention_window_size or max_seq_length
+
+    if weights is None:
+        weights = weights_size(config)
+    if activations is None:
+        activations = activations_size(config, build_config)
+    lora = num_lora_adapters * num_layers * lora_rank * sum(
+        in_features + out_features
+        for in_features, out_features in decoder_layer_matrices(
+            config)) * act_size // mapping.tp_size
+    prompt_table = build_config.max_prompt_embedding_table_size * \
+        config.hidden_size * act_size if mapping.is_first_pp_rank() else 0
+
+    # The kv heads are replicated when there are fewer of them than tp ranks
+    num_kv_heads = math.ceil(config.num_key_value_heads / mapping.tp_size)
+    head_size = config.hidden_size // config.num_attention_heads
+    token_size = num_layers * 2 * num_kv_heads * head_size * DTYPE_SIZES[
+        kv_dtype or getattr(config, 'kv_dtype', config.dtype)]
+    if plugin_config.paged_kv_cache:
+        tokens_per_block = plugin_config.tokens_per_block
+        use_one_more_block = beam_width > 1 and \
+            max_seq_length > max_attention_window_size
+    else:
+        tokens_per_block = max_attention_window_size
+        sink_token_len = 0
+        use_one_more_block = False
+    kv_block_size = token_size * tokens_per_block
+    # Without the plugin, the past and present KV caches are separate tensors
+    if not plugin_config.gpt_attention_plugin:
+        kv_block_size *= 2
+
+    available = device_memory - weights - activations - lora - prompt_table
+    max_num_blocks = int(
+        max(available, 0) * free_gpu_memory_fraction) // kv_block_size
+    return MemoryPlan(device_memory=device_memory,
+                      weights=weights,
+                      activations=activations,
+                      lora=lora,
+                      prompt_table=prompt_table,
+                      kv_cache=max_num_blocks * kv_block_size,
+                      kv_block_size=kv_block_size,
+                      max_num_blocks=max_num_blocks,
+                      tokens_per_block=tokens_per_block,
+                      max_attention_window_size=max_attention_window_size,
+                      sink_token_len=sink_token_len,
+                      beam_width=beam_width,
+                      use_one_more_block=use_one_more_block)
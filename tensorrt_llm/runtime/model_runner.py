@@ -31,6 +31,8 @@ from .generation import (ChatGLMGenerationSession, GenerationSession,
                          LogitsProcessor, LoraManager, ModelConfig,
                          QWenForCausalLMGenerationSession, SamplingConfig,
                          StoppingCriteria)
+from .logits_capture import LogitsCapture
+from .stream_deltas import StreamDelta
 
 
 def get_engine_name(model: str, dtype: str, tp_size: int, pp_size: int,
@@ -494,7 +496,9 @@ class ModelRunner(ModelRunnerMixin):
                  streaming: bool = False,
                  stopping_criteria: Optional[StoppingCriteria] = None,
                  logits_processor: Optional[LogitsProcessor] = None,
-                 **kwargs) -> Union[torch.Tensor, dict]:
+                 logits_capture: Optional[LogitsCapture] = None,
+                 stream_deltas: bool = False,
+                 **kwargs) -> Union[torch.Tensor, dict, StreamDelta]:
         """
         Generates sequences of token ids.
         The generation-controlling parameters are set in the sampling_config; it will be set to a default one if not passed.
@@ -519,6 +523,12 @@ class ModelRunner(ModelRunnerMixin):
                 Custom stopping criteria.
             logits_processor (LogitsProcessor):
                 Custom logits processors.
+            logits_capture (LogitsCapture):
+                Reduces the logits of each generation step into token logprobs, top-k alternatives or the running NLL.
+                The results are also returned in the dict when return_dict=True.
+            stream_deltas (bool):
+                In streaming mode, yields a StreamDelta of host tensors per step, the new token ids, the finished flags
+                and the lengths of the sequences, instead of the whole output_ids. Not supported with beam search.
             kwargs (Dict[str, Any]:
                 Ad hoc parametrization of sampling_config.
                 The passed **kwargs matching the sampling_config's attributes will override them.
@@ -528,6 +538,7 @@ class ModelRunner(ModelRunnerMixin):
                 If return_dict=True, the method returns a dict of output_ids,
                 sequence_lengths (if sampling_config.output_sequence_lengths=True),
                 context_logits and generation_logits (if self.gather_all_token_logits=True).
+                In streaming mode, a generator of them, or of StreamDelta if stream_deltas=True.
         """
         # Use sampling_config like HF's generation_config
         if sampling_config is None:
@@ -570,8 +581,10 @@ class ModelRunner(ModelRunnerMixin):
             streaming=streaming,
             stopping_criteria=stopping_criteria,
             logits_processor=logits_processor,
+            logits_capture=logits_capture,
+            stream_deltas=stream_deltas,
             **ptuning_kwargs)
-        if sampling_config.return_dict:
+        if sampling_config.return_dict and not stream_deltas:
             if streaming:
                 outputs = (self._prepare_outputs(curr_outputs, input_lengths)
                            for curr_outputs in outputs)
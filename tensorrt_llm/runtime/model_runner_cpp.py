@@ -14,6 +14,7 @@
 # limitations under the License.
 
 import copy
+import json
 from pathlib import Path
 from typing import List, Optional, Union
 
@@ -30,6 +31,26 @@ from .generation import (LogitsProcessor, LoraManager, SamplingConfig,
                          StoppingCriteria)
 from .model_runner import ModelRunnerMixin
 
+
+def _check_pp_partition(config: dict):
+    # The C++ runtime gives every pipeline stage num_layers / pp_size layers
+    pretrained_config = config.get('pretrained_config')
+    if pretrained_config is None:
+        return
+    mapping = pretrained_config.get('mapping', {})
+    pp_size = mapping.get('pp_size', 1)
+    num_layers = pretrained_config['num_hidden_layers']
+    pp_partition = mapping.get('pp_partition')
+    if num_layers % pp_size or (pp_partition is not None
+                                and any(n != num_layers // pp_size
+                                        for n in pp_partition)):
+        raise ValueError(
+            f"The {num_layers} layers of the engine are split unevenly between "
+            f"the {pp_size} pipeline stages (pp_partition {pp_partition}), "
+            "which is not supported by ModelRunnerCpp, use ModelRunner instead."
+        )
+
+
 _bindings_dtype_to_torch_dtype_dict = {
     DataType.FLOAT: torch.float,
     DataType.HALF: torch.half,
@@ -128,10 +149,15 @@ class ModelRunnerCpp(ModelRunnerMixin):
                 Source of checkpoint. Should be one of ['hf', 'nemo'].
         Returns:
             ModelRunnerCpp: An instance of ModelRunnerCpp.
+
+        The engines whose layers are not split evenly between the pipeline
+        stages, e.g. built with an uneven pp_partition, are not supported.
         """
         # session setup
         engine_dir = Path(engine_dir)
         config_path = engine_dir / "config.json"
+        with open(config_path) as f:
+            _check_pp_partition(json.load(f))
         json_config = GptJsonConfig.parse_file(str(config_path))
         model_config = json_config.model_config
 
@@ -0,0 +1,535 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+MAX_CODEPOINT = 0x10FFFF
+
+# A character set is a sorted tuple of disjoint inclusive codepoint ranges
+_Ranges = Tuple[Tuple[int, int], ...]
+
+
+def _normalize(ranges) -> _Ranges:
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return tuple(merged)
+
+
+def _negate(ranges: _Ranges) -> _Ranges:
+    negated, lo = [], 0
+    for start, end in ranges:
+        if start > lo:
+            negated.append((lo, start - 1))
+        lo = end + 1
+    if lo <= MAX_CODEPOINT:
+        negated.append((lo, MAX_CODEPOINT))
+    return tuple(negated)
+
+
+def _chars(chars: str) -> _Ranges:
+    return _normalize((ord(c), ord(c)) for c in chars)
+
+
+_DIGITS = ((ord('0'), ord('9')), )
+_WORD = _normalize([(ord('0'), ord('9')), (ord('A'), ord('Z')),
+                    (ord('a'), ord('z')), (ord('_'), ord('_'))])
+_SPACES = _chars(' \t\n\r\f\v')
+_CLASS_ESCAPES = {
+    'd': _DIGITS,
+    'D': _negate(_DIGITS),
+    'w': _WORD,
+    'W': _negate(_WORD),
+    's': _SPACES,
+    'S': _negate(_SPACES),
+}
+_CHAR_ESCAPES = {
+    'n': '\n',
+    't': '\t',
+    'r': '\r',
+    'f': '\f',
+    'v': '\v',
+    '0': '\0',
+}
+
+
+class _Parser(object):
+    """
+    Parses the regular language subset of the Python regex syntax into a tree
+    of ('set', ranges), ('cat', nodes), ('alt', nodes) and
+    ('repeat', node, min, max) nodes. Lookarounds and backreferences are not
+    regular and are rejected, the ^ and $ anchors are accepted at the ends
+    since the whole output is matched.
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.pos = 0
+
+    def error(self, message: str):
+        return ValueError(
+            f"{message} at position {self.pos} of regex {self.pattern!r}")
+
+    def peek(self) -> Optional[str]:
+        return self.pattern[self.pos] if self.pos < len(self.pattern) else None
+
+    def take(self) -> str:
+        if self.pos >= len(self.pattern):
+            raise self.error("Unexpected end of pattern")
+        c = self.pattern[self.pos]
+        self.pos += 1
+        return c
+
+    def parse(self):
+        node = self.parse_alt()
+        if self.pos != len(self.pattern):
+            raise self.error("Unbalanced parenthesis")
+        return node
+
+    def parse_alt(self):
+        branches = [self.parse_cat()]
+        while self.peek() == '|':
+            self.pos += 1
+            branches.append(self.parse_cat())
+        return branches[0] if len(branches) == 1 else ('alt', branches)
+
+    def parse_cat(self):
+        nodes = []
+        while self.peek() not in (None, '|', ')'):
+            if self.peek() in '^$':
+                if self.pos not in (0, len(self.pattern) - 1):
+                    raise self.error("Anchors are only supported at the ends")
+                self.pos += 1
+                continue
+            nodes.append(self.parse_quantifier(self.parse_atom()))
+        return nodes[0] if len(nodes) == 1 else ('cat', nodes)
+
+    def parse_atom(self):
+        c = self.take()
+        if c == '(':
+            if self.peek() == '?':
+                if self.pattern.startswith('?:', self.pos):
+                    self.pos += 2
+                elif self.pattern.startswith('?P<', self.pos):
+                    self.pos = self.pattern.index('>', self.pos) + 1
+                else:
+                    raise self.error("Unsupported group")
+            node = self.parse_alt()
+            if self.take() != ')':
+                raise self.error("Missing )")
+            return node
+        if c == '[':
+            return ('set', self.parse_class())
+        if c == '.':
+            return ('set', _negate(_chars('\n')))
+        if c == '\\':
+            return ('set', self.parse_escape())
+        if c in '*+?':
+            raise self.error("Nothing to repeat")
+        return ('set', _chars(c))
+
+    def parse_escape(self) -> _Ranges:
+        c = self.take()
+        if c in _CLASS_ESCAPES:
+            return _CLASS_ESCAPES[c]
+        if c in _CHAR_ESCAPES:
+            return _chars(_CHAR_ESCAPES[c])
+        if c in 'xuU':
+            num_digits = {'x': 2, 'u': 4, 'U': 8}[c]
+            digits = self.pattern[self.pos:self.pos + num_digits]
+            self.pos += num_digits
+            try:
+                return _chars(chr(int(digits, 16)))
+            except ValueError:
+                raise self.error(f"Invalid escape \\{c}{digits}")
+        if c.isalnum():
+            raise self.error(f"Unsupported escape \\{c}")
+        return _chars(c)
+
+    def parse_class(self) -> _Ranges:
+        negated = self.peek() == '^'
+        if negated:
+            self.pos += 1
+        ranges, first = [], True
+        while first or self.peek() != ']':
+            first = False
+            c = self.take()
+            if c == '\\':
+                escaped = self.parse_escape()
+                if len(escaped) != 1 or escaped[0][0] != escaped[0][1]:
+                    ranges.extend(escaped)
+                    continue
+                lo = escaped[0][0]
+            else:
+                lo = ord(c)
+            if self.peek() == '-' and self.pattern[self.pos + 1:self.pos +
+                                                   2] not in ('', ']'):
+                self.pos += 1
+                c = self.take()
+                hi = self.parse_escape()[0][0] if c == '\\' else ord(c)
+                if hi < lo:
+                    raise self.error("Bad character range")
+                ranges.append((lo, hi))
+            else:
+                ranges.append((lo, lo))
+        self.pos += 1
+        ranges = _normalize(ranges)
+        return _negate(ranges) if negated else ranges
+
+    def parse_quantifier(self, node):
+        while True:
+            c = self.peek()
+            if c == '*':
+                bounds = (0, None)
+            elif c == '+':
+                bounds = (1, None)
+            elif c == '?':
+                bounds = (0, 1)
+            elif c == '{' and self._braces() is not None:
+                bounds, end = self._braces()
+                self.pos = end - 1
+            else:
+                return node
+            self.pos += 1
+            # Lazy and possessive quantifiers match the same language
+            if self.peek() in ('?', '+'):
+                self.pos += 1
+            node = ('repeat', node) + bounds
+
+    def _braces(self):
+        end = self.pattern.find('}', self.pos)
+        if end < 0:
+            return None
+        body = self.pattern[self.pos + 1:end].split(',')
+        if len(body) > 2 or not body[0].isdigit() or not all(
+                b.isdigit() or b == '' for b in body[1:]):
+            return None
+        lo = int(body[0])
+        hi = lo if len(body) == 1 else (int(body[1]) if body[1] else None)
+        if hi is not None and hi < lo:
+            raise self.error("Bad repetition bounds")
+        return (lo, hi), end + 1
+
+
+class _NFA(object):
+
+    def __init__(self):
+        self.epsilons: List[List[int]] = []
+        self.edges: List[List[Tuple[int, int, int]]] = []
+
+    def new_state(self) -> int:
+        self.epsilons.append([])
+        self.edges.append([])
+        return len(self.edges) - 1
+
+    def build(self, node, start: int) -> int:
+        """ Thompson construction of node from start, returns its end state. """
+        kind = node[0]
+        if kind == 'set':
+            end = self.new_state()
+            self.edges[start].extend((lo, hi, end) for lo, hi in node[1])
+            return end
+        if kind == 'cat':
+            for child in node[1]:
+                start = self.build(child, start)
+            return start
+        if kind == 'alt':
+            end = self.new_state()
+            for child in node[1]:
+                branch = self.new_state()
+                self.epsilons[start].append(branch)
+                self.epsilons[self.build(child, branch)].append(end)
+            return end
+        _, child, lo, hi = node
+        for _ in range(lo):
+            start = self.build(child, start)
+        if hi is None:
+            loop = self.new_state()
+            self.epsilons[start].append(loop)
+            self.epsilons[self.build(child, loop)].append(loop)
+            return loop
+        end = self.new_state()
+        for _ in range(hi - lo):
+            self.epsilons[start].append(end)
+            start = self.build(child, start)
+        self.epsilons[start].append(end)
+        return end
+
+    def closure(self, states) -> frozenset:
+        closure, stack = set(states), list(states)
+        while stack:
+            for target in self.epsilons[stack.pop()]:
+                if target not in closure:
+                    closure.add(target)
+                    stack.append(target)
+        return frozenset(closure)
+
+
+class RegexFSM(object):
+    """
+    Deterministic automaton of a regex, matching whole strings. The states are
+    numbered from the initial state 0, each state keeps its transitions as
+    sorted codepoint intervals. Only the states from which a final state is
+    reachable are kept, so any prefix accepted by next_state can be completed.
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        nfa = _NFA()
+        start = nfa.new_state()
+        accept = nfa.build(_Parser(pattern).parse(), start)
+
+        subsets = [nfa.closure([start])]
+        ids = {subsets[0]: 0}
+        transitions = []
+        for subset in subsets:
+            intervals = []
+            for lo, hi, targets in self._partition(
+                [edge for state in subset for edge in nfa.edges[state]]):
+                target = nfa.closure(targets)
+                if target not in ids:
+                    ids[target] = len(subsets)
+                    subsets.append(target)
+                intervals.append((lo, hi, ids[target]))
+            transitions.append(intervals)
+        finals = {i for i, subset in enumerate(subsets) if accept in subset}
+        self._trim(transitions, finals)
+
+    @staticmethod
+    def _partition(edges):
+        """ Split the edges into disjoint intervals with their target sets. """
+        bounds = sorted({lo
+                         for lo, _, _ in edges}
+                        | {hi + 1
+                           for _, hi, _ in edges})
+        for lo, next_lo in zip(bounds, bounds[1:]):
+            targets = [t for start, end, t in edges if start <= lo <= end]
+            if targets:
+                yield lo, next_lo - 1, targets
+
+    def _trim(self, transitions, finals):
+        # Keep the states that can reach a final state
+        live = set(finals)
+        changed = True
+        while changed:
+            changed = False
+            for state, intervals in enumerate(transitions):
+                if state not in live and any(t in live
+                                             for _, _, t in intervals):
+                    live.add(state)
+                    changed = True
+        if 0 not in live:
+            raise ValueError(f"Regex {self.pattern!r} matches nothing")
+        renumber = {s: i for i, s in enumerate(sorted(live))}
+
+        self.finals = frozenset(renumber[s] for s in finals)
+        self._starts: List[List[int]] = []
+        self._intervals: List[List[Tuple[int, int]]] = []
+        for state in sorted(live):
+            starts, intervals = [], []
+            for lo, hi, target in transitions[state]:
+                if target not in live:
+                    continue
+                target = renumber[target]
+                if intervals and intervals[-1] == (lo - 1, target):
+                    intervals[-1] = (hi, target)
+                    continue
+                starts.append(lo)
+                intervals.append((hi, target))
+            self._starts.append(starts)
+            self._intervals.append(intervals)
+        self._cache: List[Dict[str, Optional[int]]] = [{} for _ in self._starts]
+
+    @property
+    def num_states(self) -> int:
+        return len(self._starts)
+
+    @property
+    def initial(self) -> int:
+        return 0
+
+    def next_state(self, state: int, char: str) -> Optional[int]:
+        """ Returns the state after char, None if char is not accepted. """
+        cache = self._cache[state]
+        if char in cache:
+            return cache[char]
+        code = ord(char)
+        index = bisect_right(self._starts[state], code) - 1
+        target = None
+        if index >= 0 and code <= self._intervals[state][index][0]:
+            target = self._intervals[state][index][1]
+        cache[char] = target
+        return target
+
+    def transition_table(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the dense form of the transitions: the sorted codepoints that
+        start the character classes of the automaton and the
+        [num_states, num_classes] next states, -1 where the class is not
+        accepted. The class of a codepoint c is
+        searchsorted(starts, c, 'right') - 1.
+        """
+        bounds = {0}
+        for starts, intervals in zip(self._starts, self._intervals):
+            bounds.update(starts)
+            bounds.update(hi + 1 for hi, _ in intervals)
+        class_starts = np.array(sorted(b for b in bounds if b <= MAX_CODEPOINT),
+                                dtype=np.int64)
+        table = np.full((self.num_states, len(class_starts)),
+                        -1,
+                        dtype=np.int32)
+        for state, (starts,
+                    intervals) in enumerate(zip(self._starts, self._intervals)):
+            for lo, (hi, target) in zip(starts, intervals):
+                first, last = np.searchsorted(class_starts, [lo, hi],
+                                              side='right') - 1
+                table[state, first:last + 1] = target
+        return class_starts, table
+
+    def walk(self, text: str, state: int = 0) -> Optional[int]:
+        for char in text:
+            state = self.next_state(state, char)
+            if state is None:
+                return None
+        return state
+
+    def fullmatch(self, text: str) -> bool:
+        return self.walk(text) in self.finals
+
+
+# The regexes of the JSON values, as in RFC 8259
+JSON_STRING_INNER = r'(?:[^"\\\x00-\x1f]|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})'
+JSON_INTEGER = r'-?(?:0|[1-9][0-9]*)'
+JSON_NUMBER = JSON_INTEGER + r'(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?'
+JSON_BOOLEAN = r'(?:true|false)'
+JSON_NULL = r'null'
+JSON_WHITESPACE = r'[ ]?'
+
+_REGEX_SPECIAL_CHARS = set('\\.^$*+?{}[]|()')
+
+
+def escape_regex(text: str) -> str:
+    return ''.join('\\' + c if c in _REGEX_SPECIAL_CHARS else c for c in text)
+
+
+def json_schema_to_regex(schema: Union[str, dict],
+                         whitespace: str = JSON_WHITESPACE) -> str:
+    """
+    Converts a JSON schema into a regex of the JSON documents it validates.
+
+    The supported keywords are type (object, array, string, integer, number,
+    boolean, null), properties and required, items, minItems and maxItems,
+    minLength and maxLength, enum, const, anyOf, oneOf and the local $ref.
+    The properties are generated in the schema order and no additional
+    properties are allowed. whitespace is the regex of the optional
+    whitespace between the tokens, kept bounded so that the model cannot
+    loop on it.
+    """
+    if isinstance(schema, str):
+        schema = json.loads(schema)
+    root = schema
+
+    def resolve(ref: str) -> dict:
+        if not ref.startswith('#/'):
+            raise ValueError(f"Only local $ref are supported, got {ref!r}")
+        node = root
+        for key in ref[2:].split('/'):
+            node = node[key.replace('~1', '/').replace('~0', '~')]
+        return node
+
+    def to_regex(node: dict) -> str:
+        if '$ref' in node:
+            return to_regex(resolve(node['$ref']))
+        if 'const' in node:
+            return escape_regex(json.dumps(node['const']))
+        if 'enum' in node:
+            return '(?:' + '|'.join(
+                escape_regex(json.dumps(value)) for value in node['enum']) + ')'
+        for key in ('anyOf', 'oneOf'):
+            if key in node:
+                return '(?:' + '|'.join(to_regex(sub)
+                                        for sub in node[key]) + ')'
+
+        kind = node.get('type')
+        if isinstance(kind, list):
+            return '(?:' + '|'.join(to_regex(dict(node, type=k))
+                                    for k in kind) + ')'
+        if kind == 'string':
+            lo = node.get('minLength', 0)
+            hi = node.get('maxLength', '')
+            if lo == 0 and hi == '':
+                return f'"{JSON_STRING_INNER}*"'
+            return f'"{JSON_STRING_INNER}{{{lo},{hi}}}"'
+        if kind == 'integer':
+            return JSON_INTEGER
+        if kind == 'number':
+            return JSON_NUMBER
+        if kind == 'boolean':
+            return JSON_BOOLEAN
+        if kind == 'null':
+            return JSON_NULL
+        if kind == 'array':
+            item = to_regex(node.get('items', {'type': 'string'}))
+            lo = node.get('minItems', 0)
+            hi = node.get('maxItems')
+            separated = f'{whitespace},{whitespace}{item}'
+            if hi is None:
+                rest = f'(?:{separated}){{{max(lo - 1, 0)},}}'
+            elif hi == 0:
+                return fr'\[{whitespace}\]'
+            else:
+                rest = f'(?:{separated}){{{max(lo - 1, 0)},{hi - 1}}}'
+            items = item + rest
+            if lo == 0:
+                items = f'(?:{items})?'
+            return fr'\[{whitespace}{items}{whitespace}\]'
+        if kind == 'object' or 'properties' in node:
+            return object_regex(node)
+        raise ValueError(f"Unsupported JSON schema: {node}")
+
+    def object_regex(node: dict) -> str:
+        required = set(node.get('required', []))
+        members = [
+            (f'"{escape_regex(name)}"{whitespace}:{whitespace}' + to_regex(sub),
+             name in required)
+            for name, sub in node.get('properties', {}).items()
+        ]
+        separator = f'{whitespace},{whitespace}'
+
+        def rest(start: int) -> str:
+            return ''.join(
+                separator +
+                member if is_required else f'(?:{separator}{member})?'
+                for member, is_required in members[start:])
+
+        # One alternative per member that can come first, i.e. all the
+        # members before it are optional
+        alternatives = []
+        for i, (member, is_required) in enumerate(members):
+            alternatives.append(member + rest(i + 1))
+            if is_required:
+                break
+        body = '(?:' + '|'.join(alternatives) + ')' if alternatives else ''
+        if members and not any(is_required for _, is_required in members):
+            body += '?'
+        return r'\{' + whitespace + body + whitespace + r'\}'
+
+    return to_regex(schema)
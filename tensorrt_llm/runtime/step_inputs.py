@@ -0,0 +1,295 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The position ids, last token ids and attention masks of the context and
+generation steps of GenerationSession.
+
+They are computed by vectorized ops on the device of the builder, without a
+loop over the batch or a host synchronization, so that the preparation of a
+step is a few kernel launches. The attention mask of the engines without the
+GPT attention plugin grows by a column every step: it is written into two
+buffers preallocated for the whole generation, used in turn, instead of being
+concatenated into a new tensor. The builder also runs on the CPU, where it is
+tested and benchmarked.
+"""
+from typing import Dict, Optional, Union
+
+import torch
+
+# The mask tokens of GLM-10B, [MASK], [gMASK] and [sMASK]
+GLM_MASK_TOKEN_IDS = (50260, 50263, 50264)
+
+
+def packed_position_ids(context_lengths: torch.Tensor,
+                        num_tokens: Optional[int] = None) -> torch.Tensor:
+    """
+    Returns the int32 positions 0..length-1 of the sequences of
+    context_lengths, concatenated as the packed input ids. num_tokens, the sum
+    of the lengths, is computed on the host when given, which saves a device
+    synchronization.
+    """
+    lengths = context_lengths.long()
+    if num_tokens is None:
+        num_tokens = int(lengths.sum())
+    starts = torch.cumsum(lengths, dim=0) - lengths
+    offsets = torch.repeat_interleave(starts, lengths, output_size=num_tokens)
+    positions = torch.arange(num_tokens,
+                             dtype=torch.int64,
+                             device=context_lengths.device)
+    return (positions - offsets).int()
+
+
+def glm_mask_index(input_ids: torch.Tensor,
+                   max_context_length: int,
+                   mask_token_ids=GLM_MASK_TOKEN_IDS) -> torch.Tensor:
+    """
+    Returns the int32 index of the first mask token of each row of the padded
+    input_ids of GLM-10B, max_context_length for the rows without one.
+    """
+    is_mask = torch.isin(input_ids,
+                         torch.tensor(mask_token_ids, device=input_ids.device))
+    indices = torch.arange(input_ids.shape[1], device=input_ids.device)
+    candidates = torch.where(is_mask, indices, max_context_length)
+    return candidates.min(dim=1).values.clamp_max(max_context_length).int()
+
+
+class StepInputBuilder(object):
+    """
+    Builds the model inputs of the steps of a generation on device.
+    """
+
+    def __init__(self, device: Union[str, torch.device] = 'cuda'):
+        self.device = torch.device(device)
+        # The attention mask of the current step, a view of one of the two
+        # flat buffers
+        self._mask_buffers = None
+        self._mask_index = 0
+        self._attention_mask = None
+        # The number of unpadded context tokens of the rows of the mask, and
+        # the number of columns appended since
+        self._num_context_tokens = None
+        self._num_appended = 0
+        # The int32 arange(1, n + 1) of the packed last token ids, cached
+        self._token_counts = None
+
+    def last_token_ids(self, num_rows: int,
+                       remove_input_padding: bool) -> torch.Tensor:
+        """
+        Returns the last token ids of a generation step of num_rows tokens.
+        """
+        if not remove_input_padding:
+            return torch.ones(num_rows, dtype=torch.int32, device=self.device)
+        if self._token_counts is None or len(self._token_counts) < num_rows:
+            self._token_counts = torch.arange(1,
+                                              num_rows + 1,
+                                              dtype=torch.int32,
+                                              device=self.device)
+        return self._token_counts[:num_rows]
+
+    def context_inputs(self,
+                       batch_size: int,
+                       context_lengths: torch.Tensor,
+                       host_context_lengths: torch.Tensor,
+                       use_gpt_attention_plugin: bool,
+                       remove_input_padding: bool,
+                       max_context_length: Optional[int] = None,
+                       input_ids: Optional[torch.Tensor] = None,
+                       pad_id: Optional[int] = None) -> Dict[str, torch.Tensor]:
+        """
+        Returns the position_ids, last_token_ids and, without the GPT
+        attention plugin, the attention_mask of the context step.
+        """
+        context_lengths = context_lengths.to(self.device)
+        last_token_ids = context_lengths.detach().clone()
+        if use_gpt_attention_plugin:
+            if remove_input_padding:
+                position_ids = packed_position_ids(
+                    context_lengths, int(host_context_lengths.sum()))
+                last_token_ids = torch.cumsum(last_token_ids, dim=0).int()
+            else:
+                position_ids = torch.arange(max_context_length,
+                                            dtype=torch.int32,
+                                            device=self.device).reshape(
+                                                [1,
+                                                 -1]).expand([batch_size, -1])
+            return {
+                'position_ids': position_ids,
+                'last_token_ids': last_token_ids
+            }
+
+        input_ids = input_ids.to(self.device)
+        if pad_id is not None:
+            # All ones when there is no padding
+            attention_mask = input_ids.ne(pad_id).int()
+        else:
+            attention_mask = torch.ones(input_ids.shape,
+                                        dtype=torch.int32,
+                                        device=self.device)
+        position_ids = attention_mask.cumsum(-1, dtype=torch.int32) - 1
+        position_ids.masked_fill_(attention_mask == 0, 1)
+        return {
+            'position_ids': position_ids,
+            'last_token_ids': last_token_ids,
+            'attention_mask': attention_mask
+        }
+
+    def generation_inputs(self,
+                          batch_size: int,
+                          context_lengths: torch.Tensor,
+                          use_gpt_attention_plugin: bool,
+                          remove_input_padding: bool,
+                          step: int,
+                          num_beams: int = 1,
+                          attention_mask: Optional[torch.Tensor] = None,
+                          max_new_tokens: int = 1) -> Dict[str, torch.Tensor]:
+        """
+        Returns the position_ids, last_token_ids and, without the GPT
+        attention plugin, the attention_mask of the generation step after
+        step, the context lengths and the mask being tiled by num_beams.
+
+        The returned mask is passed back at the next step: it is then extended
+        in place into the other buffer, any other mask, the one of the context
+        step in particular, starts a new sequence of buffers sized for
+        max_new_tokens steps.
+        """
+        num_rows = batch_size * num_beams
+        last_token_ids = self.last_token_ids(num_rows, remove_input_padding)
+        if use_gpt_attention_plugin:
+            position_ids = context_lengths.to(self.device) + step
+            if not remove_input_padding:
+                position_ids = position_ids.unsqueeze(1)
+            return {
+                'position_ids': position_ids,
+                'last_token_ids': last_token_ids
+            }
+
+        if attention_mask is not self._attention_mask:
+            self._start_attention_mask(attention_mask, max_new_tokens)
+        attention_mask = self._extend_attention_mask()
+        # The position of the new token is the number of unpadded tokens
+        # before it
+        position_ids = (self._num_context_tokens + self._num_appended -
+                        1).unsqueeze(-1)
+        return {
+            'position_ids': position_ids,
+            'last_token_ids': last_token_ids,
+            'attention_mask': attention_mask
+        }
+
+    def _start_attention_mask(self, attention_mask: torch.Tensor,
+                              max_new_tokens: int):
+        attention_mask = attention_mask.to(self.device)
+        num_rows, width = attention_mask.shape
+        capacity = num_rows * (width + max(max_new_tokens, 1))
+        if self._mask_buffers is None or \
+                self._mask_buffers[0].numel() < capacity or \
+                self._mask_buffers[0].dtype != attention_mask.dtype:
+            self._allocate_mask_buffers(capacity, attention_mask.dtype)
+        self._mask_index = 0
+        mask = self._mask_buffers[0][:num_rows * width].view(num_rows, width)
+        mask.copy_(attention_mask)
+        self._attention_mask = mask
+        self._num_context_tokens = attention_mask.sum(dim=-1, dtype=torch.int32)
+        self._num_appended = 0
+
+    def _allocate_mask_buffers(self, capacity: int, dtype: torch.dtype):
+        self._mask_buffers = [
+            torch.empty(capacity, dtype=dtype, device=self.device)
+            for _ in range(2)
+        ]
+
+    def _extend_attention_mask(self) -> torch.Tensor:
+        num_rows, width = self._attention_mask.shape
+        size = num_rows * (width + 1)
+        self._mask_index ^= 1
+        if self._mask_buffers[self._mask_index].numel() < size:
+            # More steps than planned, the current mask keeps its old buffer
+            self._allocate_mask_buffers(2 * size, self._attention_mask.dtype)
+        buffer = self._mask_buffers[self._mask_index]
+        # The buffer of the previous step is only written after this step was
+        # enqueued on the same stream
+        mask = buffer[:size].view(num_rows, width + 1)
+        mask[:, :width].copy_(self._attention_mask)
+        mask[:, width] = 1
+        self._attention_mask = mask
+        self._num_appended += 1
+        return mask
+
+    def glm_context_position_ids(
+            self,
+            batch_size: int,
+            context_lengths: torch.Tensor,
+            host_context_lengths: torch.Tensor,
+            max_context_length: int,
+            remove_input_padding: bool,
+            mask_index: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """
+        Returns the 2D position ids of the context step of ChatGLM, [1, 2,
+        num_tokens] packed and [batch_size, 2, max_context_length] padded. The
+        last token of a row is at the position of its mask token, mask_index
+        for GLM-10B and its length - 2 otherwise, and at block position 1.
+        """
+        context_lengths = context_lengths.to(self.device).long()
+        if remove_input_padding:
+            num_tokens = int(host_context_lengths.sum())
+            position_ids = torch.zeros([1, 2, num_tokens],
+                                       dtype=torch.int32,
+                                       device=self.device)
+            position_ids[0, 0] = packed_position_ids(context_lengths,
+                                                     num_tokens)
+            last = torch.cumsum(context_lengths, dim=0) - 1
+            position_ids[0, 0, last] = (context_lengths - 2).int()
+            position_ids[0, 1, last] = 1
+            return position_ids
+
+        position_ids = torch.zeros([batch_size, 2, max_context_length],
+                                   dtype=torch.int32,
+                                   device=self.device)
+        position_ids[:, 0, :] = torch.arange(max_context_length,
+                                             dtype=torch.int32,
+                                             device=self.device)
+        rows = torch.arange(batch_size, device=self.device)
+        last = context_lengths - 1
+        if mask_index is None:
+            position_ids[rows, 0, last] = (context_lengths - 2).int()
+        else:
+            position_ids[rows, 0, last] = mask_index.to(self.device).int()
+        position_ids[rows, 1, last] = 1
+        return position_ids
+
+    def glm_generation_position_ids(
+            self,
+            context_lengths: torch.Tensor,
+            step: int,
+            remove_input_padding: bool,
+            num_beams: int = 1,
+            mask_index: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """
+        Returns the 2D position ids of the generation step after step of
+        ChatGLM, [1, 2, rows] packed and [rows, 2, 1] padded, the context
+        lengths being tiled by num_beams and mask_index, of GLM-10B, not.
+        """
+        if mask_index is not None:
+            positions = torch.repeat_interleave(mask_index.to(self.device),
+                                                num_beams)
+        else:
+            positions = context_lengths.to(self.device) - 2
+        position_ids = torch.stack([
+            positions.int(),
+            torch.full_like(positions, step + 2, dtype=torch.int32)
+        ])
+        if remove_input_padding:
+            return position_ids.unsqueeze(0)
+        return position_ids.t().unsqueeze(-1).contiguous()
@@ -0,0 +1,163 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The per-step outputs of the delta streaming mode of GenerationSession.
+
+Instead of the whole [batch, beam, max_seq_len] output ids gathered every
+step, a step yields the tokens it generated, the finished flags and the
+sequence lengths of the sequences, as small host tensors. The new tokens, the
+finished flags and the lengths are packed into a single device tensor and
+copied to the host by one non-blocking copy per step, into a slot of a ring
+buffer of pinned memory, and an event of the slot tells when the copy is
+done. The ring also runs on the CPU, where it is tested.
+"""
+from dataclasses import dataclass
+from typing import List, Sequence, Union
+
+import torch
+
+
+@dataclass
+class StreamDelta:
+    """
+    The tokens generated by one or more consecutive steps, host tensors:
+        token_ids: [batch, beam, num_steps] int32, the tokens of the steps,
+            the first num_new_tokens of a sequence are valid.
+        num_new_tokens: [batch, beam] int32, the tokens appended to the
+            sequences by the steps, 0 for the sequences done before them.
+        finished: [batch, beam] bool, the sequences done after the last step.
+        sequence_lengths: [batch, beam] int32, the lengths of the sequences,
+            input included, after the last step.
+    """
+    token_ids: torch.Tensor
+    num_new_tokens: torch.Tensor
+    finished: torch.Tensor
+    sequence_lengths: torch.Tensor
+
+    @property
+    def num_steps(self) -> int:
+        return self.token_ids.size(-1)
+
+    def token_lists(self) -> List[List[List[int]]]:
+        """
+        Returns the valid new tokens of each beam of each sequence.
+        """
+        token_ids = self.token_ids.tolist()
+        num_new_tokens = self.num_new_tokens.tolist()
+        return [[tokens[:n] for tokens, n in zip(beams, counts)]
+                for beams, counts in zip(token_ids, num_new_tokens)]
+
+    @staticmethod
+    def concat(deltas: Sequence['StreamDelta']) -> 'StreamDelta':
+        """
+        Returns the delta of the consecutive steps of deltas, whose valid
+        tokens are appended in order.
+        """
+        if len(deltas) == 1:
+            return deltas[0]
+        token_ids = torch.cat([d.token_ids for d in deltas], dim=-1)
+        valid = torch.cat([
+            torch.arange(d.num_steps) < d.num_new_tokens.unsqueeze(-1)
+            for d in deltas
+        ],
+                          dim=-1)
+        # Moves the valid tokens first, in order
+        order = torch.sort((~valid).byte(), dim=-1, stable=True).indices
+        return StreamDelta(token_ids=token_ids.gather(-1, order),
+                           num_new_tokens=sum(d.num_new_tokens
+                                              for d in deltas).int(),
+                           finished=deltas[-1].finished,
+                           sequence_lengths=deltas[-1].sequence_lengths)
+
+
+class StreamDeltas(object):
+    """
+    Copies the new tokens of the steps of a generation to a ring buffer of
+    num_slots pinned host slots, one per step in turn.
+
+    The tensors of a delta are views of its slot, or computed from them: they
+    are valid until the slot is reused num_slots steps later, they must be
+    cloned to be kept longer. Only greedy and sampling generations are
+    supported, the beam search reorders the beams of the previous tokens.
+    """
+
+    def __init__(self,
+                 device: Union[str, torch.device] = 'cuda',
+                 num_slots: int = 4):
+        # The lengths of the previous step are read from the previous slot
+        assert num_slots >= 2, "The ring needs at least two slots"
+        self.device = torch.device(device)
+        self.num_slots = num_slots
+        self._packed = None
+        self._host = None
+        self._events = None
+        self._buffers_key = None
+        self._slot = 0
+        self._lengths = None
+
+    def setup(self, batch_size: int, beam_width: int,
+              context_lengths: torch.Tensor):
+        """
+        Starts a generation of the sequences of context_lengths.
+        """
+        assert beam_width == 1, \
+            "Streaming deltas is not supported with beam search"
+        shape = (batch_size, beam_width)
+        if self._buffers_key != shape:
+            # The buffers are reused by the generations of the same shape
+            self._buffers_key = shape
+            self._packed = torch.zeros((3, batch_size * beam_width),
+                                       dtype=torch.int32,
+                                       device=self.device)
+            self._host = torch.zeros(
+                (self.num_slots, 3, batch_size * beam_width),
+                dtype=torch.int32,
+                pin_memory=self.device.type == 'cuda')
+            if self.device.type == 'cuda':
+                self._events = [
+                    torch.cuda.Event() for _ in range(self.num_slots)
+                ]
+        self._slot = 0
+        self._lengths = context_lengths.to('cpu', torch.int32).reshape(shape)
+
+    def capture(self, new_tokens: torch.Tensor, finished: torch.Tensor,
+                sequence_lengths: torch.Tensor):
+        """
+        Starts the copy of the outputs of a step to the next slot, without
+        waiting for it.
+        """
+        self._packed[0].copy_(new_tokens.view(-1))
+        self._packed[1].copy_(finished.view(-1))
+        self._packed[2].copy_(sequence_lengths.view(-1))
+        self._host[self._slot].copy_(self._packed, non_blocking=True)
+        if self._events is not None:
+            self._events[self._slot].record()
+
+    def delta(self) -> StreamDelta:
+        """
+        Waits for the copy of the last captured step, returns its delta.
+        """
+        slot = self._slot
+        if self._events is not None:
+            self._events[slot].synchronize()
+        self._slot = (slot + 1) % self.num_slots
+        host = self._host[slot].view((3, ) + self._buffers_key)
+        lengths = host[2]
+        num_new_tokens = lengths - self._lengths
+        self._lengths = lengths
+        return StreamDelta(token_ids=host[0].unsqueeze(-1),
+                           num_new_tokens=num_new_tokens,
+                           finished=host[1] != 0,
+                           sequence_lengths=lengths)
@@ -0,0 +1,152 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import csv
+import weakref
+from collections import OrderedDict
+from itertools import accumulate, chain
+from typing import List, Sequence, Tuple, Union
+
+import numpy as np
+
+# The words of a batch item: one string of comma separated phrases (as bytes
+# or str), or the token ids of every phrase.
+WordListItem = Union[Sequence[str], Sequence[bytes], Sequence[Sequence[int]]]
+
+
+class WordListEncoder(object):
+    '''
+    Encodes stop words and bad words lists to the [batch_size, 2, pad_to]
+    int32 format of the sampling config, see to_word_list_format.
+
+    The token ids of every word list string are memoized, the requests of a
+    deployment usually reuse a few stop sequences. At most max_cache_size
+    strings are kept, least recently used first out.
+    '''
+
+    def __init__(self,
+                 tokenizer=None,
+                 add_special_tokens: bool = False,
+                 max_cache_size: int = 4096):
+        self.tokenizer = tokenizer
+        self.add_special_tokens = add_special_tokens
+        self.max_cache_size = max_cache_size
+        # words string -> (flat ids, offsets)
+        self._cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _encode_words(self, words: str) -> Tuple[np.ndarray, np.ndarray]:
+        entry = self._cache.get(words)
+        if entry is not None:
+            self._cache.move_to_end(words)
+            self.cache_hits += 1
+            return entry
+
+        self.cache_misses += 1
+        assert self.tokenizer is not None, "need to set tokenizer"
+        phrases = []
+        for word in list(csv.reader([words]))[0]:
+            ids = self.tokenizer.encode(
+                word, add_special_tokens=self.add_special_tokens)
+            if len(ids) > 0:
+                phrases.append(ids)
+        flat_ids, offsets = self._flatten(phrases)
+        entry = (np.array(flat_ids,
+                          dtype=np.int32), np.array(offsets, dtype=np.int32))
+        self._cache[words] = entry
+        if len(self._cache) > self.max_cache_size:
+            self._cache.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def _flatten(
+            phrases: Sequence[Sequence[int]]) -> Tuple[List[int], List[int]]:
+        flat_ids = list(chain.from_iterable(phrases))
+        offsets = list(
+            accumulate(len(phrase) for phrase in phrases if len(phrase) > 0))
+        return flat_ids, offsets
+
+    def encode_item(
+        self, item: WordListItem
+    ) -> Tuple[Union[np.ndarray, List[int]], Union[np.ndarray, List[int]]]:
+        '''
+        Returns the flat token ids and the end offset of every phrase.
+        '''
+        if len(item) == 0:
+            return self._flatten([])
+        first = item[0]
+        if isinstance(first, bytes):
+            return self._encode_words(first.decode())
+        if isinstance(first, str):
+            return self._encode_words(first)
+        # Pre-tokenized phrases
+        return self._flatten(item)
+
+    def encode(self, word_dict: Sequence[WordListItem]) -> np.ndarray:
+        '''
+        Builds the [batch_size, 2, pad_to] array of word_dict: row 0 holds
+        the flat token ids padded with 0, row 1 the end offset of every
+        phrase padded with -1.
+        '''
+        encoded = [self.encode_item(item) for item in word_dict]
+        pad_to = max(1, max((len(ids) for ids, _ in encoded), default=0))
+
+        result = np.zeros((len(encoded), 2, pad_to), dtype=np.int32)
+        result[:, 1, :] = -1
+        for ids_and_offsets, (ids, offsets) in zip(result, encoded):
+            ids_and_offsets[0, :len(ids)] = ids
+            ids_and_offsets[1, :len(offsets)] = offsets
+        return result
+
+
+_word_list_encoders = weakref.WeakKeyDictionary()
+
+
+def get_word_list_encoder(tokenizer,
+                          add_special_tokens: bool = False) -> WordListEncoder:
+    '''
+    Returns the WordListEncoder shared by the callers of a tokenizer, it is
+    released with the tokenizer.
+    '''
+    try:
+        encoders = _word_list_encoders.setdefault(tokenizer, {})
+    except TypeError:
+        # Not weak referenceable, nothing can be shared
+        return WordListEncoder(tokenizer, add_special_tokens)
+    encoder = encoders.get(add_special_tokens)
+    if encoder is None:
+        encoder = WordListEncoder(weakref.proxy(tokenizer), add_special_tokens)
+        encoders[add_special_tokens] = encoder
+    return encoder
+
+
+def to_word_list_format(word_dict: List[WordListItem],
+                        tokenizer=None,
+                        add_special_tokens=False):
+    '''
+    format of word_dict
+        len(word_dict) should be same to batch_size
+        word_dict[i] means the words for batch i
+        len(word_dict[i]) must be 1, which means it only contains 1 string
+        This string can contains several sentences and split by ",".
+        For example, if word_dict[2] = " I am happy, I am sad", then this function will return
+        the ids for two short sentences " I am happy" and " I am sad".
+        word_dict[i] can also be the token ids of its sentences, e.g.
+        [[40, 716, 3772], [40, 716, 6507]], then no tokenizer is needed.
+    '''
+    if tokenizer is None:
+        return WordListEncoder().encode(word_dict)
+    return get_word_list_encoder(tokenizer,
+                                 add_special_tokens).encode(word_dict)
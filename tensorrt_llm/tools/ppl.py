@@ -1,7 +1,32 @@
+import torch
+
+from ..runtime.logits_capture import token_logprobs
+
+
+class PerplexityAccumulator(object):
+    """
+    Accumulates the per-token perplexity over chunks of logits, e.g. the steps
+    of a generation, without keeping the logits.
+    """
+
+    def __init__(self):
+        # A CPU scalar, it takes the device of the logits on the first update
+        self.nll = torch.zeros(())
+        self.num_tokens = 0
+
+    def update(self, logits, output_ids):
+        # Kept as a tensor so that the accumulation does not sync the device
+        self.nll = self.nll - token_logprobs(logits, output_ids).sum()
+        self.num_tokens += output_ids.numel()
+
+    def ppl(self):
+        return (self.nll / max(self.num_tokens, 1)).exp().item()
+
+
 def ppl(logits, output_ids):
     """
     Calculate per-token perplexity.
     """
-    nlls = -logits.log_softmax(dim=-1)
-    ppls = nlls.gather(-1, output_ids.long().unsqueeze(-1))
-    return ppls.mean().exp().item()
+    accumulator = PerplexityAccumulator()
+    accumulator.update(logits, output_ids)
+    return accumulator.ppl()
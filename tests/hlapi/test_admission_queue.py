@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from tensorrt_llm.hlapi.admission_queue import (AdmissionQueue,
+                                                QueueOverloadError)
+
+
+def test_fifo():
+    queue = AdmissionQueue()
+    for request_id in range(5):
+        queue.put(request_id, f"request-{request_id}")
+    assert queue.get(2) == ["request-0", "request-1"]
+    assert queue.get(10) == ["request-2", "request-3", "request-4"]
+    assert queue.get(10) == []
+    assert queue.stats()["admitted"] == 5
+
+
+def test_priority():
+    queue = AdmissionQueue()
+    for request_id, priority in enumerate([0, 1, 0, 2, 1]):
+        queue.put(request_id, request_id, priority=priority)
+    # Higher priorities first, FIFO within a priority
+    assert queue.get(10) == [3, 1, 4, 0, 2]
+
+
+def test_overload():
+    queue = AdmissionQueue(max_size=2)
+    queue.put(0, 0)
+    queue.put(1, 1)
+    with pytest.raises(QueueOverloadError):
+        queue.put(2, 2)
+    assert queue.get(1) == [0]
+    queue.put(2, 2)
+    stats = queue.stats()
+    assert stats["rejected"] == 1
+    assert stats["depth"] == 2
+    assert stats["max_depth"] == 2
+
+
+def test_deadline():
+    expired = []
+    queue = AdmissionQueue(max_size=2, on_expire=expired.append)
+    now = time.monotonic()
+    queue.put(0, 0, deadline=now - 1)
+    queue.put(1, 1, deadline=now + 60)
+    assert queue.get(10) == [1]
+    assert expired == [0]
+
+    # The expired requests make room in a full queue
+    queue.put(2, 2, deadline=now - 1)
+    queue.put(3, 3)
+    queue.put(4, 4)
+    assert expired == [0, 2]
+    assert queue.get(10) == [3, 4]
+    assert queue.stats()["expired"] == 2
+
+
+def test_cancel():
+    queue = AdmissionQueue()
+    for request_id in range(100):
+        queue.put(request_id, request_id)
+    for request_id in range(0, 100, 2):
+        assert queue.cancel(request_id)
+    assert not queue.cancel(0)
+    assert len(queue) == 50
+    assert queue.get(3) == [1, 3, 5]
+    assert not queue.cancel(1)
+    assert queue.get(100) == list(range(7, 100, 2))
+    assert queue.stats()["cancelled"] == 50
@@ -0,0 +1,75 @@
+import pytest
+
+from tensorrt_llm.hlapi.detokenizer import IncrementalDetokenizer
+
+
+class ByteTokenizer:
+    ''' One token per UTF-8 byte, like the byte fallback of sentencepiece.  '''
+
+    def encode(self, text: str):
+        return list(text.encode())
+
+    def decode(self, token_ids) -> str:
+        return bytes(token_ids).decode(errors='replace')
+
+
+class PieceTokenizer:
+    ''' Sentencepiece-like pieces, the leading space of the decoded text is stripped.  '''
+
+    def __init__(self, text: str):
+        self.pieces = sorted(set(text.replace(' ', '▁').split('|')))
+
+    def encode(self, text: str):
+        return [self.pieces.index(p) for p in text.replace(' ', '▁').split('|')]
+
+    def decode(self, token_ids) -> str:
+        text = ''.join(self.pieces[i] for i in token_ids).replace('▁', ' ')
+        return text[1:] if text.startswith(' ') else text
+
+
+def stream(detokenizer, token_ids, step):
+    deltas = []
+    for i in range(0, len(token_ids), step):
+        deltas.append(detokenizer.decode(token_ids[i:i + step]))
+    deltas.append(detokenizer.flush())
+    return deltas
+
+
+@pytest.mark.parametrize("step", [1, 2, 5])
+def test_multi_byte(step):
+    tokenizer = ByteTokenizer()
+    prompt = tokenizer.encode("Translate: ")
+    output = tokenizer.encode("日本語 is Japanese, naïve 🙂!")
+    deltas = stream(IncrementalDetokenizer(tokenizer, prompt), output, step)
+
+    assert ''.join(deltas) == "日本語 is Japanese, naïve 🙂!"
+    assert not any('�' in delta for delta in deltas)
+
+
+@pytest.mark.parametrize("step", [1, 3])
+def test_sentencepiece_leading_space(step):
+    tokenizer = PieceTokenizer(" Tell| me| a| story|:| Once| up|on| a| time")
+    prompt = tokenizer.encode(" Tell| me| a| story|:")
+    output = tokenizer.encode(" Once| up|on| a| time")
+    deltas = stream(IncrementalDetokenizer(tokenizer, prompt), output, step)
+
+    # The prompt is not emitted, the first word keeps its leading space
+    assert ''.join(deltas) == " Once upon a time"
+
+    # Without the prompt as context the leading space is dropped as by decode
+    deltas = stream(IncrementalDetokenizer(tokenizer), output, step)
+    assert ''.join(deltas) == "Once upon a time"
+
+
+def test_bounded_window():
+    tokenizer = ByteTokenizer()
+    detokenizer = IncrementalDetokenizer(tokenizer, tokenizer.encode("x" * 100))
+    assert len(
+        detokenizer._token_ids) == IncrementalDetokenizer.PROMPT_CONTEXT_SIZE
+    for token_id in tokenizer.encode("a long output " * 100):
+        detokenizer.decode([token_id])
+        assert len(detokenizer._token_ids) <= 2
+
+    # An incomplete character is held back, then flushed as is
+    assert detokenizer.decode(tokenizer.encode("é")[:1]) == ''
+    assert detokenizer.flush() == '�'
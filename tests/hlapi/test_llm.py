@@ -6,8 +6,12 @@ import pytest
 import torch
 from transformers import AutoTokenizer
 
-from tensorrt_llm.hlapi.llm import (LLM, ModelConfig, SamplingConfig,
-                                    TokenIdsTy, TokenizerBase)
+from tensorrt_llm import profiler
+from tensorrt_llm.builder import BuildConfig
+from tensorrt_llm.hlapi.llm import (LLM, GenerationOuptut, ModelConfig,
+                                    SamplingConfig, TokenIdsTy, TokenizerBase,
+                                    _bucket_by_length, _count_padding_tokens,
+                                    _ModelRuntimeStuff, _restore_order)
 
 llm_models_root = os.environ.get('LLM_MODELS_ROOT',
                                  '/scratch.trt_llm_data/llm-models/')
@@ -104,6 +108,144 @@ def test_llm_without_tokenizer():
         print(output)
 
 
+def test_bucket_by_length():
+    input_lengths = [100, 3, 90, 5, 4, 95]
+    output_lengths = [8, 8, 8, 8, 64, 8]
+    batches = _bucket_by_length(input_lengths, output_lengths, 2)
+    assert batches == [[1, 3], [2, 5], [0, 4]]
+
+    arrival_order_batches = [[0, 1], [2, 3], [4, 5]]
+    assert _count_padding_tokens(arrival_order_batches, input_lengths,
+                                 output_lengths) == 97 + 85 + 91 + 56
+    assert _count_padding_tokens(batches, input_lengths,
+                                 output_lengths) == 2 + 5 + 96 + 56
+
+
+def test_restore_order():
+    outputs = [GenerationOuptut(request_id=i) for i in [2, 0, 3, 1]]
+    assert [o.request_id for o in _restore_order(outputs)] == [0, 1, 2, 3]
+
+
+class CharTokenizer(TokenizerBase):
+
+    @property
+    def eos_token_id(self) -> int:
+        return 0
+
+    @property
+    def pad_token_id(self) -> int:
+        return 0
+
+    def encode(self, text: str) -> TokenIdsTy:
+        return [ord(c) for c in text]
+
+    def decode(self, token_ids: TokenIdsTy) -> str:
+        return ''.join(chr(i) for i in token_ids)
+
+    def batch_encode_plus(self, texts: List[str]) -> dict:
+        return dict(input_ids=[self.encode(text) for text in texts])
+
+
+class EchoRunner:
+    ''' Generates the prompt over and over.  '''
+
+    def __init__(self):
+        self.batches = []
+
+    def generate(self, batch_input_ids, sampling_config, max_new_tokens=None):
+        max_new_tokens = max_new_tokens or sampling_config.max_new_tokens
+        self.batches.append([x.tolist() for x in batch_input_ids])
+        max_len = max(x.size(0) for x in batch_input_ids) + max_new_tokens
+        output_ids = torch.zeros(len(batch_input_ids), 1, max_len)
+        sequence_lengths = torch.zeros(len(batch_input_ids), 1)
+        for i, x in enumerate(batch_input_ids):
+            output = torch.cat([x, x.repeat(max_new_tokens)[:max_new_tokens]])
+            output_ids[i, 0, :output.size(0)] = output
+            sequence_lengths[i, 0] = output.size(0)
+        return dict(output_ids=output_ids.int(),
+                    sequence_lengths=sequence_lengths.int())
+
+
+def _make_echo_llm(max_batch_size: int, pipeline_workers: int = 0) -> LLM:
+    llm = LLM.__new__(LLM)
+    llm.config = ModelConfig(model_dir=llama_model_path)
+    llm.config.build_config = BuildConfig(max_batch_size=max_batch_size)
+    llm.pipeline_workers = pipeline_workers
+    llm.pipeline_queue_size = 2
+    llm.bucketing_report = None
+    llm.default_sampling_config = SamplingConfig(end_id=0,
+                                                 pad_id=0,
+                                                 max_new_tokens=4,
+                                                 output_sequence_lengths=True,
+                                                 return_dict=True)
+    llm.runtime_stuff = _ModelRuntimeStuff(runner=EchoRunner(),
+                                           tokenizer=CharTokenizer())
+    return llm
+
+
+echo_prompts = ["hello", "a", "a longer prompt", "bc", "hi", "another one"]
+
+
+@pytest.mark.parametrize("pipeline_workers", [0, 2])
+def test_generate_bucketed(pipeline_workers):
+    llm = _make_echo_llm(max_batch_size=2, pipeline_workers=pipeline_workers)
+    max_new_tokens = [3, 5, 2, 8, 1, 5]
+    outputs = list(
+        llm._generate_sync(echo_prompts,
+                           llm.runtime_stuff,
+                           None,
+                           max_new_tokens=max_new_tokens,
+                           bucketing=True))
+    assert [o.request_id for o in outputs] == list(range(len(echo_prompts)))
+    for prompt, num_tokens, output in zip(echo_prompts, max_new_tokens,
+                                          outputs):
+        assert output.generate_pieces[0].text == (prompt * 8)[:num_tokens]
+
+    tokenizer = CharTokenizer()
+    assert llm.runtime_stuff.runner.batches == [[
+        tokenizer.encode(echo_prompts[i]) for i in batch
+    ] for batch in [[4, 2], [0, 1], [5, 3]]]
+    report = llm.bucketing_report
+    assert report.num_batches == 3
+    assert report.padding_tokens == 13 + 1 + 4 + 2 + 9 + 3
+    assert report.saved_padding_tokens > 0
+
+    outputs = llm._generate_sync(echo_prompts,
+                                 llm.runtime_stuff,
+                                 None,
+                                 max_new_tokens=max_new_tokens,
+                                 bucketing=True,
+                                 keep_order=False)
+    assert [o.request_id for o in outputs] == [4, 2, 0, 1, 5, 3]
+
+
+def test_generate_pipelined():
+    profiler.reset()
+    llm = _make_echo_llm(max_batch_size=1, pipeline_workers=2)
+    outputs = list(llm._generate_sync(echo_prompts, llm.runtime_stuff, None))
+    assert [o.generate_pieces[0].text
+            for o in outputs] == [(prompt * 4)[:4] for prompt in echo_prompts]
+    for stage in ["LLM tokenize", "LLM generate", "LLM detokenize"]:
+        assert profiler.elapsed_time_in_sec(stage) > 0
+    _, max_depth = profiler.queue_depth_stats("LLM tokenized batches")
+    assert max_depth <= 2
+
+
+def test_llm_generate_bucketed():
+    config = ModelConfig(model_dir=llama_model_path)
+    llm = LLM(config)
+
+    long_prompts = prompts + ["Tell a very long story about " * 20]
+    max_new_tokens = [16, 4, 8]
+    outputs = list(
+        llm(long_prompts, max_new_tokens=max_new_tokens, bucketing=True))
+    assert [o.request_id for o in outputs] == [0, 1, 2]
+    for output, num_tokens in zip(outputs, max_new_tokens):
+        assert len(output.generate_pieces[0].token_ids) <= num_tokens
+    assert llm.bucketing_report.num_prompts == len(long_prompts)
+    assert llm.bucketing_report.saved_padding_tokens >= 0
+
+
 @pytest.mark.skipif(torch.cuda.device_count() < 2,
                     reason="The test needs at least 2 GPUs, skipping")
 def test_llm_build_engine_for_tp2():
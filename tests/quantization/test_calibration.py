@@ -0,0 +1,124 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import tempfile
+import unittest
+
+import torch
+import torch.nn as nn
+
+from tensorrt_llm.quantization.calibration import (_padding_mask,
+                                                   calibrate_activation_range,
+                                                   run_calibration)
+
+
+class TinyModel(nn.Module):
+    ''' A causal LM of two linear layers, the tokens mixed by a cumsum.  '''
+
+    def __init__(self, vocab_size=32, hidden_size=16):
+        super().__init__()
+        self.embedding = nn.Embedding(vocab_size, hidden_size)
+        self.fc = nn.Linear(hidden_size, 4 * hidden_size)
+        self.proj = nn.Linear(4 * hidden_size, hidden_size)
+        self.num_forwards = 0
+
+    def forward(self, input_ids, attention_mask=None):
+        self.num_forwards += 1
+        hidden = self.embedding(input_ids).cumsum(dim=1)
+        return self.proj(torch.relu(self.fc(hidden)))
+
+
+class TestCalibration(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = TinyModel()
+        lengths = torch.randint(1, 24, (19, )).tolist()
+        self.samples = [
+            torch.randint(1, 32, (length, )).tolist() for length in lengths
+        ]
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_padded_batches(self):
+        reference = run_calibration(self.model, self.samples, batch_size=1)
+        # The padded tokens are large enough to change the maxima if counted
+        act_range = run_calibration(self.model,
+                                    self.samples,
+                                    batch_size=8,
+                                    pad_token_id=31)
+        self.assertEqual(sorted(act_range), ['fc', 'proj'])
+        for name in ('fc', 'proj'):
+            for key in ('x', 'y', 'w'):
+                torch.testing.assert_close(act_range[name][key],
+                                           reference[name][key])
+        self.assertEqual(act_range['fc']['x'].shape, (16, ))
+        self.assertEqual(act_range['fc']['y'].shape, (64, ))
+        self.assertEqual(act_range['fc']['w'].shape, (64, ))
+        # The hooks are removed
+        num_forwards = self.model.num_forwards
+        self.model(torch.tensor([[1, 2]]))
+        self.assertEqual(self.model.num_forwards, num_forwards + 1)
+        self.assertEqual(len(act_range), 2)
+
+    def test_padding_mask(self):
+        mask = torch.tensor([[True, True, False], [True, False, False]])
+        self.assertEqual(
+            _padding_mask(torch.zeros(2, 3, 4), mask).shape, (2, 3, 1))
+        seq_first = _padding_mask(torch.zeros(3, 2, 4), mask)
+        self.assertTrue(torch.equal(seq_first[..., 0], mask.t()))
+        self.assertEqual(_padding_mask(torch.zeros(6, 4), mask).shape, (6, 1))
+        self.assertIsNone(_padding_mask(torch.zeros(5, 4), mask))
+        self.assertIsNone(_padding_mask(torch.zeros(2, 3, 4), None))
+
+    def test_cache(self):
+        cache_dir = self.tmp_dir.name
+        act_range = calibrate_activation_range(self.model,
+                                               self.samples,
+                                               cache_dir=cache_dir)
+        num_forwards = self.model.num_forwards
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+        # Another conversion of the same model skips the forward passes
+        cached = calibrate_activation_range(self.model,
+                                            iter(self.samples),
+                                            cache_dir=cache_dir)
+        self.assertEqual(self.model.num_forwards, num_forwards)
+        for name in act_range:
+            for key in ('x', 'y', 'w'):
+                self.assertTrue(
+                    torch.equal(cached[name][key], act_range[name][key]))
+        # The smoothing functions add the entries of the fused layers
+        self.assertEqual(cached['qkv'], {"x": None, "y": None, "w": None})
+
+        # Other samples or weights are calibrated again
+        calibrate_activation_range(self.model,
+                                   self.samples[1:],
+                                   cache_dir=cache_dir)
+        self.assertGreater(self.model.num_forwards, num_forwards)
+        num_forwards = self.model.num_forwards
+        with torch.no_grad():
+            self.model.fc.weight.mul_(2)
+        calibrate_activation_range(self.model,
+                                   self.samples,
+                                   cache_dir=cache_dir)
+        self.assertGreater(self.model.num_forwards, num_forwards)
+        self.assertEqual(len(os.listdir(cache_dir)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import torch
+from parameterized import parameterized
+
+import tensorrt_llm  # noqa: F401, loads the plugin library
+# yapf: disable
+from tensorrt_llm.quantization.weight_quant import (dequantize,
+                                                    groupwise_scales, pack_int4,
+                                                    parallel_map,
+                                                    per_channel_scales,
+                                                    quantize,
+                                                    symmetric_quantize,
+                                                    unpack_int4)
+
+# yapf: enable
+
+
+class TestWeightQuant(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+
+    def test_per_channel(self):
+        weight = torch.randn(256, 64, dtype=torch.float16)
+        for bits in (8, 4):
+            scales = per_channel_scales(weight, bits)
+            self.assertEqual(scales.shape, (64, ))
+            q = quantize(weight, scales, bits)
+            self.assertEqual(q.dtype, torch.int8)
+            self.assertGreaterEqual(q.min(), -(1 << (bits - 1)))
+            self.assertLessEqual(q.max(), (1 << (bits - 1)) - 1)
+            error = (dequantize(q, scales) - weight.float()).abs()
+            # The largest positive values are clamped to 2^(bits-1) - 1
+            self.assertTrue(torch.all(error <= scales + 1e-3))
+
+    def test_round_half_away_from_zero(self):
+        # The ties of the C++ ops, std::round, not round half to even
+        weight = torch.tensor([
+            0.5, -0.5, 1.5, -1.5, 2.5, -2.5, 126.5, -127.5, 0.49999997, 2.4,
+            -2.6, 200.0
+        ]).unsqueeze(-1)
+        expected = [1, -1, 2, -2, 3, -3, 127, -128, 0, 2, -3, 127]
+        q = quantize(weight, torch.ones(1), 8)
+        self.assertEqual(q.view(-1).tolist(), expected)
+        q = quantize(weight / 16, torch.full((1, ), 1 / 16), 4)
+        self.assertEqual(
+            q.view(-1).tolist(), [max(-8, min(7, x)) for x in expected])
+
+    def test_groupwise(self):
+        # Batched as the weights of the experts
+        weight = torch.randn(2, 256, 64)
+        scales, zeros = groupwise_scales(weight, 64)
+        self.assertEqual(scales.shape, (2, 4, 64))
+        self.assertIsNone(zeros)
+        q = quantize(weight, scales, 4, group_size=64)
+        error = (dequantize(q, scales, group_size=64) - weight).abs()
+        self.assertTrue(
+            torch.all(error <= scales.repeat_interleave(64, dim=1) + 1e-6))
+
+        # The zeros shift the range of the groups
+        weight = torch.rand(256, 64) + 1
+        scales, zeros = groupwise_scales(weight, 64, zero_point=True)
+        q = quantize(weight, scales, 4, group_size=64, zeros=zeros)
+        self.assertEqual(q.min(), -8)
+        self.assertEqual(q.max(), 7)
+        error = (dequantize(q, scales, group_size=64, zeros=zeros) -
+                 weight).abs()
+        symmetric, _ = groupwise_scales(weight, 64)
+        self.assertLess(error.max(), symmetric.min() / 2)
+
+        with self.assertRaises(ValueError):
+            groupwise_scales(weight, 100)
+
+    def test_pack_int4(self):
+        q = torch.randint(-8, 8, (16, 32), dtype=torch.int8)
+        packed = pack_int4(q)
+        self.assertEqual(packed.shape, (16, 16))
+        self.assertEqual(packed.dtype, torch.int8)
+        # The even index in the low nibble
+        self.assertEqual(packed[0, 0].item() & 0x0F, q[0, 0].item() & 0x0F)
+        self.assertTrue(torch.equal(unpack_int4(packed), q))
+        self.assertTrue(torch.equal(unpack_int4(packed, signed=False),
+                                    q & 0x0F))
+
+        # The int32 of the GPTQ checkpoints hold 8 values
+        packed_int32 = packed.view(torch.int32)
+        self.assertEqual(packed_int32.shape, (16, 4))
+        self.assertTrue(torch.equal(unpack_int4(packed_int32), q))
+
+        with self.assertRaises(ValueError):
+            pack_int4(q[:, :31])
+
+    @parameterized.expand([(torch.int8, ), (torch.quint4x2, )])
+    def test_symmetric_quantize(self, quant_type):
+        weight = torch.randn(128, 256, dtype=torch.float16)
+        # Exact ties: the scale of the columns of maximum 128 is 1 for int8
+        # and 16 for int4
+        tie_scale = 1 if quant_type == torch.int8 else 16
+        weight[0] = 128
+        for row, value in enumerate([0.5, -0.5, 2.5, -2.5, 5.5], start=1):
+            weight[row] = value * tie_scale
+        _, ref_processed, ref_scales = \
+            torch.ops.fastertransformer._symmetric_quantize_last_axis_of_batched_matrix(
+                weight, quant_type)
+        processed, scales = symmetric_quantize(weight, quant_type)
+        self.assertEqual(scales.dtype, torch.float16)
+        torch.testing.assert_close(scales, ref_scales)
+        self.assertTrue(torch.equal(processed, ref_processed))
+
+    def test_parallel_map(self):
+        weights = [torch.randn(64, 64) for _ in range(16)]
+        results = parallel_map(per_channel_scales, weights, workers=4)
+        for weight, scales in zip(weights, results):
+            self.assertTrue(torch.equal(scales, per_channel_scales(weight)))
+        self.assertEqual(parallel_map(abs, [-1, 2], workers=1), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,248 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+import re
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+
+from tensorrt_llm.runtime.constrained_decoding import (
+    ConstrainedLogitsProcessor, TokenIndex)
+from tensorrt_llm.runtime.regex_fsm import RegexFSM, json_schema_to_regex
+
+EOS = 0
+VOCAB = [None] + list('{}[]",: -.0123456789abcdefghijklmnopqrstuvwxyz') + [
+    '{"', '":', '",', '"}', 'true', 'false', 'null', 'name', 'age', ' "', '12',
+    'ab', 'abc', '\n'
+]
+
+
+def generate(index, input_lengths, num_steps, num_beams=1, seed=0):
+    """ Sample random tokens under the constraint, as the generation loop does. """
+    generator = torch.Generator().manual_seed(seed)
+    processor = ConstrainedLogitsProcessor(index, input_lengths, num_beams)
+    rows = len(input_lengths) * num_beams
+    lengths = torch.tensor(input_lengths).repeat_interleave(num_beams)
+    input_ids = torch.full((rows, max(input_lengths) + num_steps), EOS)
+    for step in range(num_steps):
+        scores = torch.randn(rows, len(VOCAB) + 3, generator=generator)
+        scores = processor(step, input_ids, scores)
+        assert torch.isfinite(scores).any(-1).all()
+        input_ids[torch.arange(rows), lengths + step] = scores.argmax(-1)
+    outputs = []
+    for row in range(rows):
+        ids = input_ids[row, lengths[row]:].tolist()
+        outputs.append(''.join(
+            VOCAB[i] for i in ids[:ids.index(EOS)]) if EOS in ids else None)
+    return outputs
+
+
+class TestRegexFSM(unittest.TestCase):
+
+    def test_fullmatch(self):
+        cases = {
+            r'[a-c]+(x|yz)?\d{2,3}': ['ax12', 'abcyz123', 'a1', 'ayz1234'],
+            r'(ab|a)*b': ['b', 'abb', 'aab', 'a', ''],
+            r'[^"\\]*': ['abc', 'a"', '', 'x\\'],
+            r'^\w+@\w+\.com$': ['a@b.com', 'a@b.org', '@b.com'],
+            r'(?:[0-9]{1,2}|x)?y': ['y', '12y', '123y', 'xy'],
+        }
+        for pattern, strings in cases.items():
+            fsm = RegexFSM(pattern)
+            for string in strings:
+                self.assertEqual(fsm.fullmatch(string),
+                                 re.fullmatch(pattern, string) is not None,
+                                 (pattern, string))
+
+        with self.assertRaises(ValueError):
+            RegexFSM(r'(a')
+        with self.assertRaises(ValueError):
+            RegexFSM(r'(a)\1')
+
+    def test_json_schema(self):
+        schema = {
+            "type": "object",
+            "properties": {
+                "name": {
+                    "type": "string",
+                    "maxLength": 10
+                },
+                "age": {
+                    "type": "integer"
+                },
+                "tags": {
+                    "type": "array",
+                    "items": {
+                        "enum": ["a", "b"]
+                    },
+                    "maxItems": 3
+                },
+                "ok": {
+                    "type": "boolean"
+                },
+            },
+            "required": ["name", "age"]
+        }
+        fsm = RegexFSM(json_schema_to_regex(schema))
+        for document in [{
+                "name": "bob",
+                "age": 3
+        }, {
+                "name": "bob",
+                "age": -3,
+                "tags": ["a", "b"],
+                "ok": True
+        }]:
+            self.assertTrue(fsm.fullmatch(json.dumps(document)))
+            self.assertTrue(
+                fsm.fullmatch(json.dumps(document, separators=(',', ':'))))
+        for document in [
+                '{"age": 3}', '{"name": "bob", "age": 3.5}',
+                '{"name": "bobbobbobbob", "age": 3}',
+                '{"name": "bob", "age": 3, "tags": ["a", "a", "a", "a"]}'
+        ]:
+            self.assertFalse(fsm.fullmatch(document))
+
+        # All the properties are optional
+        fsm = RegexFSM(
+            json_schema_to_regex({
+                "properties": {
+                    "a": {
+                        "type": "integer"
+                    },
+                    "b": {
+                        "type": "null"
+                    }
+                }
+            }))
+        for document in [
+                '{}', '{"a": 1}', '{"b": null}', '{"a": 1, "b": null}'
+        ]:
+            self.assertTrue(fsm.fullmatch(document))
+        self.assertFalse(fsm.fullmatch('{, "b": null}'))
+
+
+class TestConstrainedDecoding(unittest.TestCase):
+
+    def test_token_index(self):
+        index = TokenIndex.from_regex(r'ab?c',
+                                      vocab=VOCAB,
+                                      eos_token_ids=[EOS],
+                                      use_cache=False)
+        allowed = [VOCAB[i] for i in index.allowed_token_ids(0)]
+        self.assertEqual(sorted(allowed), ['a', 'ab', 'abc'])
+
+        states = index.advance(
+            [0, 0, 0], [VOCAB.index('abc'),
+                        VOCAB.index('a'),
+                        VOCAB.index('c')])
+        self.assertEqual(states[2], index.done_state)
+        # Only the end token is allowed after a match
+        self.assertEqual(index.allowed_token_ids(states[0]).tolist(), [EOS])
+        self.assertEqual(
+            sorted(VOCAB[i] for i in index.allowed_token_ids(states[1])),
+            ['b', 'c'])
+
+    def test_token_index_matches_vocab_scan(self):
+        pattern = json_schema_to_regex({
+            "type": "array",
+            "items": {
+                "type": "string"
+            },
+            "maxItems": 2
+        })
+        fsm = RegexFSM(pattern)
+        index = TokenIndex.build(fsm, VOCAB, [EOS], states_per_walk=3)
+        self.assertEqual(index.done_state, fsm.num_states)
+        for state in range(fsm.num_states):
+            expected = {
+                token_id: fsm.walk(token, state)
+                for token_id, token in enumerate(VOCAB)
+                if token and fsm.walk(token, state) is not None
+            }
+            if state in fsm.finals:
+                expected[EOS] = index.done_state
+            allowed = index.allowed_token_ids(state)
+            self.assertEqual(
+                dict(
+                    zip(allowed.tolist(),
+                        index.advance([state] * len(allowed),
+                                      allowed).tolist())), expected)
+
+    def test_generate_regex(self):
+        pattern = r'(true|false|-?[0-9]{1,4}) [a-c]+\.'
+        index = TokenIndex.from_regex(pattern,
+                                      vocab=VOCAB,
+                                      eos_token_ids=[EOS],
+                                      use_cache=False)
+        outputs = generate(index, [3, 1, 6, 2] * 4, num_steps=24)
+        for output in outputs:
+            if output is not None:
+                self.assertRegex(output, '^' + pattern + '$')
+        self.assertTrue(any(output is not None for output in outputs))
+
+    def test_generate_json_beams(self):
+        schema = {
+            "type": "object",
+            "properties": {
+                "name": {
+                    "type": "string",
+                    "maxLength": 4
+                },
+                "age": {
+                    "type": "integer"
+                }
+            },
+            "required": ["name", "age"]
+        }
+        index = TokenIndex.from_json_schema(schema,
+                                            vocab=VOCAB,
+                                            eos_token_ids=[EOS],
+                                            use_cache=False)
+        outputs = generate(index, [2, 5], num_steps=40, num_beams=2)
+        for output in outputs:
+            if output is not None:
+                self.assertEqual(list(json.loads(output)), ["name", "age"])
+        self.assertTrue(any(output is not None for output in outputs))
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            index = TokenIndex.from_regex(r'[0-9]+',
+                                          vocab=VOCAB,
+                                          eos_token_ids=[EOS],
+                                          cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            cached = TokenIndex.from_regex(r'[0-9]+',
+                                           vocab=VOCAB,
+                                           eos_token_ids=[EOS],
+                                           cache_dir=cache_dir)
+            for name in ('offsets', 'token_ids', 'next_states'):
+                np.testing.assert_array_equal(getattr(index, name),
+                                              getattr(cached, name))
+            self.assertEqual(cached.eos_token_ids, [EOS])
+
+            # Another vocabulary has its own entry
+            TokenIndex.from_regex(r'[0-9]+',
+                                  vocab=VOCAB + ['99'],
+                                  eos_token_ids=[EOS],
+                                  cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
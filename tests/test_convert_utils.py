@@ -0,0 +1,221 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import tempfile
+import unittest
+
+import safetensors.torch
+import torch
+from parameterized import parameterized
+
+from tensorrt_llm.mapping import Mapping
+from tensorrt_llm.models.convert_utils import (CheckpointConverter,
+                                               SafetensorsWriter)
+from tensorrt_llm.models.llama.convert import llama_weight_rules
+
+
+class TestCheckpointConverter(unittest.TestCase):
+
+    num_layers = 4
+    hidden_size = 16
+    num_heads = 4
+    num_kv_heads = 2
+    vocab_size = 32
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.model_dir = self.tmp_dir.name
+        head_dim = self.hidden_size // self.num_heads
+        kv_size = self.num_kv_heads * head_dim
+        hidden = self.hidden_size
+        self.hf_weights = {
+            'model.embed_tokens.weight': torch.randn(self.vocab_size, hidden),
+            'model.norm.weight': torch.randn(hidden),
+            'lm_head.weight': torch.randn(self.vocab_size, hidden),
+        }
+        for i in range(self.num_layers):
+            prefix = f'model.layers.{i}'
+            self.hf_weights.update({
+                f'{prefix}.self_attn.q_proj.weight':
+                torch.randn(hidden, hidden),
+                f'{prefix}.self_attn.k_proj.weight':
+                torch.randn(kv_size, hidden),
+                f'{prefix}.self_attn.v_proj.weight':
+                torch.randn(kv_size, hidden),
+                f'{prefix}.self_attn.o_proj.weight':
+                torch.randn(hidden, hidden),
+                f'{prefix}.mlp.gate_proj.weight':
+                torch.randn(2 * hidden, hidden),
+                f'{prefix}.mlp.up_proj.weight':
+                torch.randn(2 * hidden, hidden),
+                f'{prefix}.mlp.down_proj.weight':
+                torch.randn(hidden, 2 * hidden),
+                f'{prefix}.input_layernorm.weight':
+                torch.randn(hidden),
+                f'{prefix}.post_attention_layernorm.weight':
+                torch.randn(hidden),
+                f'{prefix}.self_attn.rotary_emb.inv_freq':
+                torch.randn(head_dim // 2),
+            })
+        # Two shards, the q/k/v projections of layer 1 span both shards
+        names = list(self.hf_weights.keys())
+        half = names.index('model.layers.1.self_attn.k_proj.weight')
+        for shard, shard_names in enumerate([names[:half], names[half:]]):
+            safetensors.torch.save_file(
+                {name: self.hf_weights[name]
+                 for name in shard_names},
+                os.path.join(self.model_dir,
+                             f'model-{shard:05d}-of-00002.safetensors'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def reference(self, tp_size, pp_size, rank, pp_partition=None):
+        tp_rank = rank % tp_size
+        pp_rank = rank // tp_size
+        w = self.hf_weights
+        layers = Mapping(world_size=tp_size * pp_size,
+                         rank=rank,
+                         tp_size=tp_size,
+                         pp_size=pp_size,
+                         pp_partition=pp_partition).pp_layers(self.num_layers)
+
+        def split(v, dim=0):
+            return torch.chunk(v, tp_size, dim=dim)[tp_rank]
+
+        def split_kv(v):
+            if self.num_kv_heads < tp_size:
+                reps = tp_size // self.num_kv_heads
+                v = v.reshape(self.num_kv_heads, 1, -1,
+                              v.shape[-1]).repeat(1, reps, 1,
+                                                  1).reshape(-1, v.shape[-1])
+            return split(v)
+
+        ref = {}
+        if pp_rank == 0:
+            ref['vocab_embedding.weight'] = w['model.embed_tokens.weight']
+        if pp_rank == pp_size - 1:
+            ref['ln_f.weight'] = w['model.norm.weight']
+            ref['lm_head.weight'] = split(w['lm_head.weight'])
+        for local, layer in enumerate(layers):
+            prefix = f'model.layers.{layer}'
+            target = f'layers.{local}'
+            ref[f'{target}.attention.qkv.weight'] = torch.cat([
+                split(w[f'{prefix}.self_attn.q_proj.weight']),
+                split_kv(w[f'{prefix}.self_attn.k_proj.weight']),
+                split_kv(w[f'{prefix}.self_attn.v_proj.weight'])
+            ])
+            ref[f'{target}.attention.dense.weight'] = split(
+                w[f'{prefix}.self_attn.o_proj.weight'], dim=1)
+            ref[f'{target}.mlp.fc.weight'] = split(
+                w[f'{prefix}.mlp.gate_proj.weight'])
+            ref[f'{target}.mlp.gate.weight'] = split(
+                w[f'{prefix}.mlp.up_proj.weight'])
+            ref[f'{target}.mlp.proj.weight'] = split(
+                w[f'{prefix}.mlp.down_proj.weight'], dim=1)
+            ref[f'{target}.input_layernorm.weight'] = w[
+                f'{prefix}.input_layernorm.weight']
+            ref[f'{target}.post_layernorm.weight'] = w[
+                f'{prefix}.post_attention_layernorm.weight']
+        return ref
+
+    def check_weights(self, weights, ref, dtype):
+        self.assertEqual(set(weights.keys()), set(ref.keys()))
+        for name, value in ref.items():
+            self.assertEqual(weights[name].dtype, dtype, name)
+            torch.testing.assert_close(weights[name], value.to(dtype), msg=name)
+
+    @parameterized.expand([(1, 1), (2, 1), (1, 2), (2, 2), (4, 1), (1, 3),
+                           (2, 2, [1, 3]), (1, 3, [1, 3, 0])])
+    def test_convert_to_dict(self, tp_size, pp_size, pp_partition=None):
+        rules = llama_weight_rules(self.num_kv_heads)
+        converter = CheckpointConverter(rules,
+                                        self.num_layers,
+                                        'float16',
+                                        tp_size=tp_size,
+                                        pp_size=pp_size,
+                                        workers=3,
+                                        max_inflight=2,
+                                        pp_partition=pp_partition)
+        weights = converter.convert_to_dict(self.model_dir)
+        self.assertEqual(set(weights.keys()), set(range(tp_size * pp_size)))
+        for rank, rank_weights in weights.items():
+            self.check_weights(
+                rank_weights,
+                self.reference(tp_size, pp_size, rank, pp_partition),
+                torch.float16)
+
+    def test_convert_to_files(self):
+        tp_size, pp_size = 2, 2
+        embedding = torch.randn(self.vocab_size, self.hidden_size)
+        overrides = {'model.embed_tokens.weight': embedding}
+        rules = llama_weight_rules(self.num_kv_heads,
+                                   use_parallel_embedding=True,
+                                   sharding_dim=0)
+        converter = CheckpointConverter(rules,
+                                        self.num_layers,
+                                        'bfloat16',
+                                        tp_size=tp_size,
+                                        pp_size=pp_size,
+                                        ranks=[0, 1, 3],
+                                        workers=2)
+        with tempfile.TemporaryDirectory() as output_dir:
+            converter.convert_to_files(self.model_dir, output_dir, overrides)
+            self.assertEqual(
+                sorted(os.listdir(output_dir)),
+                ['rank0.safetensors', 'rank1.safetensors', 'rank3.safetensors'])
+            for rank in [0, 1, 3]:
+                weights = safetensors.torch.load_file(
+                    os.path.join(output_dir, f'rank{rank}.safetensors'))
+                ref = self.reference(tp_size, pp_size, rank)
+                if rank < tp_size:
+                    ref['vocab_embedding.weight'] = torch.chunk(
+                        embedding, tp_size)[rank]
+                self.check_weights(weights, ref, torch.bfloat16)
+
+    def test_safetensors_writer(self):
+        weights = {
+            f'layers.{i}.weight': torch.randn(4, 8).to(dtype)
+            for i, dtype in enumerate(
+                [torch.float32, torch.float16, torch.bfloat16, torch.int8])
+        }
+        # 0 reserved bytes, the data is moved after the header when closing
+        for reserved_header_size in [1 << 20, 0]:
+            with tempfile.TemporaryDirectory() as output_dir:
+                path = os.path.join(output_dir, 'rank0.safetensors')
+                writer = SafetensorsWriter(
+                    path, reserved_header_size=reserved_header_size)
+                for name, value in weights.items():
+                    writer.add(name, value)
+                writer.close()
+                self.assertEqual(os.listdir(output_dir), ['rank0.safetensors'])
+                loaded = safetensors.torch.load_file(path)
+                self.assertEqual(set(loaded.keys()), set(weights.keys()))
+                for name, value in weights.items():
+                    torch.testing.assert_close(loaded[name], value)
+
+        # A failed conversion leaves no temporary file
+        with tempfile.TemporaryDirectory() as output_dir:
+            path = os.path.join(output_dir, 'rank0.safetensors')
+            with self.assertRaises(AssertionError):
+                with SafetensorsWriter(path) as writer:
+                    writer.add('layers.0.weight', weights['layers.0.weight'])
+                    writer.add('layers.0.weight', weights['layers.0.weight'])
+            self.assertEqual(os.listdir(output_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
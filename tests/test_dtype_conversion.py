@@ -0,0 +1,107 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import numpy as np
+import torch
+from parameterized import parameterized
+
+from tensorrt_llm._dtype_conversion import (convert, dtype_name, np_bfloat16,
+                                            np_float8, np_float8_e5m2)
+
+_TORCH_DTYPES = {
+    'bfloat16': torch.bfloat16,
+    'fp8': torch.float8_e4m3fn,
+    'fp8_e5m2': torch.float8_e5m2,
+}
+
+
+def _bits(x: np.ndarray) -> np.ndarray:
+    return x.view(np.uint16 if x.dtype.itemsize == 2 else np.uint8)
+
+
+def _torch_bits(x: torch.Tensor) -> np.ndarray:
+    dtype = torch.int16 if x.element_size() == 2 else torch.uint8
+    return _bits(x.view(dtype).numpy())
+
+
+class TestDtypeConversion(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # All the exponents, and normal values of all the magnitudes
+        bits = rng.integers(0, 1 << 32, 1 << 18, dtype=np.uint64)
+        magnitudes = rng.standard_normal(1 << 16) * 10.0**rng.integers(
+            -12, 6, 1 << 16)
+        specials = [
+            0.0, -0.0, np.inf, -np.inf, np.nan, 448, 464, 480, 57344, 61440,
+            2**-9, 2**-10, 3 * 2**-11, 3.4e38, 1e-45
+        ]
+        self.x = np.concatenate([
+            bits.astype(np.uint32).view(np.float32),
+            magnitudes.astype(np.float32),
+            np.array(specials, dtype=np.float32)
+        ])
+
+    @parameterized.expand([('bfloat16', ), ('fp8', ), ('fp8_e5m2', )])
+    def test_from_float32(self, dtype):
+        # Small chunks and threads, the result does not depend on them
+        y = convert(self.x, dtype, chunk_size=1 << 12, num_threads=4)
+        self.assertEqual(y.shape, self.x.shape)
+        self.assertEqual(dtype_name(y.dtype), dtype_name(dtype))
+        expected = torch.from_numpy(self.x).to(_TORCH_DTYPES[dtype])
+        # The NaN payloads differ
+        nan = np.isnan(self.x)
+        np.testing.assert_array_equal(
+            _bits(y)[~nan],
+            _torch_bits(expected)[~nan])
+        self.assertTrue(np.isnan(convert(y, np.float32)[nan]).all())
+
+        # Back to float32 and float16
+        np.testing.assert_array_equal(convert(y, np.float32),
+                                      expected.float().numpy())
+        np.testing.assert_array_equal(convert(y, np.float16),
+                                      expected.half().numpy())
+
+    def test_float16_to_bfloat16(self):
+        x = self.x[np.abs(self.x) < 60000].astype(np.float16)
+        y = convert(x, 'bfloat16')
+        expected = torch.from_numpy(x).to(torch.bfloat16)
+        np.testing.assert_array_equal(_bits(y), _torch_bits(expected))
+
+    def test_shapes_and_dtypes(self):
+        x = self.x[:24].reshape(2, 3, 4)
+        y = convert(x[:, ::2], 'bfloat16')
+        self.assertEqual(y.shape, (2, 2, 4))
+        self.assertEqual(y.dtype, np_bfloat16)
+        np.testing.assert_array_equal(_bits(y),
+                                      _bits(convert(x, 'bfloat16'))[:, ::2])
+        # The fp8 formats are distinct dtypes
+        self.assertNotEqual(np_float8, np_float8_e5m2)
+        self.assertNotIn(np_float8_e5m2, {np_float8: 'float8'})
+        self.assertEqual(dtype_name(convert(x, np_float8).dtype), 'float8')
+        self.assertEqual(dtype_name(convert(x, np_float8_e5m2).dtype),
+                         'float8_e5m2')
+        self.assertIs(convert(y, 'bfloat16'), y)
+        np.testing.assert_array_equal(convert(x, np.float16),
+                                      x.astype(np.float16))
+        np.testing.assert_array_equal(
+            convert(np.arange(5, dtype=np.int64), np.int32), np.arange(5))
+        with self.assertRaises(TypeError):
+            convert(np.arange(5, dtype=np.int32), 'bfloat16')
+
+
+if __name__ == '__main__':
+    unittest.main()
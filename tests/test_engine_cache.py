@@ -0,0 +1,126 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from tensorrt_llm.builder import BuildConfig
+from tensorrt_llm.mapping import Mapping
+from tensorrt_llm.runtime.engine_cache import EngineCache
+
+PLATFORM = {'tensorrt_llm': '0.0.0', 'tensorrt': '0.0.0', 'sm': '80'}
+
+
+class TestEngineCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint_dir = os.path.join(self.tmp_dir.name, 'checkpoint')
+        os.makedirs(self.checkpoint_dir)
+        with open(os.path.join(self.checkpoint_dir, 'config.json'), 'w') as f:
+            json.dump({'architecture': 'LlamaForCausalLM'}, f)
+        self.write_weights(b'\0' * 1024)
+        self.cache = EngineCache(os.path.join(self.tmp_dir.name, 'cache'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_weights(self, data):
+        with open(os.path.join(self.checkpoint_dir, 'rank0.safetensors'),
+                  'wb') as f:
+            f.write(data)
+
+    def cache_key(self, build_config=None, mapping=None, **extra):
+        return self.cache.cache_key(self.checkpoint_dir, build_config
+                                    or BuildConfig(), mapping or Mapping(),
+                                    PLATFORM, **extra)
+
+    def test_cache_key(self):
+        key = self.cache_key()
+        self.assertEqual(self.cache_key(), key)
+        self.assertNotEqual(self.cache_key(BuildConfig(max_batch_size=16)), key)
+        self.assertNotEqual(
+            self.cache_key(mapping=Mapping(world_size=2, tp_size=2)), key)
+        self.assertNotEqual(self.cache_key(model_cls='models.Custom'), key)
+        self.assertNotEqual(
+            self.cache.cache_key(self.checkpoint_dir, BuildConfig(), Mapping(),
+                                 dict(PLATFORM, sm='90')), key)
+        # The weights are hashed again once modified
+        self.write_weights(b'\1' * 1024)
+        self.assertNotEqual(self.cache_key(), key)
+
+    def test_load_and_store(self):
+        key = self.cache_key()
+        self.assertIsNone(self.cache.load(key))
+        config = {'version': '0.0.0', 'build_config': {'max_batch_size': 8}}
+        self.cache.store(key, b'rank0 engine', config, rank=0)
+        # The other ranks are not built yet
+        self.assertIsNone(self.cache.load(key, rank=1))
+        self.cache.store(key, b'rank1 engine', config, rank=1)
+
+        cache = EngineCache(self.cache.cache_dir)
+        self.assertEqual(cache.load(key, rank=0), (b'rank0 engine', config))
+        self.assertEqual(cache.load(key, rank=1), (b'rank1 engine', config))
+        self.assertEqual(cache.stats(), {
+            'hits': 2,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0
+        })
+        self.assertEqual(self.cache.stats()['misses'], 2)
+        self.assertEqual(self.cache.stats()['stores'], 2)
+
+    def test_concurrent_stores(self):
+        key = self.cache_key()
+        engine = os.urandom(1 << 20)
+
+        def store_and_load(rank):
+            self.cache.store(key, engine, {'rank': rank}, rank=rank % 2)
+            return self.cache.load(key, rank=rank % 2)
+
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(store_and_load, range(32)))
+        for engine_buffer, config in results:
+            self.assertEqual(engine_buffer, engine)
+            self.assertIn(config['rank'], range(32))
+        # No temporary file is left
+        self.assertEqual(sorted(os.listdir(self.cache.entry_dir(key))),
+                         ['config.json', 'rank0.engine', 'rank1.engine'])
+
+    def test_eviction(self):
+        cache = EngineCache(self.cache.cache_dir, max_size=3 * 1024 + 512)
+        keys = [f'{i:032x}' for i in range(4)]
+        for key in keys[:3]:
+            cache.store(key, b'\0' * 1000, {})
+            # The modification times order the entries
+            time.sleep(0.01)
+        self.assertEqual(cache.stats()['evictions'], 0)
+
+        # The least recently used entry is evicted
+        self.assertIsNotNone(cache.load(keys[0]))
+        time.sleep(0.01)
+        cache.store(keys[3], b'\0' * 1000, {})
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertIsNone(cache.load(keys[1]))
+        for key in (keys[0], keys[2], keys[3]):
+            self.assertIsNotNone(cache.load(key))
+        self.assertLessEqual(cache.size(), cache.max_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -348,6 +348,72 @@ class TestKVCacheManager(unittest.TestCase):
 
         check_amount_of_blocks(arrays[0][0][0][0], 2)
 
+    def test_kv_cache_manager_block_reuse(self):
+        blocks = 8
+        tokens_per_block = 4
+        max_blocks_per_seq = 4
+        memory_pool = torch.zeros(2,
+                                  blocks,
+                                  tokens_per_block,
+                                  64,
+                                  dtype=torch.float,
+                                  device='cuda')
+        manager = KVCacheManager(memory_pools=[memory_pool],
+                                 blocks=blocks,
+                                 tokens_per_block=tokens_per_block,
+                                 max_blocks_per_seq=max_blocks_per_seq,
+                                 max_attention_window_size=max_blocks_per_seq *
+                                 tokens_per_block,
+                                 sink_token_len=0,
+                                 enable_block_reuse=True)
+        blocks_manager = manager.blocks_manager
+        prompt = list(range(10))
+
+        # Nothing is cached yet
+        seq0 = GenerationSequence(seq_idx=0, batch_idx=0)
+        self.assertEqual(manager.add_sequence(seq0, 10, prompt), 0)
+        self.assertEqual(blocks_manager.get_number_blocks(seq0), 3)
+        # The full blocks are cached after the context phase
+        manager.step([False])
+        self.assertEqual(blocks_manager.num_cached_blocks, 2)
+        block_table = blocks_manager.block_tables[blocks_manager._slots[seq0],
+                                                  0, :2].tolist()
+
+        # Same system prompt, different question
+        seq1 = GenerationSequence(seq_idx=1, batch_idx=1)
+        self.assertEqual(manager.add_sequence(seq1, 9, prompt[:8] + [42]), 8)
+        self.assertEqual(
+            blocks_manager.block_tables[blocks_manager._slots[seq1],
+                                        0, :2].tolist(), block_table)
+        self.assertEqual(blocks_manager.ref_counts[block_table].tolist(),
+                         [2, 2])
+        self.assertEqual(manager.num_reused_tokens, 8)
+
+        # The last context token must be computed
+        seq2 = GenerationSequence(seq_idx=2, batch_idx=2)
+        self.assertEqual(manager.add_sequence(seq2, 8, prompt[:8]), 4)
+
+        # Released blocks stay cached
+        manager.step([True, True, True])
+        self.assertEqual(blocks_manager.num_cached_blocks, 2)
+        self.assertEqual(blocks_manager.get_num_free_blocks(), blocks)
+        self.assertEqual(len(blocks_manager.free_blocks), blocks - 2)
+
+        seq3 = GenerationSequence(seq_idx=3, batch_idx=0)
+        self.assertEqual(manager.add_sequence(seq3, 10, prompt), 8)
+        manager.step([True])
+
+        # Cached blocks are evicted under memory pressure
+        seq4 = GenerationSequence(seq_idx=4, batch_idx=0)
+        seq5 = GenerationSequence(seq_idx=5, batch_idx=1)
+        self.assertEqual(manager.add_sequence(seq4, 16, list(range(100, 116))),
+                         0)
+        self.assertEqual(manager.add_sequence(seq5, 13, list(range(200, 213))),
+                         0)
+        self.assertEqual(blocks_manager.num_evicted_blocks, 2)
+        self.assertEqual(blocks_manager.num_cached_blocks, 0)
+        self.assertFalse(blocks_manager.has_free_block())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,137 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import torch
+
+from tensorrt_llm.runtime.logits_capture import LogitsCapture, token_logprobs
+from tensorrt_llm.tools.ppl import PerplexityAccumulator, ppl
+
+
+class TestLogitsCapture(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.batch_size, self.beam_width, self.vocab_size = 2, 2, 11
+        self.num_steps = 5
+        # The engine vocabulary is padded
+        self.logits = torch.randn(self.num_steps,
+                                  self.batch_size * self.beam_width,
+                                  self.vocab_size + 5,
+                                  dtype=torch.float16)
+        self.tokens = torch.randint(
+            0, self.vocab_size,
+            (self.num_steps, self.batch_size * self.beam_width))
+        self.finished = torch.zeros(self.num_steps,
+                                    self.batch_size * self.beam_width,
+                                    dtype=torch.uint8)
+        # The first sequence ends at the step 1
+        self.finished[1:, 0] = 1
+
+    def run_capture(self, capture, num_steps=None):
+        num_steps = num_steps or self.num_steps
+        capture.setup(self.batch_size,
+                      self.beam_width,
+                      max_new_tokens=8,
+                      vocab_size=self.vocab_size,
+                      device='cpu')
+        for step in range(num_steps):
+            capture.capture(step, self.logits[step], self.tokens[step],
+                            self.finished[step])
+        return capture.outputs()
+
+    def test_token_logprobs(self):
+        capture = LogitsCapture(top_k=3)
+        outputs = self.run_capture(capture)
+
+        logprobs = self.logits[..., :self.vocab_size].float().log_softmax(-1)
+        expected = logprobs.gather(-1, self.tokens.unsqueeze(-1)).squeeze(-1)
+        expected = expected.permute(1, 0).reshape(self.batch_size,
+                                                  self.beam_width, -1)
+        self.assertEqual(outputs['token_logprobs'].shape,
+                         (self.batch_size, self.beam_width, self.num_steps))
+        torch.testing.assert_close(outputs['token_logprobs'], expected)
+        torch.testing.assert_close(
+            token_logprobs(self.logits, self.tokens, self.vocab_size),
+            logprobs.gather(-1, self.tokens.unsqueeze(-1)).squeeze(-1))
+
+        values, indices = logprobs.topk(3, dim=-1)
+        torch.testing.assert_close(
+            outputs['top_k_logprobs'],
+            values.permute(1, 0, 2).reshape(self.batch_size, self.beam_width,
+                                            self.num_steps, 3))
+        self.assertTrue(
+            torch.equal(
+                outputs['top_k_ids'].long(),
+                indices.permute(1, 0,
+                                2).reshape(self.batch_size, self.beam_width,
+                                           self.num_steps, 3)))
+
+    def test_candidate_logprobs(self):
+        candidate_ids = [4, 0, 9]
+        capture = LogitsCapture(output_token_logprobs=False,
+                                output_nll=False,
+                                candidate_ids=candidate_ids)
+        outputs = self.run_capture(capture, num_steps=2)
+        self.assertEqual(list(outputs), ['candidate_logprobs'])
+
+        logprobs = self.logits[:2, :, :self.vocab_size].float().log_softmax(-1)
+        expected = logprobs[..., candidate_ids].permute(1, 0, 2).reshape(
+            self.batch_size, self.beam_width, 2, len(candidate_ids))
+        torch.testing.assert_close(outputs['candidate_logprobs'], expected)
+
+    def test_perplexity(self):
+        capture = LogitsCapture(output_token_logprobs=False)
+        outputs = self.run_capture(capture)
+        self.assertNotIn('token_logprobs', outputs)
+
+        # The sequence 0 counts the tokens until its end token
+        self.assertEqual(outputs['num_tokens'].view(-1).tolist(), [2, 5, 5, 5])
+        perplexity = capture.perplexity().view(-1)
+        for seq, num_tokens in enumerate([2, 5, 5, 5]):
+            logits = self.logits[:num_tokens, seq, :self.vocab_size].float()
+            tokens = self.tokens[:num_tokens, seq]
+            self.assertAlmostEqual(perplexity[seq].item(),
+                                   ppl(logits, tokens),
+                                   places=4)
+
+    def test_reused_buffers(self):
+        capture = LogitsCapture()
+        outputs = self.run_capture(capture)
+        token_logprobs_buffer = capture.token_logprobs
+        nll = outputs['nll'].clone()
+
+        # The same shape reuses the buffers, the running values restart
+        outputs = self.run_capture(capture, num_steps=3)
+        self.assertIs(capture.token_logprobs, token_logprobs_buffer)
+        self.assertEqual(outputs['token_logprobs'].shape[-1], 3)
+        self.assertEqual(outputs['num_tokens'].view(-1).tolist(), [2, 3, 3, 3])
+        self.assertEqual(outputs['nll'][0, 0].item(), nll[0, 0].item())
+
+    def test_perplexity_accumulator(self):
+        logits = self.logits.float()
+        accumulator = PerplexityAccumulator()
+        # No tokens yet
+        self.assertEqual(accumulator.ppl(), 1.0)
+        for step in range(self.num_steps):
+            accumulator.update(logits[step], self.tokens[step])
+        self.assertAlmostEqual(accumulator.ppl(),
+                               ppl(logits, self.tokens),
+                               places=4)
+        self.assertEqual(accumulator.num_tokens, self.tokens.numel())
+
+
+if __name__ == '__main__':
+    unittest.main()
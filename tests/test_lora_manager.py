@@ -0,0 +1,164 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+import tempfile
+import unittest
+
+import safetensors.torch
+import torch
+
+from tensorrt_llm.mapping import Mapping
+from tensorrt_llm.runtime.generation import ModelConfig
+from tensorrt_llm.runtime.lora_manager import LoraManager
+
+
+class TestLoraManager(unittest.TestCase):
+
+    num_layers = 2
+    hidden_size = 16
+    target_modules = ["attn_q", "attn_k", "attn_v", "attn_dense"]
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.lora_dir = self.tmp_dir.name
+        self.adapters = {}
+        for i, (uid, low_rank) in enumerate([("a", 4), ("b", 8), ("c", 2)]):
+            adapter_dir = os.path.join(self.lora_dir, uid)
+            os.makedirs(adapter_dir)
+            with open(os.path.join(adapter_dir, "adapter_config.json"),
+                      "w") as f:
+                json.dump({"r": low_rank}, f)
+            weights = {}
+            for layer_idx in range(self.num_layers):
+                prefix = f"base_model.model.model.layers.{layer_idx}.self_attn"
+                for proj in ["q_proj", "k_proj", "v_proj", "o_proj"]:
+                    weights[f"{prefix}.{proj}.lora_A.weight"] = torch.randn(
+                        low_rank, self.hidden_size, dtype=torch.float16)
+                    weights[f"{prefix}.{proj}.lora_B.weight"] = torch.randn(
+                        self.hidden_size, low_rank, dtype=torch.float16)
+            if i % 2 == 0:
+                safetensors.torch.save_file(
+                    weights,
+                    os.path.join(adapter_dir, "adapter_model.safetensors"))
+            else:
+                torch.save(weights,
+                           os.path.join(adapter_dir, "adapter_model.bin"))
+            self.adapters[uid] = weights
+
+        self.model_config = ModelConfig(vocab_size=32,
+                                        num_layers=self.num_layers,
+                                        num_heads=4,
+                                        num_kv_heads=4,
+                                        hidden_size=self.hidden_size,
+                                        gpt_attention_plugin=True,
+                                        dtype='float32',
+                                        lora_plugin=True,
+                                        lora_target_modules=self.target_modules)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_manager(self, tp_size=1, tp_rank=0, **kwargs):
+        manager = LoraManager(device='cpu', **kwargs)
+        manager.load_from_ckpt(self.lora_dir,
+                               self.model_config,
+                               Mapping(world_size=tp_size,
+                                       rank=tp_rank,
+                                       tp_size=tp_size),
+                               ckpt_source="hf")
+        return manager
+
+    def check_resident(self, manager, uid, tp_size=1, tp_rank=0):
+        weights = self.adapters[uid]
+        low_ranks = manager.uid_to_low_ranks(uid)
+        resident = {t.data_ptr(): t for t in manager.lora_weights}
+        for layer_idx in range(self.num_layers):
+            prefix = f"base_model.model.model.layers.{layer_idx}.self_attn"
+            for lora_module, proj in zip(
+                    self.target_modules,
+                ["q_proj", "k_proj", "v_proj", "o_proj"]):
+                t_in = weights[f"{prefix}.{proj}.lora_A.weight"].float()
+                t_out = weights[f"{prefix}.{proj}.lora_B.weight"].float()
+                if lora_module == "attn_dense":
+                    t_in = torch.chunk(t_in, tp_size, dim=1)[tp_rank]
+                else:
+                    t_out = torch.chunk(t_out, tp_size, dim=0)[tp_rank]
+                self.assertEqual(low_ranks[layer_idx][lora_module],
+                                 t_in.shape[0])
+                in_ptr, out_ptr = manager.lora_weights_pointers_list[layer_idx][
+                    uid][lora_module]
+                torch.testing.assert_close(resident[in_ptr], t_in)
+                torch.testing.assert_close(resident[out_ptr], t_out)
+
+    def test_load_on_demand(self):
+        manager = self.create_manager(tp_size=2, tp_rank=1)
+        self.assertEqual(manager.lora_weights, [])
+        self.assertEqual(
+            manager.uid_to_low_ranks("-1")[0],
+            {lora_module: 0
+             for lora_module in self.target_modules})
+
+        manager.prepare(["a", "-1", None, "b", "a"])
+        for uid in ["a", "b"]:
+            self.check_resident(manager, uid, tp_size=2, tp_rank=1)
+        self.assertNotIn("c", manager.lora_weights_pointers_list[0])
+        self.assertEqual(manager.stats['misses'], 2)
+        self.assertEqual(manager.stats['host_misses'], 2)
+
+        manager.prepare(["b"])
+        self.assertEqual(manager.stats['hits'], 1)
+        self.assertEqual(manager.stats['host_misses'], 2)
+
+    def test_lru_eviction(self):
+        manager = self.create_manager(max_resident_adapters=2)
+        manager.prepare(["a", "b"])
+        manager.prepare(["a"])
+        # "b" is the least recently used adapter
+        manager.prepare(["c"])
+        self.assertEqual(manager.stats['evictions'], 1)
+        for uid in ["a", "c"]:
+            self.check_resident(manager, uid)
+        for pointers in manager.lora_weights_pointers_list:
+            self.assertNotIn("b", pointers)
+        with self.assertRaises(KeyError):
+            manager.uid_to_low_ranks("b")
+        self.assertEqual(len(manager.lora_weights),
+                         2 * 2 * self.num_layers * len(self.target_modules))
+
+        # Reloaded from the host cache
+        manager.prepare(["b", "c"])
+        self.check_resident(manager, "b")
+        self.assertEqual(manager.stats['host_hits'], 1)
+        self.assertEqual(manager.stats['host_misses'], 3)
+
+        with self.assertRaises(RuntimeError):
+            manager.prepare(["a", "b", "c"])
+
+    def test_host_cache_size(self):
+        manager = self.create_manager(max_resident_adapters=1,
+                                      max_host_cache_size=1)
+        manager.prepare(["a"])
+        manager.prepare(["b"])
+        manager.prepare(["a"])
+        # Adapters larger than the host cache are loaded every time
+        self.assertEqual(manager.stats['host_hits'], 0)
+        self.assertEqual(manager.stats['host_misses'], 3)
+        self.check_resident(manager, "a")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -44,3 +44,32 @@ class TestMapping(unittest.TestCase):
         self.assertTrue(m.is_last_pp_rank())
         self.assertEqual(m.prev_pp_rank(), 4)
         self.assertEqual(m.next_pp_rank(), 0)
+
+    def test_pp_layers(self):
+        layers = [
+            Mapping(world_size=4, rank=rank, pp_size=4).pp_layers(8)
+            for rank in range(4)
+        ]
+        self.assertEqual(layers, [[0, 1], [2, 3], [4, 5], [6, 7]])
+
+        # The remainder layers go to the middle stages first
+        stage_num_layers = Mapping(world_size=4, pp_size=4).pp_stage_num_layers
+        self.assertEqual(stage_num_layers(10), [2, 3, 3, 2])
+        self.assertEqual(stage_num_layers(11), [3, 3, 3, 2])
+        self.assertEqual(stage_num_layers(3), [1, 1, 1, 0])
+        layers = [
+            Mapping(world_size=4, rank=rank, pp_size=4).pp_layers(11)
+            for rank in range(4)
+        ]
+        self.assertEqual(sum(layers, []), list(range(11)))
+
+        m = Mapping(world_size=8,
+                    rank=3,
+                    tp_size=2,
+                    pp_size=4,
+                    pp_partition=[3, 4, 4, 1])
+        self.assertEqual(m.pp_layers(12), [3, 4, 5, 6])
+        with self.assertRaises(ValueError):
+            m.pp_layers(16)
+        with self.assertRaises(ValueError):
+            Mapping(world_size=2, pp_size=2, pp_partition=[1, 2, 3])
@@ -0,0 +1,167 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from tensorrt_llm.builder import BuildConfig
+from tensorrt_llm.mapping import Mapping
+from tensorrt_llm.plugin import PluginConfig
+from tensorrt_llm.runtime.kv_cache_manager import (blocks_per_sequence,
+                                                   sink_bubble_len)
+from tensorrt_llm.runtime.memory_planner import plan_memory, weights_size
+
+GiB = 1 << 30
+
+
+class Config(object):
+    ''' The PretrainedConfig attributes of a Llama 3 8B used by the planner.  '''
+
+    def __init__(self, tp_size=1, pp_size=1, rank=0):
+        self.dtype = 'float16'
+        self.kv_dtype = 'float16'
+        self.hidden_size = 4096
+        self.num_attention_heads = 32
+        self.num_key_value_heads = 8
+        self.intermediate_size = 14336
+        self.hidden_act = 'silu'
+        self.vocab_size = 128256
+        self.num_hidden_layers = 32
+        self.mapping = Mapping(world_size=tp_size * pp_size,
+                               rank=rank,
+                               tp_size=tp_size,
+                               pp_size=pp_size)
+
+
+def build_config(paged_kv_cache=True, **kwargs):
+    plugin_config = PluginConfig()
+    plugin_config.set_gpt_attention_plugin()
+    if paged_kv_cache:
+        plugin_config.enable_paged_kv_cache(64)
+    return BuildConfig(max_input_len=1024,
+                       max_output_len=1024,
+                       plugin_config=plugin_config,
+                       **kwargs)
+
+
+class TestMemoryPlanner(unittest.TestCase):
+
+    def test_blocks_per_sequence(self):
+        self.assertEqual(sink_bubble_len(0, 64), 0)
+        self.assertEqual(sink_bubble_len(4, 64), 60)
+        self.assertEqual(blocks_per_sequence(100, 64), 2)
+        self.assertEqual(blocks_per_sequence(128, 64), 2)
+        # The sink tokens get a block of their own
+        self.assertEqual(blocks_per_sequence(100, 64, sink_token_len=4), 3)
+        self.assertEqual(
+            blocks_per_sequence(100,
+                                64,
+                                sink_token_len=4,
+                                use_one_more_block=True), 4)
+
+    def test_weights(self):
+        layer_params = 4096 * (4096 + 2048) + 4096 * 4096 + 3 * 4096 * 14336
+        embedding = 128256 * 4096
+        self.assertEqual(weights_size(Config()),
+                         (32 * layer_params + 2 * embedding) * 2)
+        # The first pp rank has the embedding, the last one the lm_head
+        first, last = Config(pp_size=2, rank=0), Config(pp_size=2, rank=1)
+        self.assertEqual(weights_size(first), weights_size(last))
+        self.assertEqual(
+            weights_size(first) + weights_size(last), weights_size(Config()))
+
+    def test_max_num_sequences(self):
+        config = Config()
+        weights = weights_size(config)
+        plan = plan_memory(config,
+                           build_config(),
+                           weights + GiB,
+                           free_gpu_memory_fraction=1.0,
+                           activations=0)
+        # 8 kv heads of 128 fp16 values in 32 layers, 64 tokens per block
+        self.assertEqual(plan.kv_block_size, 32 * 2 * 8 * 128 * 2 * 64)
+        self.assertEqual(plan.max_num_blocks, 128)
+        self.assertEqual(plan.kv_cache, GiB)
+        self.assertEqual(plan.free, 0)
+        self.assertEqual(plan.max_blocks_per_seq, 32)
+        self.assertEqual(plan.max_num_sequences(), 4)
+        self.assertEqual(plan.max_num_sequences([512]), 16)
+        self.assertEqual(plan.max_num_sequences([512, 1536]), 8)
+        # The longer sequences only keep the attention window
+        self.assertEqual(plan.max_num_sequences([4096]), 4)
+
+        plan = plan_memory(config,
+                           build_config(max_beam_width=2),
+                           weights + GiB,
+                           free_gpu_memory_fraction=1.0,
+                           activations=0,
+                           sink_token_len=4)
+        self.assertEqual(plan.max_blocks_per_seq, 33)
+        self.assertEqual(plan.max_num_sequences([512]), 7)
+
+    def test_gqa(self):
+        block_sizes = {}
+        for tp_size in (1, 2, 8, 16):
+            config = Config(tp_size=tp_size)
+            block_sizes[tp_size] = plan_memory(config,
+                                               build_config(),
+                                               80 * GiB,
+                                               activations=0).kv_block_size
+        self.assertEqual(block_sizes[2], block_sizes[1] // 2)
+        self.assertEqual(block_sizes[8], block_sizes[1] // 8)
+        # A kv head is replicated over the tp ranks sharing it
+        self.assertEqual(block_sizes[16], block_sizes[8])
+
+    def test_lora_and_prompt_table(self):
+        config = Config()
+        plan = plan_memory(config,
+                           build_config(max_prompt_embedding_table_size=1000),
+                           80 * GiB,
+                           activations=0,
+                           lora_rank=8,
+                           num_lora_adapters=2)
+        self.assertEqual(plan.prompt_table, 1000 * 4096 * 2)
+        lora_features = (4096 + 6144) + 2 * 4096 + 2 * (4096 + 14336) + \
+            (14336 + 4096)
+        self.assertEqual(plan.lora, 2 * 32 * 8 * lora_features * 2)
+
+        reference = plan_memory(config, build_config(), 80 * GiB, activations=0)
+        self.assertLess(plan.max_num_blocks, reference.max_num_blocks)
+
+    def test_contiguous_kv_cache(self):
+        config = Config()
+        plan = plan_memory(config,
+                           build_config(paged_kv_cache=False),
+                           weights_size(config) + GiB,
+                           free_gpu_memory_fraction=1.0,
+                           activations=0)
+        # A block holds the attention window of a sequence
+        self.assertEqual(plan.tokens_per_block, 2048)
+        self.assertEqual(plan.max_blocks_per_seq, 1)
+        self.assertEqual(plan.max_num_sequences([512]), 4)
+
+    def test_activations(self):
+        config = Config()
+        plan = plan_memory(config, build_config(max_batch_size=8), 80 * GiB)
+        self.assertGreater(plan.activations, 0)
+        larger = plan_memory(config, build_config(max_batch_size=64), 80 * GiB)
+        self.assertGreater(larger.activations, plan.activations)
+        self.assertLess(larger.max_num_blocks, plan.max_num_blocks)
+        # Not enough memory for the KV cache
+        plan = plan_memory(config, build_config(), weights_size(config))
+        self.assertEqual(plan.max_num_blocks, 0)
+        self.assertEqual(plan.max_num_sequences(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
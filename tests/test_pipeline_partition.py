@@ -0,0 +1,82 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from tensorrt_llm.mapping import Mapping
+from tensorrt_llm.models.pipeline_partition import (balanced_pp_partition,
+                                                    partition_layers,
+                                                    pp_partition_report)
+
+
+class Config(object):
+    ''' The PretrainedConfig attributes used by the cost model.  '''
+
+    def __init__(self, num_hidden_layers, vocab_size, pp_size):
+        self.dtype = 'float16'
+        self.hidden_size = 4096
+        self.num_attention_heads = 32
+        self.num_key_value_heads = 8
+        self.intermediate_size = 14336
+        self.hidden_act = 'silu'
+        self.vocab_size = vocab_size
+        self.num_hidden_layers = num_hidden_layers
+        self.mapping = Mapping(world_size=pp_size, pp_size=pp_size)
+
+
+class TestPipelinePartition(unittest.TestCase):
+
+    def test_partition_layers(self):
+        self.assertEqual(partition_layers([1.0] * 8, 4), [2, 2, 2, 2])
+        self.assertEqual(partition_layers([1.0] * 10, 1), [10])
+        # The stages with the embedding and the lm_head get fewer layers
+        self.assertEqual(
+            partition_layers([1.0] * 12,
+                             4,
+                             first_stage_time=1.0,
+                             last_stage_time=3.0), [3, 4, 4, 1])
+        # Uneven layer counts and costs
+        self.assertEqual(partition_layers([1.0, 1.0, 4.0, 1.0, 1.0], 3),
+                         [2, 1, 2])
+        self.assertEqual(partition_layers([1.0] * 2, 3), [0, 1, 1])
+
+    def test_balanced_pp_partition(self):
+        # The lm_head of a 128k vocabulary costs about two decoder layers
+        config = Config(32, 128256, 4)
+        partition = balanced_pp_partition(config)
+        self.assertEqual(sum(partition), 32)
+        self.assertLess(partition[-1], 8)
+
+        even = pp_partition_report(config)
+        balanced = pp_partition_report(config, partition)
+        self.assertEqual([stage.num_layers for stage in even.stages],
+                         [8, 8, 8, 8])
+        self.assertEqual(even.bottleneck.stage, 3)
+        self.assertLess(balanced.imbalance, even.imbalance)
+        self.assertLess(balanced.bottleneck.time, even.bottleneck.time)
+        self.assertIn('imbalance', str(balanced))
+
+        # The partition flows through the mapping
+        config.mapping = Mapping(world_size=4,
+                                 rank=3,
+                                 pp_size=4,
+                                 pp_partition=partition)
+        self.assertEqual(config.mapping.pp_layers(32),
+                         list(range(32 - partition[-1], 32)))
+        self.assertEqual(
+            pp_partition_report(config).imbalance, balanced.imbalance)
+
+
+if __name__ == '__main__':
+    unittest.main()
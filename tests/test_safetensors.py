@@ -0,0 +1,66 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import safetensors.torch
+import torch
+
+from tensorrt_llm._safetensors import SafetensorsMmap
+from tensorrt_llm._utils import torch_to_numpy
+
+
+class TestSafetensorsMmap(unittest.TestCase):
+
+    def test_mmap_views(self):
+        weights = {
+            'embedding.weight': torch.randn(32, 16, dtype=torch.float16),
+            'layers.0.weight': torch.randn(16, 16, dtype=torch.bfloat16),
+            'layers.0.bias': torch.randn(16, dtype=torch.float32),
+            'layers.0.scale': torch.tensor(0.5, dtype=torch.float32),
+            'layers.0.qweight': torch.randint(-128,
+                                              127, (8, 16),
+                                              dtype=torch.int8),
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'rank0.safetensors')
+            safetensors.torch.save_file(weights, path)
+
+            with SafetensorsMmap(path) as f:
+                self.assertEqual(set(f.keys()), set(weights.keys()))
+                self.assertEqual(len(f), len(weights))
+                for name, tensor in weights.items():
+                    value = f[name]
+                    ref = torch_to_numpy(tensor)
+                    self.assertEqual(value.dtype, ref.dtype)
+                    self.assertEqual(value.shape, ref.shape)
+                    self.assertEqual(f.get_shape(name), list(ref.shape))
+                    self.assertEqual(value.tobytes(), ref.tobytes())
+                    # Zero-copy view of the mapping
+                    self.assertFalse(value.flags['OWNDATA'])
+                    self.assertTrue(value.flags['C_CONTIGUOUS'])
+
+                # Copy-on-write, the file is not modified
+                value = f['layers.0.bias']
+                value[:] = 0
+            with SafetensorsMmap(path) as f:
+                np.testing.assert_array_equal(f['layers.0.bias'],
+                                              weights['layers.0.bias'].numpy())
+
+
+if __name__ == '__main__':
+    unittest.main()
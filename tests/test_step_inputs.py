@@ -0,0 +1,197 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import torch
+
+from tensorrt_llm.runtime.step_inputs import (StepInputBuilder, glm_mask_index,
+                                              packed_position_ids)
+
+
+def _tile(tensor, num_beams):
+    return torch.repeat_interleave(tensor, num_beams, dim=0)
+
+
+class TestStepInputs(unittest.TestCase):
+
+    def setUp(self):
+        self.builder = StepInputBuilder('cpu')
+        self.context_lengths = torch.tensor([3, 1, 5, 2], dtype=torch.int32)
+        self.batch_size = len(self.context_lengths)
+        self.max_context_length = int(self.context_lengths.max())
+
+    def test_packed_context(self):
+        inputs = self.builder.context_inputs(self.batch_size,
+                                             self.context_lengths,
+                                             self.context_lengths.clone(),
+                                             use_gpt_attention_plugin=True,
+                                             remove_input_padding=True)
+        expected = torch.cat([
+            torch.arange(length, dtype=torch.int32)
+            for length in self.context_lengths.tolist()
+        ])
+        self.assertTrue(torch.equal(inputs['position_ids'], expected))
+        self.assertTrue(
+            torch.equal(inputs['last_token_ids'],
+                        torch.tensor([3, 4, 9, 11], dtype=torch.int32)))
+        self.assertTrue(
+            torch.equal(packed_position_ids(self.context_lengths), expected))
+
+        inputs = self.builder.generation_inputs(self.batch_size,
+                                                _tile(self.context_lengths, 2),
+                                                use_gpt_attention_plugin=True,
+                                                remove_input_padding=True,
+                                                step=3,
+                                                num_beams=2)
+        self.assertTrue(
+            torch.equal(inputs['position_ids'],
+                        _tile(self.context_lengths, 2) + 3))
+        self.assertTrue(
+            torch.equal(inputs['last_token_ids'],
+                        torch.arange(1, 9, dtype=torch.int32)))
+
+    def test_attention_mask(self):
+        pad_id, num_beams, num_steps = 0, 2, 6
+        # Left padded
+        input_ids = torch.randint(1, 100,
+                                  (self.batch_size, self.max_context_length))
+        for i, length in enumerate(self.context_lengths.tolist()):
+            input_ids[i, :self.max_context_length - length] = pad_id
+        inputs = self.builder.context_inputs(self.batch_size,
+                                             self.context_lengths,
+                                             self.context_lengths,
+                                             use_gpt_attention_plugin=False,
+                                             remove_input_padding=False,
+                                             input_ids=input_ids,
+                                             pad_id=pad_id)
+        reference_mask = input_ids.ne(pad_id).int()
+        self.assertTrue(torch.equal(inputs['attention_mask'], reference_mask))
+        self.assertEqual(inputs['position_ids'][0].tolist(), [1, 1, 0, 1, 2])
+
+        attention_mask = _tile(inputs['attention_mask'], num_beams)
+        reference_mask = attention_mask.clone()
+        data_ptrs = set()
+        for step in range(num_steps):
+            inputs = self.builder.generation_inputs(
+                self.batch_size,
+                _tile(self.context_lengths, num_beams),
+                use_gpt_attention_plugin=False,
+                remove_input_padding=False,
+                step=step,
+                num_beams=num_beams,
+                attention_mask=attention_mask,
+                max_new_tokens=num_steps)
+            # The concatenation of the previous implementation
+            reference_mask = torch.cat(
+                (reference_mask,
+                 reference_mask.new_ones(self.batch_size * num_beams, 1)),
+                dim=-1)
+            positions = reference_mask.long().cumsum(-1) - 1
+            attention_mask = inputs['attention_mask']
+            self.assertTrue(torch.equal(attention_mask, reference_mask))
+            self.assertTrue(
+                torch.equal(inputs['position_ids'], positions[:, -1:].int()))
+            self.assertEqual(inputs['last_token_ids'].tolist(),
+                             [1] * self.batch_size * num_beams)
+            data_ptrs.add(attention_mask.data_ptr())
+        # The masks of the steps alternate between two buffers
+        self.assertEqual(len(data_ptrs), 2)
+
+    def test_more_steps_than_planned(self):
+        attention_mask = torch.ones((2, 3), dtype=torch.int32)
+        for step in range(5):
+            inputs = self.builder.generation_inputs(
+                2,
+                torch.tensor([3, 3], dtype=torch.int32),
+                use_gpt_attention_plugin=False,
+                remove_input_padding=False,
+                step=step,
+                attention_mask=attention_mask,
+                max_new_tokens=1)
+            attention_mask = inputs['attention_mask']
+            self.assertEqual(attention_mask.shape, (2, 4 + step))
+            self.assertTrue(bool(attention_mask.eq(1).all()))
+            self.assertEqual(inputs['position_ids'].tolist(),
+                             [[3 + step], [3 + step]])
+
+    def test_glm_context(self):
+        position_ids = self.builder.glm_context_position_ids(
+            self.batch_size,
+            self.context_lengths,
+            self.context_lengths,
+            self.max_context_length,
+            remove_input_padding=True)
+        self.assertEqual(position_ids[0].tolist(),
+                         [[0, 1, 1, -1, 0, 1, 2, 3, 3, 0, 0],
+                          [0, 0, 1, 1, 0, 0, 0, 0, 1, 0, 1]])
+
+        position_ids = self.builder.glm_context_position_ids(
+            self.batch_size,
+            self.context_lengths,
+            self.context_lengths,
+            self.max_context_length,
+            remove_input_padding=False)
+        self.assertEqual(position_ids.shape, (4, 2, 5))
+        self.assertEqual(position_ids[2].tolist(),
+                         [[0, 1, 2, 3, 3], [0, 0, 0, 0, 1]])
+        self.assertEqual(position_ids[3].tolist(),
+                         [[0, 0, 2, 3, 4], [0, 1, 0, 0, 0]])
+
+    def test_glm_mask_index(self):
+        input_ids = torch.tensor([[5, 50263, 7, 50260, 50256],
+                                  [50264, 1, 2, 3, 4], [1, 2, 3, 4, 50256]])
+        self.assertEqual(glm_mask_index(input_ids, 5).tolist(), [1, 0, 5])
+
+        mask_index = glm_mask_index(input_ids, 5)
+        context_lengths = torch.tensor([4, 5, 4], dtype=torch.int32)
+        position_ids = self.builder.glm_context_position_ids(
+            3,
+            context_lengths,
+            context_lengths,
+            5,
+            remove_input_padding=False,
+            mask_index=mask_index)
+        self.assertEqual(position_ids[:, 0].tolist(),
+                         [[0, 1, 2, 1, 4], [0, 1, 2, 3, 0], [0, 1, 2, 5, 4]])
+
+        position_ids = self.builder.glm_generation_position_ids(
+            _tile(context_lengths, 2),
+            step=1,
+            remove_input_padding=False,
+            num_beams=2,
+            mask_index=mask_index)
+        self.assertEqual(position_ids.shape, (6, 2, 1))
+        self.assertEqual(position_ids[..., 0].tolist(),
+                         [[1, 3], [1, 3], [0, 3], [0, 3], [5, 3], [5, 3]])
+
+    def test_glm_generation(self):
+        num_beams = 2
+        context_lengths = _tile(self.context_lengths, num_beams)
+        position_ids = self.builder.glm_generation_position_ids(
+            context_lengths, step=4, remove_input_padding=True, num_beams=2)
+        self.assertEqual(position_ids.shape, (1, 2, 8))
+        # The beams of a sequence are adjacent, as in the other inputs
+        self.assertTrue(torch.equal(position_ids[0, 0], context_lengths - 2))
+        self.assertEqual(position_ids[0, 1].tolist(), [6] * 8)
+
+        position_ids = self.builder.glm_generation_position_ids(
+            context_lengths, step=0, remove_input_padding=False, num_beams=2)
+        self.assertEqual(position_ids.shape, (8, 2, 1))
+        self.assertTrue(torch.equal(position_ids[:, 0, 0], context_lengths - 2))
+        self.assertEqual(position_ids[:, 1, 0].tolist(), [2] * 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
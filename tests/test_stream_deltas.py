@@ -0,0 +1,107 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import torch
+
+from tensorrt_llm.runtime.stream_deltas import StreamDelta, StreamDeltas
+
+
+class TestStreamDeltas(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.context_lengths = torch.tensor([3, 1, 4], dtype=torch.int32)
+        self.batch_size = len(self.context_lengths)
+        self.num_steps = 7
+        # The steps after which the sequences are done, the last one runs
+        # until the end
+        self.end_steps = [2, 5, self.num_steps]
+        self.tokens = torch.randint(0,
+                                    100, (self.num_steps, self.batch_size, 1),
+                                    dtype=torch.int32)
+
+    def generate(self, stream_deltas):
+        """
+        Runs the decoder of a greedy generation, yields the delta of each
+        step and the expected output ids.
+        """
+        stream_deltas.setup(self.batch_size, 1, self.context_lengths)
+        sequence_lengths = self.context_lengths.clone()
+        finished = torch.zeros(self.batch_size, 1, dtype=torch.uint8)
+        outputs = [[] for _ in range(self.batch_size)]
+        for step in range(self.num_steps):
+            for i in range(self.batch_size):
+                if not finished[i]:
+                    sequence_lengths[i] += 1
+                    outputs[i].append(self.tokens[step, i, 0].item())
+                    finished[i] = step + 1 >= self.end_steps[i]
+            stream_deltas.capture(self.tokens[step], finished, sequence_lengths)
+            yield stream_deltas.delta(), [list(o) for o in outputs]
+
+    def test_deltas(self):
+        stream_deltas = StreamDeltas('cpu', num_slots=2)
+        previous = [[] for _ in range(self.batch_size)]
+        for step, (delta, outputs) in enumerate(self.generate(stream_deltas)):
+            self.assertEqual(delta.token_ids.shape, (self.batch_size, 1, 1))
+            new_tokens = [o[len(p):] for o, p in zip(outputs, previous)]
+            self.assertEqual(delta.token_lists(),
+                             [[tokens] for tokens in new_tokens])
+            self.assertEqual(
+                delta.finished.view(-1).tolist(),
+                [step + 1 >= end for end in self.end_steps])
+            self.assertTrue(
+                torch.equal(
+                    delta.sequence_lengths.view(-1), self.context_lengths +
+                    torch.tensor([len(o) for o in outputs])))
+            previous = outputs
+
+        # The buffers are reused by the next generation
+        host = stream_deltas._host
+        deltas = list(self.generate(stream_deltas))
+        self.assertIs(stream_deltas._host, host)
+        self.assertEqual(
+            sum(d.num_new_tokens for d, _ in deltas).tolist(), [[2], [5], [7]])
+
+    def test_concat(self):
+        stream_deltas = StreamDeltas('cpu')
+        # Coalesced as they come, as the slots are reused
+        coalesced = []
+        delta = None
+        for step, (out, outputs) in enumerate(self.generate(stream_deltas)):
+            delta = out if delta is None else StreamDelta.concat([delta, out])
+            if step % 3 == 2 or step == self.num_steps - 1:
+                coalesced.append(delta)
+                delta = None
+
+        self.assertEqual([d.num_steps for d in coalesced], [3, 3, 1])
+        self.assertEqual(coalesced[1].num_new_tokens.view(-1).tolist(),
+                         [0, 2, 3])
+        token_lists = [[] for _ in range(self.batch_size)]
+        for delta in coalesced:
+            for i, beams in enumerate(delta.token_lists()):
+                token_lists[i].extend(beams[0])
+        self.assertEqual(token_lists, outputs)
+        self.assertTrue(coalesced[-1].finished.all())
+        self.assertEqual(coalesced[-1].sequence_lengths.view(-1).tolist(),
+                         [5, 6, 11])
+
+    def test_beam_search(self):
+        with self.assertRaises(AssertionError):
+            StreamDeltas('cpu').setup(self.batch_size, 2, self.context_lengths)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import numpy as np
+
+from tensorrt_llm.runtime.word_list import (WordListEncoder,
+                                            get_word_list_encoder,
+                                            to_word_list_format)
+
+
+class CharTokenizer(object):
+
+    def __init__(self):
+        self.num_calls = 0
+
+    def encode(self, text, add_special_tokens=False):
+        self.num_calls += 1
+        ids = [ord(c) for c in text.strip()]
+        return [1] + ids if add_special_tokens else ids
+
+
+class TestWordList(unittest.TestCase):
+
+    def test_to_word_list_format(self):
+        tokenizer = CharTokenizer()
+        word_dict = [[" ab, c"], [b"de"], [""], ['x,,"y,z"']]
+        words = to_word_list_format(word_dict, tokenizer)
+        self.assertEqual(words.dtype, np.int32)
+        np.testing.assert_array_equal(
+            words,
+            np.array([
+                [[97, 98, 99, 0], [2, 3, -1, -1]],
+                [[100, 101, 0, 0], [2, -1, -1, -1]],
+                [[0, 0, 0, 0], [-1, -1, -1, -1]],
+                [[120, 121, 44, 122], [1, 4, -1, -1]],
+            ]))
+
+        # The words are tokenized once per tokenizer
+        num_calls = tokenizer.num_calls
+        np.testing.assert_array_equal(
+            to_word_list_format(word_dict * 2, tokenizer),
+            np.concatenate([words, words]))
+        self.assertEqual(tokenizer.num_calls, num_calls)
+        encoder = get_word_list_encoder(tokenizer)
+        self.assertEqual(encoder.cache_misses, 4)
+        self.assertEqual(encoder.cache_hits, 8)
+
+        words = to_word_list_format([["ab"]],
+                                    tokenizer,
+                                    add_special_tokens=True)
+        np.testing.assert_array_equal(words, [[[1, 97, 98], [3, -1, -1]]])
+
+    def test_pretokenized(self):
+        words = to_word_list_format([[[5, 6], [7]], [], [np.array([8])]])
+        np.testing.assert_array_equal(
+            words,
+            np.array([
+                [[5, 6, 7], [2, 3, -1]],
+                [[0, 0, 0], [-1, -1, -1]],
+                [[8, 0, 0], [1, -1, -1]],
+            ]))
+        np.testing.assert_array_equal(to_word_list_format([[], []]),
+                                      [[[0], [-1]], [[0], [-1]]])
+
+    def test_cache_size(self):
+        tokenizer = CharTokenizer()
+        encoder = WordListEncoder(tokenizer, max_cache_size=2)
+        for words in ["a", "b", "a", "c", "b"]:
+            encoder.encode([[words]])
+        # "b" was evicted by "c"
+        self.assertEqual(encoder.cache_hits, 1)
+        self.assertEqual(encoder.cache_misses, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()